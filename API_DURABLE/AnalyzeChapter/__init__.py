@@ -10,11 +10,19 @@
 import logging
 import json
 import os
+import sys
 import time as time_module
 from google import genai
 from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+
 logging.basicConfig(level=logging.INFO)
 logging.getLogger('tenacity').setLevel(logging.WARNING)
 
@@ -268,6 +276,7 @@ def build_analysis_prompt(fragment: dict) -> str:
     return prompt
 
 
+@offload_payloads(fields=())
 def main(fragment_json) -> dict:
     """
     Analiza un fragmento con Gemini 2.5 Flash, preservando contexto jerárquico.
@@ -286,6 +295,14 @@ def main(fragment_json) -> dict:
         else:
             fragment = fragment_json
 
+        # Rescate desde el orquestador: {fragments (BlobRef ya hidratado), fragment_id}
+        if 'fragments' in fragment and 'fragment_id' in fragment:
+            wanted = str(fragment['fragment_id'])
+            fragment = next(
+                (f for f in fragment['fragments'] if str(f.get('id')) == wanted),
+                {"id": wanted, "title": "No encontrado", "content": ""}
+            )
+
         # B. Extraer campos
         fragment_id = str(fragment.get('id', 0))
         parent_chapter_id = fragment.get('parent_chapter_id', 0)
@@ -0,0 +1,81 @@
+# =============================================================================
+# AttachBatchResults/__init__.py - LYA 6.0
+# =============================================================================
+# Inyecta resultados por capítulo en los capítulos consolidados, para que el
+# orquestador nunca tenga que recorrerlos (le llegan como BlobRef).
+# Cada attachment puede ser un manifest de payload_store, una lista de
+# manifests (uno por grupo de capítulos) o una lista de resultados con
+# 'chapter_id'.
+#
+# Input:
+#   {
+#     "chapters": [...consolidated...] | [[...grupo 1...], [...grupo 2...]],
+#     "attachments": {"layer2_structural": manifest | [manifest...], "emotional_arc": [...]}
+#   }
+#
+# Output:
+#   {"chapters": [...], "chapter_index": [{chapter_id, titulo, score_global}]}
+# =============================================================================
+
+import logging
+import os
+import sys
+
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import iter_manifest, is_result_manifest, offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import iter_manifest, is_result_manifest, offload_payloads
+
+logging.basicConfig(level=logging.INFO)
+
+
+def build_chapter_index(chapters: list) -> list:
+    """Índice ligero que el orquestador usa para decidir por capítulo."""
+    index = []
+    for i, chapter in enumerate(chapters):
+        qualitative = chapter.get('layer3_qualitative') or {}
+        index.append({
+            'chapter_id': chapter.get('chapter_id', i),
+            'titulo': chapter.get('titulo', ''),
+            'score_global': qualitative.get('score_global', 10.0)
+        })
+    return index
+
+
+@offload_payloads(fields=('chapters',))
+def main(payload: dict) -> dict:
+    # Los grupos del análisis por capítulos llegan como listas anidadas (BlobRef hidratados)
+    chapters = []
+    for item in payload.get('chapters', []):
+        if isinstance(item, list):
+            chapters.extend(item)
+        else:
+            chapters.append(item)
+    attachments = payload.get('attachments', {})
+
+    for field, source in attachments.items():
+        if is_result_manifest(source):
+            results = iter_manifest(source)
+        elif isinstance(source, list) and source and all(is_result_manifest(s) for s in source):
+            # Un manifest por grupo de capítulos (análisis por capítulos)
+            results = (item for manifest in source for item in iter_manifest(manifest))
+        else:
+            results = source or []
+
+        by_chapter = {}
+        for result in results:
+            if isinstance(result, dict):
+                by_chapter[str(result.get('chapter_id'))] = result
+
+        for i, chapter in enumerate(chapters):
+            ch_id = str(chapter.get('chapter_id', i))
+            chapter[field] = by_chapter.get(ch_id, {})
+
+        logging.info(f"📎 {field}: {len(by_chapter)} resultados adjuntados a {len(chapters)} capítulos")
+
+    return {
+        'chapters': chapters,
+        'chapter_index': build_chapter_index(chapters)
+    }
@@ -0,0 +1,117 @@
+# =============================================================================
+# BatchLatencyHistory/__init__.py - Historial de Latencia de Batches (LYA 6.0)
+# =============================================================================
+# Guarda cuánto tardó cada batch en completarse, por tipo de proveedor
+# (gemini_flash, gemini_pro, claude_vertex), y devuelve percentiles para
+# que BatchTrackerOrchestrator planifique sus polls.
+#
+# Input:  {"record": [{"kind": "...", "seconds": 123.4}], "kinds": ["..."]}
+# Output: {"gemini_pro": {"samples": 12, "p50": 540.0, "p90": 900.0}, ...}
+# =============================================================================
+
+import logging
+import json
+import os
+import sys
+from typing import Dict, List, Any
+
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from config_models import PAYLOAD_CONTAINER, BATCH_LATENCY_HISTORY_SIZE
+except ImportError:
+    from API_DURABLE.config_models import PAYLOAD_CONTAINER, BATCH_LATENCY_HISTORY_SIZE
+
+try:
+    from azure.storage.blob import BlobServiceClient, ContentSettings
+    BLOB_AVAILABLE = True
+except ImportError:
+    BLOB_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+
+HISTORY_BLOB = "batch-latency/history.json"
+
+
+def get_history_blob():
+    """Devuelve el blob del historial, o None si no hay storage."""
+    if not BLOB_AVAILABLE:
+        return None
+    connect_str = os.environ.get('AzureWebJobsStorage')
+    if not connect_str:
+        return None
+    service = BlobServiceClient.from_connection_string(connect_str)
+    try:
+        service.create_container(PAYLOAD_CONTAINER)
+    except Exception:
+        pass
+    return service.get_blob_client(PAYLOAD_CONTAINER, HISTORY_BLOB)
+
+
+def load_history(blob_client) -> Dict[str, List[float]]:
+    try:
+        return json.loads(blob_client.download_blob().readall())
+    except Exception:
+        # Primer uso: todavía no hay historial
+        return {}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(history: Dict[str, List[float]], kinds: List[str]) -> Dict[str, Any]:
+    stats = {}
+    for kind in kinds:
+        samples = history.get(kind, [])
+        if not samples:
+            continue
+        stats[kind] = {
+            'samples': len(samples),
+            'p50': round(percentile(samples, 0.5), 1),
+            'p90': round(percentile(samples, 0.9), 1)
+        }
+    return stats
+
+
+def main(payload: dict) -> dict:
+    """
+    Activity Function: registra latencias nuevas y devuelve estadísticas.
+    Nunca falla: sin historial el tracker usa la secuencia de intervalos fija.
+    """
+    try:
+        payload = payload or {}
+        records = payload.get('record', [])
+        kinds = payload.get('kinds', [])
+
+        blob_client = get_history_blob()
+        if blob_client is None:
+            return {}
+
+        history = load_history(blob_client)
+
+        if records:
+            for record in records:
+                kind = record.get('kind')
+                seconds = record.get('seconds')
+                if not kind or not isinstance(seconds, (int, float)) or seconds <= 0:
+                    continue
+                samples = history.setdefault(kind, [])
+                samples.append(round(float(seconds), 1))
+                del samples[:-BATCH_LATENCY_HISTORY_SIZE]
+
+            # Último en escribir gana: perder una muestra no afecta a nadie
+            blob_client.upload_blob(
+                json.dumps(history),
+                overwrite=True,
+                content_settings=ContentSettings(content_type='application/json')
+            )
+            logging.info(f"⏱️ Latencias registradas: {[(r.get('kind'), r.get('seconds')) for r in records]}")
+
+        return summarize(history, kinds)
+
+    except Exception as e:
+        logging.warning(f"⚠️ Historial de latencia no disponible: {e}")
+        return {}
@@ -0,0 +1,216 @@
+# =============================================================================
+# BatchTrackerOrchestrator/__init__.py - LYA 6.0
+# =============================================================================
+# Sub-orquestación genérica que espera N batches heterogéneos a la vez
+# (Gemini Flash, Gemini Pro, Claude/Vertex) con un solo bucle de polling.
+#
+# Input:
+#   {
+#     "jobs": {
+#       "layer2": {"kind": "gemini_pro",
+#                  "poll_activity": "PollGeminiProBatchResult",
+#                  "batch_info": {...},                       # salida del Submit
+#                  "submitted_at": "2025-12-01T10:00:00"},    # opcional
+#       ...
+#     },
+#     "deadline_minutes": 120
+#   }
+#
+# Output: {"layer2": {"status": "success" | "failed" | "timeout",
+#                     "result": {...}, "error": "...", "seconds": 431}, ...}
+#
+# PLANIFICACIÓN:
+#   - Cada job tiene su propio "próximo poll"; el tracker duerme hasta el más
+#     cercano y en cada tick consulta con task_all solo los que tocan.
+#   - Los intervalos salen del historial de latencia del proveedor
+#     (BatchLatencyHistory): pocos polls antes del p50 y cadencia fija entre
+#     p50 y p90. Sin historial se usa la secuencia adaptativa clásica.
+#   - El límite es de reloj real (deadline), no un número de polls.
+#   - Los envíos servidos desde cache o ejecutados online (execution_router)
+#     se consultan en el acto y no cuentan para el historial de latencia.
+#
+# Nunca lanza excepción por un batch: el llamador decide qué hacer con cada
+# resultado 'failed' / 'timeout'.
+# =============================================================================
+
+import azure.durable_functions as df
+import logging
+from datetime import datetime, timedelta
+
+try:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from config_models import (
+        BATCH_DEADLINE_MINUTES,
+        BATCH_POLL_MIN_SECONDS,
+        BATCH_POLL_MAX_SECONDS,
+        BATCH_MAX_POLL_ERRORS,
+        BATCH_LATENCY_MIN_SAMPLES
+    )
+except ImportError:
+    BATCH_DEADLINE_MINUTES = 120
+    BATCH_POLL_MIN_SECONDS = 10
+    BATCH_POLL_MAX_SECONDS = 300
+    BATCH_MAX_POLL_ERRORS = 3
+    BATCH_LATENCY_MIN_SAMPLES = 3
+
+
+def get_adaptive_interval(kind: str, attempt: int) -> int:
+    """
+    Secuencia fija (sin historial): empieza rápido y va incrementando.
+    """
+    if kind.startswith('gemini'):
+        # Secuencia: 10, 15, 20, 25, 30, 35, 40, 45, 45, ...
+        return min(10 + (attempt * 5), 45)
+
+    if kind.startswith('claude'):
+        # Secuencia: 20, 35, 50, 65, 80, 90, 90, ...
+        return min(20 + (attempt * 15), 90)
+
+    return 30
+
+
+def get_poll_delay(kind: str, stats: dict, elapsed: float, attempt: int) -> int:
+    """
+    Segundos hasta el próximo poll de un job según el historial del proveedor.
+
+    - Antes del p50: se recorta a la mitad la distancia restante (un batch
+      rápido se detecta pronto sin gastar polls al principio).
+    - Después del p50: cadencia fija de un cuarto del rango p50-p90.
+    """
+    if not stats or stats.get('samples', 0) < BATCH_LATENCY_MIN_SAMPLES:
+        return get_adaptive_interval(kind, attempt)
+
+    p50 = stats.get('p50', 0)
+    p90 = max(stats.get('p90', p50), p50)
+
+    if elapsed < p50:
+        delay = (p50 - elapsed) / 2
+    else:
+        delay = (p90 - p50) / 4
+
+    return int(min(max(delay, BATCH_POLL_MIN_SECONDS), BATCH_POLL_MAX_SECONDS))
+
+
+def orchestrator_function(context: df.DurableOrchestrationContext):
+    tracker_input = context.get_input() or {}
+    jobs = tracker_input.get('jobs', {})
+    deadline_minutes = tracker_input.get('deadline_minutes') or BATCH_DEADLINE_MINUTES
+
+    start = context.current_utc_datetime
+    deadline = start + timedelta(minutes=deadline_minutes)
+
+    kinds = sorted({job.get('kind', 'unknown') for job in jobs.values()})
+    try:
+        latency_stats = yield context.call_activity('BatchLatencyHistory', {'kinds': kinds})
+    except Exception as e:
+        logging.warning(f"[TRACKER] Sin historial de latencia: {e}")
+        latency_stats = None
+    latency_stats = latency_stats or {}
+
+    state = {}
+    for key, job in jobs.items():
+        kind = job.get('kind', 'unknown')
+        batch_info = job.get('batch_info', {})
+        # El batch pudo enviarse antes de empezar a esperarlo (p.ej. edición
+        # single-pass enviada antes del fan-out de reflection)
+        submitted = datetime.fromisoformat(job['submitted_at']) if job.get('submitted_at') else start
+        # Todo venía del cache o se ejecutó online: no hay job que esperar, se consulta ya
+        immediate = batch_info.get('status') in ('cached', 'online')
+        first_delay = 0 if immediate else get_poll_delay(
+            kind, latency_stats.get(kind), (start - submitted).total_seconds(), 0
+        )
+        state[key] = {
+            'kind': kind,
+            'poll_activity': job.get('poll_activity'),
+            'batch_info': batch_info,
+            'cached': immediate,
+            'submitted': submitted,
+            'attempt': 0,
+            'errors': 0,
+            'next_poll': start + timedelta(seconds=first_delay)
+        }
+
+    outcomes = {}
+    job_labels = ', '.join(f"{key} ({job['kind']})" for key, job in state.items())
+    logging.info(f"[TRACKER] {len(jobs)} batches: {job_labels}")
+
+    while len(outcomes) < len(state):
+        pending = [key for key in state if key not in outcomes]
+
+        wake = min(min(state[key]['next_poll'] for key in pending), deadline)
+        if wake > context.current_utc_datetime:
+            yield context.create_timer(wake)
+
+        now = context.current_utc_datetime
+        if now >= deadline:
+            for key in pending:
+                outcomes[key] = {'status': 'timeout', 'error': f"Timeout tras {deadline_minutes} min"}
+            break
+
+        due = [key for key in pending if state[key]['next_poll'] <= now]
+        if not due:
+            continue
+
+        try:
+            results = yield context.task_all([
+                context.call_activity(state[key]['poll_activity'], state[key]['batch_info'])
+                for key in due
+            ])
+        except Exception as e:
+            logging.error(f"[TRACKER] Error en poll ({', '.join(due)}): {e}")
+            results = [{'status': 'error', 'error': str(e)} for _ in due]
+
+        now = context.current_utc_datetime
+
+        for key, result in zip(due, results):
+            job = state[key]
+            job['attempt'] += 1
+            elapsed = (now - job['submitted']).total_seconds()
+            status = result.get('status', 'unknown') if isinstance(result, dict) else 'error'
+
+            if status == 'success':
+                outcomes[key] = {'status': 'success', 'result': result, 'seconds': int(elapsed)}
+                logging.info(f"[TRACKER] ✅ {key} completado en ~{int(elapsed)}s ({job['attempt']} polls)")
+                continue
+
+            if status == 'failed':
+                outcomes[key] = {'status': 'failed', 'error': result.get('error')}
+                logging.error(f"[TRACKER] ❌ {key} falló: {result.get('error')}")
+                continue
+
+            if status == 'error':
+                # Error transitorio del poll: se conserva el batch_info anterior
+                job['errors'] += 1
+                if job['errors'] >= BATCH_MAX_POLL_ERRORS:
+                    outcomes[key] = {'status': 'failed', 'error': result.get('error')}
+                    logging.error(f"[TRACKER] ❌ {key}: {job['errors']} polls con error")
+                    continue
+            else:
+                job['batch_info'] = result
+                job['errors'] = 0
+
+            delay = get_poll_delay(job['kind'], latency_stats.get(job['kind']), elapsed, job['attempt'])
+            job['next_poll'] = now + timedelta(seconds=delay)
+
+        status_parts = []
+        for key in state:
+            key_status = outcomes.get(key, {}).get('status', 'processing')
+            status_parts.append(f"{key}:{'✓' if key_status == 'success' else key_status}")
+        logging.info(f"[TRACKER] {int((now - start).total_seconds())}s - {' | '.join(status_parts)}")
+        context.set_custom_status(f"Batches: {' '.join(status_parts)}")
+
+    # Los envíos servidos desde cache u online no dicen nada de la cola del proveedor
+    samples = [
+        {'kind': state[key]['kind'], 'seconds': outcome['seconds']}
+        for key, outcome in outcomes.items()
+        if outcome['status'] == 'success' and not state[key]['cached']
+    ]
+    if samples:
+        yield context.call_activity('BatchLatencyHistory', {'record': samples})
+
+    return outcomes
+
+
+main = df.Orchestrator.create(orchestrator_function)
@@ -0,0 +1,146 @@
+# =============================================================================
+# BibleRecomputeOrchestrator/__init__.py - LYA 6.0
+# =============================================================================
+# Recalculo incremental tras editar la Biblia de un proyecto ya terminado.
+# El endpoint de aprobación compara la Biblia aplicada con la editada
+# (bible_deps.diff_bible) y arranca esta orquestación solo con los capítulos
+# cuya parte de la Biblia cambió:
+#
+#   PrepareBibleRecompute -> notas de margen (solo margin_notes_chapters)
+#   -> edición Claude single-pass (edit_chapters) -> ReconstructManuscript
+#   -> SaveBibleRecompute (parchea notas, capítulos, cambios y shards)
+#
+# Los demás capítulos conservan sus notas, ediciones y decisiones. La carta
+# editorial no se regenera aquí (ver letter_stale en el diff y
+# EditorialLetterOrchestrator).
+#
+# Input:
+#   {
+#     "job_id": "...",
+#     "bible": BlobRef,                  # lya-outputs/{job_id}/biblia_validada.json
+#     "bible_hash": "...",
+#     "chapters": BlobRef,               # lya-outputs/{job_id}/capitulos_consolidados.json
+#     "margin_notes": BlobRef | None,    # lya-outputs/{job_id}/notas_margen.json
+#     "carta_editorial": BlobRef | None, # lya-outputs/{job_id}/carta_editorial.json
+#     "margin_notes_chapters": [...], "edit_chapters": [...],
+#     "book_metadata": {...}
+#   }
+#
+# custom_status: {"kind": "bible_recompute", "phase": "preparing" |
+#                 "margin_notes" | "editing" | "saving" | "completed" | "failed",
+#                 "step": n, "total_steps": 4, "message": str, "started_at": iso}
+# =============================================================================
+
+import azure.durable_functions as df
+import logging
+
+try:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from config_models import BATCH_DEADLINE_MINUTES
+except ImportError:
+    BATCH_DEADLINE_MINUTES = 120
+
+TOTAL_STEPS = 4
+
+
+def track_batch(context, key: str, kind: str, poll_activity: str, batch_info: dict):
+    """Espera un batch con BatchTrackerOrchestrator; excepción si no termina bien."""
+    outcomes = yield context.call_sub_orchestrator('BatchTrackerOrchestrator', {
+        'jobs': {key: {'kind': kind, 'poll_activity': poll_activity, 'batch_info': batch_info}},
+        'deadline_minutes': BATCH_DEADLINE_MINUTES
+    })
+    outcome = (outcomes or {}).get(key) or {'status': 'failed', 'error': 'Sin resultado del tracker'}
+    if outcome.get('status') != 'success':
+        raise Exception(f"Batch {key} {outcome.get('status')}: {outcome.get('error')}")
+    return outcome.get('result', {})
+
+
+def orchestrator_function(context: df.DurableOrchestrationContext):
+    job = context.get_input() or {}
+    job_id = job.get('job_id')
+    started_at = context.current_utc_datetime.isoformat()
+    margin_ids = [str(c) for c in job.get('margin_notes_chapters') or []]
+    edit_ids = [str(c) for c in job.get('edit_chapters') or []]
+
+    def progress(step, phase, message):
+        context.set_custom_status({
+            'kind': 'bible_recompute',
+            'phase': phase,
+            'step': step,
+            'total_steps': TOTAL_STEPS,
+            'message': message,
+            'chapters': len(edit_ids),
+            'started_at': started_at
+        })
+
+    try:
+        progress(0, 'preparing', f"Preparando {len(edit_ids)} capítulos...")
+        prepared = yield context.call_activity('PrepareBibleRecompute', {
+            'chapters': job.get('chapters'),
+            'margin_notes': job.get('margin_notes'),
+            'chapter_ids': edit_ids
+        })
+
+        # 1. Notas de margen de los capítulos cuya vista de notas cambió
+        new_notes = None
+        if margin_ids:
+            progress(1, 'margin_notes', f"Notas de margen: {len(margin_ids)} capítulos...")
+            notes_batch = yield context.call_activity('SubmitMarginNotes', {
+                'chapters': prepared['chapters'],
+                'chapter_ids': margin_ids,
+                'carta_editorial': job.get('carta_editorial') or {},
+                'bible': job.get('bible'),
+                'book_metadata': job.get('book_metadata') or {}
+            })
+            if not notes_batch or notes_batch.get('status') == 'error':
+                raise Exception(f"Error submit notas: {(notes_batch or {}).get('error')}")
+            new_notes = yield from track_batch(context, 'margin_notes', 'claude_vertex', 'PollMarginNotesBatch', notes_batch)
+
+        # 2. Edición single-pass: notas nuevas donde las hay, las vigentes en el resto
+        progress(2, 'editing', f"Editando {len(edit_ids)} capítulos...")
+        margin_sources = [prepared['notes_by_chapter']]
+        if new_notes:
+            margin_sources.append(new_notes.get('notes_by_chapter', {}))
+        edit_batch = yield context.call_activity('SubmitClaudeBatch', {
+            'chapters': prepared['chapters'],
+            'bible': job.get('bible'),
+            'margin_notes': margin_sources,
+            'book_metadata': job.get('book_metadata') or {}
+        })
+        if not edit_batch or edit_batch.get('status') == 'error':
+            raise Exception(f"Error submit edición: {(edit_batch or {}).get('error')}")
+        edited = yield from track_batch(context, 'edicion', 'claude_vertex', 'PollClaudeBatchResult', edit_batch)
+
+        manuscript = yield context.call_activity('ReconstructManuscript', {
+            'edited_chapters': [edited.get('results', [])],
+            'consolidated_chapters': prepared['chapters'],
+            'book_name': (job.get('book_metadata') or {}).get('title', 'Libro')
+        })
+        if manuscript.get('status') == 'error':
+            raise Exception(f"Reconstrucción: {manuscript.get('error')}")
+
+        # 3. Parchear los artefactos del proyecto
+        progress(3, 'saving', "Guardando capítulos recalculados...")
+        saved = yield context.call_activity('SaveBibleRecompute', {
+            'job_id': job_id,
+            'bible': job.get('bible'),
+            'bible_hash': job.get('bible_hash'),
+            'chapter_ids': edit_ids,
+            'margin_notes_chapters': margin_ids,
+            'margin_notes': new_notes.get('notes_by_chapter', {}) if new_notes else {},
+            'edited_chapters': manuscript.get('consolidated_chapters', [])
+        })
+
+        progress(4, 'completed', f"Biblia aplicada: {len(edit_ids)} capítulos recalculados")
+        return {**saved, 'job_id': job_id}
+
+    except Exception as e:
+        if not context.is_replaying:
+            logging.error(f"❌ Error en recalculo por Biblia de {job_id}: {e}")
+        progress(TOTAL_STEPS, 'failed', f"Error recalculando: {e}")
+        return {'status': 'error', 'job_id': job_id, 'error': str(e)}
+
+
+main = df.Orchestrator.create(orchestrator_function)
@@ -9,8 +9,17 @@
 
 import logging
 import json
+import os
+import sys
 from collections import defaultdict
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import iter_manifest, offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import iter_manifest, offload_payloads
+
 logging.basicConfig(level=logging.INFO)
 
 
@@ -260,6 +269,29 @@ def consolidate_editorial_signals(signals_list: list) -> dict:
     }
 
 
+def inject_chapter_content(consolidated: list, fragments: list) -> None:
+    """
+    Reinyecta el texto de los fragmentos originales en cada capítulo consolidado.
+    (Antes lo hacía el orquestador; main() ya recibe los fragmentos hidratados.)
+    """
+    by_chapter = defaultdict(list)
+    for frag in fragments:
+        by_chapter[str(frag.get('parent_chapter_id', frag.get('id', '')))].append(frag)
+
+    for chapter in consolidated:
+        relevant_frags = by_chapter.get(str(chapter.get('chapter_id', '')), [])
+        relevant_frags.sort(key=lambda x: x.get('fragment_index', 0))
+
+        full_content = "\n\n".join([f.get('content', '') for f in relevant_frags])
+        chapter['content'] = full_content
+
+        # Recalculamos métricas si están en 0
+        estructura = chapter.setdefault('metricas_agregadas', {}).setdefault('estructura', {})
+        if estructura.get('total_palabras', 0) == 0:
+            estructura['total_palabras'] = len(full_content.split())
+
+
+@offload_payloads()
 def main(fragment_analyses) -> list:
     """
     Consolida análisis.
@@ -271,11 +303,16 @@ def main(fragment_analyses) -> list:
     try:
         analyses_list = []
         chapter_map = {}
+        source_fragments = []
 
         # 1. Desempaquetado inteligente
-        if isinstance(payload, dict) and 'fragment_analyses' in payload:
-            analyses_list = payload.get('fragment_analyses', [])
+        if isinstance(payload, dict) and ('fragment_analyses' in payload or 'result_manifest' in payload):
+            analyses_list = list(payload.get('fragment_analyses') or [])
             chapter_map = payload.get('chapter_map', {}) 
+            source_fragments = payload.get('fragments') or []
+            # Resultados del batch escritos en Blob por PollBatchResult
+            if payload.get('result_manifest'):
+                analyses_list.extend(iter_manifest(payload['result_manifest']))
         elif isinstance(payload, list):
             analyses_list = payload
         else:
@@ -375,6 +412,10 @@ def main(fragment_analyses) -> list:
             
             consolidated.append(chapter_consolidated)
         
+        if source_fragments:
+            inject_chapter_content(consolidated, source_fragments)
+            logging.info(f"📝 Texto inyectado en {len(consolidated)} capítulos")
+        
         logging.info(f"✅ Consolidación completada: {len(consolidated)} capítulos")
         return consolidated
 
@@ -10,11 +10,19 @@
 import logging
 import json
 import os
+import sys
 import time
 from google import genai
 from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+
 logging.basicConfig(level=logging.INFO)
 
 # -----------------------------------------------------------------------------
@@ -186,6 +194,7 @@ def prepare_causality_full(causality_analysis: dict) -> str:
     if not causality_analysis: return "{}"
     return json.dumps(causality_analysis, indent=2, ensure_ascii=False)
 
+@offload_payloads()
 def main(bible_input_json) -> dict:
     bible_input_raw = bible_input_json 
     try:
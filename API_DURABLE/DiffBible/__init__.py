@@ -0,0 +1,31 @@
+# =============================================================================
+# DiffBible/__init__.py - LYA 6.0
+# =============================================================================
+# Compara dos Biblias desde el orquestador (que no puede leer BlobRefs) y
+# devuelve qué artefactos y capítulos dependen de lo que cambió
+# (bible_deps.diff_bible).
+#
+# Input:  {"old": {...} | BlobRef, "new": {...} | BlobRef, "chapter_ids": [...]}
+# Output: diff_bible(old, new, chapter_ids)
+# =============================================================================
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+    from bible_deps import diff_bible, recompute_summary
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.bible_deps import diff_bible, recompute_summary
+
+logging.basicConfig(level=logging.INFO)
+
+
+@offload_payloads(fields=())
+def main(input_data: dict) -> dict:
+    diff = diff_bible(input_data.get('old') or {}, input_data.get('new') or {}, input_data.get('chapter_ids') or [])
+    logging.info(f"📖 Diff de Biblia: {recompute_summary(diff)}")
+    return diff
@@ -0,0 +1,68 @@
+# =============================================================================
+# EditorialLetterOrchestrator/__init__.py - LYA 6.0
+# =============================================================================
+# Regeneración de la carta editorial como trabajo en segundo plano. El endpoint
+# HTTP solo arranca esta orquestación y devuelve el job id; el cliente consulta
+# el progreso (custom_status) con el endpoint de estado.
+#
+# Input:
+#   {
+#     "job_id": "...",
+#     "bible": BlobRef,                    # lya-outputs/{job_id}/biblia_validada.json
+#     "consolidated_chapters": BlobRef|[], # lya-outputs/{job_id}/capitulos_consolidados.json
+#     "book_metadata": {"title": ..., "job_id": ...}
+#   }
+#
+# custom_status: {"kind": "editorial_letter", "phase": "generating" | "saving" |
+#                 "completed" | "failed", "step": n, "total_steps": 2,
+#                 "message": str, "started_at": iso}
+# =============================================================================
+
+import azure.durable_functions as df
+import logging
+
+TOTAL_STEPS = 2
+
+
+def orchestrator_function(context: df.DurableOrchestrationContext):
+    job = context.get_input() or {}
+    job_id = job.get('job_id')
+    started_at = context.current_utc_datetime.isoformat()
+
+    def progress(step, phase, message):
+        context.set_custom_status({
+            'kind': 'editorial_letter',
+            'phase': phase,
+            'step': step,
+            'total_steps': TOTAL_STEPS,
+            'message': message,
+            'started_at': started_at
+        })
+
+    progress(0, 'generating', 'Escribiendo Carta Editorial...')
+    carta = yield context.call_activity('GenerateEditorialLetter', {
+        'bible': job.get('bible'),
+        'consolidated_chapters': job.get('consolidated_chapters') or [],
+        'fragments': [],  # No es crítico para la carta editorial
+        'book_metadata': job.get('book_metadata') or {'job_id': job_id}
+    })
+
+    if not carta or carta.get('status') in ('error', 'config_error'):
+        error = (carta or {}).get('error', 'Respuesta vacía')
+        if not context.is_replaying:
+            logging.error(f"❌ Error regenerando carta de {job_id}: {error}")
+        progress(1, 'failed', f"Error generando carta: {error}")
+        return {'status': 'error', 'job_id': job_id, 'error': error}
+
+    progress(1, 'saving', 'Guardando Carta Editorial...')
+    saved = yield context.call_activity('SaveEditorialLetter', {
+        'job_id': job_id,
+        'carta_editorial': carta.get('carta_editorial'),
+        'carta_markdown': carta.get('carta_markdown')
+    })
+
+    progress(2, 'completed', 'Carta Editorial regenerada')
+    return {**saved, 'job_id': job_id}
+
+
+main = df.Orchestrator.create(orchestrator_function)
@@ -3,56 +3,130 @@
 # =============================================================================
 # Analiza el arco emocional de la narrativa usando sentiment analysis
 # Detecta problemas de ritmo emocional y verifica coherencia con estructura
+#
+# RENDIMIENTO: las ventanas de TODOS los capítulos se tokenizan una sola vez
+# y se infieren en lotes de tamaño fijo bajo torch.inference_mode(); las
+# valencias viajan como arrays de NumPy hasta construir la salida JSON.
+# El pipeline se mantiene caliente entre invocaciones (registro por proceso)
+# y puede usar un backend int8 u ONNX Runtime (SENTIMENT_BACKEND).
 # =============================================================================
 
 import logging
 import json
 import os
+import sys
 import re
 from typing import List, Dict, Any, Tuple
 import numpy as np
 
 # NOTA: Se ha eliminado el import global de transformers para evitar Cold Start timeouts.
-# Se importa dentro de la clase EmotionalArcAnalyzer.
+# Se importa dentro de get_sentiment_pipeline() la primera vez que se necesita.
+
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+    from config_models import get_emotional_analysis_config
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.config_models import get_emotional_analysis_config
 
 logging.basicConfig(level=logging.INFO)
 
+# =============================================================================
+# REGISTRO DE MODELOS (por proceso)
+# =============================================================================
+# El worker de Functions reutiliza el proceso entre invocaciones: el pipeline
+# se carga una vez por (modelo, backend) y queda caliente para las siguientes.
+# Un fallo transitorio de carga no se cachea; la ausencia de transformers sí.
+
+_PIPELINE_REGISTRY: Dict[Tuple[str, str], Any] = {}
+
+
+def _load_model(model_name: str, backend: str):
+    """Carga el modelo de clasificación según el backend configurado."""
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            logging.info("⚙️ Backend ONNX Runtime (export desde PyTorch)")
+            return ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+        except ImportError:
+            logging.warning("⚠️ optimum[onnxruntime] no instalado. Usando backend torch.")
+
+    from transformers import AutoModelForSequenceClassification
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    if backend == "torch_int8":
+        import torch
+        logging.info("⚙️ Backend PyTorch con cuantización dinámica int8")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return model
+
+
+def get_sentiment_pipeline(model_name: str, backend: str = "torch", max_tokens: int = 512):
+    """
+    Devuelve el pipeline de sentiment del registro, cargándolo la primera vez.
+    None si transformers no está disponible (se usa el análisis léxico).
+    """
+    key = (model_name, backend)
+    if key in _PIPELINE_REGISTRY:
+        logging.info(f"♻️ Modelo de sentiment en caliente: {model_name} ({backend})")
+        return _PIPELINE_REGISTRY[key]
+
+    # --- LAZY LOADING: Importar transformers SOLO al cargar el modelo ---
+    try:
+        logging.info("⏳ Intentando cargar transformers pipeline...")
+        from transformers import pipeline, AutoTokenizer
+
+        logging.info(f"🤖 Cargando modelo de sentiment: {model_name} ({backend})")
+        sentiment_pipeline = pipeline(
+            "sentiment-analysis",
+            model=_load_model(model_name, backend),
+            tokenizer=AutoTokenizer.from_pretrained(model_name),
+            truncation=True,
+            max_length=max_tokens
+        )
+        logging.info("✅ Modelo cargado exitosamente")
+
+    except ImportError:
+        logging.warning("⚠️ Transformers no instalado. Se usará análisis léxico simple (Fallback).")
+        sentiment_pipeline = None
+    except Exception as e:
+        logging.error(f"❌ Error cargando modelo: {e}")
+        return None
+    # -----------------------------------------------------------------------
+
+    _PIPELINE_REGISTRY[key] = sentiment_pipeline
+    return sentiment_pipeline
+
+
 class EmotionalArcAnalyzer:
     """
     Analiza el arco emocional de un manuscrito mediante sentiment analysis.
     """
 
-    def __init__(self, model_name: str = "finiteautomata/beto-sentiment-analysis"):
+    def __init__(
+        self,
+        model_name: str = "finiteautomata/beto-sentiment-analysis",
+        batch_size: int = 16,
+        max_tokens: int = 512,
+        backend: str = "torch"
+    ):
         """
         Inicializa el analizador emocional.
 
         Args:
             model_name: Modelo de HuggingFace para sentiment analysis en español
+            batch_size: Ventanas por lote de inferencia
+            max_tokens: Longitud máxima de cada ventana en tokens
+            backend: "torch", "torch_int8" u "onnx" (ver config_models)
         """
         self.model_name = model_name
-        self.sentiment_analyzer = None
-
-        # --- LAZY LOADING: Importar transformers SOLO al instanciar la clase ---
-        try:
-            logging.info("⏳ Intentando cargar transformers pipeline...")
-            from transformers import pipeline
-            
-            logging.info(f"🤖 Cargando modelo de sentiment: {model_name}")
-            self.sentiment_analyzer = pipeline(
-                "sentiment-analysis",
-                model=model_name,
-                truncation=True,
-                max_length=512
-            )
-            logging.info("✅ Modelo cargado exitosamente")
-            
-        except ImportError:
-            logging.warning("⚠️ Transformers no instalado. Se usará análisis léxico simple (Fallback).")
-            self.sentiment_analyzer = None
-        except Exception as e:
-            logging.error(f"❌ Error cargando modelo: {e}")
-            self.sentiment_analyzer = None
-        # -----------------------------------------------------------------------
+        self.batch_size = max(1, batch_size)
+        self.max_tokens = max_tokens
+        self.sentiment_analyzer = get_sentiment_pipeline(model_name, backend, max_tokens)
 
 
     def analyze_text_sentiment(self, text: str) -> Dict[str, float]:
@@ -65,31 +139,74 @@ class EmotionalArcAnalyzer:
         Returns:
             {"label": "POS/NEG/NEU", "score": 0.0-1.0, "valence": -1.0 a 1.0}
         """
+        valences, labels, scores = self.score_windows([text])
+        return {
+            "label": str(labels[0]),
+            "score": float(scores[0]),
+            "valence": float(valences[0])
+        }
+
+
+    def score_windows(self, windows: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sentimiento de un lote de ventanas.
+
+        Returns:
+            (valencias, etiquetas, scores) — arrays alineados con windows
+        """
+        if not windows:
+            return np.zeros(0), np.array([], dtype=object), np.zeros(0)
+
         if self.sentiment_analyzer:
             try:
-                result = self.sentiment_analyzer(text[:512])[0]  # Truncar a 512 chars
-                label = result['label']
-                score = result['score']
-
-                # Convertir a valencia (-1 a 1)
-                if label == 'POS':
-                    valence = score
-                elif label == 'NEG':
-                    valence = -score
-                else:  # NEU
-                    valence = 0.0
-
-                return {
-                    "label": label,
-                    "score": score,
-                    "valence": valence
-                }
-
+                return self._score_windows_batched(windows)
             except Exception as e:
                 logging.error(f"Error en análisis de sentimiento (ML): {e}")
-                return self._fallback_sentiment(text)
-        else:
-            return self._fallback_sentiment(text)
+
+        results = [self._fallback_sentiment(window) for window in windows]
+        return (
+            np.array([r['valence'] for r in results], dtype=float),
+            np.array([r['label'] for r in results], dtype=object),
+            np.array([r['score'] for r in results], dtype=float)
+        )
+
+
+    def _score_windows_batched(self, windows: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Inferencia por lotes con el modelo del pipeline.
+
+        Tokeniza todas las ventanas de una vez (truncado por tokens, no por
+        caracteres) y las agrupa por longitud para minimizar el padding.
+        """
+        import torch
+
+        tokenizer = self.sentiment_analyzer.tokenizer
+        model = self.sentiment_analyzer.model
+
+        encodings = tokenizer(windows, truncation=True, max_length=self.max_tokens)
+        keys = list(encodings.keys())
+        lengths = np.array([len(ids) for ids in encodings['input_ids']])
+        order = np.argsort(lengths, kind='stable')
+
+        probs = np.zeros((len(windows), model.config.num_labels), dtype=np.float32)
+
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch_idx = order[start:start + self.batch_size]
+                features = [{key: encodings[key][i] for key in keys} for i in batch_idx]
+                batch = tokenizer.pad(features, return_tensors='pt')
+                batch = {key: value.to(model.device) for key, value in batch.items()}
+                logits = model(**batch).logits
+                probs[batch_idx] = torch.softmax(logits, dim=-1).float().cpu().numpy()
+
+        # Convertir a valencia (-1 a 1): POS → score, NEG → -score, NEU → 0
+        label_names = np.array([model.config.id2label[i] for i in range(probs.shape[1])], dtype=object)
+        best = probs.argmax(axis=1)
+        scores = probs[np.arange(len(best)), best].astype(float)
+        labels = label_names[best]
+        valences = np.where(labels == 'POS', scores, np.where(labels == 'NEG', -scores, 0.0))
+
+        return valences, labels, scores
 
 
     def _fallback_sentiment(self, text: str) -> Dict[str, float]:
@@ -138,16 +255,48 @@ class EmotionalArcAnalyzer:
         words = text.split()
         windows = []
 
-        step_size = window_size // 2  # Overlap de 50%
+        step_size = max(1, window_size // 2)  # Overlap de 50%
 
         for i in range(0, len(words), step_size):
-            window = ' '.join(words[i:i + window_size])
-            if len(window.split()) >= 50:  # Mínimo 50 palabras
-                windows.append(window)
+            window_words = words[i:i + window_size]
+            if len(window_words) >= 50:  # Mínimo 50 palabras
+                windows.append(' '.join(window_words))
 
         return windows
 
 
+    def analyze_chapters(
+        self,
+        chapters: List[Tuple[Any, str]],
+        window_size: int = 500
+    ) -> List[Dict[str, Any]]:
+        """
+        Analiza el arco emocional de varios capítulos en una sola pasada
+        de inferencia (todas las ventanas del libro en lotes).
+
+        Args:
+            chapters: Lista de (chapter_id, contenido)
+            window_size: Tamaño de ventana en palabras
+
+        Returns:
+            Lista de arcos (ver analyze_chapter_arc), en el mismo orden
+        """
+        all_windows = []
+        bounds = []
+        for _, content in chapters:
+            windows = self.create_sliding_windows(content, window_size)
+            bounds.append((len(all_windows), len(all_windows) + len(windows)))
+            all_windows.extend(windows)
+
+        logging.info(f"📊 Analizando {len(all_windows)} ventanas de {len(chapters)} capítulos (lotes de {self.batch_size})")
+        valences, labels, _ = self.score_windows(all_windows)
+
+        return [
+            self._build_chapter_arc(chapter_id, valences[start:end], labels[start:end])
+            for (chapter_id, _), (start, end) in zip(chapters, bounds)
+        ]
+
+
     def analyze_chapter_arc(
         self,
         chapter_content: str,
@@ -172,11 +321,12 @@ class EmotionalArcAnalyzer:
                 "critical_moments": [...]
             }
         """
-        logging.info(f"📊 Analizando arco emocional del capítulo {chapter_id}")
+        return self.analyze_chapters([(chapter_id, chapter_content)], window_size)[0]
 
-        windows = self.create_sliding_windows(chapter_content, window_size)
 
-        if not windows:
+    def _build_chapter_arc(self, chapter_id: Any, valences: np.ndarray, labels: np.ndarray) -> Dict[str, Any]:
+        """Métricas de un capítulo a partir de las valencias de sus ventanas."""
+        if len(valences) == 0:
             return {
                 "chapter_id": chapter_id,
                 "error": "Capítulo demasiado corto para análisis",
@@ -184,26 +334,21 @@ class EmotionalArcAnalyzer:
                 "avg_valence": 0.0
             }
 
-        # Analizar cada ventana
-        trajectory = []
-        for i, window in enumerate(windows):
-            sentiment = self.analyze_text_sentiment(window)
-            trajectory.append({
-                "window_index": i,
-                "valence": sentiment['valence'],
-                "label": sentiment['label']
-            })
-
         # Calcular métricas
-        valences = [point['valence'] for point in trajectory]
-        avg_valence = np.mean(valences)
-        emotional_range = max(valences) - min(valences)
+        avg_valence = valences.mean()
+        emotional_range = valences.max() - valences.min()
 
         # Detectar patrón emocional
         pattern = self._detect_emotional_pattern(valences)
 
         # Identificar momentos críticos (picos y valles)
-        critical_moments = self._find_critical_moments(trajectory, chapter_content, window_size)
+        critical_moments = self._find_critical_moments(valences)
+
+        # La trayectoria solo se materializa como dicts para la salida JSON
+        trajectory = [
+            {"window_index": i, "valence": float(valence), "label": str(label)}
+            for i, (valence, label) in enumerate(zip(valences, labels))
+        ]
 
         return {
             "chapter_id": chapter_id,
@@ -212,7 +357,7 @@ class EmotionalArcAnalyzer:
             "emotional_range": float(emotional_range),
             "emotional_pattern": pattern,
             "critical_moments": critical_moments,
-            "total_windows": len(windows)
+            "total_windows": len(valences)
         }
 
 
@@ -256,40 +401,37 @@ class EmotionalArcAnalyzer:
             return "NEUTRAL"
 
 
-    def _find_critical_moments(
-        self,
-        trajectory: List[Dict],
-        chapter_content: str,
-        window_size: int
-    ) -> List[Dict]:
+    def _find_critical_moments(self, valences: np.ndarray) -> List[Dict]:
         """
         Identifica picos emocionales (altos y bajos) en el capítulo.
         """
-        valences = [point['valence'] for point in trajectory]
+        valences = np.asarray(valences, dtype=float)
 
         if len(valences) < 3:
             return []
 
-        critical = []
-
-        # Encontrar máximos y mínimos locales
-        for i in range(1, len(valences) - 1):
-            if valences[i] > valences[i-1] and valences[i] > valences[i+1]:
-                # Pico positivo
-                critical.append({
-                    "type": "PICO_POSITIVO",
-                    "window_index": i,
-                    "valence": valences[i],
-                    "description": "Momento de mayor intensidad emocional positiva"
-                })
-            elif valences[i] < valences[i-1] and valences[i] < valences[i+1]:
-                # Valle negativo
-                critical.append({
-                    "type": "VALLE_NEGATIVO",
-                    "window_index": i,
-                    "valence": valences[i],
-                    "description": "Momento de mayor intensidad emocional negativa"
-                })
+        # Encontrar máximos y mínimos locales (comparación vectorizada con vecinos)
+        center, left, right = valences[1:-1], valences[:-2], valences[2:]
+        peaks = np.flatnonzero((center > left) & (center > right)) + 1
+        valleys = np.flatnonzero((center < left) & (center < right)) + 1
+
+        critical = [
+            {
+                "type": "PICO_POSITIVO",
+                "window_index": int(i),
+                "valence": float(valences[i]),
+                "description": "Momento de mayor intensidad emocional positiva"
+            }
+            for i in peaks
+        ] + [
+            {
+                "type": "VALLE_NEGATIVO",
+                "window_index": int(i),
+                "valence": float(valences[i]),
+                "description": "Momento de mayor intensidad emocional negativa"
+            }
+            for i in valleys
+        ]
 
         # Limitar a los 3 más extremos
         critical.sort(key=lambda x: abs(x['valence']), reverse=True)
@@ -297,6 +439,7 @@ class EmotionalArcAnalyzer:
         return critical[:3]
 
 
+@offload_payloads(fields=('emotional_arcs',))
 def main(consolidated_chapters: List[Dict]) -> Dict:
     """
     Analiza el arco emocional completo de la obra.
@@ -314,11 +457,15 @@ def main(consolidated_chapters: List[Dict]) -> Dict:
     try:
         logging.info("🎭 Iniciando Análisis de Arco Emocional...")
 
-        analyzer = EmotionalArcAnalyzer()
-
-        chapter_arcs = []
-        all_valences = []
+        config = get_emotional_analysis_config()
+        analyzer = EmotionalArcAnalyzer(
+            model_name=config['sentiment_model'],
+            batch_size=config['batch_size'],
+            max_tokens=config['max_tokens'],
+            backend=config['backend']
+        )
 
+        chapters = []
         for chapter in consolidated_chapters:
             chapter_id = chapter.get('chapter_id', 0)
             content = chapter.get('content', '')
@@ -327,15 +474,20 @@ def main(consolidated_chapters: List[Dict]) -> Dict:
                 logging.warning(f"⚠️ Capítulo {chapter_id} demasiado corto, omitiendo")
                 continue
 
-            arc = analyzer.analyze_chapter_arc(content, chapter_id)
-            chapter_arcs.append(arc)
+            chapters.append((chapter_id, content))
+
+        # Una sola pasada de inferencia para todo el libro
+        chapter_arcs = analyzer.analyze_chapters(chapters, config['window_size'])
 
-            # Agregar valencias para análisis global
-            all_valences.extend([point['valence'] for point in arc['emotional_trajectory']])
+        # Agregar valencias para análisis global
+        all_valences = np.array(
+            [point['valence'] for arc in chapter_arcs for point in arc['emotional_trajectory']],
+            dtype=float
+        )
 
         # Análisis global
-        global_avg_valence = np.mean(all_valences) if all_valences else 0.0
-        global_pattern = analyzer._detect_emotional_pattern(all_valences) if all_valences else "INDETERMINADO"
+        global_avg_valence = all_valences.mean() if all_valences.size else 0.0
+        global_pattern = analyzer._detect_emotional_pattern(all_valences) if all_valences.size else "INDETERMINADO"
 
         # Diagnosticar problemas
         diagnostics = []
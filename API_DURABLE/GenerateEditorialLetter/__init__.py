@@ -19,8 +19,10 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 try:
     from vertex_utils import resolve_vertex_model_id
+    from payload_store import offload_payloads
 except ImportError:
     from API_DURABLE.vertex_utils import resolve_vertex_model_id
+    from API_DURABLE.payload_store import offload_payloads
 
 logging.basicConfig(level=logging.INFO)
 
@@ -128,6 +130,7 @@ def build_smart_manuscript(fragments: list, consolidated: list) -> str:
     return "\n".join(hybrid_text)
 
 
+@offload_payloads(fields=('carta_editorial', 'carta_markdown'))
 def main(input_data: dict) -> dict:
     """
     Genera la carta editorial usando Claude Opus 4.5 con parámetro 'effort'.
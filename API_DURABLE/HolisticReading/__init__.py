@@ -9,11 +9,19 @@
 import logging
 import json
 import os
+import sys
 import time
 from google import genai
 from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+
 logging.basicConfig(level=logging.INFO)
 
 # Prompt OPTIMIZADO - (TU PROMPT ORIGINAL INTACTO)
@@ -114,11 +122,17 @@ def call_gemini_pro_new_sdk(client, prompt):
         )
     )
 
+@offload_payloads()
 def main(full_book_text: str) -> dict:
     """Lectura Holística del libro completo"""
     try:
         start_time = time.time()
         
+        # El orquestador envía los fragmentos (BlobRef) y aquí se arma el texto
+        if isinstance(full_book_text, dict):
+            fragments = full_book_text.get('fragments', [])
+            full_book_text = "\n".join([f"CAP {f['title']}: {f['content'][:600]}..." for f in fragments])
+        
         # --- Lógica de estimación de tokens original ---
         word_count = len(full_book_text.split())
         token_estimate = int(word_count * 1.33)
@@ -1,6 +1,6 @@
 """
 HTTP API Endpoints para LYA Web Platform
-VERSIÓN 5.0 - FIX: save_all_decisions + nuevos endpoints
+VERSIÓN 5.1 - Storage asíncrono (aio) con cliente compartido por worker
 """
 
 import azure.functions as func
@@ -12,12 +12,64 @@ import base64
 import hmac
 import hashlib
 import re
+import sys
+import gzip
+import asyncio
 from datetime import datetime, timedelta
-from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobBlock
+
+from . import storage
+
+# Compresión brotli opcional (gzip siempre disponible)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+from .storage import OUTPUTS_CONTAINER, INPUTS_CONTAINER
+
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from project_index import upsert_project, remove_project, query_projects
+    from payload_store import blobref
+    from progress_model import is_structured, progress_label, progress_version
+    from manuscript_export import EXPORT_FORMATS, export_to_blob
+    from bible_deps import BIBLE_FILE, APPLIED_BIBLE_FILE, bible_hash, bible_version_path, diff_bible, recompute_summary
+    from artifact_shards import (
+        chapters_index_path, chapter_shard_path, changes_shard_path,
+        chapter_summary, group_changes_by_chapter, count_by_status, page_changes
+    )
+except ImportError:
+    from API_DURABLE.project_index import upsert_project, remove_project, query_projects
+    from API_DURABLE.payload_store import blobref
+    from API_DURABLE.progress_model import is_structured, progress_label, progress_version
+    from API_DURABLE.manuscript_export import EXPORT_FORMATS, export_to_blob
+    from API_DURABLE.bible_deps import BIBLE_FILE, APPLIED_BIBLE_FILE, bible_hash, bible_version_path, diff_bible, recompute_summary
+    from API_DURABLE.artifact_shards import (
+        chapters_index_path, chapter_shard_path, changes_shard_path,
+        chapter_summary, group_changes_by_chapter, count_by_status, page_changes
+    )
+
+from . import decisions
 
 # Configuración
 ADMIN_PASSWORD = os.environ.get('LYA_PASSWORD', 'lya2025')
 TOKEN_SECRET = os.environ.get('LYA_TOKEN_SECRET', 'lya-secret-key-2025')
+
+# Upload por bloques: tamaño fijo (el cliente lo usa también para la huella)
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+UPLOAD_SESSION_BLOB = '_upload.json'
+FINGERPRINT_PREFIX = '_fingerprints'
+
+# Respuestas más pequeñas que esto se envían sin comprimir
+COMPRESSION_MIN_BYTES = 1024
+
+# Long-poll de progreso: espera máxima por request y cadencia de consulta interna
+PROGRESS_WAIT_MAX_SECONDS = 25
+PROGRESS_CHECK_INTERVAL_SECONDS = 2
 logging.basicConfig(level=logging.INFO)
 
 # =============================================================================
@@ -45,14 +97,18 @@ async def main(req: func.HttpRequest, starter: str) -> func.HttpResponse:
         if auth_error: return auth_error
 
         if raw_route == 'projects':
-            return handle_projects_list(req, method)
+            return await handle_projects_list(req, method)
 
         if len(parts) >= 2 and parts[0] == 'project':
             job_id = parts[1]
 
-            # UPLOAD
-            if method == 'POST' and job_id == 'upload':
-                return handle_upload(req)
+            # UPLOAD (init / bloques / commit)
+            if job_id == 'upload':
+                return await handle_upload(req, method, parts[2:])
+
+            # PROGRESO (long-poll: ?since=<version>&wait=<segundos>)
+            if method == 'GET' and len(parts) == 3 and parts[2] == 'progress':
+                return await get_progress_long_poll(client, job_id, req)
 
             # STATUS
             if method == 'GET' and len(parts) == 3 and parts[2] == 'status':
@@ -64,45 +120,55 @@ async def main(req: func.HttpRequest, starter: str) -> func.HttpResponse:
 
             # DELETE
             if method == 'DELETE' and len(parts) == 2:
-                return delete_project(job_id)
+                return await delete_project(job_id)
 
             # INFO
-            if method == 'GET' and len(parts) == 2: return get_project_info(job_id)
+            if method == 'GET' and len(parts) == 2: return await get_project_info(req, job_id)
             
             # --- BIBLIA ---
             if len(parts) >= 3 and parts[2] == 'bible':
                 if len(parts) == 4 and parts[3] == 'approve' and method == 'POST':
                     return await approve_bible_and_resume(client, job_id)
-                if method == 'GET': return get_bible(job_id)
-                if method == 'POST': return save_bible(job_id, req)
+                # recompute: GET [/{recompute_job_id}] consulta el recalculo incremental
+                if len(parts) >= 4 and parts[3] == 'recompute' and method == 'GET':
+                    return await get_recompute_job_status(client, job_id, parts[4] if len(parts) == 5 else None)
+                if method == 'GET': return await get_bible(req, job_id)
+                if method == 'POST': return await save_bible(job_id, req)
 
             # --- CARTA EDITORIAL (NUEVO 5.0) ---
             if len(parts) >= 3 and parts[2] == 'editorial-letter':
-                if method == 'GET': return get_editorial_letter(job_id)
-                if method == 'POST' and len(parts) == 4 and parts[3] == 'regenerate':
-                    return regenerate_editorial_letter(job_id)
+                # regenerate: POST arranca el trabajo, GET [/{letter_job_id}] consulta su progreso
+                if len(parts) >= 4 and parts[3] == 'regenerate':
+                    if method == 'POST': return await regenerate_editorial_letter(client, job_id)
+                    if method == 'GET': return await get_letter_job_status(client, job_id, parts[4] if len(parts) == 5 else None)
+                if method == 'GET': return await get_editorial_letter(req, job_id)
             
             # --- NOTAS DE MARGEN (NUEVO 5.0) ---
             if len(parts) >= 3 and parts[2] == 'margin-notes':
-                if method == 'GET': return get_margin_notes(job_id)
+                if method == 'GET': return await get_margin_notes(req, job_id)
 
             # MANUSCRITOS
             if len(parts) >= 3 and parts[2] == 'manuscript':
-                if parts[3] == 'edited': return get_manuscript_edited(job_id)
-                if parts[3] == 'annotated': return get_manuscript_annotated(job_id)
+                if parts[3] == 'edited': return await get_manuscript_edited(req, job_id)
+                if parts[3] == 'annotated': return await get_manuscript_annotated(req, job_id)
             
             # CAMBIOS
             if len(parts) >= 3 and parts[2] == 'changes':
                 if len(parts) == 3: 
-                    return get_changes(job_id)
+                    # ?chapter=&status=&tipo=&cursor=&limit= -> página; sin parámetros -> archivo completo
+                    if req.params: return await get_changes_page(req, job_id)
+                    return await get_changes(req, job_id)
                 if len(parts) == 4 and method == 'POST': 
                     # FIX: Ahora actualiza en lugar de sobrescribir
-                    return save_all_decisions_fixed(job_id, req)
+                    return await save_all_decisions_fixed(job_id, req)
                 if len(parts) == 5: 
-                    return save_change_decision(job_id, parts[3], req)
+                    return await save_change_decision(job_id, parts[3], req)
 
-            if len(parts) >= 3 and parts[2] == 'export': return export_manuscript(job_id)
-            if len(parts) >= 3 and parts[2] == 'chapters': return get_chapters(job_id)
+            if len(parts) >= 3 and parts[2] == 'export': return await export_manuscript(req, job_id)
+            if len(parts) >= 3 and parts[2] == 'chapters':
+                if len(parts) == 3: return await get_chapters(req, job_id)
+                if parts[3] == 'index': return await get_chapters_index(req, job_id)
+                return await get_chapter(req, job_id, parts[3])
 
         return error_response(f'Ruta no encontrada: {raw_route}', 404)
 
@@ -117,25 +183,40 @@ async def approve_bible_and_resume(client, instance_id):
     """
     1. Marca la metadata como aprobada.
     2. Envía el evento 'BibleApproved' al orquestador para que salga de la pausa.
+       Si el proyecto ya terminó, la Biblia editada se aplica con un recalculo
+       incremental (solo los capítulos afectados, ver bible_deps.py).
     """
     try:
         logging.info(f"👍 Aprobando biblia para: {instance_id}")
         
         # 1. Actualizar Metadata (Para historial)
         try:
-            c = get_blob_service().get_blob_client("lya-outputs", f"{instance_id}/metadata.json")
-            if c.exists():
-                meta = json.loads(c.download_blob().readall())
+            meta = await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{instance_id}/metadata.json")
+            if meta is not None:
                 meta['bible_approved'] = True
                 meta['bible_approved_at'] = datetime.utcnow().isoformat() + 'Z'
-                c.upload_blob(json.dumps(meta), overwrite=True)
+                await storage.write_json(OUTPUTS_CONTAINER, f"{instance_id}/metadata.json", meta)
         except Exception as e:
             logging.warning(f"No se pudo actualizar metadata (no crítico): {e}")
 
-        # 2. DESPERTAR AL ORQUESTADOR
-        await client.raise_event(instance_id, "BibleApproved")
+        # Proyecto terminado: recalculo incremental en lugar de reanudar
+        status = await client.get_status(instance_id, show_history=False)
+        if status and status.runtime_status and status.runtime_status not in (
+                df.OrchestrationRuntimeStatus.Running, df.OrchestrationRuntimeStatus.Pending):
+            return await start_bible_recompute(client, instance_id)
+
+        # 2. DESPERTAR AL ORQUESTADOR con la huella de la Biblia aprobada (copia inmutable):
+        #    el orquestador reutiliza lo especulativo si coincide con la que ya usó
+        approved = await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{instance_id}/{BIBLE_FILE}")
+        event = None
+        if approved is not None:
+            version = bible_hash(approved)
+            await storage.write_json(OUTPUTS_CONTAINER, bible_version_path(instance_id, version), approved)
+            event = {'bible_hash': version, 'bible': blobref(OUTPUTS_CONTAINER, bible_version_path(instance_id, version))}
+        await client.raise_event(instance_id, "BibleApproved", event)
         
-        return success_response({'message': 'Biblia aprobada. Reanudando edición.'})
+        return success_response({'message': 'Biblia aprobada. Reanudando edición.',
+                                 'bible_hash': event['bible_hash'] if event else None})
         
     except Exception as e:
         logging.error(f"Error reanudando orquestador: {e}")
@@ -151,7 +232,9 @@ async def get_orchestrator_status(client, instance_id):
         
         if status:
             rt = str(status.runtime_status.value) if hasattr(status.runtime_status, 'value') else str(status.runtime_status)
-            cust = status.custom_status
+            # custom_status estructurado (progress_model): el texto sigue viajando en custom_status
+            progress = status.custom_status if is_structured(status.custom_status) else None
+            cust = progress_label(status.custom_status) or None
             
             # --- TRADUCTOR DE ESTADOS ---
             cust_str = str(cust).lower() if cust else ""
@@ -193,6 +276,8 @@ async def get_orchestrator_status(client, instance_id):
                 'instance_id': instance_id,
                 'runtime_status': rt,
                 'custom_status': cust,          
+                'progress': progress,
+                'version': progress_version(rt, status.custom_status),
                 'friendly_message': friendly,   
                 'is_completed': rt == 'Completed',
                 'is_failed': rt == 'Failed',
@@ -202,9 +287,8 @@ async def get_orchestrator_status(client, instance_id):
             
         # Fallback Metadata
         try:
-            c = get_blob_service().get_blob_client("lya-outputs", f"{instance_id}/metadata.json")
-            if c.exists():
-                meta = json.loads(c.download_blob().readall())
+            meta = await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{instance_id}/metadata.json")
+            if meta is not None:
                 is_terminated = meta.get('status') == 'terminated'
                 return success_response({
                     'instance_id': instance_id,
@@ -220,16 +304,39 @@ async def get_orchestrator_status(client, instance_id):
         return error_response('Proceso no encontrado', 404)
     except Exception as e: return error_response(str(e), 500)
     
+async def get_progress_long_poll(client, instance_id, req):
+    """
+    Long-poll de progreso: responde en cuanto la versión del estado difiere de
+    ?since= (o el proceso termina); si no cambia en ?wait= segundos responde
+    con changed=false. La consulta al estado durable ocurre dentro de UNA
+    ejecución, en lugar de una ejecución de la Function por cada poll.
+    """
+    since = req.params.get('since')
+    wait = req.params.get('wait', '')
+    wait = min(int(wait), PROGRESS_WAIT_MAX_SECONDS) if wait.isdigit() else PROGRESS_WAIT_MAX_SECONDS
+    deadline = asyncio.get_running_loop().time() + wait
+
+    while True:
+        response = await get_orchestrator_status(client, instance_id)
+        if response.status_code != 200: return response
+        data = json.loads(response.get_body())
+
+        finished = data.get('runtime_status') not in ('Running', 'Pending')
+        if finished or data.get('version') != since or asyncio.get_running_loop().time() >= deadline:
+            data['changed'] = data.get('version') != since
+            return success_response(data)
+        await asyncio.sleep(PROGRESS_CHECK_INTERVAL_SECONDS)
+
 async def terminate_orchestrator(client, instance_id, req):
     try:
         await client.terminate(instance_id, 'User termination')
         try:
-            c = get_blob_service().get_blob_client("lya-outputs", f"{instance_id}/metadata.json")
-            if c.exists():
-                meta = json.loads(c.download_blob().readall())
+            meta = await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{instance_id}/metadata.json")
+            if meta is not None:
                 meta['status'] = 'terminated'
                 meta['terminated_at'] = datetime.utcnow().isoformat() + 'Z'
-                c.upload_blob(json.dumps(meta), overwrite=True)
+                await storage.write_json(OUTPUTS_CONTAINER, f"{instance_id}/metadata.json", meta)
+                await storage.run_sync(upsert_project, meta)
         except: pass
         return success_response({'terminated': True})
     except Exception as e: return error_response(str(e), 500)
@@ -238,66 +345,192 @@ async def terminate_orchestrator(client, instance_id, req):
 # OTRAS FUNCIONES
 # =============================================================================
 
-def handle_upload(req):
+# =============================================================================
+# UPLOAD POR BLOQUES (REANUDABLE)
+# =============================================================================
+# POST project/upload/init                    -> {job_id, block_size, total_blocks, received_blocks}
+# GET  project/upload/{job_id}                -> bloques ya recibidos (para reanudar)
+# PUT  project/upload/{job_id}/block/{n}      -> cuerpo binario del bloque n
+# POST project/upload/{job_id}/commit         -> ensambla el blob y crea el proyecto
+#
+# Cada bloque se hashea al recibirlo y su SHA-256 viaja dentro del block id,
+# así el estado vive en el propio blob (sin carreras entre PUTs paralelos).
+# La huella del manuscrito es SHA-256(digest_0 + digest_1 + ...): el cliente
+# la calcula antes de subir y el init detecta duplicados sin transferir nada.
+# Solo se indexan huellas calculadas en el servidor al hacer commit, y cada
+# duplicado recibe su propia copia del blob (copia dentro de storage), así
+# borrar el proyecto original no deja a los demás sin manuscrito.
+
+async def handle_upload(req, method, rest):
     try:
-        body = req.get_json()
-        filename, project_name, content = body.get('filename'), body.get('projectName'), body.get('content')
-        if not all([filename, project_name, content]): return error_response('Faltan datos', 400)
-        
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', project_name)[:30]
-        job_id = f"{safe_name}_{timestamp}"
-        
-        service = get_blob_service()
-        try: service.create_container("lya-inputs")
-        except: pass
-        try: service.create_container("lya-outputs")
-        except: pass
-        
-        service.get_blob_client("lya-inputs", f"{job_id}/{filename}").upload_blob(base64.b64decode(content), overwrite=True)
-
-        meta = {
-            'job_id': job_id,
-            'project_name': project_name,
-            'book_name': project_name,  # FIX: Agregar book_name desde el inicio
-            'original_filename': filename,
-            'status': 'starting',
-            'created_at': datetime.utcnow().isoformat() + 'Z'
-        }
-        service.get_blob_client("lya-outputs", f"{job_id}/metadata.json").upload_blob(json.dumps(meta), overwrite=True)
-        
-        return success_response({'job_id': job_id, 'status': 'uploaded', 'blob_path': f"{job_id}/{filename}"})
+        if method == 'POST' and rest in ([], ['init']): return await init_upload(req)
+        if method == 'GET' and len(rest) == 1: return await get_upload_status(rest[0])
+        if method == 'PUT' and len(rest) == 3 and rest[1] == 'block': return await put_upload_block(req, rest[0], rest[2])
+        if method == 'POST' and len(rest) == 2 and rest[1] == 'commit': return await commit_upload(rest[0])
+        return error_response('Operación de upload no soportada', 404)
     except Exception as e: return error_response(str(e), 500)
 
-def delete_project(job_id):
+def make_block_id(index, digest): return base64.b64encode(index.to_bytes(4, 'big') + digest).decode()
+
+def parse_block_id(block_id):
+    raw = base64.b64decode(block_id)
+    return int.from_bytes(raw[:4], 'big'), raw[4:]
+
+def total_blocks(size): return max(1, -(-size // UPLOAD_BLOCK_SIZE))
+
+async def get_upload_session(job_id): return await storage.read_json_or_none(INPUTS_CONTAINER, f"{job_id}/{UPLOAD_SESSION_BLOB}")
+
+async def create_project_metadata(job_id, project_name, filename, extra=None):
+    meta = {
+        'job_id': job_id,
+        'project_name': project_name,
+        'book_name': project_name,  # FIX: Agregar book_name desde el inicio
+        'original_filename': filename,
+        'status': 'starting',
+        'created_at': datetime.utcnow().isoformat() + 'Z'
+    }
+    meta.update(extra or {})
+    await storage.write_json(OUTPUTS_CONTAINER, f"{job_id}/metadata.json", meta)
+    await storage.run_sync(upsert_project, meta)
+    return meta
+
+async def find_duplicate(fingerprint, size):
+    if not fingerprint or not re.fullmatch(r'[0-9a-f]{64}', fingerprint): return None
+    known = await storage.read_json_or_none(INPUTS_CONTAINER, f"{FINGERPRINT_PREFIX}/{fingerprint}.json")
+    if not known or known.get('size') != size: return None
+    # El proyecto original pudo borrarse (o el blob cambiar desde el commit)
+    try: props = await storage.blob(INPUTS_CONTAINER, known['blob_path']).get_blob_properties()
+    except ResourceNotFoundError: return None
+    return known if props.size == size else None
+
+async def init_upload(req):
+    body = req.get_json()
+    filename, project_name, size = body.get('filename'), body.get('projectName'), body.get('size')
+    if not all([filename, project_name]) or not isinstance(size, int) or size <= 0: return error_response('Faltan datos', 400)
+    if size > UPLOAD_MAX_SIZE: return error_response('Archivo demasiado grande', 413)
+
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    safe_name = re.sub(r'[^a-zA-Z0-9]', '_', project_name)[:30]
+    job_id = f"{safe_name}_{timestamp}"
+    filename = os.path.basename(filename)
+
+    await asyncio.gather(storage.ensure_container(INPUTS_CONTAINER), storage.ensure_container(OUTPUTS_CONTAINER))
+
+    # Manuscrito ya subido: el cliente no transfiere nada, el blob se copia dentro de storage
+    duplicate = await find_duplicate(body.get('fingerprint'), size)
+    if duplicate:
+        blob_path = f"{job_id}/{filename}"
+        await storage.copy_blob(INPUTS_CONTAINER, duplicate['blob_path'], blob_path)
+        logging.info(f"♻️ Upload duplicado de {duplicate['job_id']}: {duplicate['blob_path']} copiado a {blob_path}")
+        await create_project_metadata(job_id, project_name, filename, {'duplicate_of': duplicate['job_id'], 'fingerprint': body['fingerprint']})
+        return success_response({'job_id': job_id, 'status': 'uploaded', 'blob_path': blob_path, 'duplicate_of': duplicate['job_id']})
+
+    session = {
+        'filename': filename,
+        'project_name': project_name,
+        'size': size,
+        'block_size': UPLOAD_BLOCK_SIZE,
+        'total_blocks': total_blocks(size),
+        'fingerprint': body.get('fingerprint'),
+        'created_at': datetime.utcnow().isoformat() + 'Z'
+    }
+    await storage.write_json(INPUTS_CONTAINER, f"{job_id}/{UPLOAD_SESSION_BLOB}", session)
+    return success_response({'job_id': job_id, 'status': 'uploading', 'block_size': UPLOAD_BLOCK_SIZE, 'total_blocks': session['total_blocks'], 'received_blocks': []})
+
+async def received_blocks(job_id, session):
+    try: _, uncommitted = await storage.blob(INPUTS_CONTAINER, f"{job_id}/{session['filename']}").get_block_list('uncommitted')
+    except ResourceNotFoundError: return {}  # Todavía no hay ningún bloque
+    blocks = {}
+    for block in uncommitted:
+        index, digest = parse_block_id(block.id)
+        blocks[index] = (block, digest)
+    return blocks
+
+async def get_upload_status(job_id):
+    session = await get_upload_session(job_id)
+    if session is None: return error_response('Upload no encontrado', 404)
+    blocks = await received_blocks(job_id, session)
+    return success_response({'job_id': job_id, 'status': 'uploading', 'block_size': session['block_size'], 'total_blocks': session['total_blocks'], 'received_blocks': sorted(blocks)})
+
+async def put_upload_block(req, job_id, index_str):
+    session = await get_upload_session(job_id)
+    if session is None: return error_response('Upload no encontrado', 404)
+
+    if not index_str.isdigit() or int(index_str) >= session['total_blocks']: return error_response('Bloque fuera de rango', 400)
+    index = int(index_str)
+    expected = min(session['block_size'], session['size'] - index * session['block_size'])
+    data = req.get_body()
+    if len(data) != expected: return error_response(f'Tamaño de bloque inválido ({len(data)} != {expected})', 400)
+
+    digest = hashlib.sha256(data).digest()
+    await storage.blob(INPUTS_CONTAINER, f"{job_id}/{session['filename']}").stage_block(make_block_id(index, digest), data)
+    return success_response({'block': index, 'sha256': digest.hex()})
+
+async def commit_upload(job_id):
+    session = await get_upload_session(job_id)
+    if session is None: return error_response('Upload no encontrado', 404)
+
+    blob_path = f"{job_id}/{session['filename']}"
+    blocks = await received_blocks(job_id, session)
+    missing = [i for i in range(session['total_blocks']) if i not in blocks]
+    if missing: return error_response(f'Faltan bloques: {missing[:20]}', 409)
+
+    ordered = [blocks[i] for i in range(session['total_blocks'])]
+    fingerprint = hashlib.sha256(b''.join(digest for _, digest in ordered)).hexdigest()
+    if session.get('fingerprint') and session['fingerprint'] != fingerprint:
+        return error_response('La huella del archivo no coincide con los bloques recibidos', 409)
+
+    committed = storage.blob(INPUTS_CONTAINER, blob_path)
+    await committed.commit_block_list([BlobBlock(block_id=block.id) for block, _ in ordered])
+    # La huella sale de los digests calculados al recibir cada bloque; antes de
+    # indexarla se comprueba que el blob confirmado es exactamente lo declarado
+    if (await committed.get_blob_properties()).size != session['size']:
+        return error_response('El archivo confirmado no coincide con el tamaño declarado', 409)
+    await asyncio.gather(
+        storage.write_json(INPUTS_CONTAINER, f"{FINGERPRINT_PREFIX}/{fingerprint}.json", {'job_id': job_id, 'blob_path': blob_path, 'size': session['size']}),
+        create_project_metadata(job_id, session['project_name'], session['filename'], {'fingerprint': fingerprint})
+    )
+    await storage.blob(INPUTS_CONTAINER, f"{job_id}/{UPLOAD_SESSION_BLOB}").delete_blob()
+
+    logging.info(f"📤 Upload completado: {blob_path} ({session['size']:,} bytes, {session['total_blocks']} bloques)")
+    return success_response({'job_id': job_id, 'status': 'uploaded', 'blob_path': blob_path, 'fingerprint': fingerprint})
+
+async def forget_fingerprint(job_id, meta):
+    """Quita la huella del índice si apunta a este proyecto (sus duplicados tienen copia propia)."""
+    if not (meta or {}).get('fingerprint'): return
+    path = f"{FINGERPRINT_PREFIX}/{meta['fingerprint']}.json"
+    known = await storage.read_json_or_none(INPUTS_CONTAINER, path)
+    if known and known.get('job_id') == job_id: await storage.blob(INPUTS_CONTAINER, path).delete_blob()
+
+async def delete_project(job_id):
     try:
-        srv = get_blob_service()
-        for c in ["lya-outputs", "lya-inputs"]:
-            try:
-                cont = srv.get_container_client(c)
-                for b in cont.list_blobs(name_starts_with=job_id): cont.delete_blob(b.name)
-            except: pass
+        await forget_fingerprint(job_id, await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{job_id}/metadata.json"))
+        results = await asyncio.gather(
+            *[storage.delete_prefix(c, f"{job_id}/") for c in (OUTPUTS_CONTAINER, INPUTS_CONTAINER)],
+            return_exceptions=True
+        )
+        for r in results:
+            if isinstance(r, Exception): logging.warning(f"⚠️ Borrado parcial de {job_id}: {r}")
+        await storage.run_sync(remove_project, job_id)
         return success_response({'deleted': True})
     except Exception as e: return error_response(str(e), 500)
 
-def handle_projects_list(req, method):
+async def handle_projects_list(req, method):
+    """
+    GET projects?status=completed,processing&q=texto&sort=createdAt&order=desc&limit=50&cursor=...
+    Una sola lectura del índice de proyectos (project_index.py).
+    """
     try:
-        c = get_blob_service().get_container_client("lya-outputs")
-        projects = []
-        seen = set()
-        for b in c.list_blobs():
-            jid = b.name.split('/')[0]
-            if jid not in seen:
-                seen.add(jid)
-                try:
-                    bc = c.get_blob_client(f"{jid}/metadata.json")
-                    if bc.exists():
-                        m = json.loads(bc.download_blob().readall())
-                        projects.append({'id': jid, 'name': m.get('project_name'), 'status': m.get('status'), 'createdAt': m.get('created_at', '')})
-                except: pass
-        projects.sort(key=lambda x: x.get('createdAt', ''), reverse=True)
-        return success_response({'projects': projects})
-    except: return success_response({'projects': []})
+        p = req.params
+        limit = int(p['limit']) if p.get('limit', '').isdigit() else None
+        return success_response(await storage.run_sync(
+            query_projects, status=p.get('status'), search=p.get('q'),
+            sort=p.get('sort', 'createdAt'), order=p.get('order', 'desc'),
+            cursor=p.get('cursor'), limit=limit
+        ))
+    except Exception as e:
+        logging.error(f"Error listando proyectos: {e}")
+        return success_response({'projects': [], 'total': 0, 'next_cursor': None})
 
 # =============================================================================
 # AUTH HELPERS
@@ -334,250 +567,336 @@ def handle_analyze_file(req): return success_response({'word_count': 0})
 # BLOB HELPERS
 # =============================================================================
 
-def get_blob_service(): return BlobServiceClient.from_connection_string(os.environ['AzureWebJobsStorage'])
 def cors_response(): return func.HttpResponse(status_code=200, headers=get_cors_headers())
 def success_response(d): return func.HttpResponse(json.dumps(d), status_code=200, mimetype='application/json', headers=get_cors_headers())
 def error_response(m, c): return func.HttpResponse(json.dumps({'error': m}), status_code=c, mimetype='application/json', headers=get_cors_headers())
-def get_cors_headers(): return {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': '*', 'Access-Control-Allow-Headers': '*'}
+def get_cors_headers(): return {'Access-Control-Allow-Origin': '*', 'Access-Control-Allow-Methods': '*', 'Access-Control-Allow-Headers': '*', 'Access-Control-Expose-Headers': 'ETag, Content-Disposition'}
 
-def get_blob_json(jid, f):
-    try: return success_response(json.loads(get_blob_service().get_blob_client("lya-outputs", f"{jid}/{f}").download_blob().readall()))
-    except: return error_response("Not found", 404)
+def pick_encoding(req):
+    accepted = req.headers.get('Accept-Encoding', '').lower()
+    if BROTLI_AVAILABLE and 'br' in accepted: return 'br'
+    if 'gzip' in accepted: return 'gzip'
+    return None
 
-def save_blob_json(jid, f, d):
+def compress(data, encoding):
+    if encoding == 'br': return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+async def artifact_response(req, container, path, mimetype, compressible=True, extra_headers=None):
+    """
+    Artefacto con GET condicional: ETag del blob (If-None-Match -> 304),
+    cuerpo comprimido según Accept-Encoding y LRU en memoria validado por ETag.
+    """
+    entry = await storage.read_cached(container, path)
+    headers = {**get_cors_headers(), 'ETag': entry['etag'], 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding', **(extra_headers or {})}
+
+    if_none_match = [t.strip() for t in req.headers.get('If-None-Match', '').split(',') if t.strip()]
+    if entry['etag'] in if_none_match or '*' in if_none_match:
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    body = entry['data']
+    encoding = pick_encoding(req) if compressible and len(body) >= COMPRESSION_MIN_BYTES else None
+    if encoding:
+        if encoding not in entry['variants']:
+            # Comprimir es CPU: fuera del event loop
+            storage.cache_variant((container, path), entry, encoding, await asyncio.to_thread(compress, body, encoding))
+        body = entry['variants'][encoding]
+        headers['Content-Encoding'] = encoding
+
+    return func.HttpResponse(body, status_code=200, mimetype=mimetype, charset='utf-8', headers=headers)
+
+async def get_blob_json(req, jid, f):
+    try: return await artifact_response(req, OUTPUTS_CONTAINER, f"{jid}/{f}", 'application/json')
+    except ResourceNotFoundError: return error_response("Not found", 404)
+    except Exception as e:
+        logging.error(f"Error leyendo {jid}/{f}: {e}")
+        return error_response("Not found", 404)
+
+async def save_blob_json(jid, f, d):
     try: 
-        get_blob_service().get_blob_client("lya-outputs", f"{jid}/{f}").upload_blob(json.dumps(d), overwrite=True)
+        await storage.write_json(OUTPUTS_CONTAINER, f"{jid}/{f}", d)
         return success_response({'success': True})
     except: return error_response("Error saving", 500)
 
-def get_blob_text(jid, f):
-    try: return func.HttpResponse(get_blob_service().get_blob_client("lya-outputs", f"{jid}/{f}").download_blob().readall().decode(), headers=get_cors_headers())
-    except: return error_response("Not found", 404)
+async def get_blob_text(req, jid, f):
+    try: return await artifact_response(req, OUTPUTS_CONTAINER, f"{jid}/{f}", 'text/plain')
+    except ResourceNotFoundError: return error_response("Not found", 404)
+    except Exception as e:
+        logging.error(f"Error leyendo {jid}/{f}: {e}")
+        return error_response("Not found", 404)
 
 # =============================================================================
 # DATA ENDPOINTS
 # =============================================================================
 
-def get_project_info(jid): return get_blob_json(jid, 'metadata.json')
-def get_bible(jid): return get_blob_json(jid, 'biblia_validada.json')
-def get_changes(jid): return get_blob_json(jid, 'cambios_estructurados.json')
-def get_chapters(jid): return get_blob_json(jid, 'capitulos_consolidados.json')
-def get_manuscript_edited(jid): return get_blob_text(jid, 'manuscrito_editado.md')
-def get_manuscript_annotated(jid): return get_blob_text(jid, 'manuscrito_anotado.md')
-def save_bible(jid, req): return save_blob_json(jid, 'biblia_validada.json', req.get_json())
+async def get_project_info(req, jid): return await get_blob_json(req, jid, 'metadata.json')
+async def get_bible(req, jid): return await get_blob_json(req, jid, 'biblia_validada.json')
+async def get_changes(req, jid):
+    await decisions.ensure_compacted(jid)
+    return await get_blob_json(req, jid, 'cambios_estructurados.json')
+async def get_chapters(req, jid): return await get_blob_json(req, jid, 'capitulos_consolidados.json')
+async def get_manuscript_edited(req, jid): return await get_blob_text(req, jid, 'manuscrito_editado.md')
+async def get_manuscript_annotated(req, jid): return await get_blob_text(req, jid, 'manuscrito_anotado.md')
+async def save_bible(jid, req):
+    # Proyectos terminados antes de biblia_aplicada.json: la Biblia actual es la que produjo los artefactos
+    if not await storage.exists(OUTPUTS_CONTAINER, f"{jid}/{APPLIED_BIBLE_FILE}") and await storage.exists(OUTPUTS_CONTAINER, f"{jid}/carta_editorial.json"):
+        applied = await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/{BIBLE_FILE}")
+        if applied is not None: await storage.write_json(OUTPUTS_CONTAINER, f"{jid}/{APPLIED_BIBLE_FILE}", applied)
+    return await save_blob_json(jid, BIBLE_FILE, req.get_json())
 
 # NUEVO 5.0: Carta editorial
-def get_editorial_letter(jid): return get_blob_json(jid, 'carta_editorial.json')
+async def get_editorial_letter(req, jid): return await get_blob_json(req, jid, 'carta_editorial.json')
 
 # NUEVO 5.0: Notas de margen
-def get_margin_notes(jid): return get_blob_json(jid, 'notas_margen.json')
+async def get_margin_notes(req, jid): return await get_blob_json(req, jid, 'notas_margen.json')
+
+# =============================================================================
+# ENDPOINTS POR CAPÍTULO (shards escritos por SaveOutputs, ver artifact_shards.py)
+# =============================================================================
+# Proyectos anteriores a los shards: se derivan del archivo completo.
+
+async def load_full_changes(jid):
+    await decisions.ensure_compacted(jid)
+    return (await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/cambios_estructurados.json") or {}).get('changes', [])
+
+async def get_chapters_index(req, jid):
+    await decisions.ensure_compacted(jid)
+    try: return await artifact_response(req, OUTPUTS_CONTAINER, chapters_index_path(jid), 'application/json')
+    except ResourceNotFoundError: pass
+
+    chapters, changes = await asyncio.gather(
+        storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/capitulos_consolidados.json"), load_full_changes(jid)
+    )
+    if chapters is None: return error_response("Not found", 404)
+    by_chapter = group_changes_by_chapter(changes)
+    index = [chapter_summary(ch, i, by_chapter.get(str(ch.get('chapter_id', i + 1)), [])) for i, ch in enumerate(chapters)]
+    return success_response({'total_chapters': len(index), 'changes': count_by_status(changes), 'chapters': index})
+
+async def get_chapter(req, jid, chapter_id):
+    try: return await artifact_response(req, OUTPUTS_CONTAINER, chapter_shard_path(jid, chapter_id), 'application/json')
+    except ResourceNotFoundError: pass
+
+    chapters = await storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/capitulos_consolidados.json") or []
+    chapter = next((ch for ch in chapters if str(ch.get('chapter_id')) == chapter_id), None)
+    return success_response(chapter) if chapter else error_response("Capítulo no encontrado", 404)
+
+async def load_chapter_changes(jid, chapter_id):
+    await decisions.ensure_compacted(jid)
+    try: return (json.loads((await storage.read_cached(OUTPUTS_CONTAINER, changes_shard_path(jid, chapter_id)))['data'])).get('changes', [])
+    except ResourceNotFoundError: pass
+    return group_changes_by_chapter(await load_full_changes(jid)).get(str(chapter_id), [])
+
+async def get_changes_page(req, jid):
+    """GET changes?chapter=3&status=pending&tipo=...&cursor=...&limit=100"""
+    try:
+        p = req.params
+        chapter_id = p.get('chapter')
+        changes = await load_chapter_changes(jid, chapter_id) if chapter_id else await load_full_changes(jid)
+        limit = int(p['limit']) if p.get('limit', '').isdigit() else None
+        page, total, next_cursor = page_changes(changes, status=p.get('status'), tipo=p.get('tipo'), cursor=p.get('cursor'), limit=limit)
+        return success_response({'chapter_id': chapter_id, 'changes': page, 'total': total, 'next_cursor': next_cursor})
+    except Exception as e:
+        logging.error(f"Error paginando cambios de {jid}: {e}")
+        return error_response(str(e), 500)
 
 # =============================================================================
 # REGENERAR CARTA EDITORIAL (Útil para debugging o regeneración manual)
 # =============================================================================
 
-def regenerate_editorial_letter(jid):
+def letter_job_id(jid): return f"{jid}-carta"
+
+async def regenerate_editorial_letter(client, jid):
     """
-    Regenera SOLO la carta editorial usando la biblia y datos existentes.
-    No requiere reprocesar todo el manuscrito.
+    Regenera SOLO la carta editorial usando la biblia y datos existentes, como
+    trabajo en segundo plano (EditorialLetterOrchestrator). Responde al
+    momento con el job id; el progreso se consulta con GET .../regenerate.
 
     Uso: POST /project/{jid}/editorial-letter/regenerate
     """
     try:
-        logging.info(f"🔄 Regenerando Carta Editorial para job: {jid}")
-
-        service = get_blob_service()
-        container = "lya-outputs"
-
-        # 1. Cargar datos existentes del blob storage
-        try:
-            bible_blob = service.get_blob_client(container, f"{jid}/biblia_validada.json")
-            bible = json.loads(bible_blob.download_blob().readall())
-            logging.info(f"✅ Biblia cargada")
-        except Exception as e:
-            return error_response(f"No se encontró la biblia: {str(e)}", 404)
-
-        try:
-            chapters_blob = service.get_blob_client(container, f"{jid}/capitulos_consolidados.json")
-            consolidated_chapters = json.loads(chapters_blob.download_blob().readall())
-            logging.info(f"✅ Capítulos consolidados cargados ({len(consolidated_chapters)} caps)")
-        except Exception as e:
-            logging.warning(f"⚠️ No se encontraron capítulos consolidados: {e}")
-            consolidated_chapters = []
+        instance_id = letter_job_id(jid)
+        status_url = f"project/{jid}/editorial-letter/regenerate/{instance_id}"
+
+        # Una regeneración a la vez por proyecto
+        current = await client.get_status(instance_id, show_history=False)
+        if current and current.runtime_status in (df.OrchestrationRuntimeStatus.Running, df.OrchestrationRuntimeStatus.Pending):
+            return func.HttpResponse(json.dumps({'job_id': instance_id, 'status_url': status_url, 'already_running': True}),
+                                     status_code=202, mimetype='application/json', headers=get_cors_headers())
+
+        bible_path, chapters_path = f"{jid}/biblia_validada.json", f"{jid}/capitulos_consolidados.json"
+        has_bible, has_chapters, metadata = await asyncio.gather(
+            storage.exists(OUTPUTS_CONTAINER, bible_path),
+            storage.exists(OUTPUTS_CONTAINER, chapters_path),
+            storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/metadata.json")
+        )
+        if not has_bible: return error_response("No se encontró la biblia", 404)
+        if not has_chapters: logging.warning(f"⚠️ No se encontraron capítulos consolidados")
+        book_name = (metadata or {}).get('book_name') or (metadata or {}).get('project_name') or 'Sin título'
+
+        # La orquestación recibe referencias: la activity descarga los artefactos
+        await client.start_new('EditorialLetterOrchestrator', instance_id, {
+            'job_id': jid,
+            'bible': blobref(OUTPUTS_CONTAINER, bible_path),
+            'consolidated_chapters': blobref(OUTPUTS_CONTAINER, chapters_path) if has_chapters else [],
+            'book_metadata': {'title': book_name, 'job_id': jid}
+        })
+        logging.info(f"🔄 Regeneración de Carta Editorial encolada: {instance_id}")
 
-        try:
-            meta_blob = service.get_blob_client(container, f"{jid}/metadata.json")
-            metadata = json.loads(meta_blob.download_blob().readall())
-            book_name = metadata.get('book_name', metadata.get('project_name', 'Sin título'))
-            logging.info(f"✅ Metadata cargada: {book_name}")
-        except Exception as e:
-            logging.warning(f"⚠️ No se encontró metadata: {e}")
-            book_name = "Sin título"
+        return func.HttpResponse(json.dumps({'job_id': instance_id, 'status_url': status_url, 'already_running': False}),
+                                 status_code=202, mimetype='application/json', headers=get_cors_headers())
+    except Exception as e:
+        logging.error(f"❌ Error encolando regeneración de carta editorial: {e}")
+        return error_response(f"Error: {str(e)}", 500)
 
-        # 2. Importar y ejecutar GenerateEditorialLetter
-        try:
-            import importlib.util
-            import os
-
-            # Cargar el módulo GenerateEditorialLetter dinámicamente
-            gen_letter_path = os.path.join(os.path.dirname(__file__), '..', 'GenerateEditorialLetter', '__init__.py')
-            spec = importlib.util.spec_from_file_location("generate_editorial_letter", gen_letter_path)
-            gen_letter_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(gen_letter_module)
-
-            logging.info(f"✅ Módulo GenerateEditorialLetter cargado")
-            logging.info(f"🔄 Llamando a GenerateEditorialLetter...")
-
-            # Preparar input (fragments vacío ya que no es crítico para la carta)
-            carta_input = {
-                'bible': bible,
-                'consolidated_chapters': consolidated_chapters,
-                'fragments': [],  # No es crítico para carta editorial
-                'book_metadata': {
-                    'title': book_name,
-                    'job_id': jid
-                }
-            }
-
-            # Ejecutar la función main del módulo
-            carta_result = gen_letter_module.main(carta_input)
-
-            if carta_result.get('status') == 'error':
-                logging.error(f"❌ Error al generar carta: {carta_result.get('error')}")
-                return error_response(f"Error generando carta: {carta_result.get('error')}", 500)
-
-            logging.info(f"✅ Carta Editorial generada exitosamente")
-
-        except ImportError as e:
-            logging.error(f"❌ Error importando GenerateEditorialLetter: {e}")
-            return error_response(f"Error de importación: {str(e)}", 500)
-        except Exception as e:
-            logging.error(f"❌ Error ejecutando GenerateEditorialLetter: {e}")
-            import traceback
-            logging.error(traceback.format_exc())
-            return error_response(f"Error generando carta: {str(e)}", 500)
+async def get_letter_job_status(client, jid, instance_id=None):
+    """Progreso de la regeneración: {job_id, runtime_status, progress, output}."""
+    return await get_background_job_status(client, jid, instance_id or letter_job_id(jid), "Regeneración no encontrada")
 
-        # 3. Guardar resultados en blob storage
-        carta_editorial = carta_result.get('carta_editorial', {})
-        carta_markdown = carta_result.get('carta_markdown', '')
+async def get_background_job_status(client, jid, instance_id, not_found):
+    """Estado de una orquestación auxiliar del proyecto (carta, recalculo por Biblia)."""
+    try:
+        if not instance_id.startswith(jid): return error_response("Job no pertenece al proyecto", 400)
+        status = await client.get_status(instance_id, show_history=False)
+        if not status or not status.runtime_status: return error_response(not_found, 404)
 
-        if not carta_editorial:
-            logging.error(f"❌ carta_editorial está vacía")
-            return error_response("La carta editorial generada está vacía", 500)
+        rt = str(status.runtime_status.value) if hasattr(status.runtime_status, 'value') else str(status.runtime_status)
+        output = status.output if rt == 'Completed' else None
+        return success_response({
+            'job_id': instance_id,
+            'runtime_status': rt,
+            'progress': status.custom_status,
+            'is_completed': rt == 'Completed' and (output or {}).get('status') == 'success',
+            'is_failed': rt in ('Failed', 'Terminated') or (rt == 'Completed' and (output or {}).get('status') != 'success'),
+            'is_running': rt in ('Running', 'Pending'),
+            'output': output
+        })
+    except Exception as e: return error_response(str(e), 500)
 
-        try:
-            # Guardar JSON
-            carta_json_blob = service.get_blob_client(container, f"{jid}/carta_editorial.json")
-            carta_json_blob.upload_blob(
-                json.dumps(carta_editorial, ensure_ascii=False, indent=2),
-                overwrite=True
-            )
-            logging.info(f"✅ carta_editorial.json guardada")
-
-            # Guardar Markdown
-            if carta_markdown:
-                carta_md_blob = service.get_blob_client(container, f"{jid}/carta_editorial.md")
-                carta_md_blob.upload_blob(carta_markdown, overwrite=True)
-                logging.info(f"✅ carta_editorial.md guardada")
-
-            # Actualizar metadata para marcar como completed
-            try:
-                meta_blob = service.get_blob_client(container, f"{jid}/metadata.json")
-                if meta_blob.exists():
-                    meta = json.loads(meta_blob.download_blob().readall())
-                    meta['status'] = 'completed'
-                    meta['carta_regenerated_at'] = datetime.utcnow().isoformat() + 'Z'
-                    meta_blob.upload_blob(json.dumps(meta, ensure_ascii=False), overwrite=True)
-                    logging.info(f"✅ Metadata actualizada a 'completed'")
-            except Exception as e:
-                logging.warning(f"⚠️ No se pudo actualizar metadata: {e}")
+# =============================================================================
+# BIBLIA EDITADA: RECALCULO INCREMENTAL (VER bible_deps.py)
+# =============================================================================
 
-            return success_response({
-                'success': True,
-                'message': 'Carta Editorial regenerada exitosamente',
-                'job_id': jid,
-                'sections': list(carta_editorial.keys())[:5] if isinstance(carta_editorial, dict) else [],
-                'has_markdown': bool(carta_markdown)
-            })
+def recompute_job_id(jid): return f"{jid}-biblia"
 
-        except Exception as e:
-            logging.error(f"❌ Error guardando carta editorial: {e}")
-            return error_response(f"Error guardando carta: {str(e)}", 500)
+async def start_bible_recompute(client, jid):
+    """
+    Compara la Biblia aplicada con la editada y arranca BibleRecomputeOrchestrator
+    solo con los capítulos cuya parte de la Biblia cambió. Responde 202 con el
+    diff y el job id; sin capítulos afectados no arranca nada (200).
+    """
+    try:
+        instance_id = recompute_job_id(jid)
+        status_url = f"project/{jid}/bible/recompute/{instance_id}"
+
+        current = await client.get_status(instance_id, show_history=False)
+        if current and current.runtime_status in (df.OrchestrationRuntimeStatus.Running, df.OrchestrationRuntimeStatus.Pending):
+            return func.HttpResponse(json.dumps({'job_id': instance_id, 'status_url': status_url, 'already_running': True}),
+                                     status_code=202, mimetype='application/json', headers=get_cors_headers())
+
+        chapters_path = f"{jid}/capitulos_consolidados.json"
+        bible, applied, index, metadata, has_notes, has_letter = await asyncio.gather(
+            storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/{BIBLE_FILE}"),
+            storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/{APPLIED_BIBLE_FILE}"),
+            storage.read_json_or_none(OUTPUTS_CONTAINER, chapters_index_path(jid)),
+            storage.read_json_or_none(OUTPUTS_CONTAINER, f"{jid}/metadata.json"),
+            storage.exists(OUTPUTS_CONTAINER, f"{jid}/notas_margen.json"),
+            storage.exists(OUTPUTS_CONTAINER, f"{jid}/carta_editorial.json")
+        )
+        if bible is None: return error_response("No se encontró la biblia", 404)
+        if applied is None: return error_response("El proyecto no tiene una Biblia aplicada con la que comparar", 409)
+
+        if index is not None:
+            chapter_ids = [c.get('chapter_id') for c in index.get('chapters', [])]
+        else:
+            chapter_ids = [c.get('chapter_id') for c in await storage.read_json_or_none(OUTPUTS_CONTAINER, chapters_path) or []]
+
+        diff = diff_bible(applied, bible, chapter_ids)
+        logging.info(f"📖 Biblia editada de {jid}: {recompute_summary(diff)}")
+        if not diff['edit_chapters']:
+            return success_response({'message': recompute_summary(diff), 'diff': diff, 'job_id': None})
+
+        book_name = (metadata or {}).get('book_name') or (metadata or {}).get('project_name') or 'Sin título'
+        await client.start_new('BibleRecomputeOrchestrator', instance_id, {
+            'job_id': jid,
+            'bible': blobref(OUTPUTS_CONTAINER, f"{jid}/{BIBLE_FILE}"),
+            'bible_hash': bible_hash(bible),
+            'chapters': blobref(OUTPUTS_CONTAINER, chapters_path),
+            'margin_notes': blobref(OUTPUTS_CONTAINER, f"{jid}/notas_margen.json") if has_notes else None,
+            'carta_editorial': blobref(OUTPUTS_CONTAINER, f"{jid}/carta_editorial.json") if has_letter else None,
+            'margin_notes_chapters': diff['margin_notes_chapters'],
+            'edit_chapters': diff['edit_chapters'],
+            'book_metadata': {'title': book_name, 'job_id': jid}
+        })
+        logging.info(f"🔄 Recalculo por Biblia encolado: {instance_id}")
 
+        return func.HttpResponse(json.dumps({'job_id': instance_id, 'status_url': status_url, 'already_running': False,
+                                             'message': recompute_summary(diff), 'diff': diff}, ensure_ascii=False),
+                                 status_code=202, mimetype='application/json', headers=get_cors_headers())
     except Exception as e:
-        logging.error(f"❌ Error general regenerando carta editorial: {e}")
-        import traceback
-        logging.error(traceback.format_exc())
+        logging.error(f"❌ Error encolando recalculo por Biblia: {e}")
         return error_response(f"Error: {str(e)}", 500)
 
+async def get_recompute_job_status(client, jid, instance_id=None):
+    return await get_background_job_status(client, jid, instance_id or recompute_job_id(jid), "Recalculo no encontrado")
+
 # =============================================================================
-# FIX: save_all_decisions - ACTUALIZA en lugar de SOBRESCRIBIR
+# DECISIONES (LOG APPEND-ONLY, VER decisions.py)
 # =============================================================================
 
-def save_all_decisions_fixed(jid, req):
-    """
-    FIX CRÍTICO: En lugar de sobrescribir todo el archivo cambios_estructurados.json
-    con solo las decisiones, ahora:
-    1. Lee el archivo existente
-    2. Actualiza solo los campos 'status' de cada cambio
-    3. Guarda el archivo completo preservando los datos originales
-    """
+async def save_all_decisions_fixed(jid, req):
+    """Guardado masivo: agrega las decisiones recibidas al log en un solo append."""
     try:
-        service = get_blob_service()
-        blob_path = f"{jid}/cambios_estructurados.json"
-        blob_client = service.get_blob_client("lya-outputs", blob_path)
-        
-        # 1. Leer archivo existente
-        try:
-            existing_data = json.loads(blob_client.download_blob().readall())
-        except:
-            # Si no existe, crear estructura vacía
-            existing_data = {"changes": [], "total_changes": 0}
-        
-        # 2. Obtener decisiones del request
-        decisions_data = req.get_json()
-        decisions = decisions_data.get('decisions', [])
-        
-        # Crear mapa de decisiones por change_id
-        decision_map = {d.get('change_id'): d.get('status', 'pending') for d in decisions}
-        
-        # 3. Actualizar status de cada cambio existente
-        changes = existing_data.get('changes', [])
-        for change in changes:
-            change_id = change.get('change_id')
-            if change_id in decision_map:
-                change['status'] = decision_map[change_id]
-        
-        # 4. Guardar contadores actualizados
-        accepted = sum(1 for c in changes if c.get('status') == 'accepted')
-        rejected = sum(1 for c in changes if c.get('status') == 'rejected')
-        pending = sum(1 for c in changes if c.get('status') == 'pending')
-        
-        existing_data['decision_stats'] = {
-            'accepted': accepted,
-            'rejected': rejected,
-            'pending': pending,
-            'total': len(changes),
-            'updated_at': datetime.utcnow().isoformat() + 'Z'
-        }
-        
-        # 5. Guardar archivo completo
-        blob_client.upload_blob(json.dumps(existing_data, ensure_ascii=False), overwrite=True)
-        
-        logging.info(f"✅ Decisiones guardadas para {jid}: {accepted} aceptadas, {rejected} rechazadas, {pending} pendientes")
-        
-        return success_response({
-            'success': True,
-            'stats': existing_data['decision_stats']
-        })
-        
+        body = req.get_json()
+        saved = await decisions.append_decisions(jid, body.get('decisions', []))
+        logging.info(f"✅ {saved} decisiones registradas para {jid}")
+        return success_response({'success': True, 'saved': saved})
     except Exception as e:
         logging.error(f"Error guardando decisiones: {e}")
         return error_response(f"Error saving decisions: {str(e)}", 500)
 
+async def save_change_decision(jid, cid, req):
+    """Decisión individual (un click): un append al log."""
+    try:
+        body = req.get_json()
+        status = decisions.normalize_status(body.get('status') or body.get('action'))
+        if not status: return error_response("Acción inválida (accept, reject o revert)", 400)
+        await decisions.append_decisions(jid, [{'change_id': cid, 'status': status}])
+        return success_response({'saved': True, 'change_id': cid, 'status': status})
+    except Exception as e:
+        logging.error(f"Error guardando decisión {cid}: {e}")
+        return error_response(f"Error saving decision: {str(e)}", 500)
 
-def save_change_decision(jid, cid, req): 
-    """Guardar decisión individual (legacy, mantener por compatibilidad)"""
-    return success_response({'saved': True})
+# =============================================================================
+# EXPORTACIÓN (MANUSCRITO FINAL CON DECISIONES, VER manuscript_export.py)
+# =============================================================================
 
-def export_manuscript(jid): return get_blob_text(jid, 'manuscrito_editado.md')
+async def export_version(jid):
+    """Versión del render: ETag de la vista de decisiones ya compactada + ETag de los capítulos."""
+    await decisions.ensure_compacted(jid)
+    changes_props, chapters_props = await asyncio.gather(
+        storage.blob(OUTPUTS_CONTAINER, f"{jid}/cambios_estructurados.json").get_blob_properties(),
+        storage.blob(OUTPUTS_CONTAINER, f"{jid}/capitulos_consolidados.json").get_blob_properties()
+    )
+    return hashlib.sha256(f"{changes_props.etag}|{chapters_props.etag}".encode()).hexdigest()[:16]
+
+async def export_manuscript(req, jid):
+    """
+    GET|POST export?format=md|docx -> manuscrito con los cambios ACEPTADOS aplicados.
+    El render se guarda por versión de decisiones: mientras no cambien, se sirve
+    desde el blob (y el LRU) con ETag.
+    """
+    fmt = (req.params.get('format') or 'md').lower()
+    if fmt not in EXPORT_FORMATS: return error_response(f"Formato no soportado: {fmt}", 400)
+    try:
+        path = f"{jid}/exports/manuscrito_final-{await export_version(jid)}.{fmt}"
+        if not await storage.exists(OUTPUTS_CONTAINER, path):
+            await storage.run_sync(export_to_blob, OUTPUTS_CONTAINER, jid, fmt, path)
+        return await artifact_response(
+            req, OUTPUTS_CONTAINER, path, EXPORT_FORMATS[fmt], compressible=(fmt == 'md'),
+            extra_headers={'Content-Disposition': f'attachment; filename="manuscrito_final.{fmt}"'}
+        )
+    except ResourceNotFoundError:
+        return error_response("Manuscrito no disponible todavía", 404)
+    except Exception as e:
+        logging.error(f"❌ Error exportando {jid} ({fmt}): {e}")
+        return error_response(f"Error exportando: {str(e)}", 500)
@@ -0,0 +1,264 @@
+"""
+Log de decisiones del editor (aceptar/rechazar cambios).
+
+Cada click agrega UNA línea JSON a un append blob ({job_id}/decisions/log.jsonl):
+una sola operación de storage sin importar cuántos cambios tenga el libro, y
+los appends concurrentes nunca se pisan (el servicio los serializa).
+
+La vista materializada (cambios_estructurados.json + shards por capítulo) se
+compacta en segundo plano: se aplica la cola del log desde el offset ya
+compactado, los contadores se ajustan por delta (anterior -> nuevo) y la vista
+se escribe con ETag (if_match), de modo que dos compactaciones simultáneas no
+se pisan. El offset compactado viaja dentro de la vista y se replica como
+metadata del log para que las lecturas detecten con un HEAD si hay cola
+pendiente (read-repair).
+
+Límite: un append blob admite 50.000 bloques; cada click usa uno y cada
+guardado masivo uno por cada 4 MB.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+from . import storage
+from .storage import OUTPUTS_CONTAINER
+
+try:
+    from artifact_shards import chapters_index_path, changes_shard_path, count_by_status
+except ImportError:
+    from API_DURABLE.artifact_shards import chapters_index_path, changes_shard_path, count_by_status
+
+DECISION_STATUSES = ('pending', 'accepted', 'rejected')
+# Acciones del cliente -> status
+DECISION_ACTIONS = {'accept': 'accepted', 'reject': 'rejected', 'revert': 'pending', 'reset': 'pending'}
+
+# Espera antes de compactar: los clicks seguidos se agrupan en una compactación
+COMPACT_DELAY_SECONDS = 5
+COMPACT_MAX_RETRIES = 5
+# Tamaño máximo de un bloque de append blob
+LOG_MAX_BLOCK_BYTES = 4 * 1024 * 1024
+
+COMPACTED_OFFSET_META = 'compacted_offset'
+
+_scheduled: Dict[str, asyncio.Task] = {}
+
+
+def log_path(job_id: str) -> str:
+    return f"{job_id}/decisions/log.jsonl"
+
+
+def changes_path(job_id: str) -> str:
+    return f"{job_id}/cambios_estructurados.json"
+
+
+def normalize_status(value: Optional[str]) -> Optional[str]:
+    value = (value or '').strip().lower()
+    value = DECISION_ACTIONS.get(value, value)
+    return value if value in DECISION_STATUSES else None
+
+
+# -----------------------------------------------------------------------------
+# ESCRITURA (O(1) POR CLICK)
+# -----------------------------------------------------------------------------
+
+def _encode_blocks(records: List[Dict[str, Any]]) -> List[bytes]:
+    """Agrupa las líneas en bloques de como máximo LOG_MAX_BLOCK_BYTES."""
+    blocks, current, size = [], [], 0
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode()
+        if current and size + len(line) > LOG_MAX_BLOCK_BYTES:
+            blocks.append(b''.join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        blocks.append(b''.join(current))
+    return blocks
+
+
+async def append_decisions(job_id: str, decisions: Iterable[Dict[str, Any]]) -> int:
+    """
+    Agrega decisiones {change_id, status} al log. Retorna cuántas se guardaron.
+    Las decisiones con status desconocido se ignoran.
+    """
+    now = datetime.utcnow().isoformat() + 'Z'
+    records = []
+    for decision in decisions:
+        status = normalize_status(decision.get('status') or decision.get('action'))
+        if decision.get('change_id') is not None and status:
+            records.append({'change_id': decision['change_id'], 'status': status, 'ts': now})
+    if not records:
+        return 0
+
+    client = storage.blob(OUTPUTS_CONTAINER, log_path(job_id))
+    for block in _encode_blocks(records):
+        try:
+            await client.append_block(block)
+        except ResourceNotFoundError:
+            try:
+                await client.create_append_blob(match_condition=MatchConditions.IfMissing)
+            except (ResourceExistsError, ResourceModifiedError):
+                pass  # Otro request lo creó primero
+            await client.append_block(block)
+
+    schedule_compaction(job_id)
+    return len(records)
+
+
+# -----------------------------------------------------------------------------
+# COMPACTACIÓN
+# -----------------------------------------------------------------------------
+
+async def _log_state(job_id: str):
+    """(tamaño del log, offset compactado según metadata); (0, 0) si no hay log."""
+    try:
+        props = await storage.blob(OUTPUTS_CONTAINER, log_path(job_id)).get_blob_properties()
+    except ResourceNotFoundError:
+        return 0, 0
+    return props.size, int((props.metadata or {}).get(COMPACTED_OFFSET_META, 0))
+
+
+async def _read_log_tail(job_id: str, offset: int, size: int) -> List[Dict[str, Any]]:
+    downloader = await storage.blob(OUTPUTS_CONTAINER, log_path(job_id)).download_blob(
+        offset=offset, length=size - offset
+    )
+    data = await downloader.readall()
+    return [json.loads(line) for line in data.decode().splitlines() if line.strip()]
+
+
+async def _mark_compacted(job_id: str, offset: int):
+    try:
+        await storage.blob(OUTPUTS_CONTAINER, log_path(job_id)).set_blob_metadata({COMPACTED_OFFSET_META: str(offset)})
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudo marcar el log de decisiones de {job_id}: {e}")
+
+
+def apply_decisions(view: Dict[str, Any], records: List[Dict[str, Any]]) -> set:
+    """
+    Aplica los registros del log a la vista y ajusta decision_stats por delta.
+    Retorna los chapter_id (str) cuyos cambios se modificaron.
+    """
+    changes = view.setdefault('changes', [])
+    stats = view.get('decision_stats')
+    if not stats:
+        stats = count_by_status(changes)
+    by_id = {str(c.get('change_id')): c for c in changes}
+
+    touched = set()
+    for record in records:
+        change = by_id.get(str(record.get('change_id')))
+        if change is None:
+            continue
+        previous, status = change.get('status', 'pending'), record['status']
+        if previous == status:
+            continue
+        change['status'] = status
+        change['user_decision'] = {'action': status, 'timestamp': record.get('ts')}
+        stats[previous] = stats.get(previous, 0) - 1
+        stats[status] = stats.get(status, 0) + 1
+        touched.add(str(change.get('chapter_id')))
+
+    stats['total'] = len(changes)
+    stats['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+    view['decision_stats'] = stats
+    return touched
+
+
+async def refresh_change_shards(job_id: str, changes: List[Dict], chapter_ids: Iterable[str],
+                                totals: Optional[Dict[str, int]] = None):
+    """Reescribe los shards de cambios de los capítulos tocados y sus contadores en el índice."""
+    chapter_ids = set(chapter_ids)
+    index = await storage.read_json_or_none(OUTPUTS_CONTAINER, chapters_index_path(job_id))
+    if index is None:
+        return  # Proyecto sin shards
+
+    by_chapter: Dict[str, List[Dict]] = {cid: [] for cid in chapter_ids}
+    for change in changes:
+        cid = str(change.get('chapter_id'))
+        if cid in by_chapter:
+            by_chapter[cid].append(change)
+
+    writes = [
+        storage.write_json(OUTPUTS_CONTAINER, changes_shard_path(job_id, cid), {'chapter_id': cid, 'changes': chapter_changes})
+        for cid, chapter_changes in by_chapter.items()
+    ]
+    for summary in index.get('chapters', []):
+        cid = str(summary.get('chapter_id'))
+        if cid in by_chapter:
+            summary['changes'] = count_by_status(by_chapter[cid])
+    totals = totals or count_by_status(changes)
+    index['changes'] = {k: totals.get(k, 0) for k in DECISION_STATUSES + ('total',)}
+    writes.append(storage.write_json(OUTPUTS_CONTAINER, chapters_index_path(job_id), index))
+    await asyncio.gather(*writes)
+
+
+async def compact(job_id: str) -> bool:
+    """
+    Aplica la cola del log a la vista materializada. Retorna True si la vista
+    quedó al día (haya o no habido algo que aplicar).
+    """
+    for _ in range(COMPACT_MAX_RETRIES):
+        size, _ = await _log_state(job_id)
+        try:
+            downloader = await storage.blob(OUTPUTS_CONTAINER, changes_path(job_id)).download_blob()
+            view = json.loads(await downloader.readall())
+            etag = downloader.properties.etag
+        except ResourceNotFoundError:
+            return False
+
+        offset = view.get('decision_log_offset', 0)
+        if offset >= size:
+            await _mark_compacted(job_id, offset)
+            return True
+
+        records = await _read_log_tail(job_id, offset, size)
+        touched = apply_decisions(view, records)
+        view['decision_log_offset'] = size
+
+        try:
+            await storage.write_json(OUTPUTS_CONTAINER, changes_path(job_id), view,
+                                     etag=etag, match_condition=MatchConditions.IfNotModified)
+        except ResourceModifiedError:
+            continue  # Otra compactación ganó: releer y aplicar lo que falte
+
+        if touched:
+            await refresh_change_shards(job_id, view['changes'], touched, view['decision_stats'])
+        await _mark_compacted(job_id, size)
+        logging.info(f"🗜️ Decisiones compactadas para {job_id}: {len(records)} registros, {len(touched)} capítulos")
+        return True
+
+    logging.warning(f"⚠️ Compactación de decisiones de {job_id}: {COMPACT_MAX_RETRIES} conflictos seguidos")
+    return False
+
+
+async def ensure_compacted(job_id: str):
+    """Read-repair: si el log tiene cola sin aplicar, compacta antes de leer la vista."""
+    size, compacted = await _log_state(job_id)
+    if size > compacted:
+        await compact(job_id)
+
+
+async def _compact_later(job_id: str):
+    try:
+        await asyncio.sleep(COMPACT_DELAY_SECONDS)
+        # Los clicks que lleguen durante la compactación programan otra
+        _scheduled.pop(job_id, None)
+        await compact(job_id)
+    except Exception as e:
+        logging.warning(f"⚠️ Compactación en segundo plano de {job_id} falló: {e}")
+    finally:
+        if _scheduled.get(job_id) is asyncio.current_task():
+            _scheduled.pop(job_id, None)
+
+
+def schedule_compaction(job_id: str):
+    """Programa una compactación diferida (una por proyecto a la vez)."""
+    if job_id in _scheduled:
+        return
+    _scheduled[job_id] = asyncio.get_running_loop().create_task(_compact_later(job_id))
@@ -0,0 +1,235 @@
+"""
+Capa de acceso a Blob Storage para los endpoints HTTP.
+
+Un cliente aio por proceso del worker (pool de conexiones compartido entre
+requests) para no bloquear el event loop con descargas síncronas, más un
+cliente síncrono también compartido para los módulos que solo existen en
+versión síncrona (project_index), que se ejecutan en un hilo con run_sync.
+
+Los artefactos que el editor consulta una y otra vez pasan por un LRU en
+memoria validado por ETag (read_cached): cada lectura es una descarga
+condicional que, si el blob no cambió, no transfiere el cuerpo.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ResourceNotModifiedError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+
+OUTPUTS_CONTAINER = "lya-outputs"
+INPUTS_CONTAINER = "lya-inputs"
+
+# Descargas/borrados simultáneos por operación multi-blob
+MAX_PARALLEL_BLOB_OPS = 16
+
+_async_service: Optional[AsyncBlobServiceClient] = None
+_sync_service: Optional[BlobServiceClient] = None
+_known_containers = set()
+
+# LRU de artefactos: (container, path) -> {"etag", "data", "variants", "size"}
+ARTIFACT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+ARTIFACT_CACHE_MAX_ENTRY_BYTES = 16 * 1024 * 1024
+_artifact_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_artifact_cache_bytes = 0
+
+
+def get_async_service() -> AsyncBlobServiceClient:
+    global _async_service
+    if _async_service is None:
+        _async_service = AsyncBlobServiceClient.from_connection_string(os.environ['AzureWebJobsStorage'])
+    return _async_service
+
+
+def get_sync_service() -> BlobServiceClient:
+    global _sync_service
+    if _sync_service is None:
+        _sync_service = BlobServiceClient.from_connection_string(os.environ['AzureWebJobsStorage'])
+    return _sync_service
+
+
+async def run_sync(fn, *args, **kwargs):
+    """Ejecuta fn(sync_service, *args) en un hilo sin bloquear el event loop."""
+    return await asyncio.to_thread(fn, get_sync_service(), *args, **kwargs)
+
+
+def blob(container: str, path: str):
+    return get_async_service().get_blob_client(container, path)
+
+
+async def ensure_container(name: str):
+    if name in _known_containers:
+        return
+    try:
+        await get_async_service().create_container(name)
+    except ResourceExistsError:
+        pass
+    _known_containers.add(name)
+
+
+# -----------------------------------------------------------------------------
+# LECTURA
+# -----------------------------------------------------------------------------
+
+async def read_bytes(container: str, path: str) -> bytes:
+    """Raises ResourceNotFoundError si el blob no existe."""
+    downloader = await blob(container, path).download_blob()
+    return await downloader.readall()
+
+
+async def read_json(container: str, path: str) -> Any:
+    return json.loads(await read_bytes(container, path))
+
+
+async def read_text(container: str, path: str) -> str:
+    return (await read_bytes(container, path)).decode()
+
+
+async def read_json_or_none(container: str, path: str) -> Any:
+    try:
+        return await read_json(container, path)
+    except ResourceNotFoundError:
+        return None
+
+
+async def read_many_json(container: str, paths: Iterable[str]) -> Dict[str, Any]:
+    """Descarga varios JSON en paralelo; los inexistentes o ilegibles quedan en None."""
+    paths = list(paths)
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_BLOB_OPS)
+
+    async def read_one(path):
+        async with semaphore:
+            try:
+                return await read_json(container, path)
+            except ResourceNotFoundError:
+                return None
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudo leer {container}/{path}: {e}")
+                return None
+
+    results = await asyncio.gather(*[read_one(path) for path in paths])
+    return dict(zip(paths, results))
+
+
+async def exists(container: str, path: str) -> bool:
+    return await blob(container, path).exists()
+
+
+# -----------------------------------------------------------------------------
+# LRU DE ARTEFACTOS (VALIDADO POR ETAG)
+# -----------------------------------------------------------------------------
+
+def _cache_put(key: tuple, entry: Dict[str, Any]):
+    global _artifact_cache_bytes
+    _cache_evict(key)
+    if entry['size'] > ARTIFACT_CACHE_MAX_ENTRY_BYTES:
+        return
+    _artifact_cache[key] = entry
+    _artifact_cache_bytes += entry['size']
+    while _artifact_cache_bytes > ARTIFACT_CACHE_MAX_BYTES and _artifact_cache:
+        _, oldest = _artifact_cache.popitem(last=False)
+        _artifact_cache_bytes -= oldest['size']
+
+
+def _cache_evict(key: tuple):
+    global _artifact_cache_bytes
+    old = _artifact_cache.pop(key, None)
+    if old:
+        _artifact_cache_bytes -= old['size']
+
+
+def cache_variant(key: tuple, entry: Dict[str, Any], encoding: str, data: bytes):
+    """Guarda una versión comprimida del artefacto junto a la original."""
+    global _artifact_cache_bytes
+    if encoding in entry['variants']:
+        return
+    entry['variants'][encoding] = data
+    entry['size'] += len(data)
+    if _artifact_cache.get(key) is entry:
+        _artifact_cache_bytes += len(data)
+
+
+async def read_cached(container: str, path: str) -> Dict[str, Any]:
+    """
+    Artefacto con su ETag: {"etag": str, "data": bytes, "variants": {...}}.
+    Si está en cache se valida con una descarga condicional (If-None-Match):
+    sin cambios solo cuesta la ida y vuelta de cabeceras.
+
+    Raises ResourceNotFoundError si el blob no existe.
+    """
+    key = (container, path)
+    entry = _artifact_cache.get(key)
+    client = blob(container, path)
+
+    try:
+        if entry:
+            downloader = await client.download_blob(etag=entry['etag'], match_condition=MatchConditions.IfModified)
+        else:
+            downloader = await client.download_blob()
+    except ResourceNotModifiedError:
+        _artifact_cache.move_to_end(key)
+        return entry
+    except ResourceNotFoundError:
+        _cache_evict(key)
+        raise
+
+    data = await downloader.readall()
+    entry = {'etag': downloader.properties.etag, 'data': data, 'variants': {}, 'size': len(data)}
+    _cache_put(key, entry)
+    return entry
+
+
+# -----------------------------------------------------------------------------
+# ESCRITURA
+# -----------------------------------------------------------------------------
+
+async def write_bytes(container: str, path: str, data, content_type: Optional[str] = None, **kwargs):
+    _cache_evict((container, path))
+    if content_type:
+        kwargs['content_settings'] = ContentSettings(content_type=content_type)
+    kwargs.setdefault('overwrite', True)
+    return await blob(container, path).upload_blob(data, **kwargs)
+
+
+async def write_json(container: str, path: str, data: Any, **kwargs):
+    return await write_bytes(container, path, json.dumps(data, ensure_ascii=False), 'application/json', **kwargs)
+
+
+async def copy_blob(container: str, source_path: str, dest_path: str, timeout_seconds: float = 60):
+    """Copia dentro de la cuenta de storage (el contenido no pasa por el worker) y espera a que termine."""
+    _cache_evict((container, dest_path))
+    dest = blob(container, dest_path)
+    copy = await dest.start_copy_from_url(blob(container, source_path).url)
+    status = copy.get('copy_status')
+    deadline = asyncio.get_running_loop().time() + timeout_seconds
+    while status == 'pending':
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError(f"Copia de {source_path} sin terminar tras {timeout_seconds}s")
+        await asyncio.sleep(0.5)
+        status = (await dest.get_blob_properties()).copy.status
+    if status != 'success':
+        raise RuntimeError(f"Copia de {source_path} fallida ({status})")
+
+
+async def delete_prefix(container: str, prefix: str) -> int:
+    """Borra todos los blobs bajo prefix en paralelo. Retorna cuántos borró."""
+    container_client = get_async_service().get_container_client(container)
+    names = [b.name async for b in container_client.list_blobs(name_starts_with=prefix)]
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_BLOB_OPS)
+
+    async def delete_one(name):
+        async with semaphore:
+            _cache_evict((container, name))
+            try:
+                await container_client.delete_blob(name)
+            except ResourceNotFoundError:
+                pass
+
+    await asyncio.gather(*[delete_one(name) for name in names])
+    return len(names)
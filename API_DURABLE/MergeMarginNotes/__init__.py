@@ -0,0 +1,65 @@
+# =============================================================================
+# MergeMarginNotes/__init__.py - LYA 6.0
+# =============================================================================
+# Combina un resultado completo de notas de margen (PollMarginNotesBatch) con
+# las notas regeneradas de algunos capítulos: reemplaza esos capítulos y
+# recalcula all_notes y estadísticas. Lo usan la aprobación especulativa de la
+# Biblia (Orchestrator) y el recalculo incremental (SaveBibleRecompute).
+# Con "parts" une los resultados de los grupos de capítulos (edición por
+# capítulos) en un único resultado.
+#
+# Input:  {"base": {...} | BlobRef, "updates": {chapter_id: [...]} | BlobRef,
+#          "chapter_ids": [...]}
+#         | {"parts": [{...} | BlobRef, ...]}
+# Output: misma forma que PollMarginNotesBatch
+# =============================================================================
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+    from PollMarginNotesBatch import build_success_response, calcular_estadisticas_notas
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.PollMarginNotesBatch import build_success_response, calcular_estadisticas_notas
+
+logging.basicConfig(level=logging.INFO)
+
+
+def merge_margin_notes(current: dict, new_notes: dict, chapter_ids: list) -> dict:
+    """Reemplaza las notas de chapter_ids y recalcula all_notes y estadísticas."""
+    chapter_ids = [str(c) for c in chapter_ids]
+    notes_by_chapter = dict(current.get('notes_by_chapter') or {})
+    for chapter_id in chapter_ids:
+        notes_by_chapter[chapter_id] = new_notes.get(chapter_id, [])
+
+    for result in current.get('results') or []:
+        chapter_id = str(result.get('chapter_id'))
+        if chapter_id in chapter_ids:
+            result['notas_margen'] = notes_by_chapter[chapter_id]
+
+    all_notes = [note for notes in notes_by_chapter.values() for note in notes]
+    return {
+        **current,
+        'notes_by_chapter': notes_by_chapter,
+        'all_notes': all_notes,
+        'statistics': calcular_estadisticas_notas(all_notes),
+        'total': len(notes_by_chapter)
+    }
+
+
+@offload_payloads(fields=('results', 'all_notes', 'notes_by_chapter'))
+def main(input_data: dict) -> dict:
+    if input_data.get('parts') is not None:
+        parts = [part for part in input_data['parts'] if part]
+        combined = build_success_response([result for part in parts for result in part.get('results') or []])
+        logging.info(f"📝 Notas de margen unidas: {len(parts)} grupos, {combined['total']} capítulos")
+        return combined
+
+    chapter_ids = input_data.get('chapter_ids') or []
+    merged = merge_margin_notes(input_data.get('base') or {}, input_data.get('updates') or {}, chapter_ids)
+    logging.info(f"📝 Notas de margen combinadas: {len(chapter_ids)} capítulos reemplazados, {len(merged['all_notes'])} notas")
+    return merged
@@ -12,13 +12,43 @@
 #   1. Polling Adaptativo: Empieza rápido (10s), luego incrementa
 #   2. Paralelización: Fase 4 y 5 ejecutan simultáneamente
 #   3. [FIX] Inyección de contenido: Repara capítulos vacíos antes de edición
+#
+# SEGUIMIENTO DE BATCHES:
+#   Todos los batches se esperan con BatchTrackerOrchestrator (intervalos según
+#   historial de latencia del proveedor, deadline de reloj real). Los envíos
+#   pequeños (p.ej. los grupos de capítulos) se ejecutan online en el Submit
+#   cuando eso es más rápido que la cola del batch (execution_router).
+#
+# GRAFO DE FASES:
+#   Las fases 2-6 y 7-9 se declaran como DAG (build_analysis_dag /
+#   build_editorial_dag) y run_phase_dag lanza cada una en cuanto terminan
+#   sus dependencias: holística ‖ Capa 1, Capa 2/3 ‖ emocional ‖ sensorial,
+#   arcos ‖ carta + notas de margen.
+#
+# ANÁLISIS POR CAPÍTULOS (ENABLE_ANALYSIS_STREAMING):
+#   Capa 1 -> rescate -> consolidación -> envío de Capa 2/3 se declaran por
+#   grupo de capítulos (chapter_groups): cada grupo es un micro-batch que
+#   avanza en cuanto terminan sus fragmentos, así un fragmento rezagado solo
+#   retrasa su grupo. Las fases globales (emocional, sensorial, Biblia)
+#   esperan a las uniones 'consolidacion' y 'capa2_y_3_paralelo'.
+#
+# EDICIÓN POR CAPÍTULOS (ENABLE_EDITING_STREAMING):
+#   Las notas de margen se piden por grupo de capítulos y el batch
+#   single-pass de cada grupo se envía en cuanto llegan sus notas
+#   (build_editing_dag), mientras los demás grupos y los arcos siguen.
+#   Los batches se recogen juntos tras los reflection loops.
+#
+# APROBACIÓN ESPECULATIVA (ENABLE_SPECULATIVE_EDITORIAL):
+#   El DAG editorial arranca con la Biblia sin aprobar y la espera de
+#   BibleApproved es una fase más. El evento trae la huella de la Biblia
+#   aprobada: si coincide se reutiliza todo; si no, DiffBible decide qué
+#   fases y capítulos se recalculan (ver bible_deps.py).
 # =============================================================================
 
 import azure.functions as func
 import azure.durable_functions as df
 import logging
 import json
-from datetime import timedelta
 
 # Importaciones de LYA 6.0
 try:
@@ -29,7 +59,16 @@ try:
         REFLECTION_QUALITY_THRESHOLD,
         ENABLE_EMOTIONAL_ARC_ANALYSIS,
         ENABLE_SENSORY_DETECTION,
-        ENABLE_REFLECTION_LOOPS
+        ENABLE_REFLECTION_LOOPS,
+        REFLECTION_MAX_CONCURRENCY,
+        BATCH_DEADLINE_MINUTES,
+        SENSORY_BATCH_MIN_CHAPTERS,
+        ENABLE_SPECULATIVE_EDITORIAL,
+        ENABLE_ANALYSIS_STREAMING,
+        ANALYSIS_STREAM_CHAPTERS_PER_BATCH,
+        LAYER1_RESCUE_MAX_FRAGMENTS,
+        ENABLE_EDITING_STREAMING,
+        EDITING_STREAM_CHAPTERS_PER_BATCH
     )
     logging.info("[LYA 6.0] Configuración de modelos cargada exitosamente")
 except ImportError as e:
@@ -38,376 +77,928 @@ except ImportError as e:
     ENABLE_EMOTIONAL_ARC_ANALYSIS = True
     ENABLE_SENSORY_DETECTION = True
     ENABLE_REFLECTION_LOOPS = True
+    REFLECTION_MAX_CONCURRENCY = 8
+    BATCH_DEADLINE_MINUTES = 120
+    SENSORY_BATCH_MIN_CHAPTERS = 80
+    ENABLE_SPECULATIVE_EDITORIAL = True
+    ENABLE_ANALYSIS_STREAMING = True
+    ANALYSIS_STREAM_CHAPTERS_PER_BATCH = 8
+    LAYER1_RESCUE_MAX_FRAGMENTS = 10
+    ENABLE_EDITING_STREAMING = True
+    EDITING_STREAM_CHAPTERS_PER_BATCH = 10
+
+# Payloads grandes viajan como BlobRef (solo se inspeccionan, nunca se leen aquí)
+try:
+    from payload_store import is_blobref
+    from progress_model import ProgressReporter
+    from bible_deps import bible_hash
+except ImportError:
+    from API_DURABLE.payload_store import is_blobref
+    from API_DURABLE.progress_model import ProgressReporter
+    from API_DURABLE.bible_deps import bible_hash
 
 # =============================================================================
 # CONFIGURACIÓN OPTIMIZADA
 # =============================================================================
 
 LIMIT_TO_FIRST_N_CHAPTERS = None  # None = procesar todos
-MAX_WAIT_MINUTES = 60
-
-# NUEVO: Polling adaptativo - Empieza rápido, luego incrementa
-def get_adaptive_interval(batch_type: str, attempt: int) -> int:
-    """
-    Polling inteligente: empieza rápido y va incrementando.
-    """
-    if batch_type in ['gemini', 'gemini_flash']:
-        # Secuencia: 10, 15, 20, 25, 30, 35, 40, 45, 45, ...
-        interval = 10 + (attempt * 5)
-        return min(interval, 45)
-    
-    elif batch_type == 'claude':
-        # Secuencia: 20, 35, 50, 65, 80, 90, 90, ...
-        interval = 20 + (attempt * 15)
-        return min(interval, 90)
-    
-    else:
-        return 30
 
 # =============================================================================
 # HELPERS OPTIMIZADOS
 # =============================================================================
 
-def run_gemini_pro_batch_optimized(context, analysis_type: str, items: list, bible: dict = None):
+def describe_payload(payload) -> str:
+    """Tamaño legible para logs de un payload que puede venir como BlobRef."""
+    if is_blobref(payload):
+        return f"BlobRef ({payload['__blobref__'].get('bytes', 0):,} bytes)"
+    return str(len(payload or []))
+
+
+def extend_payload(target: list, items) -> None:
+    """Agrega resultados a target; un BlobRef se agrega como un único elemento."""
+    if is_blobref(items):
+        target.append(items)
+    elif items:
+        target.extend(items)
+
+
+def chunked(items: list, size: int) -> list:
+    """Parte items en grupos consecutivos de como máximo size."""
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def chapter_groups(fragment_index: list, chapters_per_group: int) -> list:
+    """
+    Agrupa los ids de fragmento por capítulo padre (en orden de aparición) y
+    parte los capítulos en grupos de chapters_per_group. Devuelve [[fragment_id...]].
+    """
+    by_chapter = {}
+    for f in fragment_index:
+        by_chapter.setdefault(str(f.get('parent_chapter_id', f.get('id'))), []).append(str(f.get('id')))
+    return [
+        [fragment_id for chapter in group for fragment_id in chapter]
+        for group in chunked(list(by_chapter.values()), chapters_per_group)
+    ]
+
+
+# -----------------------------------------------------------------------------
+# SEGUIMIENTO DE BATCHES (BatchTrackerOrchestrator)
+# -----------------------------------------------------------------------------
+
+def batch_job(kind: str, poll_activity: str, batch_info: dict, submitted_at=None) -> dict:
+    """Describe un batch enviado para BatchTrackerOrchestrator."""
+    job = {'kind': kind, 'poll_activity': poll_activity, 'batch_info': batch_info}
+    if submitted_at is not None:
+        job['submitted_at'] = submitted_at.isoformat()
+    return job
+
+
+def batch_tracker_task(context, jobs: dict):
+    """
+    Tarea (sin yield) que espera todos los batches de jobs en una sola
+    sub-orquestación; se puede combinar con otras en task_all.
+    """
+    return context.call_sub_orchestrator('BatchTrackerOrchestrator', {
+        'jobs': jobs,
+        'deadline_minutes': BATCH_DEADLINE_MINUTES
+    })
+
+
+def track_batches(context, jobs: dict):
+    """Espera los batches de jobs. Devuelve {key: outcome} (ver BatchTrackerOrchestrator)."""
+    logging.info(f"[BATCH] Esperando {len(jobs)} batches: {', '.join(jobs)}")
+    outcomes = yield batch_tracker_task(context, jobs)
+    return outcomes
+
+
+def batch_result(outcomes: dict, key: str) -> dict:
+    """Resultado del poll final de un batch, o excepción si falló / expiró."""
+    outcome = outcomes.get(key) or {'status': 'failed', 'error': 'Sin resultado del tracker'}
+    if outcome.get('status') != 'success':
+        raise Exception(f"Batch {key} {outcome.get('status')}: {outcome.get('error')}")
+    return outcome.get('result', {})
+
+
+def gemini_pro_job(batch_info: dict) -> dict:
+    return batch_job('gemini_pro', 'PollGeminiProBatchResult', batch_info)
+
+
+def margin_notes_job(batch_info: dict) -> dict:
+    return batch_job('claude_vertex', 'PollMarginNotesBatch', batch_info)
+
+
+def submit_claude_edit_batch(context, fragments, chapter_ids, bible, consolidated, 
+                             margin_notes, book_metadata: dict):
+    """
+    Envía a un batch de Claude los fragmentos de chapter_ids (None = todos).
+    Devuelve el batch_info para poll_claude_edit_batch.
+    """
     logging.info(f"")
     logging.info(f"{'='*60}")
-    logging.info(f">>> BATCH GEMINI PRO: {analysis_type.upper()}")
-    logging.info(f"    Items: {len(items)} | Polling: ADAPTATIVO")
+    logging.info(f">>> EDICIÓN PROFESIONAL (BATCH)")
+    logging.info(f"    Capítulos: {len(chapter_ids) if chapter_ids is not None else 'todos'}")
     logging.info(f"{'='*60}")
     
     batch_input = {
-        'analysis_type': analysis_type,
-        'items': items,
-        'bible': bible or {}
+        'fragments': fragments,
+        'chapter_ids': chapter_ids,
+        'bible': bible,
+        'consolidated_chapters': consolidated,
+        'margin_notes': margin_notes,
+        'book_metadata': book_metadata
     }
     
     try:
-        batch_info = yield context.call_activity('SubmitGeminiProBatch', batch_input)
+        batch_info = yield context.call_activity('SubmitClaudeBatch', batch_input)
     except Exception as e:
-        logging.error(f"[ERROR] en SubmitGeminiProBatch [{analysis_type}]: {str(e)}")
+        logging.error(f"[ERROR] en SubmitClaudeBatch: {str(e)}")
         raise
     
     if batch_info.get('status') == 'error':
-        logging.error(f"[ERROR] Submit falló [{analysis_type}]: {batch_info.get('error')}")
-        raise Exception(f"Error submit batch {analysis_type}: {batch_info.get('error')}")
+        raise Exception(f"Error submit edición: {batch_info.get('error')}")
     
-    job_name = batch_info.get('batch_job_name', 'unknown')
-    logging.info(f"[BATCH] Batch {analysis_type} creado: {job_name}")
+    batch_id = batch_info.get('batch_id')
+    logging.info(f"[BATCH] Batch edición creado: {batch_id}")
+    return batch_info
+
+
+def poll_claude_edit_batch(context, batch_info: dict, submitted_at=None):
+    """
+    Espera el batch de edición. Devuelve (resultados o BlobRef, número de fragmentos editados).
+    """
+    outcomes = yield from track_batches(context, {
+        'edicion': batch_job('claude_vertex', 'PollClaudeBatchResult', batch_info, submitted_at)
+    })
+    result = batch_result(outcomes, 'edicion')
     
-    for attempt in range(MAX_WAIT_MINUTES):
-        interval = get_adaptive_interval('gemini', attempt)
-        next_check = context.current_utc_datetime + timedelta(seconds=interval)
-        yield context.create_timer(next_check)
-        
-        try:
-            result = yield context.call_activity('PollGeminiProBatchResult', batch_info)
-        except Exception as e:
-            logging.error(f"[ERROR] Poll [{analysis_type}] intento {attempt+1}: {str(e)}")
-            continue
-        
-        status = result.get('status', 'unknown')
-        
-        if status == 'success':
-            total_time = sum(get_adaptive_interval('gemini', i) for i in range(attempt + 1))
-            logging.info(f"[OK] BATCH {analysis_type.upper()} COMPLETADO en ~{total_time}s ({attempt+1} polls)")
-            return result.get('results', [])
-        
-        elif status == 'failed':
-            raise Exception(f"Batch {analysis_type} falló: {result.get('error')}")
+    # FIX: PollClaudeBatchResult devuelve 'results', no 'edited_chapters'
+    edited_chapters = result.get('results', result.get('edited_chapters', []))
+    total = result.get('total_processed', 0)
+    logging.info(f"✅ Capítulos editados recibidos: {total}")
+    return edited_chapters, total
+
+
+def edit_with_claude_batch_v2_optimized(context, fragments, chapter_ids, bible, consolidated, 
+                                        margin_notes, book_metadata: dict):
+    """Submit + poll del batch de edición (ver submit/poll_claude_edit_batch)."""
+    batch_info = yield from submit_claude_edit_batch(
+        context, fragments, chapter_ids, bible, consolidated, margin_notes, book_metadata
+    )
+    return (yield from poll_claude_edit_batch(context, batch_info))
+
+
+def run_reflection_fan_out(context, chapter_ids: list, base_input: dict, max_concurrency: int,
+                           progress: ProgressReporter = None):
+    """
+    Lanza una sub-orquestación ReflectionEditingOrchestrator por capítulo,
+    con como máximo max_concurrency en vuelo (ventana deslizante).
+    Devuelve los fragmentos editados en el orden en que terminan. Una
+    sub-orquestación que falla (timeout, error de replay) devuelve el mismo
+    fragmento de error que el sub-orquestador, y la Fase 11 usa el original.
+    """
+    pending = list(chapter_ids)
+    running = []      # (chapter_id, task)
+    edited = []
+    
+    while pending or running:
+        while pending and len(running) < max(1, max_concurrency):
+            chapter_id = pending.pop(0)
+            running.append((chapter_id, context.call_sub_orchestrator(
+                'ReflectionEditingOrchestrator',
+                {**base_input, 'chapter_id': chapter_id},
+                f"{context.instance_id}-reflection-{chapter_id}"
+            )))
         
-        elif status == 'processing':
-            batch_info = result
-            state = result.get('state', 'unknown')
-            logging.info(f"[WAIT] [{analysis_type}] Poll {attempt+1} (+{interval}s) - {state}")
-            context.set_custom_status(f"Batch {analysis_type}: {state} (poll {attempt+1})")
+        finished = yield context.task_any([task for _, task in running])
+        entry = next(item for item in running if item[1] is finished)
+        running.remove(entry)
+        chapter_id = entry[0]
+        if isinstance(finished.result, Exception):
+            logging.error(f"❌ Reflection cap {chapter_id} falló: {finished.result}")
+            edited.append({
+                'chapter_id': chapter_id,
+                'fragment_id': chapter_id,
+                'contenido_editado': '',
+                'cambios_estructurados': [],
+                'error': str(finished.result)
+            })
+        else:
+            edited.append(finished.result)
         
+        label = f"Reflection: {len(edited)}/{len(chapter_ids)} capítulos ({len(running)} en curso)"
+        if progress:
+            progress.update('edicion', label, completed=len(edited), total=len(chapter_ids), running=len(running))
         else:
-            batch_info = result
+            context.set_custom_status(label)
+    
+    return edited
 
-    raise Exception(f"Timeout en Batch {analysis_type}")
 
+# =============================================================================
+# GRAFO DE FASES (DAG)
+# =============================================================================
+# Cada fase declara de qué fases depende y cómo se lanza:
+#   start(r)          -> Task, lista de Tasks (fan-out) o None (fase omitida)
+#   finish(valor, r)  -> resultado de la fase (valida / transforma / lanza)
+# r es el dict de resultados de las fases ya terminadas.
+# run_phase_dag lanza cada fase en cuanto sus dependencias terminan y espera
+# con task_any, de modo que las fases independientes corren a la vez.
+# =============================================================================
 
-def analyze_with_batch_api_v2_optimized(context, fragments):
-    logging.info(f">>> ANÁLISIS CAPA 1 (FACTUAL) - POLLING ADAPTATIVO")
-    context.set_custom_status("Enviando Batch Capa 1...")
-    
-    try:
-        batch_info = yield context.call_activity('SubmitBatchAnalysis', fragments)
-    except Exception as e:
-        logging.error(f"[ERROR] en SubmitBatchAnalysis: {str(e)}")
-        raise
-    
-    if batch_info.get('error'):
-        raise Exception(f"Error submit Batch C1: {batch_info.get('error')}")
+def phase(start, deps=(), finish=None, status=None, optional=False) -> dict:
+    """
+    Declara una fase del DAG (status: texto para set_custom_status).
+    Si una fase optional lanza excepción, su finish recibe {'error': ...}
+    en vez de abortar la orquestación.
+    """
+    return {'start': start, 'deps': tuple(deps), 'finish': finish, 'status': status, 'optional': optional}
+
+
+def run_phase_dag(context, phases: dict, results: dict = None,
+                  progress: ProgressReporter = None, stage: str = None):
+    """
+    Ejecuta el DAG de fases. Devuelve (resultados, duración de cada fase).
+    El orden de declaración decide el orden de lanzamiento (determinista).
+    Con progress, el avance se publica como fases terminadas / total.
+    """
+    results = dict(results or {})
+    timings = {}
+    pending = dict(phases)
+    running = []      # (nombre, índice, task)
+    collected = {}    # nombre -> [valores] de fases con varias tasks
+    started_at = {}
     
-    batch_results = []
+    def complete(name, value):
+        finish = phases[name]['finish']
+        results[name] = finish(value, results) if finish else value
+        timings[name] = str(context.current_utc_datetime - started_at[name])
+        logging.info(f"[DAG] ✅ {name} ({timings[name]})")
     
-    for attempt in range(MAX_WAIT_MINUTES):
-        interval = get_adaptive_interval('gemini_flash', attempt)
-        next_check = context.current_utc_datetime + timedelta(seconds=interval)
-        yield context.create_timer(next_check)
-        
-        try:
-            result = yield context.call_activity('PollBatchResult', batch_info)
-        except Exception as e:
-            logging.error(f"[ERROR] en PollBatchResult intento {attempt+1}: {str(e)}")
-            continue
+    while pending or running:
+        # Lanzar todo lo que ya tiene sus dependencias (una fase omitida
+        # termina en el acto y puede desbloquear otras)
+        launched = True
+        while launched:
+            launched = False
+            for name in list(pending):
+                spec = pending[name]
+                if not all(dep in results for dep in spec['deps']):
+                    continue
+                del pending[name]
+                launched = True
+                started_at[name] = context.current_utc_datetime
+                tasks = spec['start'](results)
+                
+                if tasks is None:
+                    complete(name, None)
+                elif isinstance(tasks, list):
+                    logging.info(f"[DAG] ▶ {name} ({len(tasks)} tareas)")
+                    collected[name] = [None] * len(tasks)
+                    running.extend((name, i, task) for i, task in enumerate(tasks))
+                    if not tasks:
+                        complete(name, collected.pop(name))
+                else:
+                    logging.info(f"[DAG] ▶ {name}")
+                    running.append((name, None, tasks))
         
-        if isinstance(result, list):
-            batch_results = result
-            total_time = sum(get_adaptive_interval('gemini_flash', i) for i in range(attempt + 1))
-            logging.info(f"[OK] BATCH CAPA 1 COMPLETADO - {len(batch_results)} análisis en ~{total_time}s")
+        if not running:
+            if pending:
+                raise Exception(f"DAG bloqueado: dependencias sin resolver en {', '.join(pending)}")
             break
         
-        status = result.get('status', 'unknown')
-        if status in ['failed', 'error']:
-            break
+        # Estado visible: la fase más temprana del pipeline que sigue en curso
+        running_names = list(dict.fromkeys(name for name, _, _ in running))
+        label = next((phases[n]['status'] for n in phases if n in running_names and phases[n]['status']), None)
+        if label:
+            extra = len(running_names) - 1
+            label = f"{label} (+{extra} fases simultáneas)" if extra else label
+            if progress:
+                progress.update(stage, label, completed=sum(1 for n in phases if n in results),
+                                total=len(phases), running=running_names)
+            else:
+                context.set_custom_status(label)
         
-        batch_info = result
-        logging.info(f"[WAIT] Capa 1 - Poll {attempt+1} (+{interval}s)")
-        context.set_custom_status(f"Batch C1: {result.get('state', 'processing')} (poll {attempt+1})")
-    
-    # Identificar fragmentos faltantes
-    successful_ids = {str(r.get('fragment_id') or r.get('chapter_id') or r.get('id')) for r in batch_results if r}
-    failed_fragments = [f for f in fragments if str(f.get('id')) not in successful_ids]
+        finished = yield context.task_any([task for _, _, task in running])
+        entry = next(item for item in running if item[2] is finished)
+        running.remove(entry)
+        name, index, _ = entry
+        
+        if index is None:
+            if isinstance(finished.result, Exception):
+                if not phases[name].get('optional'):
+                    raise finished.result
+                logging.error(f"[DAG] ⚠️ {name} falló (opcional): {finished.result}")
+                complete(name, {'error': str(finished.result)})
+            else:
+                complete(name, finished.result)
+        else:
+            collected[name][index] = finished.result
+            if not any(item[0] == name for item in running):
+                complete(name, collected.pop(name))
     
-    if not failed_fragments:
-        return batch_results
+    return results, timings
 
-    # Rescate de fragmentos fallidos
-    logging.info(f"[RECOVERY] RESCATANDO {len(failed_fragments)} FRAGMENTOS")
-    final_results = list(batch_results)
-    
-    for frag in failed_fragments[:10]:
-        try:
-            res = yield context.call_activity('AnalyzeChapter', frag)
-            if res:
-                final_results.append(res)
-        except:
-            pass
-    
-    return final_results
 
+def require_submitted(batch_info: dict, label: str) -> dict:
+    """Valida la respuesta de una activity Submit*."""
+    if not isinstance(batch_info, dict) or batch_info.get('status') == 'error' or batch_info.get('error'):
+        error = batch_info.get('error') if isinstance(batch_info, dict) else batch_info
+        raise Exception(f"Error submit {label}: {error}")
+    return batch_info
 
-def run_margin_notes_batch_optimized(context, chapters: list, carta_editorial: dict, bible: dict, book_metadata: dict):
-    logging.info(f"")
-    logging.info(f"{'='*60}")
-    logging.info(f">>> FASE 8: NOTAS DE MARGEN - POLLING ADAPTATIVO")
-    logging.info(f"    Capítulos: {len(chapters)}")
-    logging.info(f"{'='*60}")
+
+def parse_json_result(value, results=None):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def build_analysis_dag(context, fragments, fragment_index: list, book_metadata: dict) -> dict:
+    """
+    Fases 2-6 (hasta la Biblia). HolisticReading solo necesita los fragmentos
+    y corre desde el principio; emocional y sensorial solo necesitan la
+    consolidación y corren mientras esperan los batches de Capa 2/3.
+    En libros muy grandes el análisis sensorial va por Batch API.
+    """
+    total_chapters = len({f.get('parent_chapter_id', f.get('id')) for f in fragment_index})
+    sensory_via_batch = ENABLE_SENSORY_DETECTION and total_chapters >= SENSORY_BATCH_MIN_CHAPTERS
     
-    batch_input = {
-        'chapters': chapters,
-        'carta_editorial': carta_editorial,
-        'bible': bible,
-        'book_metadata': book_metadata
-    }
+    groups = chapter_groups(fragment_index, ANALYSIS_STREAM_CHAPTERS_PER_BATCH) if ENABLE_ANALYSIS_STREAMING else []
+    streaming = len(groups) > 1
     
-    try:
-        batch_info = yield context.call_activity('SubmitMarginNotes', batch_input)
-    except Exception as e:
-        logging.error(f"[ERROR] en SubmitMarginNotes: {str(e)}")
-        raise
+    def layer1_rescue(manifest, fragment_ids=None):
+        if manifest is None:
+            return None
+        successful_ids = set(manifest.get('ids', []))
+        wanted = set(fragment_ids) if fragment_ids is not None else None
+        failed = [
+            f for f in fragment_index
+            if str(f.get('id')) not in successful_ids and (wanted is None or str(f.get('id')) in wanted)
+        ]
+        if not failed:
+            return None
+        logging.info(f"[RECOVERY] RESCATANDO {len(failed)} FRAGMENTOS")
+        return [
+            context.call_activity('AnalyzeChapter', {'fragments': fragments, 'fragment_id': f['id']})
+            for f in failed[:LAYER1_RESCUE_MAX_FRAGMENTS]
+        ]
     
-    if batch_info.get('status') == 'error':
-        raise Exception(f"Error submit notas: {batch_info.get('error')}")
+    def rescued(values, r):
+        return [v for v in (values or []) if v and not isinstance(v, Exception)]
     
-    batch_id = batch_info.get('batch_id')
-    logging.info(f"[BATCH] Batch notas creado: {batch_id}")
+    def layer1_manifest(key):
+        def finish(outcomes, r):
+            if outcomes is None:
+                return None
+            try:
+                manifest = batch_result(outcomes, key).get('manifest', {})
+                logging.info(f"[OK] BATCH {key.upper()} COMPLETADO - {manifest.get('count', 0)} análisis")
+                return manifest
+            except Exception as e:
+                # Se rescatan los fragmentos uno a uno
+                logging.error(f"[ERROR] {e}")
+                return {'chunks': [], 'ids': [], 'count': 0}
+        return finish
+    
+    def consolidation(value, r):
+        value = parse_json_result(value)
+        if not value:
+            raise Exception("Consolidación falló")
+        logging.info(f"[OK] Consolidación completada: {describe_payload(value)}")
+        return value
     
-    for attempt in range(MAX_WAIT_MINUTES):
-        interval = get_adaptive_interval('claude', attempt)
-        next_check = context.current_utc_datetime + timedelta(seconds=interval)
-        yield context.create_timer(next_check)
+    def layer23_submit(items):
+        return [
+            context.call_activity('SubmitGeminiProBatch', {
+                'analysis_type': analysis_type,
+                'items': items,
+                'bible': {}
+            })
+            for analysis_type in ('layer2_structural', 'layer3_qualitative')
+        ]
+    
+    def layer23_jobs(batch_infos, r):
+        if batch_infos is None:
+            return None
+        return {
+            'layer2_structural': gemini_pro_job(require_submitted(batch_infos[0], 'layer2_structural')),
+            'layer3_qualitative': gemini_pro_job(require_submitted(batch_infos[1], 'layer3_qualitative'))
+        }
+    
+    def layer23_manifests(jobs_key):
+        def finish(outcomes, r):
+            if outcomes is None:
+                return None
+            return {key: batch_result(outcomes, key).get('manifest', {}) for key in r[jobs_key]}
+        return finish
+    
+    def group_phases(g: int, fragment_ids: list) -> dict:
+        """Capa 1 -> rescate -> consolidación -> Capa 2/3 de un grupo de capítulos."""
+        label = f"(grupo {g + 1}/{len(groups)})"
         
-        try:
-            result = yield context.call_activity('PollMarginNotesBatch', batch_info)
-        except Exception as e:
-            logging.error(f"[ERROR] en PollMarginNotesBatch intento {attempt+1}: {str(e)}")
-            continue
+        def layer1_submitted(value, r):
+            if isinstance(value, dict) and value.get('status') == 'empty_input':
+                # Solo fragmentos vacíos: nada que analizar en este grupo
+                return None
+            return require_submitted(value, f'Batch C1 {label}')
         
-        status = result.get('status', 'unknown')
+        def group_consolidation(value, r):
+            value = parse_json_result(value)
+            if not value:
+                logging.warning(f"⚠️ Grupo {g + 1}: sin capítulos consolidados")
+                return None
+            return value
         
-        if status == 'success':
-            total_time = sum(get_adaptive_interval('claude', i) for i in range(attempt + 1))
-            logging.info(f"[OK] NOTAS COMPLETADAS en ~{total_time}s")
-            logging.info(f"    Total notas: {len(result.get('all_notes', []))}")
-            return result
+        def consolidate(r):
+            manifest = r[f'capa1_{g}'] or {}
+            if not manifest.get('chunks') and not r[f'capa1_rescate_{g}']:
+                return None
+            return context.call_activity('ConsolidateFragmentAnalyses', {
+                'result_manifest': manifest,
+                'fragment_analyses': r[f'capa1_rescate_{g}'],
+                'fragments': fragments,
+                'chapter_map': {}
+            })
         
-        elif status == 'failed':
-            raise Exception(f"Batch notas falló: {result.get('error')}")
+        return {
+            f'capa1_envio_{g}': phase(
+                lambda r: context.call_activity('SubmitBatchAnalysis', {
+                    'fragments': fragments,
+                    'fragment_ids': fragment_ids
+                }),
+                finish=layer1_submitted,
+                status=f"Fase 2: Capa 1 {label}..."
+            ),
+            f'capa1_{g}': phase(
+                lambda r: batch_tracker_task(context, {
+                    f'capa1_{g}': batch_job('gemini_flash', 'PollBatchResult', r[f'capa1_envio_{g}'])
+                }) if r[f'capa1_envio_{g}'] else None,
+                deps=[f'capa1_envio_{g}'],
+                finish=layer1_manifest(f'capa1_{g}'),
+                status=f"Fase 2: Capa 1 {label}..."
+            ),
+            f'capa1_rescate_{g}': phase(
+                lambda r: layer1_rescue(r[f'capa1_{g}'], fragment_ids),
+                deps=[f'capa1_{g}'],
+                finish=rescued,
+                status=f"Fase 2: Capa 1 (rescate) {label}..."
+            ),
+            f'consolidacion_{g}': phase(
+                consolidate,
+                deps=[f'capa1_{g}', f'capa1_rescate_{g}'],
+                finish=group_consolidation,
+                status=f"Fase 3: Consolidando {label}..."
+            ),
+            f'capa2_y_3_envio_{g}': phase(
+                lambda r: layer23_submit(r[f'consolidacion_{g}']) if r[f'consolidacion_{g}'] else None,
+                deps=[f'consolidacion_{g}'],
+                finish=layer23_jobs,
+                status=f"Fase 4+5: Análisis paralelo {label}..."
+            ),
+            f'capa2_y_3_{g}': phase(
+                lambda r: batch_tracker_task(context, r[f'capa2_y_3_envio_{g}']) if r[f'capa2_y_3_envio_{g}'] else None,
+                deps=[f'capa2_y_3_envio_{g}'],
+                finish=layer23_manifests(f'capa2_y_3_envio_{g}'),
+                status=f"Fase 4+5: Análisis paralelo {label}..."
+            ),
+        }
+    
+    def streaming_phases() -> dict:
+        """Fases 2-5 por grupo de capítulos + uniones con los nombres del flujo clásico."""
+        phases = {}
+        for g, fragment_ids in enumerate(groups):
+            phases.update(group_phases(g, fragment_ids))
         
-        elif status == 'processing':
-            batch_info = result
-            logging.info(f"[WAIT] Notas - Poll {attempt+1} (+{interval}s)")
-            context.set_custom_status(f"Batch notas: processing (poll {attempt+1})")
+        consolidated_keys = [f'consolidacion_{g}' for g in range(len(groups))]
+        layer23_keys = [f'capa2_y_3_{g}' for g in range(len(groups))]
         
-        else:
-            batch_info = result
-
-    raise Exception(f"Timeout en Batch notas")
-
-
-def edit_with_claude_batch_v2_optimized(context, edit_requests: list, bible: dict, consolidated: list, 
-                                        arc_map: dict, margin_notes: dict, book_metadata: dict):
-    logging.info(f"")
-    logging.info(f"{'='*60}")
-    logging.info(f">>> EDICIÓN PROFESIONAL - POLLING ADAPTATIVO")
-    logging.info(f"    Capítulos: {len(edit_requests)}")
-    logging.info(f"{'='*60}")
+        def merge_layer23(value, r):
+            merged = {'layer2_structural': [], 'layer3_qualitative': []}
+            for key in layer23_keys:
+                for field, manifest in (r[key] or {}).items():
+                    merged[field].append(manifest)
+            return merged
+        
+        phases['consolidacion'] = phase(
+            # AttachBatchResults sin attachments: une los capítulos de todos los grupos
+            lambda r: context.call_activity('AttachBatchResults', {
+                'chapters': [r[key] for key in consolidated_keys if r[key]],
+                'attachments': {}
+            }),
+            deps=consolidated_keys,
+            finish=lambda value, r: consolidation((value or {}).get('chapters'), r),
+            status="Fase 3: Consolidando..."
+        )
+        phases['capa2_y_3_paralelo'] = phase(
+            lambda r: None,
+            deps=layer23_keys,
+            finish=merge_layer23
+        )
+        return phases
     
-    batch_input = {
-        'edit_requests': edit_requests,
-        'bible': bible,
-        'consolidated_chapters': consolidated,
-        'arc_map': arc_map,
-        'margin_notes': margin_notes,
-        'book_metadata': book_metadata
+    def emotional_finish(value, r):
+        value = parse_json_result(value) or {}
+        if value.get('error'):
+            # Continuar sin análisis emocional
+            logging.error(f"[ERROR] Análisis emocional falló: {value.get('error')}")
+            return {}
+        if value:
+            logging.info(f"    Patrón global: {value.get('global_arc', {}).get('emotional_pattern', 'N/A')}")
+        return value
+    
+    def sensory_finish(value, r):
+        value = parse_json_result(value) or {}
+        if not ENABLE_SENSORY_DETECTION:
+            return value
+        ratio = value.get('global_metrics', {}).get('avg_showing_ratio', 0)
+        logging.info(f"📊 Showing Ratio Global: {ratio:.2%}")
+        
+        # SAFETY STOP: 0% EXACTO ES UN ERROR TÉCNICO
+        if ratio <= 0.0000001:
+            error_msg = "⛔ FATAL ERROR: Detección Sensorial devolvió 0% absoluto. Abortando para evitar datos corruptos."
+            logging.error(f"[ERROR CRÍTICO] {error_msg} ({value.get('error', 'sin error')})")
+            raise Exception(error_msg)
+        return value
+    
+    def attach_analyses(r):
+        attachments = dict(r['capa2_y_3_paralelo'])
+        if r['analisis_emocional']:
+            # Inyectar en consolidated para Biblia
+            attachments['emotional_arc'] = r['analisis_emocional'].get('emotional_arcs', [])
+        if r['deteccion_sensorial']:
+            # Inyectar en consolidated para notas de margen
+            attachments['sensory_analysis'] = r['deteccion_sensorial'].get('sensory_analyses', [])
+        return context.call_activity('AttachBatchResults', {
+            'chapters': r['consolidacion'],
+            'attachments': attachments
+        })
+    
+    phases = {
+        'lectura_holistica': phase(
+            lambda r: context.call_activity('HolisticReading', {'fragments': fragments}),
+            finish=parse_json_result,
+            status="Fase 6: Lectura holistica..."
+        ),
     }
+    if streaming:
+        logging.info(f"[STREAMING] Análisis en {len(groups)} grupos de {ANALYSIS_STREAM_CHAPTERS_PER_BATCH} capítulos")
+        phases.update(streaming_phases())
+    else:
+        phases.update({
+            'capa1_envio': phase(
+                lambda r: context.call_activity('SubmitBatchAnalysis', fragments),
+                finish=lambda v, r: require_submitted(v, 'Batch C1'),
+                status="Fase 2: Enviando Batch Capa 1..."
+            ),
+            'capa1': phase(
+                lambda r: batch_tracker_task(context, {
+                    'capa1': batch_job('gemini_flash', 'PollBatchResult', r['capa1_envio'])
+                }),
+                deps=['capa1_envio'],
+                finish=layer1_manifest('capa1'),
+                status="Fase 2: Capa 1..."
+            ),
+            'capa1_rescate': phase(
+                lambda r: layer1_rescue(r['capa1']),
+                deps=['capa1'],
+                finish=rescued,
+                status="Fase 2: Capa 1 (rescate)..."
+            ),
+            'consolidacion': phase(
+                lambda r: context.call_activity('ConsolidateFragmentAnalyses', {
+                    'result_manifest': r['capa1'],
+                    'fragment_analyses': r['capa1_rescate'],
+                    'fragments': fragments,
+                    'chapter_map': {}
+                }),
+                deps=['capa1', 'capa1_rescate'],
+                finish=consolidation,
+                status="Fase 3: Consolidando..."
+            ),
+            'capa2_y_3_envio': phase(
+                lambda r: layer23_submit(r['consolidacion']),
+                deps=['consolidacion'],
+                finish=layer23_jobs,
+                status="Fase 4+5: Análisis paralelo..."
+            ),
+            'capa2_y_3_paralelo': phase(
+                lambda r: batch_tracker_task(context, r['capa2_y_3_envio']),
+                deps=['capa2_y_3_envio'],
+                finish=layer23_manifests('capa2_y_3_envio'),
+                status="Fase 4+5: Análisis paralelo..."
+            ),
+        })
     
-    try:
-        batch_info = yield context.call_activity('SubmitClaudeBatch', batch_input)
-    except Exception as e:
-        logging.error(f"[ERROR] en SubmitClaudeBatch: {str(e)}")
-        raise
+    phases.update({
+        'analisis_emocional': phase(
+            lambda r: context.call_activity('EmotionalArcAnalysis', r['consolidacion'])
+            if ENABLE_EMOTIONAL_ARC_ANALYSIS else None,
+            deps=['consolidacion'],
+            finish=emotional_finish,
+            status="Fase 5.5: Arco emocional...",
+            optional=True
+        ),
+        'sensorial_envio': phase(
+            lambda r: context.call_activity('SubmitGeminiProBatch', {
+                'analysis_type': 'sensory',
+                'items': r['consolidacion'],
+                'bible': {}
+            }) if sensory_via_batch else None,
+            deps=['consolidacion'],
+            finish=lambda v, r: require_submitted(v, 'sensory') if v is not None else None,
+            status="Fase 5.6: Análisis sensorial (batch)..."
+        ),
+        'sensorial_batch': phase(
+            lambda r: batch_tracker_task(context, {
+                'sensory': batch_job('gemini_flash', 'PollGeminiProBatchResult', r['sensorial_envio'])
+            })
+            if r['sensorial_envio'] else None,
+            deps=['sensorial_envio'],
+            finish=lambda outcomes, r: batch_result(outcomes, 'sensory').get('manifest', {})
+            if outcomes is not None else None,
+            status="Fase 5.6: Análisis sensorial (batch)..."
+        ),
+        'deteccion_sensorial': phase(
+            lambda r: context.call_activity('SensoryDetectionAnalysis', (
+                {'chapters': r['consolidacion'], 'result_manifest': r['sensorial_batch']}
+                if sensory_via_batch else r['consolidacion']
+            )) if ENABLE_SENSORY_DETECTION else None,
+            deps=['consolidacion', 'sensorial_batch'],
+            finish=sensory_finish,
+            status="Fase 5.6: Análisis sensorial..."
+        ),
+        'adjuntar_analisis': phase(
+            attach_analyses,
+            deps=['consolidacion', 'capa2_y_3_paralelo', 'analisis_emocional', 'deteccion_sensorial']
+        ),
+        'biblia': phase(
+            lambda r: context.call_activity('CreateBible', {
+                "chapter_analyses": r['adjuntar_analisis']['chapters'],
+                "holistic_analysis": r['lectura_holistica'],
+                "book_metadata": book_metadata
+            }),
+            deps=['adjuntar_analisis', 'lectura_holistica'],
+            finish=parse_json_result,
+            status="Fase 6: Biblia..."
+        ),
+    })
+    return phases
+
+
+def margin_notes_phase(notes_groups: list, g: int) -> str:
+    """Fase del DAG editorial que entrega las notas del grupo g."""
+    return f'notas_margen_{g}' if notes_groups and len(notes_groups) > 1 else 'notas_margen'
+
+
+def build_editorial_dag(context, consolidated, fragments, bible: dict, book_metadata: dict,
+                        notes_chapter_ids: list = None, previous_notes=None,
+                        notes_groups: list = None) -> dict:
+    """
+    Fases 7-9 (tras aprobar la Biblia). El batch de arcos solo depende de la
+    Biblia y corre mientras se escriben la carta y las notas de margen.
+    Con notes_chapter_ids solo se regeneran las notas de esos capítulos y
+    'fusion_notas' las combina con previous_notes.
+    Con notes_groups (más de un grupo) las notas van en un batch por grupo y
+    'notas_margen' las une.
+    """
+    def margin_notes_finish(key):
+        def finish(outcomes, r):
+            result = batch_result(outcomes, key)
+            logging.info(f"    Total notas ({key}): {result.get('statistics', {}).get('total', 0)}")
+            return result
+        return finish
     
-    if batch_info.get('status') == 'error':
-        raise Exception(f"Error submit edición: {batch_info.get('error')}")
+    def submit_margin_notes(r, chapter_ids):
+        return context.call_activity('SubmitMarginNotes', {
+            'chapters': consolidated,
+            'chapter_ids': chapter_ids,
+            'carta_editorial': r['carta_editorial'].get('carta_editorial', {}),
+            'bible': bible,
+            'book_metadata': book_metadata
+        })
     
-    batch_id = batch_info.get('batch_id')
-    logging.info(f"[BATCH] Batch edición creado: {batch_id}")
+    def grouped_margin_notes() -> dict:
+        phases = {}
+        for g, chapter_ids in enumerate(notes_groups):
+            label = f"(grupo {g + 1}/{len(notes_groups)})"
+            phases[f'notas_margen_envio_{g}'] = phase(
+                lambda r, ids=chapter_ids: submit_margin_notes(r, ids),
+                deps=['carta_editorial'],
+                finish=lambda v, r, label=label: require_submitted(v, f'notas {label}'),
+                status=f"Fase 8: Notas de margen {label}..."
+            )
+            phases[f'notas_margen_{g}'] = phase(
+                lambda r, g=g: batch_tracker_task(context, {
+                    f'margin_notes_{g}': margin_notes_job(r[f'notas_margen_envio_{g}'])
+                }),
+                deps=[f'notas_margen_envio_{g}'],
+                finish=margin_notes_finish(f'margin_notes_{g}'),
+                status=f"Fase 8: Notas de margen {label}..."
+            )
+        group_keys = [f'notas_margen_{g}' for g in range(len(notes_groups))]
+        phases['notas_margen'] = phase(
+            lambda r: context.call_activity('MergeMarginNotes', {'parts': [r[key] for key in group_keys]}),
+            deps=group_keys
+        )
+        return phases
     
-    for attempt in range(MAX_WAIT_MINUTES):
-        interval = get_adaptive_interval('claude', attempt)
-        next_check = context.current_utc_datetime + timedelta(seconds=interval)
-        yield context.create_timer(next_check)
-        
-        try:
-            result = yield context.call_activity('PollClaudeBatchResult', batch_info)
-        except Exception as e:
-            logging.error(f"[ERROR] en PollClaudeBatchResult intento {attempt+1}: {str(e)}")
-            continue
-        
-        status = result.get('status', 'unknown')
-        
-        if status == 'success':
-            total_time = sum(get_adaptive_interval('claude', i) for i in range(attempt + 1))
-            logging.info(f"[OK] EDICIÓN COMPLETADA en ~{total_time}s")
-            # FIX: PollClaudeBatchResult devuelve 'results', no 'edited_chapters'
-            edited_chapters = result.get('results', result.get('edited_chapters', []))
-            logging.info(f"✅ Capítulos editados recibidos: {len(edited_chapters)}")
-            return edited_chapters
-        
-        elif status == 'failed':
-            raise Exception(f"Batch edición falló: {result.get('error')}")
-        
-        elif status == 'processing':
-            batch_info = result
-            logging.info(f"[WAIT] Edición - Poll {attempt+1} (+{interval}s)")
-            context.set_custom_status(f"Batch edición: processing (poll {attempt+1})")
-        
-        else:
-            batch_info = result
-
-    raise Exception(f"Timeout en Batch edición")
+    if notes_groups and len(notes_groups) > 1 and notes_chapter_ids is None:
+        margin_notes_phases = grouped_margin_notes()
+    else:
+        margin_notes_phases = {
+            'notas_margen_envio': phase(
+                lambda r: submit_margin_notes(r, notes_chapter_ids),
+                deps=['carta_editorial'],
+                finish=lambda v, r: require_submitted(v, 'notas'),
+                status="Fase 8: Notas de margen..."
+            ),
+            'notas_margen': phase(
+                lambda r: batch_tracker_task(context, {'margin_notes': margin_notes_job(r['notas_margen_envio'])}),
+                deps=['notas_margen_envio'],
+                finish=margin_notes_finish('margin_notes'),
+                status="Fase 8: Notas de margen..."
+            ),
+        }
+    
+    return {
+        'arcos_envio': phase(
+            lambda r: context.call_activity('SubmitGeminiProBatch', {
+                'analysis_type': 'arc_maps',
+                'items': consolidated,
+                'bible': bible
+            }),
+            finish=lambda v, r: require_submitted(v, 'arc_maps'),
+            status="Fase 9: Enviando arcos..."
+        ),
+        'carta_editorial': phase(
+            lambda r: context.call_activity('GenerateEditorialLetter', {
+                'bible': bible,
+                'consolidated_chapters': consolidated,
+                'fragments': fragments,
+                'book_metadata': book_metadata
+            }),
+            finish=parse_json_result,
+            status="Fase 7: Carta Editorial..."
+        ),
+        # FIX: USAR CONSOLIDATED EN LUGAR DE FRAGMENTS
+        **margin_notes_phases,
+        'arcos': phase(
+            lambda r: batch_tracker_task(context, {'arc_maps': gemini_pro_job(r['arcos_envio'])}),
+            deps=['arcos_envio'],
+            finish=lambda outcomes, r: batch_result(outcomes, 'arc_maps').get('manifest', {}),
+            status="Fase 9: Arcos..."
+        ),
+        'adjuntar_arcos': phase(
+            lambda r: context.call_activity('AttachBatchResults', {
+                'chapters': consolidated,
+                'attachments': {'arc_map': r['arcos']}
+            }),
+            deps=['arcos']
+        ),
+        'fusion_notas': phase(
+            lambda r: context.call_activity('MergeMarginNotes', {
+                'base': previous_notes,
+                'updates': r['notas_margen'].get('notes_by_chapter', {}),
+                'chapter_ids': notes_chapter_ids
+            }) if previous_notes is not None else None,
+            deps=['notas_margen']
+        ),
+    }
 
 
-def run_parallel_structural_qualitative(context, consolidated: list):
-    logging.info(f"")
-    logging.info(f"{'='*60}")
-    logging.info(f">>> FASE 4+5: ANÁLISIS PARALELO (STRUCTURAL + QUALITATIVE)")
-    logging.info(f"    Estrategia: EJECUTAR SIMULTÁNEAMENTE")
-    logging.info(f"{'='*60}")
+def build_editing_dag(context, notes_groups: list, single_pass_ids: list, fragments, bible,
+                      consolidated, book_metadata: dict) -> dict:
+    """
+    Fase 10 (envío): un batch single-pass de Claude por grupo de capítulos,
+    lanzado en cuanto están las notas de ese grupo. Un envío fallido no
+    detiene el DAG: sus capítulos caen al texto original en la recogida.
+    """
+    single_pass = {str(c) for c in single_pass_ids}
     
-    logging.info("[PARALLEL] Enviando ambos batches simultáneamente...")
+    def submit_group(r, g, chapter_ids):
+        if not chapter_ids:
+            return None
+        return context.call_activity('SubmitClaudeBatch', {
+            'fragments': fragments,
+            'chapter_ids': chapter_ids,
+            'bible': bible,
+            'consolidated_chapters': consolidated,
+            'margin_notes': r[margin_notes_phase(notes_groups, g)].get('notes_by_chapter', {}),
+            'book_metadata': book_metadata
+        })
     
-    batch_input_structural = {
-        'analysis_type': 'layer2_structural',
-        'items': consolidated,
-        'bible': {}
-    }
+    def submitted(chapter_ids):
+        def finish(batch_info, r):
+            if not chapter_ids:
+                return None
+            try:
+                batch_info = require_submitted(batch_info, 'edición')
+                logging.info(f"[BATCH] Batch edición creado: {batch_info.get('batch_id')} ({len(chapter_ids)} capítulos)")
+                return {'batch_info': batch_info, 'chapter_ids': chapter_ids,
+                        'submitted_at': context.current_utc_datetime}
+            except Exception as e:
+                logging.error(f"      ❌ Error enviando batch single-pass: {e}")
+                return {'error': str(e), 'chapter_ids': chapter_ids}
+        return finish
     
-    batch_input_qualitative = {
-        'analysis_type': 'layer3_qualitative',
-        'items': consolidated,
-        'bible': {}
+    phases = {}
+    for g, group in enumerate(notes_groups):
+        chapter_ids = [str(c) for c in group if str(c) in single_pass]
+        label = f" (grupo {g + 1}/{len(notes_groups)})" if len(notes_groups) > 1 else ""
+        phases[f'edicion_envio_{g}'] = phase(
+            lambda r, g=g, ids=chapter_ids: submit_group(r, g, ids),
+            deps=[margin_notes_phase(notes_groups, g)],
+            finish=submitted(chapter_ids),
+            status=f"Fase 10: Enviando edición{label}..."
+        )
+    return phases
+
+
+def collect_edit_batches(context, submissions: list):
+    """
+    Espera los batches single-pass enviados por build_editing_dag. Devuelve
+    (fragmentos editados o BlobRefs, número de capítulos). Los capítulos de
+    un grupo fallido vuelven vacíos con 'error' (texto original en Fase 11).
+    """
+    jobs = {
+        f'edicion_{g}': batch_job('claude_vertex', 'PollClaudeBatchResult', s['batch_info'], s['submitted_at'])
+        for g, s in enumerate(submissions) if s and 'batch_info' in s
     }
+    outcomes = (yield from track_batches(context, jobs)) if jobs else {}
     
-    try:
-        batch_infos = yield context.task_all([
-            context.call_activity('SubmitGeminiProBatch', batch_input_structural),
-            context.call_activity('SubmitGeminiProBatch', batch_input_qualitative)
-        ])
-        
-        batch_info_l2 = batch_infos[0]
-        batch_info_l3 = batch_infos[1]
-        
-        logging.info(f"[PARALLEL] ✅ Ambos batches enviados")
-        
-    except Exception as e:
-        logging.error(f"[ERROR] Enviando batches paralelos: {str(e)}")
-        raise
-    
-    layer2_results = None
-    layer3_results = None
-    
-    for attempt in range(MAX_WAIT_MINUTES):
-        interval = get_adaptive_interval('gemini', attempt)
-        next_check = context.current_utc_datetime + timedelta(seconds=interval)
-        yield context.create_timer(next_check)
-        
-        poll_tasks = []
-        if layer2_results is None:
-            poll_tasks.append(context.call_activity('PollGeminiProBatchResult', batch_info_l2))
-        if layer3_results is None:
-            poll_tasks.append(context.call_activity('PollGeminiProBatchResult', batch_info_l3))
-        
-        if not poll_tasks:
-            break
-        
+    edited, total = [], 0
+    for g, submission in enumerate(submissions):
+        if not submission:
+            continue
         try:
-            poll_results = yield context.task_all(poll_tasks)
-            
-            result_idx = 0
-            if layer2_results is None:
-                result_l2 = poll_results[result_idx]
-                result_idx += 1
-                
-                if result_l2.get('status') == 'success':
-                    layer2_results = result_l2.get('results', [])
-                    logging.info(f"[PARALLEL] ✅ Layer 2 COMPLETADO - {len(layer2_results)} análisis")
-                elif result_l2.get('status') == 'failed':
-                    raise Exception(f"Batch structural falló: {result_l2.get('error')}")
-                else:
-                    batch_info_l2 = result_l2
-            
-            if layer3_results is None:
-                result_l3 = poll_results[result_idx]
-                
-                if result_l3.get('status') == 'success':
-                    layer3_results = result_l3.get('results', [])
-                    logging.info(f"[PARALLEL] ✅ Layer 3 COMPLETADO - {len(layer3_results)} análisis")
-                elif result_l3.get('status') == 'failed':
-                    raise Exception(f"Batch qualitative falló: {result_l3.get('error')}")
-                else:
-                    batch_info_l3 = result_l3
-            
-            status_parts = []
-            status_parts.append("L2:✓" if layer2_results else "L2:processing")
-            status_parts.append("L3:✓" if layer3_results else "L3:processing")
-            
-            logging.info(f"[PARALLEL] Poll {attempt+1} (+{interval}s) - {' | '.join(status_parts)}")
-            context.set_custom_status(f"Análisis paralelo: {' '.join(status_parts)}")
-            
+            if 'batch_info' not in submission:
+                raise Exception(submission.get('error', 'Batch single-pass no enviado'))
+            result = batch_result(outcomes, f'edicion_{g}')
+            # FIX: PollClaudeBatchResult devuelve 'results', no 'edited_chapters'
+            extend_payload(edited, result.get('results', result.get('edited_chapters', [])))
+            total += result.get('total_processed', 0)
         except Exception as e:
-            logging.error(f"[ERROR] Poll paralelo intento {attempt+1}: {str(e)}")
-            continue
-    
-    if layer2_results is None or layer3_results is None:
-        raise Exception("Timeout en análisis paralelo")
-    
-    logging.info(f"[PARALLEL] 🎉 AMBOS ANÁLISIS COMPLETADOS")
-    return layer2_results, layer3_results
+            logging.error(f"      ❌ Error en single-pass (grupo {g + 1}): {e}")
+            # Fallback: ReconstructManuscript usa el texto original de cada capítulo
+            for chapter_id in submission['chapter_ids']:
+                edited.append({
+                    'chapter_id': chapter_id,
+                    'fragment_id': chapter_id,
+                    'contenido_editado': '',
+                    'cambios_estructurados': [],
+                    'error': str(e)
+                })
+                total += 1
+    logging.info(f"✅ Capítulos editados recibidos: {total}")
+    return edited, total
+
+
+# Fases del DAG editorial que dependen de cada parte de la Biblia
+LETTER_PHASES = ('carta_editorial',)
+MARGIN_NOTES_PHASES = ('notas_margen_envio', 'notas_margen', 'fusion_notas')
+ARC_MAP_PHASES = ('arcos_envio', 'arcos', 'adjuntar_arcos')
+
+
+def approved_bible_ref(approval, speculative_hash: str):
+    """
+    BlobRef de la Biblia aprobada si difiere de la usada hasta ahora (o no se
+    conoce la huella de esta); None si es la misma o el evento no trae huella
+    (clientes anteriores).
+    """
+    if not isinstance(approval, dict) or not approval.get('bible_hash'):
+        return None
+    if speculative_hash and approval['bible_hash'] == speculative_hash:
+        return None
+    return approval.get('bible')
+
+
+def revalidate_editorial(context, editorial: dict, diff: dict, consolidated, fragments, bible,
+                         book_metadata: dict, progress: ProgressReporter):
+    """
+    Rehace solo las fases del DAG editorial invalidadas por el diff de la
+    Biblia; las demás se reutilizan de la ejecución especulativa.
+    """
+    letter_stale = diff.get('letter_stale')
+    stale = set(LETTER_PHASES) if letter_stale else set()
+    # Las notas de margen se escriben a partir de la carta (contexto editorial y
+    # notas por capítulo): carta nueva -> notas nuevas para todos los capítulos
+    notes_chapter_ids = None if letter_stale else diff.get('margin_notes_chapters')
+    if letter_stale or notes_chapter_ids:
+        stale.update(MARGIN_NOTES_PHASES)
+    if diff.get('arc_maps_stale'):
+        stale.update(ARC_MAP_PHASES)
+
+    phases = build_editorial_dag(
+        context, consolidated, fragments, bible, book_metadata,
+        notes_chapter_ids=notes_chapter_ids,
+        previous_notes=None if letter_stale else editorial.get('notas_margen')
+    )
+    reused = {name: value for name, value in editorial.items() if name not in stale}
+    logging.info(f"[ESPECULACIÓN] Recalculando: {', '.join(sorted(stale)) or 'nada'}")
+    logging.info(f"    Notas a regenerar: {'todos los' if notes_chapter_ids is None and letter_stale else len(notes_chapter_ids or [])} capítulos")
+    return (yield from run_phase_dag(
+        context, {name: spec for name, spec in phases.items() if name in stale},
+        results=reused, progress=progress, stage='editorial'
+    ))
 
 
 # =============================================================================
@@ -418,6 +1009,7 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
     try:
         start_time = context.current_utc_datetime
         tiempos = {}
+        progress = ProgressReporter(context)
         
         logging.info(f"{'#'*70}")
         logging.info(f"#  LYA 6.0 FIX - DEVELOPMENTAL EDITOR AI")
@@ -439,190 +1031,39 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
 
         # --- FASE 1: SEGMENTACIÓN ---
         logging.info(f">>> FASE 1: SEGMENTACIÓN")
-        context.set_custom_status("Fase 1: Segmentando...")
+        progress.update('segmentacion', "Fase 1: Segmentando...")
         
         seg_result = yield context.call_activity('SegmentBook', {'job_id': job_id, 'blob_path': blob_path})
         if isinstance(seg_result, str): seg_result = json.loads(seg_result)
         if seg_result.get('error'): raise Exception(f"Segmentación: {seg_result.get('error')}")
         
+        # fragments viaja como BlobRef; el orquestador decide con el índice ligero
         fragments = seg_result.get('fragments', [])
+        fragment_index = seg_result.get('fragment_index', [])
         book_metadata.update(seg_result.get('book_metadata', {}))
-        logging.info(f"[OK] {len(fragments)} fragmentos generados")
+        logging.info(f"[OK] {len(fragment_index)} fragmentos generados")
         
         t1 = context.current_utc_datetime
         tiempos['segmentacion'] = str(t1 - start_time)
 
-        # --- FASE 2: ANÁLISIS CAPA 1 ---
-        logging.info(f">>> FASE 2: ANÁLISIS CAPA 1")
-        context.set_custom_status("Fase 2: Capa 1...")
+        # --- FASES 2-6: GRAFO DE DEPENDENCIAS ---
+        # Capa 1 → Consolidación → (Capa 2/3 ‖ Emocional ‖ Sensorial) → Biblia,
+        # con la lectura holística corriendo desde el principio (Capa 1 a 3 por
+        # grupos de capítulos si el libro da para más de un grupo)
+        logging.info(f">>> FASES 2-6: ANÁLISIS (DAG)")
+        analysis, dag_tiempos = yield from run_phase_dag(
+            context, build_analysis_dag(context, fragments, fragment_index, book_metadata),
+            progress=progress, stage='analisis'
+        )
+        tiempos.update(dag_tiempos)
         
-        layer1_results = yield from analyze_with_batch_api_v2_optimized(context, fragments)
-        t2 = context.current_utc_datetime
-        tiempos['capa1'] = str(t2 - t1)
-
-        # --- FASE 3: CONSOLIDACIÓN ---
-        logging.info(f">>> FASE 3: CONSOLIDACIÓN")
-        context.set_custom_status("Fase 3: Consolidando...")
-        
-        consol_input = {'fragment_analyses': layer1_results, 'chapter_map': {}}
-        consolidated = yield context.call_activity('ConsolidateFragmentAnalyses', consol_input)
-        if isinstance(consolidated, str): consolidated = json.loads(consolidated)
-        if not consolidated: raise Exception("Consolidación falló")
-        
-        logging.info(f"[OK] Consolidación completada: {len(consolidated)} capítulos")
-        t3 = context.current_utc_datetime
-        tiempos['consolidacion'] = str(t3 - t2)
-
-        # =====================================================================
-        # [FIX] INYECCIÓN DE CONTENIDO PERDIDO
-        # =====================================================================
-        # Recuperamos el texto de los fragmentos originales y lo metemos en los capítulos consolidados
-        logging.info(f"[FIX] Reinyectando contenido de texto en capítulos consolidados...")
-        
-        for chapter in consolidated:
-            chap_id = str(chapter.get('chapter_id', ''))
-            
-            # Buscar fragmentos que coincidan con este capítulo
-            relevant_frags = [
-                f for f in fragments 
-                if str(f.get('chapter_id', '')) == chap_id or str(f.get('id', '')) == chap_id
-            ]
-            
-            # Ordenar por secuencia
-            relevant_frags.sort(key=lambda x: x.get('sequence', 0))
-            
-            # Unir el texto
-            full_content = "\n\n".join([f.get('content', '') for f in relevant_frags])
-            
-            # Inyectar en el objeto del capítulo
-            chapter['content'] = full_content
-            
-            # Recalculamos métricas si están en 0
-            words = len(full_content.split())
-            if 'metricas_agregadas' not in chapter: chapter['metricas_agregadas'] = {}
-            if 'estructura' not in chapter['metricas_agregadas']: chapter['metricas_agregadas']['estructura'] = {}
-            
-            current_words = chapter['metricas_agregadas']['estructura'].get('total_palabras', 0)
-            if current_words == 0:
-                chapter['metricas_agregadas']['estructura']['total_palabras'] = words
-
-        logging.info(f"[FIX] Texto inyectado exitosamente en {len(consolidated)} capítulos.")
-        # =====================================================================
-
-        # --- FASE 4+5: PARALELO ---
-        logging.info(f">>> OPTIMIZACIÓN: EJECUTANDO FASE 4 Y 5 EN PARALELO")
-        context.set_custom_status("Fase 4+5: Análisis paralelo...")
-        
-        layer2_results, layer3_results = yield from run_parallel_structural_qualitative(context, consolidated)
-        
-        for i, ch in enumerate(consolidated):
-            ch_id = str(ch.get('chapter_id', i))
-            l2 = next((r for r in layer2_results if str(r.get('chapter_id')) == ch_id), {})
-            l3 = next((r for r in layer3_results if str(r.get('chapter_id')) == ch_id), {})
-            ch['layer2_structural'] = l2
-            ch['layer3_qualitative'] = l3
-        
-        t4_5 = context.current_utc_datetime
-        tiempos['capa2_y_3_paralelo'] = str(t4_5 - t3)
-
-        # =====================================================================
-        # FASE 5.5: ANÁLISIS DE ARCO EMOCIONAL (LYA 6.0)
-        # =====================================================================
-        emotional_arc_result = {}
-        if ENABLE_EMOTIONAL_ARC_ANALYSIS:
-            logging.info(f"")
-            logging.info(f"{'='*60}")
-            logging.info(f">>> FASE 5.5: ANÁLISIS DE ARCO EMOCIONAL (LYA 6.0)")
-            logging.info(f"    Capítulos: {len(consolidated)}")
-            logging.info(f"{'='*60}")
-            context.set_custom_status("Fase 5.5: Arco emocional...")
-
-            try:
-                emotional_arc_result = yield context.call_activity('EmotionalArcAnalysis', consolidated)
-                if isinstance(emotional_arc_result, str):
-                    emotional_arc_result = json.loads(emotional_arc_result)
-
-                # Inyectar en consolidated para Biblia
-                for chapter in consolidated:
-                    chap_id = str(chapter.get('chapter_id'))
-                    arc = next((a for a in emotional_arc_result.get('emotional_arcs', [])
-                               if str(a.get('chapter_id')) == chap_id), {})
-                    chapter['emotional_arc'] = arc
-
-                logging.info(f"[OK] Análisis emocional completado")
-                logging.info(f"    Patrón global: {emotional_arc_result.get('global_arc', {}).get('emotional_pattern', 'N/A')}")
-
-            except Exception as e:
-                logging.error(f"[ERROR] Análisis emocional falló: {e}")
-                # Continuar sin análisis emocional
-
-        t5_5 = context.current_utc_datetime
-        tiempos['analisis_emocional'] = str(t5_5 - t4_5)
-
-        # =====================================================================
-        # FASE 5.6: DETECCIÓN SENSORIAL (LYA 6.0)
-        # =====================================================================
-        sensory_result = {}
-        if ENABLE_SENSORY_DETECTION:
-            logging.info(f"")
-            logging.info(f"{'='*60}")
-            logging.info(f">>> FASE 5.6: DETECCIÓN SENSORIAL (LYA 6.0)")
-            logging.info(f"    Capítulos: {len(consolidated)}")
-            logging.info(f"{'='*60}")
-            context.set_custom_status("Fase 5.6: Análisis sensorial...")
-
-            try:
-                sensory_result = yield context.call_activity('SensoryDetectionAnalysis', consolidated)
-                if isinstance(sensory_result, str):
-                    sensory_result = json.loads(sensory_result)
-
-                global_metrics = sensory_result.get('global_metrics', {})
-                ratio = global_metrics.get('avg_showing_ratio', 0)
-                logging.info(f"📊 Showing Ratio Global: {ratio:.2%}")
-
-                # SAFETY STOP: 0% EXACTO ES UN ERROR TÉCNICO
-                if ratio <= 0.0000001:
-                    error_msg = "⛔ FATAL ERROR: Detección Sensorial devolvió 0% absoluto. Abortando para evitar datos corruptos."
-                    logging.error(error_msg)
-                    raise Exception(error_msg)
-
-                # Inyectar en consolidated para notas de margen
-                for chapter in consolidated:
-                    chap_id = str(chapter.get('chapter_id'))
-                    analysis = next((a for a in sensory_result.get('sensory_analyses', [])
-                                    if str(a.get('chapter_id')) == chap_id), {})
-                    chapter['sensory_analysis'] = analysis
-
-                logging.info(f"[OK] Detección sensorial completada")
-
-            except Exception as e:
-                logging.error(f"[ERROR CRÍTICO] Detección sensorial falló: {e}")
-                raise e # Detener orquestación
-
-        t5_6 = context.current_utc_datetime
-        tiempos['deteccion_sensorial'] = str(t5_6 - t5_5)
-
-        # --- FASE 6: BIBLIA ---
-        logging.info(f"")
-        logging.info(f"{'='*60}")
-        logging.info(f">>> FASE 6: BIBLIA NARRATIVA")
-        logging.info(f"{'='*60}")
-        context.set_custom_status("Fase 6: Biblia...")
-        
-        full_text = "\n".join([f"CAP {f['title']}: {f['content'][:600]}..." for f in fragments])
-        holistic = yield context.call_activity('HolisticReading', full_text)
-        if isinstance(holistic, str): holistic = json.loads(holistic)
-        
-        bible_in = {
-            "chapter_analyses": consolidated,
-            "holistic_analysis": holistic,
-            "book_metadata": book_metadata
-        }
-        bible = yield context.call_activity('CreateBible', bible_in)
-        if isinstance(bible, str): bible = json.loads(bible)
+        consolidated = analysis['adjuntar_analisis']['chapters']
+        chapter_index = analysis['adjuntar_analisis']['chapter_index']
+        emotional_arc_result = analysis['analisis_emocional'] or {}
+        sensory_result = analysis['deteccion_sensorial'] or {}
+        bible = analysis['biblia']
         
         t6 = context.current_utc_datetime
-        tiempos['biblia'] = str(t6 - t4_5)
         
         # GUARDAR PRELIMINAR
         pre_save_payload = {
@@ -636,57 +1077,106 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
             'emotional_arc_analysis': emotional_arc_result,
             'sensory_detection_analysis': sensory_result
         }
+        # Huella de la Biblia guardada: identifica los resultados especulativos
+        speculative_hash = None if is_blobref(bible) else bible_hash(bible)
         try:
-            yield context.call_activity('SaveOutputs', pre_save_payload)
+            pre_saved = yield context.call_activity('SaveOutputs', pre_save_payload)
+            speculative_hash = (pre_saved or {}).get('bible_hash') or speculative_hash
         except Exception as e:
             logging.error(f"Error guardado intermedio: {e}")
         
-        # PAUSA
-        logging.info(f"[WAIT] Esperando aprobación humana de la Biblia...")
-        context.set_custom_status("Esperando aprobacion de Biblia...")
-        yield context.wait_for_external_event("BibleApproved")
-        logging.info(f"[RESUME] Biblia aprobada.")
-
-        # --- FASE 7: CARTA ---
-        logging.info(f">>> FASE 7: CARTA EDITORIAL")
-        context.set_custom_status("Fase 7: Carta Editorial...")
+        # PLAN DE EDICIÓN (Fase 10): se decide ya qué capítulos van por reflection,
+        # para enviar el single-pass de cada grupo en cuanto estén sus notas
+        reflection_ids = []
+        single_pass_ids = []
+        if ENABLE_REFLECTION_LOOPS:
+            logging.info(f"[REFLECTION] Modo activado - Analizando calidad por capítulo...")
+            # chapter_index trae el score de Capa 3; los capítulos completos viajan como BlobRef
+            for entry in chapter_index:
+                chapter_id = entry.get('chapter_id')
+                qualitative_score = entry.get('score_global', 10.0)
+
+                # Decisión: ¿Reflection o single-pass?
+                if qualitative_score < REFLECTION_QUALITY_THRESHOLD:
+                    logging.info(f"   📖 Capítulo {chapter_id}: Score {qualitative_score:.1f} → REFLECTION LOOP")
+                    reflection_ids.append(chapter_id)
+                else:
+                    logging.info(f"   📖 Capítulo {chapter_id}: Score {qualitative_score:.1f} → SINGLE PASS")
+                    single_pass_ids.append(str(chapter_id))
         
-        carta_input = {
-            'bible': bible,
-            'consolidated_chapters': consolidated,
-            'fragments': fragments,
-            'book_metadata': book_metadata
-        }
-        carta_result = yield context.call_activity('GenerateEditorialLetter', carta_input)
-        if isinstance(carta_result, str): carta_result = json.loads(carta_result)
+        all_chapter_ids = [str(entry.get('chapter_id')) for entry in chapter_index]
+        notes_groups = chunked(
+            all_chapter_ids,
+            EDITING_STREAM_CHAPTERS_PER_BATCH if ENABLE_EDITING_STREAMING else len(all_chapter_ids)
+        )
         
-        carta_editorial = carta_result.get('carta_editorial', {})
-        carta_markdown = carta_result.get('carta_markdown', '')
+        # PAUSA (con especulación: carta, notas y arcos corren mientras se espera)
+        logging.info(f"[WAIT] Esperando aprobación humana de la Biblia ({(speculative_hash or '?')[:12]})...")
+        approval_task = context.wait_for_external_event("BibleApproved")
+        waiting_label = "Esperando aprobacion de Biblia..."
         
-        t7 = context.current_utc_datetime
-        tiempos['carta_editorial'] = str(t7 - t6)
-
-        # --- FASE 8: NOTAS ---
-        logging.info(f">>> FASE 8: NOTAS DE MARGEN")
-        context.set_custom_status("Fase 8: Notas de margen...")
+        if ENABLE_SPECULATIVE_EDITORIAL:
+            # La espera va primero: mientras siga pendiente, es el estado visible
+            logging.info(f">>> FASES 7-9: CARTA, NOTAS Y ARCOS (ESPECULATIVO)")
+            progress.update('editorial', waiting_label, waiting_for='BibleApproved', bible_hash=speculative_hash)
+            editorial, dag_tiempos = yield from run_phase_dag(
+                context, {
+                    'aprobacion_biblia': phase(lambda r: approval_task, status=waiting_label),
+                    **build_editorial_dag(context, consolidated, fragments, bible, book_metadata,
+                                          notes_groups=notes_groups)
+                },
+                progress=progress, stage='editorial'
+            )
+            approval = editorial.pop('aprobacion_biblia')
+            tiempos.update(dag_tiempos)
+            logging.info(f"[RESUME] Biblia aprobada.")
+            
+            approved_ref = approved_bible_ref(approval, speculative_hash)
+            diff = {}
+            if approved_ref is not None:
+                diff = yield context.call_activity('DiffBible', {
+                    'old': bible,
+                    'new': approved_ref,
+                    'chapter_ids': [str(entry.get('chapter_id')) for entry in chapter_index]
+                })
+                bible = approved_ref
+            if diff.get('changed'):
+                # La Biblia cambió durante la revisión: invalidar solo lo que depende de lo editado
+                editorial, dag_tiempos = yield from revalidate_editorial(
+                    context, editorial, diff, consolidated, fragments, bible, book_metadata, progress
+                )
+                tiempos.update({f"revalidacion_{name}": value for name, value in dag_tiempos.items()})
+            else:
+                logging.info(f"[ESPECULACIÓN] Biblia sin cambios: carta, notas y arcos reutilizados")
+        else:
+            progress.update('aprobacion_biblia', waiting_label, waiting_for='BibleApproved')
+            approval = yield approval_task
+            logging.info(f"[RESUME] Biblia aprobada.")
+            bible = approved_bible_ref(approval, speculative_hash) or bible
+
+            # --- FASES 7-9 (+ envío de la 10): GRAFO DE DEPENDENCIAS ---
+            # Arcos (solo Biblia) ‖ Carta → Notas de margen por grupo → Envío de la edición del grupo
+            logging.info(f">>> FASES 7-9: CARTA, NOTAS Y ARCOS (DAG)")
+            editing_phases = build_editing_dag(
+                context, notes_groups, single_pass_ids, fragments, bible, consolidated, book_metadata
+            ) if ENABLE_REFLECTION_LOOPS else {}
+            editorial, dag_tiempos = yield from run_phase_dag(
+                context, {
+                    **build_editorial_dag(context, consolidated, fragments, bible, book_metadata,
+                                          notes_groups=notes_groups),
+                    **editing_phases
+                },
+                progress=progress, stage='editorial'
+            )
+            tiempos.update(dag_tiempos)
         
-        # FIX: USAR CONSOLIDATED EN LUGAR DE FRAGMENTS
-        margin_result = yield from run_margin_notes_batch_optimized(context, consolidated, carta_editorial, bible, book_metadata)
-        margin_notes_by_chapter = {}
-        for ch_result in margin_result.get('results', []):
-            ch_id = str(ch_result.get('chapter_id', ch_result.get('fragment_id', '?')))
-            margin_notes_by_chapter[ch_id] = ch_result.get('notas_margen', [])
+        carta_editorial = editorial['carta_editorial'].get('carta_editorial', {})
+        carta_markdown = editorial['carta_editorial'].get('carta_markdown', '')
+        margin_result = editorial.get('fusion_notas') or editorial['notas_margen']
+        margin_notes_by_chapter = margin_result.get('notes_by_chapter', {})
+        consolidated = editorial['adjuntar_arcos']['chapters']
         
-        t8 = context.current_utc_datetime
-        tiempos['notas_margen'] = str(t8 - t7)
-
-        # --- FASE 9: ARCOS ---
-        logging.info(f">>> FASE 9: ARCOS POR CAPÍTULO")
-        context.set_custom_status("Fase 9: Arcos...")
-        arc_results = yield from run_gemini_pro_batch_optimized(context, 'arc_maps', consolidated, bible=bible)
-        arc_map_dict = {str(r['chapter_id']): r for r in arc_results}
         t9 = context.current_utc_datetime
-        tiempos['arcos'] = str(t9 - t8)
 
         # =====================================================================
         # FASE 10: EDICIÓN CON REFLECTION LOOPS SELECTIVOS (LYA 6.0)
@@ -694,12 +1184,13 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
         logging.info(f"")
         logging.info(f"{'='*60}")
         logging.info(f">>> FASE 10: EDICIÓN PROFESIONAL CON REFLECTION (LYA 6.0)")
-        logging.info(f"    Estrategia: Reflection para capítulos problemáticos, single-pass para buenos")
+        logging.info(f"    Estrategia: Reflection en paralelo (máx {REFLECTION_MAX_CONCURRENCY}) + un batch single-pass por grupo")
         logging.info(f"    Umbral de calidad: {REFLECTION_QUALITY_THRESHOLD}")
         logging.info(f"{'='*60}")
-        context.set_custom_status("Fase 10: Edición inteligente...")
+        progress.update('edicion', "Fase 10: Edición inteligente...")
 
         edited_fragments = []
+        edited_count = 0
         reflection_stats_global = {
             'total_chapters': 0,
             'chapters_with_reflection': 0,
@@ -709,96 +1200,52 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
         }
 
         if ENABLE_REFLECTION_LOOPS:
-            # EDICIÓN SELECTIVA CON REFLECTION LOOPS
-            logging.info(f"[REFLECTION] Modo activado - Analizando calidad por capítulo...")
-
-            for i, chapter in enumerate(consolidated):
-                chapter_id = chapter.get('chapter_id', i)
-                qualitative_data = chapter.get('layer3_qualitative', {})
-                qualitative_score = qualitative_data.get('score_global', 10.0)
-
-                reflection_stats_global['total_chapters'] += 1
-
-                # Decisión: ¿Reflection o single-pass?
-                if qualitative_score < REFLECTION_QUALITY_THRESHOLD:
-                    # CAPÍTULO PROBLEMÁTICO → REFLECTION LOOP
-                    logging.info(f"")
-                    logging.info(f"   📖 Capítulo {chapter_id}: Score {qualitative_score:.1f} → REFLECTION LOOP")
-                    context.set_custom_status(f"Reflection: Cap {chapter_id} (score {qualitative_score:.1f})...")
-
-                    reflection_stats_global['chapters_with_reflection'] += 1
-
-                    # Preparar input para ReflectionEditingLoop
-                    reflection_input = {
-                        'chapter': chapter,
-                        'bible': bible,
-                        'margin_notes': margin_notes_by_chapter.get(str(chapter_id), []),
-                        'arc_map': arc_map_dict.get(str(chapter_id), {}),
-                        'consolidated_chapters': consolidated,
-                        'metadata': book_metadata
-                    }
-
-                    try:
-                        edited_result = yield context.call_activity('ReflectionEditingLoop', reflection_input)
-                        if isinstance(edited_result, str):
-                            edited_result = json.loads(edited_result)
-
-                        # Extraer stats
-                        stats = edited_result.get('reflection_stats', {})
-                        iterations = stats.get('iterations_used', 1)
-                        final_score = stats.get('final_score', 0)
-                        improvement = stats.get('improvement_delta', 0)
-
-                        reflection_stats_global['total_iterations'] += iterations
-
-                        logging.info(f"      ✅ Completado: {iterations} iter, score {final_score:.1f} (+{improvement:.1f})")
-
-                        # Crear fragmento editado compatible con Fase 11
-                        edited_fragment = {
-                            'chapter_id': chapter_id,
-                            'fragment_id': chapter_id,
-                            'contenido_editado': edited_result.get('edited_content', ''),
-                            'cambios_estructurados': edited_result.get('changes', []),
-                            'reflection_stats': stats
-                        }
-                        edited_fragments.append(edited_fragment)
-
-                    except Exception as e:
-                        logging.error(f"      ❌ Error en reflection: {e}")
-                        # Fallback: añadir original sin editar
-                        edited_fragments.append({
-                            'chapter_id': chapter_id,
-                            'fragment_id': chapter_id,
-                            'contenido_editado': chapter.get('content', ''),
-                            'cambios_estructurados': [],
-                            'error': str(e)
-                        })
-
-                else:
-                    # CAPÍTULO BUENO → SINGLE PASS (método v5.3)
-                    logging.info(f"   📖 Capítulo {chapter_id}: Score {qualitative_score:.1f} → SINGLE PASS")
-                    reflection_stats_global['chapters_single_pass'] += 1
-
-                    # Usar el método tradicional batch para este capítulo
-                    # (Nota: En producción, podrías optimizar agrupando múltiples capítulos "buenos" en un solo batch)
-                    edit_reqs = [{'chapter': frag} for frag in fragments if str(frag.get('id', '')) == str(chapter_id) or str(frag.get('chapter_id', '')) == str(chapter_id)]
-
-                    if edit_reqs:
-                        try:
-                            single_edited = yield from edit_with_claude_batch_v2_optimized(
-                                context, edit_reqs, bible, consolidated, arc_map_dict, margin_notes_by_chapter, book_metadata
-                            )
-                            edited_fragments.extend(single_edited)
-                            reflection_stats_global['total_iterations'] += 1
-                        except Exception as e:
-                            logging.error(f"      ❌ Error en single-pass: {e}")
-                            edited_fragments.append({
-                                'chapter_id': chapter_id,
-                                'fragment_id': chapter_id,
-                                'contenido_editado': chapter.get('content', ''),
-                                'cambios_estructurados': [],
-                                'error': str(e)
-                            })
+            # EDICIÓN SELECTIVA CON REFLECTION LOOPS (plan decidido antes de la Fase 7)
+            reflection_stats_global['total_chapters'] = len(chapter_index)
+            reflection_stats_global['chapters_with_reflection'] = len(reflection_ids)
+            reflection_stats_global['chapters_single_pass'] = len(single_pass_ids)
+
+            # 1. Capítulos buenos: un batch de Claude por grupo, enviados antes del
+            #    fan-out para que procesen mientras corren los reflection loops.
+            #    Sin especulación ya salieron del DAG editorial según llegaban las notas.
+            edit_submissions = editorial
+            if ENABLE_SPECULATIVE_EDITORIAL:
+                notes_ready = {
+                    margin_notes_phase(notes_groups, g): {'notes_by_chapter': margin_notes_by_chapter}
+                    for g in range(len(notes_groups))
+                }
+                edit_submissions, dag_tiempos = yield from run_phase_dag(
+                    context, build_editing_dag(
+                        context, notes_groups, single_pass_ids, fragments, bible, consolidated, book_metadata
+                    ),
+                    results=notes_ready, progress=progress, stage='edicion'
+                )
+                tiempos.update(dag_tiempos)
+            single_submissions = [edit_submissions.get(f'edicion_envio_{g}') for g in range(len(notes_groups))]
+
+            # 2. Capítulos problemáticos: sub-orquestaciones en paralelo
+            if reflection_ids:
+                reflection_base_input = {
+                    'bible': bible,
+                    'margin_notes_by_chapter': margin_notes_by_chapter,
+                    'consolidated_chapters': consolidated,
+                    'metadata': book_metadata
+                }
+                reflected = yield from run_reflection_fan_out(
+                    context, reflection_ids, reflection_base_input, REFLECTION_MAX_CONCURRENCY, progress
+                )
+                for edited_fragment in reflected:
+                    edited_fragments.append(edited_fragment)
+                    edited_count += 1
+                    stats = edited_fragment.get('reflection_stats')
+                    reflection_stats_global['total_iterations'] += stats.get('iterations_used', 1) if stats else 0
+
+            # 3. Recoger los batches single-pass
+            if single_pass_ids:
+                single_edited, single_count = yield from collect_edit_batches(context, single_submissions)
+                extend_payload(edited_fragments, single_edited)
+                edited_count += single_count
+                reflection_stats_global['total_iterations'] += len(single_pass_ids)
 
             # Calcular promedio de iteraciones
             if reflection_stats_global['total_chapters'] > 0:
@@ -816,20 +1263,25 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
         else:
             # FALLBACK: Usar método v5.3 tradicional (batch para todo)
             logging.info(f"[FALLBACK] Reflection loops desactivado, usando método v5.3...")
-            edit_reqs = [{'chapter': frag} for frag in fragments]
-            edited_fragments = yield from edit_with_claude_batch_v2_optimized(
-                context, edit_reqs, bible, consolidated, arc_map_dict, margin_notes_by_chapter, book_metadata
+            all_edited, edited_count = yield from edit_with_claude_batch_v2_optimized(
+                context, fragments, None, bible, consolidated, margin_notes_by_chapter, book_metadata
             )
+            extend_payload(edited_fragments, all_edited)
 
-        edited_fragments.sort(key=lambda x: int(x.get('chapter_id', 0) or x.get('fragment_id', 0) or 0))
+        # El orden por capítulo lo resuelve ReconstructManuscript
         t10 = context.current_utc_datetime
         tiempos['edicion'] = str(t10 - t9)
         tiempos['edicion_reflection_stats'] = reflection_stats_global
 
         # --- FASE 11: RECONSTRUCCIÓN ---
         logging.info(f">>> FASE 11: RECONSTRUCCIÓN")
-        context.set_custom_status("Fase 11: Reconstruyendo...")
-        recon_input = {'edited_chapters': edited_fragments, 'book_name': book_name, 'bible': bible}
+        progress.update('reconstruccion', "Fase 11: Reconstruyendo...")
+        recon_input = {
+            'edited_chapters': edited_fragments,
+            'consolidated_chapters': consolidated,
+            'book_name': book_name,
+            'bible': bible
+        }
         manuscript = yield context.call_activity('ReconstructManuscript', recon_input)
         if isinstance(manuscript, str): manuscript = json.loads(manuscript)
         t11 = context.current_utc_datetime
@@ -837,7 +1289,7 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
 
         # --- FASE 12: FIN ---
         logging.info(f">>> FASE 12: GUARDADO FINAL")
-        context.set_custom_status("Finalizando...")
+        progress.update('guardado', "Finalizando...")
         t_final = context.current_utc_datetime
         tiempos['total'] = str(t_final - start_time)
         
@@ -855,10 +1307,10 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
             'margin_notes': margin_result,
             'tiempos': tiempos,
             'stats': {
-                'fragmentos_entrada': len(fragments),
-                'capitulos_consolidados': len(consolidated),
-                'capitulos_editados': len(edited_fragments),
-                'notas_margen': len(margin_result.get('all_notes', []))
+                'fragmentos_entrada': len(fragment_index),
+                'capitulos_consolidados': len(chapter_index),
+                'capitulos_editados': edited_count,
+                'notas_margen': margin_result.get('statistics', {}).get('total', 0)
             },
             # Nuevos análisis LYA 6.0
             'emotional_arc_analysis': emotional_arc_result,
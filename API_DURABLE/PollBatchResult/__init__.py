@@ -4,12 +4,98 @@
 import logging
 import json
 import os
+import sys
 import traceback
 from google import genai
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from result_cache import get_cached_result, put_cached_result
+    from payload_store import iter_jsonl, ResultManifestWriter
+    from execution_router import is_online, online_results_jsonl
+except ImportError:
+    from API_DURABLE.result_cache import get_cached_result, put_cached_result
+    from API_DURABLE.payload_store import iter_jsonl, ResultManifestWriter
+    from API_DURABLE.execution_router import is_online, online_results_jsonl
+
 logging.basicConfig(level=logging.INFO)
 
 
+def write_cached_analyses(cached_map: list, writer: ResultManifestWriter) -> int:
+    """Vuelca al manifest los análisis de fragmentos que no se enviaron al batch."""
+    found = 0
+    for item in cached_map:
+        analysis = get_cached_result(item.get('cache_key'))
+        if not isinstance(analysis, dict):
+            continue
+        analysis['fragment_id'] = item['fragment_id']
+        analysis['parent_chapter_id'] = item['parent_chapter_id']
+        writer.add(analysis, item['fragment_id'])
+        found += 1
+    if cached_map:
+        logging.info(f"♻️ Recuperados {found}/{len(cached_map)} análisis desde cache")
+    return found
+
+
+def write_batch_results(file_content_bytes: bytes, id_map_lookup: dict, writer: ResultManifestWriter) -> int:
+    """Parsea la salida JSONL del batch (o de la ejecución online) hacia el manifest."""
+    error_count = 0
+    
+    # Parseo línea a línea: cada análisis va directo a su chunk en Blob
+    for line_num, result_item in iter_jsonl(file_content_bytes):
+        if result_item is None:
+            error_count += 1
+            continue
+        
+        key = result_item.get('key')
+        if not key or key not in id_map_lookup:
+            error_count += 1
+            continue
+        
+        original_meta = id_map_lookup[key]
+        
+        response_obj = result_item.get('response', {})
+        text = None
+        
+        try:
+            candidates = response_obj.get('candidates', [])
+            if candidates:
+                content = candidates[0].get('content', {})
+                parts = content.get('parts', [])
+                if parts:
+                    text = parts[0].get('text')
+        except Exception:
+            pass
+        
+        if not text:
+            error_count += 1
+            continue
+        
+        text = text.replace('```json', '').replace('```', '').strip()
+        
+        try:
+            analysis = json.loads(text)
+            analysis['fragment_id'] = original_meta['fragment_id']
+            analysis['parent_chapter_id'] = original_meta['parent_chapter_id']
+            writer.add(analysis, original_meta['fragment_id'])
+            put_cached_result(original_meta.get('cache_key'), analysis)
+            
+        except json.JSONDecodeError:
+            error_count += 1
+    return error_count
+
+
+def build_success_response(manifest: dict, error_count: int = 0) -> dict:
+    """Solo el manifest viaja al orquestador; los análisis quedan en Blob."""
+    return {
+        "status": "success",
+        "manifest": manifest,
+        "total": manifest['count'],
+        "errors": error_count
+    }
+
+
 def main(batch_info: dict) -> dict:
     """
     Consulta el estado del batch job y extrae resultados cuando complete.
@@ -21,12 +107,27 @@ def main(batch_info: dict) -> dict:
             return {"status": "error", "error": "No API Key"}
         
         batch_job_name = batch_info.get('batch_job_name')
-        if not batch_job_name:
-            return {"status": "error", "error": "No Job Name"}
+        cached_map = batch_info.get('cached_map', [])
+        
+        # Todo el libro venía del cache: no hay job que consultar
+        if not batch_job_name and cached_map:
+            writer = ResultManifestWriter("layer1_factual")
+            write_cached_analyses(cached_map, writer)
+            return build_success_response(writer.close())
         
         id_map_list = batch_info.get('id_map', [])
         id_map_lookup = {item['key']: item for item in id_map_list if item.get('key')}
         
+        # Ejecutado online en el Submit: las respuestas ya están en batch_info
+        if is_online(batch_info):
+            writer = ResultManifestWriter("layer1_factual")
+            error_count = write_batch_results(online_results_jsonl(batch_info), id_map_lookup, writer)
+            write_cached_analyses(cached_map, writer)
+            return build_success_response(writer.close(), error_count)
+        
+        if not batch_job_name:
+            return {"status": "error", "error": "No Job Name"}
+        
         logging.info(f"🔍 Consultando estado de: {batch_job_name}")
         
         client = genai.Client(api_key=api_key)
@@ -59,61 +160,19 @@ def main(batch_info: dict) -> dict:
             
             try:
                 file_content_bytes = client.files.download(file=result_file_name)
-                text_content = file_content_bytes.decode('utf-8')
-                logging.info(f"📥 Descargados {len(text_content)} bytes")
+                logging.info(f"📥 Descargados {len(file_content_bytes)} bytes")
             except Exception as download_error:
                 logging.error(f"❌ Error descargando archivo: {download_error}")
                 return {"status": "error", "error": f"Download failed: {str(download_error)}"}
             
-            results = []
-            error_count = 0
+            writer = ResultManifestWriter("layer1_factual")
+            error_count = write_batch_results(file_content_bytes, id_map_lookup, writer)
             
-            for line_num, line in enumerate(text_content.splitlines(), 1):
-                if not line.strip():
-                    continue
-                
-                try:
-                    result_item = json.loads(line)
-                except json.JSONDecodeError:
-                    error_count += 1
-                    continue
-                
-                key = result_item.get('key')
-                if not key or key not in id_map_lookup:
-                    error_count += 1
-                    continue
-                
-                original_meta = id_map_lookup[key]
-                
-                response_obj = result_item.get('response', {})
-                text = None
-                
-                try:
-                    candidates = response_obj.get('candidates', [])
-                    if candidates:
-                        content = candidates[0].get('content', {})
-                        parts = content.get('parts', [])
-                        if parts:
-                            text = parts[0].get('text')
-                except Exception:
-                    pass
-                
-                if not text:
-                    error_count += 1
-                    continue
-                
-                text = text.replace('```json', '').replace('```', '').strip()
-                
-                try:
-                    analysis = json.loads(text)
-                    analysis['fragment_id'] = original_meta['fragment_id']
-                    analysis['parent_chapter_id'] = original_meta['parent_chapter_id']
-                    results.append(analysis)
-                    
-                except json.JSONDecodeError:
-                    error_count += 1
+            del file_content_bytes
+            logging.info(f"✅ Procesados {len(writer.ids)} resultados exitosamente")
             
-            logging.info(f"✅ Procesados {len(results)} resultados exitosamente")
+            write_cached_analyses(cached_map, writer)
+            manifest = writer.close()
             
             # Limpieza
             try:
@@ -124,7 +183,7 @@ def main(batch_info: dict) -> dict:
             except:
                 pass
             
-            return results
+            return build_success_response(manifest, error_count)
         
         # ============ JOB FAILED ============
         elif 'FAILED' in job_state or 'CANCELLED' in job_state:
@@ -142,7 +201,8 @@ def main(batch_info: dict) -> dict:
                 "status": "processing",
                 "state": job_state,
                 "batch_job_name": batch_job_name,
-                "id_map": id_map_list
+                "id_map": id_map_list,
+                "cached_map": cached_map
             }
     
     except Exception as e:
@@ -15,8 +15,14 @@ import re
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 try:
     from vertex_utils import get_batch_job_status, get_batch_job_results
+    from result_cache import get_cached_result, put_cached_result
+    from payload_store import offload_payloads
+    from execution_router import is_online, online_results
 except ImportError:
     from API_DURABLE.vertex_utils import get_batch_job_status, get_batch_job_results
+    from API_DURABLE.result_cache import get_cached_result, put_cached_result
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.execution_router import is_online, online_results
 
 logging.basicConfig(level=logging.INFO)
 
@@ -56,16 +62,62 @@ def clean_json_response(response_text: str) -> tuple:
     return {}, False
 
 
+def load_cached_edits(cached_ids: list, fragment_metadata_map: dict) -> list:
+    """Reconstruye desde el cache las ediciones de capítulos sin cambios."""
+    results = []
+    for chapter_id in cached_ids:
+        fragment_meta = fragment_metadata_map.get(chapter_id, {})
+        parsed = get_cached_result(fragment_meta.get('cache_key'))
+        if not isinstance(parsed, dict):
+            continue
+        
+        results.append({
+            'chapter_id': chapter_id,
+            'fragment_id': fragment_meta.get('fragment_id', chapter_id),
+            'parent_chapter_id': fragment_meta.get('parent_chapter_id', chapter_id),
+            'original_title': fragment_meta.get('original_title', 'Sin título'),
+            'contenido_editado': parsed.get('capitulo_editado', ''),
+            'contenido_original': fragment_meta.get('content', ''),
+            'cambios_realizados': parsed.get('cambios_realizados', []),
+            'notas_editor': parsed.get('notas_editor', ''),
+            'metadata': {
+                'status': 'success',
+                'costo_usd': 0.0,
+                'tokens_in': 0,
+                'tokens_out': 0,
+                'parse_success': True,
+                'from_cache': True
+            }
+        })
+    
+    if cached_ids:
+        logging.info(f"♻️ Recuperadas {len(results)}/{len(cached_ids)} ediciones desde cache")
+    return results
+
+
+@offload_payloads(fields=('results', 'fragment_metadata_map'))
 def main(batch_info: dict) -> object:
     try:
         batch_id = batch_info.get('batch_id')
-        if not batch_id:
-            return {"status": "error", "error": "No batch_id provided"}
-        
         fragment_metadata_map = batch_info.get('fragment_metadata_map', {})
+        cached_ids = batch_info.get('cached_ids', [])
         
-        # Consultar estado en Vertex AI
-        job_status = get_batch_job_status(batch_id)
+        # Todas las ediciones venían del cache (o no había nada que editar)
+        if not batch_id and batch_info.get('status') == 'cached':
+            results = load_cached_edits(cached_ids, fragment_metadata_map)
+            return {
+                "status": "success",
+                "results": results,
+                "batch_id": None,
+                "total_processed": len(results)
+            }
+        
+        online = is_online(batch_info)
+        if not batch_id and not online:
+            return {"status": "error", "error": "No batch_id provided"}
+        
+        # Consultar estado en Vertex AI (online: ya terminó en el Submit)
+        job_status = {'state': 'JOB_STATE_SUCCEEDED'} if online else get_batch_job_status(batch_id)
         state = job_status.get('state')
         
         logging.info(f"🤖 Vertex Batch Status: [{state}] - ID: {batch_id}")
@@ -76,6 +128,7 @@ def main(batch_info: dict) -> object:
                 "processing_status": state,
                 "batch_id": batch_id,
                 "fragment_metadata_map": fragment_metadata_map,
+                "cached_ids": cached_ids,
                 "state": state
             }
             
@@ -89,7 +142,7 @@ def main(batch_info: dict) -> object:
         elif state in ["JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"]:
             logging.info(f"✅ Batch finalizado. Descargando resultados...")
             
-            raw_results = get_batch_job_results(batch_id)
+            raw_results = online_results(batch_info) if online else get_batch_job_results(batch_id)
             
             results = []
             processed_ids = set()
@@ -161,6 +214,8 @@ def main(batch_info: dict) -> object:
                          logging.warning(f"⚠️ {chapter_id}: Contenido inválido, usando original")
                          final_content = fragment_meta.get('content', '')
                          parse_failures += 1
+                     else:
+                         put_cached_result(fragment_meta.get('cache_key'), parsed)
                 else:
                     logging.warning(f"⚠️ {chapter_id}: Parsing falló, usando original")
                     final_content = fragment_meta.get('content', '')
@@ -192,6 +247,11 @@ def main(batch_info: dict) -> object:
                 }
                 results.append(result_item)
             
+            # Capítulos que no se enviaron porque ya estaban en cache
+            cached_results = load_cached_edits(cached_ids, fragment_metadata_map)
+            results.extend(cached_results)
+            processed_ids.update(r['chapter_id'] for r in cached_results)
+            
             # Verificar faltantes
             all_ids = set(fragment_metadata_map.keys())
             missing_ids = all_ids - processed_ids
@@ -224,7 +284,8 @@ def main(batch_info: dict) -> object:
                 "status": "unknown",
                 "processing_status": state,
                 "batch_id": batch_id,
-                "fragment_metadata_map": fragment_metadata_map
+                "fragment_metadata_map": fragment_metadata_map,
+                "cached_ids": cached_ids
             }
 
     except Exception as e:
@@ -11,12 +11,106 @@
 import logging
 import json
 import os
+import sys
 import traceback
 from google import genai
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from result_cache import get_cached_result, put_cached_result
+    from payload_store import iter_jsonl, ResultManifestWriter
+    from execution_router import is_online, online_results_jsonl
+except ImportError:
+    from API_DURABLE.result_cache import get_cached_result, put_cached_result
+    from API_DURABLE.payload_store import iter_jsonl, ResultManifestWriter
+    from API_DURABLE.execution_router import is_online, online_results_jsonl
+
 logging.basicConfig(level=logging.INFO)
 
 
+def write_cached_analyses(cached_map: list, analysis_type: str, writer: ResultManifestWriter) -> int:
+    """Vuelca al manifest los análisis de capítulos que no se enviaron al batch."""
+    found = 0
+    for item in cached_map:
+        analysis = get_cached_result(item.get('cache_key'))
+        if not isinstance(analysis, dict):
+            continue
+        analysis['chapter_id'] = item.get('chapter_id', 0)
+        analysis['analysis_type'] = analysis_type
+        writer.add(analysis, analysis['chapter_id'])
+        found += 1
+    if cached_map:
+        logging.info(f"♻️ [{analysis_type}] Recuperados {found}/{len(cached_map)} análisis desde cache")
+    return found
+
+
+def write_batch_results(file_content_bytes: bytes, id_map_lookup: dict, analysis_type: str, writer: ResultManifestWriter) -> int:
+    """Parsea la salida JSONL del batch (o de la ejecución online) hacia el manifest."""
+    error_count = 0
+    
+    for line_num, row in iter_jsonl(file_content_bytes):
+        if row is None:
+            logging.warning(f"⚠️ Línea {line_num}: JSON inválido")
+            error_count += 1
+            continue
+        
+        # ─────────────────────────────────────────────────
+        # FIX #3: Usar 'key' (NO 'custom_id')
+        # ─────────────────────────────────────────────────
+        key = row.get('key')
+        if not key:
+            logging.warning(f"⚠️ Línea {line_num}: Sin 'key'")
+            error_count += 1
+            continue
+        
+        # Buscar metadatos originales
+        meta = id_map_lookup.get(key, {})
+        chapter_id = meta.get('chapter_id', 0)
+        
+        # ─────────────────────────────────────────────────
+        # FIX #4: Estructura correcta de respuesta Gemini
+        # candidates[0].content.parts[0].text
+        # ─────────────────────────────────────────────────
+        response_obj = row.get('response', {})
+        text = None
+        
+        try:
+            candidates = response_obj.get('candidates', [])
+            if candidates:
+                content = candidates[0].get('content', {})
+                parts = content.get('parts', [])
+                if parts:
+                    text = parts[0].get('text')
+        except Exception as extract_err:
+            logging.warning(f"⚠️ Línea {line_num}: Error extrayendo texto: {extract_err}")
+        
+        if not text:
+            logging.warning(f"⚠️ {key}: Sin texto en respuesta")
+            error_count += 1
+            continue
+        
+        # Limpiar markdown de JSON
+        text = text.replace('```json', '').replace('```', '').strip()
+        
+        # Parsear JSON del análisis
+        try:
+            analysis = json.loads(text)
+            
+            # Agregar metadatos
+            analysis['chapter_id'] = chapter_id
+            analysis['analysis_type'] = analysis_type
+            
+            writer.add(analysis, chapter_id)
+            put_cached_result(meta.get('cache_key'), analysis)
+            
+        except json.JSONDecodeError as je:
+            logging.warning(f"⚠️ {key}: JSON de análisis inválido: {je}")
+            error_count += 1
+            continue
+    return error_count
+
+
 def main(batch_info: dict) -> dict:
     """
     Activity Function: Consulta estado de Batch Job de Gemini Pro.
@@ -26,6 +120,38 @@ def main(batch_info: dict) -> dict:
         job_name = batch_info.get('batch_job_name')
         id_map = batch_info.get('id_map', [])
         analysis_type = batch_info.get('analysis_type', 'unknown')
+        cached_map = batch_info.get('cached_map', [])
+        
+        # Todos los capítulos venían del cache: no hay job que consultar
+        if not job_name and cached_map:
+            writer = ResultManifestWriter(analysis_type)
+            cached_count = write_cached_analyses(cached_map, analysis_type, writer)
+            manifest = writer.close()
+            return {
+                'status': 'success',
+                'analysis_type': analysis_type,
+                'total': manifest['count'],
+                'errors': 0,
+                'cached': cached_count,
+                'manifest': manifest
+            }
+        
+        # Ejecutado online en el Submit: las respuestas ya están en batch_info
+        if is_online(batch_info):
+            id_map_lookup = {item['key']: item for item in id_map if item.get('key')}
+            writer = ResultManifestWriter(analysis_type)
+            error_count = write_batch_results(online_results_jsonl(batch_info), id_map_lookup, analysis_type, writer)
+            cached_count = write_cached_analyses(cached_map, analysis_type, writer)
+            manifest = writer.close()
+            logging.info(f"✅ [{analysis_type}] {len(writer.ids)} resultados online, {error_count} errores")
+            return {
+                'status': 'success',
+                'analysis_type': analysis_type,
+                'total': manifest['count'],
+                'errors': error_count,
+                'cached': cached_count,
+                'manifest': manifest
+            }
         
         if not job_name:
             return {'status': 'error', 'error': 'No batch_job_name provided'}
@@ -46,7 +172,7 @@ def main(batch_info: dict) -> dict:
             job = client.batches.get(name=job_name)
         except Exception as api_err:
             logging.error(f"❌ Error conectando con Google API: {api_err}")
-            return {'status': 'processing', 'batch_job_name': job_name, 'id_map': id_map, 'analysis_type': analysis_type}
+            return {'status': 'processing', 'batch_job_name': job_name, 'id_map': id_map, 'analysis_type': analysis_type, 'cached_map': cached_map}
 
         # Recuperar estado de forma segura
         state = getattr(job, 'state', None)
@@ -64,6 +190,7 @@ def main(batch_info: dict) -> dict:
                 'batch_job_name': job_name,
                 'id_map': id_map,
                 'analysis_type': analysis_type,
+                'cached_map': cached_map,
                 'state': str(state)
             }
 
@@ -106,86 +233,24 @@ def main(batch_info: dict) -> dict:
             # ─────────────────────────────────────────────────────
             try:
                 file_content_bytes = client.files.download(file=result_file_name)
-                content_str = file_content_bytes.decode('utf-8')
-                logging.info(f"📥 Descargados {len(content_str)} bytes")
+                logging.info(f"📥 Descargados {len(file_content_bytes)} bytes")
             except Exception as download_error:
                 logging.error(f"❌ Error descargando: {download_error}")
                 return {'status': 'error', 'error': f'Download failed: {str(download_error)}'}
             
             # ─────────────────────────────────────────────────────
-            # PARSEAR RESULTADOS JSONL
+            # PARSEAR RESULTADOS JSONL (streaming línea a línea → Blob)
             # ─────────────────────────────────────────────────────
-            # Crear lookup para id_map
             id_map_lookup = {item['key']: item for item in id_map if item.get('key')}
             
-            results = []
-            error_count = 0
+            writer = ResultManifestWriter(analysis_type)
+            error_count = write_batch_results(file_content_bytes, id_map_lookup, analysis_type, writer)
             
-            for line_num, line in enumerate(content_str.strip().split('\n'), 1):
-                if not line.strip():
-                    continue
-                
-                try:
-                    row = json.loads(line)
-                except json.JSONDecodeError:
-                    logging.warning(f"⚠️ Línea {line_num}: JSON inválido")
-                    error_count += 1
-                    continue
-                
-                # ─────────────────────────────────────────────────
-                # FIX #3: Usar 'key' (NO 'custom_id')
-                # ─────────────────────────────────────────────────
-                key = row.get('key')
-                if not key:
-                    logging.warning(f"⚠️ Línea {line_num}: Sin 'key'")
-                    error_count += 1
-                    continue
-                
-                # Buscar metadatos originales
-                meta = id_map_lookup.get(key, {})
-                chapter_id = meta.get('chapter_id', 0)
-                
-                # ─────────────────────────────────────────────────
-                # FIX #4: Estructura correcta de respuesta Gemini
-                # candidates[0].content.parts[0].text
-                # ─────────────────────────────────────────────────
-                response_obj = row.get('response', {})
-                text = None
-                
-                try:
-                    candidates = response_obj.get('candidates', [])
-                    if candidates:
-                        content = candidates[0].get('content', {})
-                        parts = content.get('parts', [])
-                        if parts:
-                            text = parts[0].get('text')
-                except Exception as extract_err:
-                    logging.warning(f"⚠️ Línea {line_num}: Error extrayendo texto: {extract_err}")
-                
-                if not text:
-                    logging.warning(f"⚠️ {key}: Sin texto en respuesta")
-                    error_count += 1
-                    continue
-                
-                # Limpiar markdown de JSON
-                text = text.replace('```json', '').replace('```', '').strip()
-                
-                # Parsear JSON del análisis
-                try:
-                    analysis = json.loads(text)
-                    
-                    # Agregar metadatos
-                    analysis['chapter_id'] = chapter_id
-                    analysis['analysis_type'] = analysis_type
-                    
-                    results.append(analysis)
-                    
-                except json.JSONDecodeError as je:
-                    logging.warning(f"⚠️ {key}: JSON de análisis inválido: {je}")
-                    error_count += 1
-                    continue
+            del file_content_bytes
+            logging.info(f"✅ Procesados {len(writer.ids)} resultados, {error_count} errores")
             
-            logging.info(f"✅ Procesados {len(results)} resultados, {error_count} errores")
+            cached_count = write_cached_analyses(cached_map, analysis_type, writer)
+            manifest = writer.close()
             
             # ─────────────────────────────────────────────────────
             # LIMPIEZA DE ARCHIVOS
@@ -199,9 +264,10 @@ def main(batch_info: dict) -> dict:
             return {
                 'status': 'success',
                 'analysis_type': analysis_type,
-                'total': len(results),
+                'total': manifest['count'],
                 'errors': error_count,
-                'results': results
+                'cached': cached_count,
+                'manifest': manifest
             }
 
         # =======================================================
@@ -213,7 +279,8 @@ def main(batch_info: dict) -> dict:
             'state': str(state),
             'batch_job_name': job_name,
             'id_map': id_map,
-            'analysis_type': analysis_type
+            'analysis_type': analysis_type,
+            'cached_map': cached_map
         }
 
     except Exception as e:
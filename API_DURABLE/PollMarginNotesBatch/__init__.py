@@ -14,22 +14,85 @@ import re
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 try:
     from vertex_utils import get_batch_job_status, get_batch_job_results
+    from result_cache import get_cached_result, put_cached_result
+    from payload_store import offload_payloads
+    from execution_router import is_online, online_results
 except ImportError:
     from API_DURABLE.vertex_utils import get_batch_job_status, get_batch_job_results
+    from API_DURABLE.result_cache import get_cached_result, put_cached_result
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.execution_router import is_online, online_results
 
 logging.basicConfig(level=logging.INFO)
 
 
+def build_chapter_result(parsed: dict, ch_id: str, metadata: dict) -> dict:
+    """Arma el resultado de un capítulo a partir de la respuesta parseada."""
+    return {
+        "chapter_id": metadata.get('parent_chapter_id', ch_id),
+        "fragment_id": metadata.get('fragment_id', ch_id),
+        "original_title": metadata.get('original_title', 'Sin título'),
+        "notas_margen": parsed.get('notas_margen', []),
+        "resumen_capitulo": parsed.get('resumen_capitulo', {}),
+        "status": "success"
+    }
+
+
+def load_cached_notes(cached_ids: list, chapter_metadata: dict) -> list:
+    """Recupera del cache las notas de capítulos que no se enviaron al batch."""
+    results = []
+    for ch_id in cached_ids:
+        metadata = chapter_metadata.get(ch_id, {})
+        parsed = get_cached_result(metadata.get('cache_key'))
+        if isinstance(parsed, dict):
+            results.append(build_chapter_result(parsed, ch_id, metadata))
+    if cached_ids:
+        logging.info(f"♻️ Recuperadas notas de {len(results)}/{len(cached_ids)} capítulos desde cache")
+    return results
+
+
+def build_success_response(results: list) -> dict:
+    """Respuesta final con todas las notas y sus estadísticas."""
+    all_notes = []
+    notes_by_chapter = {}
+    for chapter_result in results:
+        all_notes.extend(chapter_result.get('notas_margen', []))
+        ch_id = str(chapter_result.get('chapter_id', chapter_result.get('fragment_id', '?')))
+        notes_by_chapter[ch_id] = chapter_result.get('notas_margen', [])
+    
+    stats = calcular_estadisticas_notas(all_notes)
+    
+    logging.info(f"📊 Total notas generadas: {len(all_notes)}")
+    
+    return {
+        "status": "success",
+        "results": results,
+        "all_notes": all_notes,
+        "notes_by_chapter": notes_by_chapter,
+        "statistics": stats,
+        "total": len(results),
+        "errors": 0 # Simplificado
+    }
+
+
+@offload_payloads(fields=('results', 'all_notes', 'notes_by_chapter', 'chapter_metadata'))
 def main(batch_info: dict) -> dict:
     try:
         batch_id = batch_info.get('batch_id')
         chapter_metadata = batch_info.get('chapter_metadata', {})
+        cached_ids = batch_info.get('cached_ids', [])
+        
+        online = is_online(batch_info)
         
-        if not batch_id:
+        # Todas las notas venían del cache: no hay job que consultar
+        if not batch_id and cached_ids and not online:
+            return build_success_response(load_cached_notes(cached_ids, chapter_metadata))
+        
+        if not batch_id and not online:
             return {"error": "batch_id no proporcionado", "status": "error"}
         
-        # Consultar estado
-        job_status = get_batch_job_status(batch_id)
+        # Consultar estado (online: ya terminó en el Submit)
+        job_status = {'state': 'JOB_STATE_SUCCEEDED'} if online else get_batch_job_status(batch_id)
         state = job_status.get('state')
         
         logging.info(f"📊 Vertex Batch Notes Status [{state}] - ID: {batch_id}")
@@ -40,6 +103,7 @@ def main(batch_info: dict) -> dict:
                 "processing_status": state,
                 "batch_id": batch_id,
                 "chapter_metadata": chapter_metadata,
+                "cached_ids": cached_ids,
                 "state": state
             }
             
@@ -53,10 +117,9 @@ def main(batch_info: dict) -> dict:
         # Batch completado
         logging.info(f"✅ Batch notas completado. Descargando resultados...")
         
-        raw_results = get_batch_job_results(batch_id)
+        raw_results = online_results(batch_info) if online else get_batch_job_results(batch_id)
         
         results = []
-        all_notes = []
         processed_ids = set()
         
         for item in raw_results:
@@ -96,31 +159,13 @@ def main(batch_info: dict) -> dict:
             processed_ids.add(ch_id)
             metadata = chapter_metadata.get(ch_id, {})
             
-            chapter_result = {
-                "chapter_id": metadata.get('parent_chapter_id', ch_id),
-                "fragment_id": metadata.get('fragment_id', ch_id),
-                "original_title": metadata.get('original_title', 'Sin título'),
-                "notas_margen": parsed.get('notas_margen', []),
-                "resumen_capitulo": parsed.get('resumen_capitulo', {}),
-                "status": "success"
-            }
-            
-            results.append(chapter_result)
-            all_notes.extend(parsed.get('notas_margen', []))
-        
-        # Estadísticas
-        stats = calcular_estadisticas_notas(all_notes)
+            results.append(build_chapter_result(parsed, ch_id, metadata))
+            if parsed.get('notas_margen'):
+                put_cached_result(metadata.get('cache_key'), parsed)
         
-        logging.info(f"📊 Total notas generadas: {len(all_notes)}")
+        results.extend(load_cached_notes(cached_ids, chapter_metadata))
         
-        return {
-            "status": "success",
-            "results": results,
-            "all_notes": all_notes,
-            "statistics": stats,
-            "total": len(results),
-            "errors": 0 # Simplificado
-        }
+        return build_success_response(results)
         
     except Exception as e:
         logging.error(f"❌ Error en poll: {str(e)}")
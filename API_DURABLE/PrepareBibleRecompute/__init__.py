@@ -0,0 +1,56 @@
+# =============================================================================
+# PrepareBibleRecompute/__init__.py - LYA 6.0
+# =============================================================================
+# Primer paso de BibleRecomputeOrchestrator: toma los capítulos ya editados
+# (capitulos_consolidados.json) y deja solo los que hay que reeditar, con la
+# forma que esperan SubmitMarginNotes y SubmitClaudeBatch (texto ORIGINAL en
+# 'content'). También entrega las notas de margen vigentes, que se reutilizan
+# en los capítulos cuyas notas no cambian.
+#
+# Input:  {"chapters": BlobRef, "margin_notes": BlobRef|None, "chapter_ids": [...]}
+# Output: {"chapters": BlobRef, "notes_by_chapter": BlobRef, "chapter_ids": [...]}
+# =============================================================================
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+
+logging.basicConfig(level=logging.INFO)
+
+
+@offload_payloads(fields=('chapters', 'notes_by_chapter'))
+def main(input_data: dict) -> dict:
+    wanted = {str(c) for c in input_data.get('chapter_ids') or []}
+    margin_notes = input_data.get('margin_notes') or {}
+
+    chapters = []
+    for chapter in input_data.get('chapters') or []:
+        chapter_id = str(chapter.get('chapter_id'))
+        if chapter_id not in wanted:
+            continue
+        title = chapter.get('original_title') or chapter.get('titulo') or f"Capítulo {chapter_id}"
+        chapters.append({
+            'id': chapter_id,
+            'chapter_id': chapter_id,
+            'parent_chapter_id': chapter_id,
+            'title': title,
+            'original_title': title,
+            'content': chapter.get('contenido_original') or chapter.get('content', '')
+        })
+
+    missing = wanted - {c['chapter_id'] for c in chapters}
+    if missing:
+        logging.warning(f"⚠️ Capítulos a recalcular sin texto original: {sorted(missing)}")
+
+    logging.info(f"📚 Recalculo por Biblia: {len(chapters)} capítulos preparados")
+    return {
+        'chapters': chapters,
+        'notes_by_chapter': margin_notes.get('notes_by_chapter', {}),
+        'chapter_ids': [c['chapter_id'] for c in chapters]
+    }
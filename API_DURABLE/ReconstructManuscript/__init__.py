@@ -4,8 +4,17 @@
 
 import logging
 import json
+import os
+import sys
 import re
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+
 logging.basicConfig(level=logging.INFO)
 
 def sanitize_content(content: str, fragment_id: str) -> str:
@@ -101,6 +110,7 @@ def get_changes_robust(fragment: dict) -> list:
             return val
     return []
 
+@offload_payloads(fields=('manuscripts', 'consolidated_chapters'))
 def main(inputData: dict) -> dict:
     logging.info("📚 Starting ReconstructManuscript (Robust V3)...")
     
@@ -108,10 +118,27 @@ def main(inputData: dict) -> dict:
         try: inputData = json.loads(inputData)
         except: inputData = {}
             
-    edited_chapters = inputData.get('edited_chapters', [])
+    # Los lotes de edición batch llegan como listas anidadas (BlobRef hidratados)
+    edited_chapters = []
+    for item in inputData.get('edited_chapters', []):
+        if isinstance(item, list):
+            edited_chapters.extend(item)
+        else:
+            edited_chapters.append(item)
     book_name = inputData.get('book_name', 'Libro')
     bible = inputData.get('bible', {})
     
+    # Fallbacks sin texto (reflection fallida): usar el original del capítulo
+    source_text = {
+        str(c.get('chapter_id')): c.get('content', '')
+        for c in (inputData.get('consolidated_chapters') or [])
+    }
+    for frag in edited_chapters:
+        if isinstance(frag, dict) and not (frag.get('contenido_editado') or frag.get('edited_content')):
+            original = source_text.get(str(frag.get('parent_chapter_id') or frag.get('chapter_id')), '')
+            frag['contenido_editado'] = original
+            frag.setdefault('contenido_original', original)
+    
     if not edited_chapters:
         return {'status': 'error', 'error': 'No edited chapters provided'}
     
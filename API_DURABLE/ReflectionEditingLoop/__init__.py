@@ -23,8 +23,10 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 try:
     from vertex_utils import resolve_vertex_model_id
+    from payload_store import offload_payloads
 except ImportError:
     from API_DURABLE.vertex_utils import resolve_vertex_model_id
+    from API_DURABLE.payload_store import offload_payloads
 
 # Fallback por si no existe config_models
 try:
@@ -131,6 +133,7 @@ Responde JSON:
 # LÓGICA PRINCIPAL
 # =============================================================================
 
+@offload_payloads(fields=('edited_content', 'changes'))
 def main(input_data: dict) -> dict:
     try:
         gemini_key = os.environ.get('GEMINI_API_KEY')
@@ -160,6 +163,17 @@ def main(input_data: dict) -> dict:
         bible = input_data.get('bible', {})
         margin_notes = input_data.get('margin_notes', [])
         metadata = input_data.get('metadata', {})
+        
+        # El orquestador solo envía el chapter_id; el capítulo y sus notas
+        # salen de los payloads (BlobRef) ya hidratados
+        chapter_id = str(input_data.get('chapter_id', ''))
+        if not chapter and chapter_id:
+            chapter = next(
+                (c for c in input_data.get('consolidated_chapters', []) if str(c.get('chapter_id')) == chapter_id),
+                {}
+            )
+        if not margin_notes and chapter_id:
+            margin_notes = (input_data.get('margin_notes_by_chapter') or {}).get(chapter_id, [])
 
         original_text = chapter.get('content', '')
         chapter_title = chapter.get('title', 'Capítulo')
@@ -0,0 +1,55 @@
+# =============================================================================
+# ReflectionEditingOrchestrator/__init__.py - LYA 6.0
+# =============================================================================
+# Sub-orquestación de UN capítulo en reflection loop.
+# El orquestador principal lanza una por capítulo problemático (fan-out con
+# límite de concurrencia), de modo que la fase de edición dura lo que el
+# capítulo más lento y no la suma de todos.
+#
+# Nunca lanza excepción: si la activity falla devuelve un fragmento vacío
+# con 'error' y ReconstructManuscript usa el texto original.
+# =============================================================================
+
+import azure.durable_functions as df
+import logging
+import json
+
+
+def orchestrator_function(context: df.DurableOrchestrationContext):
+    reflection_input = context.get_input() or {}
+    chapter_id = reflection_input.get('chapter_id')
+
+    try:
+        edited_result = yield context.call_activity('ReflectionEditingLoop', reflection_input)
+        if isinstance(edited_result, str):
+            edited_result = json.loads(edited_result)
+        if edited_result.get('error'):
+            raise Exception(edited_result['error'])
+
+        stats = edited_result.get('reflection_stats', {})
+        logging.info(
+            f"      ✅ Cap {chapter_id}: {stats.get('iterations_used', 1)} iter, "
+            f"score {stats.get('final_score', 0):.1f} (+{stats.get('improvement_delta', 0):.1f})"
+        )
+
+        # Fragmento editado compatible con Fase 11
+        return {
+            'chapter_id': chapter_id,
+            'fragment_id': chapter_id,
+            'contenido_editado': edited_result.get('edited_content', ''),
+            'cambios_estructurados': edited_result.get('changes', []),
+            'reflection_stats': stats
+        }
+
+    except Exception as e:
+        logging.error(f"      ❌ Error en reflection cap {chapter_id}: {e}")
+        return {
+            'chapter_id': chapter_id,
+            'fragment_id': chapter_id,
+            'contenido_editado': '',
+            'cambios_estructurados': [],
+            'error': str(e)
+        }
+
+
+main = df.Orchestrator.create(orchestrator_function)
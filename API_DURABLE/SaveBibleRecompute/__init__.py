@@ -0,0 +1,185 @@
+# =============================================================================
+# SaveBibleRecompute/__init__.py - LYA 6.0
+# =============================================================================
+# Último paso de BibleRecomputeOrchestrator: parchea en lya-outputs solo los
+# capítulos recalculados, sin pasar por SaveOutputs (que reescribe todo):
+#
+#   - notas_margen.json           -> notas de margin_notes_chapters
+#   - capitulos_consolidados.json -> contenido_editado / cambios_realizados
+#   - cambios_estructurados.json  -> cambios nuevos de los capítulos (con ETag,
+#                                    igual que la compactación de decisiones)
+#   - shards de esos capítulos + índice
+#   - biblia_aplicada.json        -> la Biblia que produjo los artefactos
+#
+# Los cambios nuevos llevan ids con la huella de la Biblia, así las decisiones
+# antiguas del log no se aplican a cambios que no vio el usuario. Un cambio
+# idéntico (original y editado) a uno ya decidido conserva la decisión.
+#
+# Input:  {"job_id", "bible", "bible_hash", "chapter_ids", "margin_notes_chapters",
+#          "margin_notes" ({chapter_id: [...]}), "edited_chapters" ([...])}
+# Output: {"status": "success", "chapters": n, "changes": n, "kept_decisions": n}
+# =============================================================================
+
+import logging
+import json
+import os
+import sys
+from datetime import datetime
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+    from project_index import upsert_project
+    from artifact_shards import build_chapter_shards, chapters_index_path, chapter_shard_path, changes_shard_path, count_by_status, group_changes_by_chapter
+    from bible_deps import APPLIED_BIBLE_FILE
+    from SaveOutputs.structure_changes import structure_changes
+    from MergeMarginNotes import merge_margin_notes
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.project_index import upsert_project
+    from API_DURABLE.artifact_shards import build_chapter_shards, chapters_index_path, chapter_shard_path, changes_shard_path, count_by_status, group_changes_by_chapter
+    from API_DURABLE.bible_deps import APPLIED_BIBLE_FILE
+    from API_DURABLE.SaveOutputs.structure_changes import structure_changes
+    from API_DURABLE.MergeMarginNotes import merge_margin_notes
+
+logging.basicConfig(level=logging.INFO)
+
+OUTPUTS_CONTAINER = "lya-outputs"
+VIEW_WRITE_MAX_RETRIES = 5
+
+
+def rebuild_changes(view: dict, chapters: list, patched: list, revision: str) -> int:
+    """
+    Sustituye en la vista los cambios de los capítulos parcheados. Retorna
+    cuántas decisiones previas se conservaron.
+    """
+    previous = group_changes_by_chapter(view.get('changes', []))
+    by_chapter = dict(previous)
+    for chapter in patched:
+        by_chapter[str(chapter.get('chapter_id'))] = []
+
+    kept = 0
+    for chapter_changes in group_changes_by_chapter(structure_changes(patched)['changes']).values():
+        chapter_id = str(chapter_changes[0].get('chapter_id'))
+        decided = {
+            (c.get('original'), c.get('editado')): c for c in previous.get(chapter_id, [])
+            if c.get('status', 'pending') != 'pending'
+        }
+        for index, change in enumerate(chapter_changes):
+            change['change_id'] = f"ch{chapter_id}-b{revision}-change-{str(index).zfill(3)}"
+            decision = decided.get((change.get('original'), change.get('editado')))
+            if decision:
+                change['status'] = decision['status']
+                change['user_decision'] = decision.get('user_decision')
+                kept += 1
+        by_chapter[chapter_id] = chapter_changes
+
+    order = [str(c.get('chapter_id')) for c in chapters]
+    order += [cid for cid in by_chapter if cid not in order]
+    changes = [change for cid in order for change in by_chapter.get(cid, [])]
+
+    changes_by_type = {}
+    for change in changes:
+        changes_by_type[change.get('tipo', 'otro')] = changes_by_type.get(change.get('tipo', 'otro'), 0) + 1
+
+    view['changes'] = changes
+    view['total_changes'] = len(changes)
+    view['changes_by_type'] = changes_by_type
+    view['decision_stats'] = {**count_by_status(changes), 'updated_at': datetime.utcnow().isoformat() + 'Z'}
+    return kept
+
+
+@offload_payloads(fields=())
+def main(input_data: dict) -> dict:
+    job_id = input_data['job_id']
+    bible = input_data.get('bible') or {}
+    revision = (input_data.get('bible_hash') or '')[:8] or datetime.utcnow().strftime('%H%M%S')
+    chapter_ids = [str(c) for c in input_data.get('chapter_ids') or []]
+    margin_ids = [str(c) for c in input_data.get('margin_notes_chapters') or []]
+    edited = {str(c.get('chapter_id')): c for c in input_data.get('edited_chapters') or []}
+
+    service = BlobServiceClient.from_connection_string(os.environ['AzureWebJobsStorage'])
+    container = service.get_container_client(OUTPUTS_CONTAINER)
+
+    def read(name, default=None):
+        try:
+            return json.loads(container.get_blob_client(f"{job_id}/{name}").download_blob().readall())
+        except ResourceNotFoundError:
+            return default
+
+    def upload(path, content, **kwargs):
+        data = content if isinstance(content, (str, bytes)) else json.dumps(content, indent=2, ensure_ascii=False)
+        container.get_blob_client(path).upload_blob(
+            data, overwrite=True, content_settings=ContentSettings(content_type='application/json'), **kwargs
+        )
+
+    # A. Notas de margen
+    if margin_ids:
+        notes = merge_margin_notes(read('notas_margen.json', {}), input_data.get('margin_notes') or {}, margin_ids)
+        upload(f"{job_id}/notas_margen.json", notes)
+        logging.info(f"✅ Notas de margen actualizadas: {len(margin_ids)} capítulos")
+
+    # B. Capítulos editados
+    chapters = read('capitulos_consolidados.json', [])
+    patched = []
+    now = datetime.utcnow().isoformat() + 'Z'
+    for chapter in chapters:
+        new = edited.get(str(chapter.get('chapter_id')))
+        if new is None or str(chapter.get('chapter_id')) not in chapter_ids:
+            continue
+        chapter['contenido_editado'] = new.get('contenido_editado', chapter.get('contenido_editado', ''))
+        chapter['cambios_realizados'] = new.get('cambios_realizados', [])
+        chapter['bible_revision'] = revision
+        chapter['recomputed_at'] = now
+        patched.append(chapter)
+    upload(f"{job_id}/capitulos_consolidados.json", chapters)
+
+    # C. Vista de cambios (ETag: puede coincidir con una compactación de decisiones)
+    view, kept = None, 0
+    for _ in range(VIEW_WRITE_MAX_RETRIES):
+        try:
+            downloader = container.get_blob_client(f"{job_id}/cambios_estructurados.json").download_blob()
+            view, etag = json.loads(downloader.readall()), downloader.properties.etag
+            conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+        except ResourceNotFoundError:
+            view, conditions = {'changes': []}, {}
+        kept = rebuild_changes(view, chapters, patched, revision)
+        try:
+            upload(f"{job_id}/cambios_estructurados.json", view, **conditions)
+            break
+        except ResourceModifiedError:
+            continue
+    else:
+        raise Exception(f"cambios_estructurados.json de {job_id}: {VIEW_WRITE_MAX_RETRIES} conflictos seguidos")
+
+    # D. Shards de los capítulos tocados + índice
+    shards = build_chapter_shards(job_id, chapters, view)
+    for chapter in patched:
+        for path in (chapter_shard_path(job_id, chapter.get('chapter_id')), changes_shard_path(job_id, chapter.get('chapter_id'))):
+            if path in shards:
+                upload(path, shards[path])
+    upload(chapters_index_path(job_id), shards[chapters_index_path(job_id)])
+
+    # E. Biblia aplicada + metadata
+    upload(f"{job_id}/{APPLIED_BIBLE_FILE}", bible)
+    metadata = read('metadata.json')
+    if metadata is not None:
+        metadata['status'] = 'completed'
+        metadata['bible_revision'] = revision
+        metadata['bible_recomputed_at'] = now
+        upload(f"{job_id}/metadata.json", metadata)
+        try:
+            upsert_project(service, {**metadata, 'job_id': job_id})
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo actualizar el índice de proyectos: {e}")
+
+    logging.info(f"✅ Recalculo por Biblia guardado: {len(patched)} capítulos, {kept} decisiones conservadas")
+    return {
+        'status': 'success',
+        'chapters': len(patched),
+        'changes': len(view.get('changes', [])),
+        'kept_decisions': kept
+    }
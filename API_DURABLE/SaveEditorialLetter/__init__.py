@@ -0,0 +1,70 @@
+# =============================================================================
+# SaveEditorialLetter/__init__.py - LYA 6.0
+# =============================================================================
+# Guarda una carta editorial regenerada (EditorialLetterOrchestrator) sin pasar
+# por SaveOutputs: solo carta_editorial.json/.md, metadata e índice.
+#
+# Input:  {"job_id", "carta_editorial" (BlobRef o dict), "carta_markdown"}
+# Output: {"status": "success", "sections": [...], "has_markdown": bool}
+# =============================================================================
+
+import logging
+import json
+import os
+import sys
+from datetime import datetime
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+    from project_index import upsert_project
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.project_index import upsert_project
+
+logging.basicConfig(level=logging.INFO)
+
+OUTPUTS_CONTAINER = "lya-outputs"
+
+
+@offload_payloads(fields=())
+def main(input_data: dict) -> dict:
+    job_id = input_data['job_id']
+    carta_editorial = input_data.get('carta_editorial') or {}
+    carta_markdown = input_data.get('carta_markdown') or ''
+
+    if not carta_editorial:
+        raise ValueError("La carta editorial generada está vacía")
+
+    service = BlobServiceClient.from_connection_string(os.environ['AzureWebJobsStorage'])
+    container = service.get_container_client(OUTPUTS_CONTAINER)
+
+    def upload(path, content, content_type):
+        container.get_blob_client(path).upload_blob(
+            content, overwrite=True, content_settings=ContentSettings(content_type=content_type)
+        )
+
+    upload(f"{job_id}/carta_editorial.json", json.dumps(carta_editorial, ensure_ascii=False, indent=2), 'application/json')
+    if carta_markdown:
+        upload(f"{job_id}/carta_editorial.md", carta_markdown, 'text/markdown')
+    logging.info(f"✅ carta_editorial guardada ({'json + md' if carta_markdown else 'json'})")
+
+    try:
+        meta_client = container.get_blob_client(f"{job_id}/metadata.json")
+        metadata = json.loads(meta_client.download_blob().readall())
+        metadata['status'] = 'completed'
+        metadata['carta_regenerated_at'] = datetime.utcnow().isoformat() + 'Z'
+        upload(f"{job_id}/metadata.json", json.dumps(metadata, ensure_ascii=False), 'application/json')
+        upsert_project(service, {**metadata, 'job_id': job_id})
+    except ResourceNotFoundError:
+        logging.warning(f"⚠️ No se encontró metadata de {job_id}")
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudo actualizar metadata: {e}")
+
+    return {
+        'status': 'success',
+        'sections': list(carta_editorial.keys())[:5] if isinstance(carta_editorial, dict) else [],
+        'has_markdown': bool(carta_markdown)
+    }
@@ -5,12 +5,30 @@
 import logging
 import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Any
 from azure.storage.blob import BlobServiceClient, ContentSettings
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads
+    from project_index import upsert_project
+    from artifact_shards import build_chapter_shards
+    from bible_deps import APPLIED_BIBLE_FILE, bible_hash
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.project_index import upsert_project
+    from API_DURABLE.artifact_shards import build_chapter_shards
+    from API_DURABLE.bible_deps import APPLIED_BIBLE_FILE, bible_hash
+
 logging.basicConfig(level=logging.INFO)
 
+# Subidas simultáneas de shards por capítulo
+SHARD_UPLOAD_WORKERS = 16
+
 # -----------------------------------------------------------------------------
 # HELPERS (Funciones auxiliares necesarias)
 # -----------------------------------------------------------------------------
@@ -123,6 +141,7 @@ def structure_changes_safe(consolidated):
 # MAIN FUNCTION
 # -----------------------------------------------------------------------------
 
+@offload_payloads(fields=())
 def main(input_data: Any) -> dict:
     """
     Guarda todos los outputs del proceso LYA 6.0.
@@ -243,10 +262,14 @@ def main(input_data: Any) -> dict:
             metadata['reflection_stats'] = reflection_stats
 
         urls['metadata'] = upload_blob(f"{base_path}/metadata.json", metadata, 'application/json')
+        upsert_project(blob_service, metadata)
 
         # B. Biblia
         if bible:
             urls['biblia_json'] = upload_blob(f"{base_path}/biblia_validada.json", bible, 'application/json')
+            if carta_editorial:
+                # Biblia con la que se generaron notas y ediciones (base del recalculo incremental)
+                upload_blob(f"{base_path}/{APPLIED_BIBLE_FILE}", bible, 'application/json')
             biblia_md = generate_bible_markdown(bible)
             urls['biblia_narrativa'] = upload_blob(f"{base_path}/biblia_narrativa.md", biblia_md, 'text/markdown')
 
@@ -276,6 +299,13 @@ def main(input_data: Any) -> dict:
                 structured_changes = structure_changes_safe(consolidated_chapters)
             
             urls['cambios'] = upload_blob(f"{base_path}/cambios_estructurados.json", structured_changes, 'application/json')
+
+            # Shards por capítulo para los endpoints paginados del editor
+            shards = build_chapter_shards(base_path, consolidated_chapters, structured_changes)
+            with ThreadPoolExecutor(max_workers=SHARD_UPLOAD_WORKERS) as pool:
+                list(pool.map(lambda item: upload_blob(item[0], item[1], 'application/json'), shards.items()))
+            urls['indice_capitulos'] = f"https://{blob_service.account_name}.blob.core.windows.net/{container_name}/{base_path}/chapters/index.json"
+            logging.info(f"✅ {len(shards)} shards por capítulo guardados")
             
             reporte_md = generate_changes_report_v5(consolidated_chapters)
             urls['reporte_cambios'] = upload_blob(f"{base_path}/reporte_cambios.md", reporte_md, 'text/markdown')
@@ -310,7 +340,8 @@ def main(input_data: Any) -> dict:
             'status': 'success',
             'job_id': job_id,
             'urls': urls,
-            'stats': {'total_cambios': structured_changes.get('total_changes', 0)}
+            'stats': {'total_cambios': structured_changes.get('total_changes', 0)},
+            'bible_hash': bible_hash(bible) if bible else None
         }
 
     except Exception as e:
@@ -78,18 +78,23 @@ def find_change_position(original_text: str, paragraphs: List[str]) -> Dict[str,
         paragraphs: Lista de párrafos del capítulo
         
     Returns:
-        Diccionario con información de posición
+        Diccionario con información de posición. 'offset' y 'length' son
+        caracteres sobre el texto del capítulo ('\n\n'.join(paragraphs)); el
+        exportador los usa como claves de su piece table.
     """
     if not original_text:
         return {
             'paragraph_index': 0,
             'word_start': 0,
             'word_end': 0,
+            'offset': None,
+            'length': 0,
             'context_before': '',
             'context_after': ''
         }
     
     # Buscar en qué párrafo está
+    para_offset = 0
     for para_idx, para in enumerate(paragraphs):
         if original_text in para:
             # Encontrar posición de palabras
@@ -105,9 +110,12 @@ def find_change_position(original_text: str, paragraphs: List[str]) -> Dict[str,
                 'paragraph_index': para_idx,
                 'word_start': len(words_before),
                 'word_end': len(words_before) + len(words_in_change),
+                'offset': para_offset + pos,
+                'length': len(original_text),
                 'context_before': para[context_start:pos].strip(),
                 'context_after': para[pos + len(original_text):context_end].strip()
             }
+        para_offset += len(para) + 2  # separador '\n\n'
     
     # Si no se encuentra, posición genérica
     logging.warning(f"⚠️ No se encontró posición exacta para cambio: {original_text[:50]}...")
@@ -115,6 +123,8 @@ def find_change_position(original_text: str, paragraphs: List[str]) -> Dict[str,
         'paragraph_index': 0,
         'word_start': 0,
         'word_end': 0,
+        'offset': None,
+        'length': 0,
         'context_before': '',
         'context_after': ''
     }
\ No newline at end of file
@@ -1,10 +1,16 @@
 # =============================================================================
-# SegmentBook/__init__.py - LYA 4.1.0 (BLOB STORAGE)
+# SegmentBook/__init__.py - LYA 4.3.0 (EXTRACCIÓN EN STREAMING)
 # =============================================================================
 # MEJORAS:
 #   - Lee archivos desde Azure Blob Storage
 #   - Fallback a archivo local para desarrollo
 #   - Soporta input como string (blob_path) o dict con configuración
+#   - Segmentación de una pasada sobre offsets (segmenter.py): los fragmentos
+#     se empaquetan por párrafos según el presupuesto de tokens de cada
+#     modelo destino y llevan char_start/char_end en el texto del libro
+#   - Extracción en streaming (extraction.py): el blob se descarga a disco,
+#     el PDF se procesa por rangos de páginas en un pool de procesos y cada
+#     pieza alimenta al detector de capítulos conforme llega
 # =============================================================================
 
 import azure.functions as func
@@ -13,8 +19,8 @@ import json
 import logging
 import os
 import sys
+import tempfile
 import traceback
-from io import BytesIO
 
 # Azure Storage
 try:
@@ -23,22 +29,20 @@ try:
 except ImportError:
     BLOB_AVAILABLE = False
 
-# Importaciones opcionales para formatos
-try:
-    import pdfplumber
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+DEFAULT_LIMIT_CHAPTERS = None 
+MIN_CONTENT_CHARS = 100
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 try:
-    from docx import Document
-    DOCX_AVAILABLE = True
+    from payload_store import offload_payloads
+    from config_models import get_segment_token_budget, PDF_EXTRACTION_WORKERS, PDF_PAGES_PER_TASK
 except ImportError:
-    DOCX_AVAILABLE = False
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.config_models import get_segment_token_budget, PDF_EXTRACTION_WORKERS, PDF_PAGES_PER_TASK
 
-MAX_CHARS_PER_CHUNK = 12000
-DEFAULT_LIMIT_CHAPTERS = None 
-MIN_CONTENT_CHARS = 100
+from .extraction import iter_document_text
+from .segmenter import ChapterDetector, TokenBudget, pack_fragments
 
 logging.basicConfig(level=logging.INFO)
 
@@ -46,8 +50,11 @@ logging.basicConfig(level=logging.INFO)
 # FUNCIONES DE LECTURA
 # -----------------------------------------------------------------------------
 
-def read_from_blob_storage(blob_path: str) -> bytes:
-    """Lee un archivo desde Azure Blob Storage."""
+def download_blob_to_file(blob_path: str, dest_dir: str) -> str:
+    """
+    Descarga un archivo de Azure Blob Storage a disco en streaming
+    (sin cargarlo entero en memoria). Retorna la ruta local.
+    """
     if not BLOB_AVAILABLE:
         raise ImportError("azure-storage-blob no está instalado")
     
@@ -71,60 +78,25 @@ def read_from_blob_storage(blob_path: str) -> bytes:
     if not blob_client.exists():
         raise FileNotFoundError(f"Blob no encontrado: {container_name}/{blob_name}")
     
-    return blob_client.download_blob().readall()
+    local_path = os.path.join(dest_dir, parts[-1])
+    with open(local_path, 'wb') as f:
+        blob_client.download_blob(max_concurrency=4).readinto(f)
+    return local_path
 
 
-def extract_text_from_bytes(file_bytes: bytes, filename: str) -> str:
-    """Extrae texto de bytes (para blob storage)."""
-    extension = os.path.splitext(filename)[1].lower()
-    
-    if extension == '.docx':
-        if not DOCX_AVAILABLE:
-            raise ImportError("python-docx no instalado")
-        doc = Document(BytesIO(file_bytes))
-        return "\n".join([para.text for para in doc.paragraphs])
-    
-    elif extension == '.pdf':
-        if not PDF_AVAILABLE:
-            raise ImportError("pdfplumber no instalado")
-        text = ""
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages:
-                text += (page.extract_text() or "") + "\n"
-        return text
-    
-    elif extension == '.txt':
-        return file_bytes.decode('utf-8')
-    
-    else:
-        raise ValueError(f"Formato no soportado: {extension}")
-
+def read_document(file_path: str) -> tuple:
+    """
+    Extrae el texto del documento pieza a pieza y detecta los capítulos
+    sobre la marcha.
 
-def extract_text_from_file(file_path: str) -> str:
-    """Extrae texto de archivo local (fallback para desarrollo)."""
+    Returns:
+        (text, chapters) — ver segmenter.ChapterDetector
+    """
     try:
-        extension = os.path.splitext(file_path)[1].lower()
-        
-        if extension == '.pdf':
-            if not PDF_AVAILABLE: raise ImportError("pdfplumber no instalado")
-            text = ""
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    text += (page.extract_text() or "") + "\n"
-            return text
-        
-        elif extension == '.docx':
-            if not DOCX_AVAILABLE: raise ImportError("python-docx no instalado")
-            doc = Document(file_path)
-            return "\n".join([para.text for para in doc.paragraphs])
-        
-        elif extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        
-        else:
-            raise ValueError(f"Formato no soportado: {extension}")
-            
+        detector = ChapterDetector()
+        for piece in iter_document_text(file_path, PDF_EXTRACTION_WORKERS, PDF_PAGES_PER_TASK):
+            detector.feed(piece)
+        return detector.finish()
     except Exception as e:
         logging.error(f"❌ Error extrayendo texto: {e}")
         raise
@@ -158,61 +130,39 @@ def detect_section_type(title: str) -> str:
         return 'CHAPTER'
 
 
-def smart_split(text: str, max_chars: int) -> list:
-    """Divide texto largo en fragmentos respetando párrafos."""
-    if len(text) <= max_chars: return [text]
-    chunks = []
-    while len(text) > max_chars:
-        split_point = text.rfind('\n\n', 0, max_chars)
-        if split_point == -1: split_point = text.rfind('\n', 0, max_chars)
-        if split_point == -1: split_point = text.rfind('. ', 0, max_chars) + 1
-        if split_point <= 0: split_point = max_chars
-        
-        chunks.append(text[:split_point].strip())
-        text = text[split_point:].strip()
-    if text: chunks.append(text)
-    return chunks
-
+def generate_hierarchical_metadata(text: str, chapters_raw: list, budget: TokenBudget) -> list:
+    """
+    Genera la estructura plana de fragmentos con metadatos.
 
-def generate_hierarchical_metadata(chapters_raw: list) -> list:
-    """Genera la estructura plana de fragmentos con metadatos."""
+    chapters_raw solo trae offsets; el texto de cada fragmento se copia del
+    buffer del libro una única vez, al construir su dict.
+    """
     final_list = []
     global_fragment_id = 1
     chapter_id = 1
-    
+
     for chapter_data in chapters_raw:
         raw_title = chapter_data['title']
-        content = chapter_data['content']
         section_type = chapter_data['section_type']
-        
-        if len(content) > MAX_CHARS_PER_CHUNK:
-            sub_chunks = smart_split(content, MAX_CHARS_PER_CHUNK)
-            total_frags = len(sub_chunks)
-            for idx, chunk in enumerate(sub_chunks):
-                final_list.append({
-                    'id': global_fragment_id,
-                    'parent_chapter_id': chapter_id,
-                    'original_title': raw_title,
-                    'title': f"{raw_title} ({idx + 1}/{total_frags})",
-                    'fragment_index': idx + 1,
-                    'total_fragments': total_frags,
-                    'section_type': section_type,
-                    'is_fragment': True,
-                    'content': chunk,
-                    'word_count': len(chunk.split())
-                })
-                global_fragment_id += 1
-        else:
+
+        spans = pack_fragments(text, chapter_data['start'], chapter_data['end'], budget)
+        total_frags = len(spans)
+
+        for idx, (start, end) in enumerate(spans):
+            content = text[start:end]
             final_list.append({
                 'id': global_fragment_id,
                 'parent_chapter_id': chapter_id,
                 'original_title': raw_title,
-                'title': raw_title,
-                'fragment_index': 1,
-                'total_fragments': 1,
+                'title': f"{raw_title} ({idx + 1}/{total_frags})" if total_frags > 1 else raw_title,
+                'fragment_index': idx + 1,
+                'total_fragments': total_frags,
                 'section_type': section_type,
-                'is_fragment': False,
+                'is_fragment': total_frags > 1,
                 'content': content,
+                'char_start': start,
+                'char_end': end,
+                'estimated_tokens': budget.estimate_tokens(end - start),
                 'word_count': len(content.split())
             })
             global_fragment_id += 1
@@ -224,7 +174,8 @@ def generate_hierarchical_metadata(chapters_raw: list) -> list:
 # MAIN FUNCTION (ACTIVITY TRIGGER)
 # -----------------------------------------------------------------------------
 
-def main(book_path) -> str:
+@offload_payloads(fields=('fragments',))
+def main(book_path) -> dict:
     """
     Activity Function que recibe configuración y devuelve el libro segmentado.
     
@@ -234,7 +185,7 @@ def main(book_path) -> str:
     """
     try:
         logging.info("=" * 80)
-        logging.info("🚀 SegmentBook v4.1.0 (Blob Storage) iniciado")
+        logging.info("🚀 SegmentBook v4.3.0 (Streaming) iniciado")
         
         # --- PASO 1: PARSEAR INPUT ---
         blob_path = ""
@@ -261,14 +212,15 @@ def main(book_path) -> str:
         
         # --- PASO 2: LEER ARCHIVO ---
         text = ""
+        detected_chapters = []
         source_info = ""
         
         # Intentar leer desde Blob Storage
         if blob_path and '/' in blob_path and BLOB_AVAILABLE:
             try:
-                filename = blob_path.split('/')[-1]
-                file_bytes = read_from_blob_storage(blob_path)
-                text = extract_text_from_bytes(file_bytes, filename)
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    local_copy = download_blob_to_file(blob_path, tmp_dir)
+                    text, detected_chapters = read_document(local_copy)
                 source_info = f"blob://{blob_path}"
                 logging.info(f"✅ Archivo leído desde Blob Storage: {blob_path}")
             except Exception as e:
@@ -288,7 +240,7 @@ def main(book_path) -> str:
                 local_file_path = os.path.join(script_dir, 'Piel_Morena.docx')
             
             if os.path.exists(local_file_path):
-                text = extract_text_from_file(local_file_path)
+                text, detected_chapters = read_document(local_file_path)
                 source_info = f"local://{local_file_path}"
                 logging.info(f"✅ Archivo leído localmente: {local_file_path}")
             else:
@@ -296,7 +248,7 @@ def main(book_path) -> str:
                 for f in os.listdir(script_dir):
                     if f.endswith('.docx'):
                         local_file_path = os.path.join(script_dir, f)
-                        text = extract_text_from_file(local_file_path)
+                        text, detected_chapters = read_document(local_file_path)
                         source_info = f"local://{local_file_path}"
                         logging.info(f"✅ Usando archivo encontrado: {local_file_path}")
                         break
@@ -307,22 +259,13 @@ def main(book_path) -> str:
         logging.info(f"📄 Texto extraído: {len(text):,} caracteres")
         
         # --- PASO 3: DETECTAR CAPÍTULOS ---
-        special_keywords = r'(?:Prólogo|Prefacio|Introducción|Interludio|Epílogo|Nota para el editor)'
-        full_pattern = f'(?mi)(?:^\\s*)(?:{special_keywords}|(?:Capítulo|Acto|Parte)\\s+)[^\n]*'
-        original_chapters = re.split(f'(?={full_pattern})', text)
-        
         chapters_raw = []
         skipped_headers = []
         
-        for raw_chapter in original_chapters:
-            if not raw_chapter.strip(): 
-                continue
-            
-            lines = raw_chapter.strip().split('\n')
-            title = lines[0].strip()
-            content = '\n'.join(lines[1:]).strip()
+        for chapter in detected_chapters:
+            title = chapter['title']
             section_type = detect_section_type(title)
-            content_length = len(content)
+            content_length = chapter['end'] - chapter['start']
             
             is_structural_header = section_type in ('ACT_HEADER', 'PART_HEADER')
             
@@ -340,7 +283,8 @@ def main(book_path) -> str:
             
             chapters_raw.append({
                 'title': title,
-                'content': content,
+                'start': chapter['start'],
+                'end': chapter['end'],
                 'section_type': section_type
             })
             
@@ -357,7 +301,9 @@ def main(book_path) -> str:
             logging.info(f"✅ PROCESANDO LIBRO COMPLETO ({total_detected} capítulos).")
 
         # --- PASO 5: SEGMENTAR ---
-        fragments = generate_hierarchical_metadata(chapters_raw) 
+        budget = TokenBudget(get_segment_token_budget())
+        logging.info(f"📏 Presupuesto por fragmento: {budget.max_chars:,} chars ({budget.estimate_tokens(budget.max_chars)} tokens)")
+        fragments = generate_hierarchical_metadata(text, chapters_raw, budget)
 
         chapter_map = {}
         for frag in fragments:
@@ -366,8 +312,23 @@ def main(book_path) -> str:
                 chapter_map[p_id] = {'fragment_ids': [], 'original_title': frag['original_title']}
             chapter_map[p_id]['fragment_ids'].append(frag['id'])
 
+        # Índice ligero: es lo único de los fragmentos que ve el orquestador
+        # (el texto completo viaja como BlobRef)
+        fragment_index = [
+            {
+                'id': frag['id'],
+                'parent_chapter_id': frag['parent_chapter_id'],
+                'fragment_index': frag['fragment_index'],
+                'title': frag['title'],
+                'char_start': frag['char_start'],
+                'char_end': frag['char_end']
+            }
+            for frag in fragments
+        ]
+
         result = {
             'fragments': fragments,
+            'fragment_index': fragment_index,
             'book_metadata': {
                 'total_chapters': len(chapter_map),
                 'total_fragments': len(fragments),
@@ -387,7 +348,7 @@ def main(book_path) -> str:
         logging.info(f"   Encabezados saltados: {len(skipped_headers)}")
         logging.info(f"{'='*60}")
         
-        return json.dumps(result, ensure_ascii=False)
+        return result
 
     except Exception as e:
         logging.error(f"❌ Error Fatal en SegmentBook: {str(e)}")
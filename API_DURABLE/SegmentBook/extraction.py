@@ -0,0 +1,113 @@
+"""
+Extracción de texto en streaming.
+
+Cada formato se expone como un generador de piezas de texto (páginas en PDF,
+párrafos en DOCX, líneas en TXT) terminadas en salto de línea, para que el
+detector de capítulos las consuma a medida que llegan sin construir el texto
+completo varias veces. Los PDF grandes se reparten por rangos de páginas
+entre procesos (pdfplumber es CPU-bound y no libera el GIL).
+
+Los procesos se crean con 'spawn': hacer fork dentro del worker de Functions
+(multi-hilo: gRPC, locks de logging) puede dejar un hijo bloqueado. Solo hay
+PDF_MAX_PENDING_RANGES_PER_WORKER rangos en vuelo por proceso, así que la
+memoria no crece con el tamaño del documento: el texto de un rango se
+entrega y se libera antes de pedir los siguientes.
+"""
+
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List
+
+try:
+    import pdfplumber
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+try:
+    from docx import Document
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+# Rangos de páginas encargados a la vez por proceso (ventana del pool)
+PDF_MAX_PENDING_RANGES_PER_WORKER = 2
+
+
+def count_pdf_pages(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_pdf_page_range(path: str, first: int, last: int) -> List[str]:
+    """Texto de las páginas [first, last) — se ejecuta en un proceso del pool."""
+    with pdfplumber.open(path) as pdf:
+        pages = []
+        for page in pdf.pages[first:last]:
+            pages.append(page.extract_text() or "")
+            # Libera la caché de objetos de la página (pdfplumber la retiene)
+            page.flush_cache()
+        return pages
+
+
+def iter_pdf_pages(path: str, workers: int, pages_per_task: int) -> Iterator[str]:
+    """Páginas del PDF en orden; en paralelo si el documento lo justifica."""
+    if not PDF_AVAILABLE:
+        raise ImportError("pdfplumber no instalado")
+
+    total_pages = count_pdf_pages(path)
+    ranges = [
+        (first, min(first + pages_per_task, total_pages))
+        for first in range(0, total_pages, pages_per_task)
+    ]
+    workers = min(workers, len(ranges), os.cpu_count() or 1)
+    logging.info(f"📑 PDF: {total_pages} páginas en {len(ranges)} rangos ({workers} procesos)")
+
+    if workers <= 1:
+        for first, last in ranges:
+            for page_text in extract_pdf_page_range(path, first, last):
+                yield page_text + "\n"
+        return
+
+    pending_ranges = deque(ranges)
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        while pending_ranges or in_flight:
+            # Ventana acotada; se consume en orden aunque los rangos terminen desordenados
+            while pending_ranges and len(in_flight) < workers * PDF_MAX_PENDING_RANGES_PER_WORKER:
+                first, last = pending_ranges.popleft()
+                in_flight.append(pool.submit(extract_pdf_page_range, path, first, last))
+            for page_text in in_flight.popleft().result():
+                yield page_text + "\n"
+
+
+def iter_docx_paragraphs(path: str) -> Iterator[str]:
+    if not DOCX_AVAILABLE:
+        raise ImportError("python-docx no instalado")
+    for para in Document(path).paragraphs:
+        yield para.text + "\n"
+
+
+def iter_txt_lines(path: str) -> Iterator[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line
+
+
+def iter_document_text(path: str, workers: int = 1, pages_per_task: int = 25) -> Iterator[str]:
+    """Generador de piezas de texto del documento según su extensión."""
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.pdf':
+        return iter_pdf_pages(path, workers, pages_per_task)
+    elif extension == '.docx':
+        return iter_docx_paragraphs(path)
+    elif extension == '.txt':
+        return iter_txt_lines(path)
+    else:
+        raise ValueError(f"Formato no soportado: {extension}")
@@ -0,0 +1,199 @@
+"""
+Motor de segmentación por offsets.
+
+Trabaja sobre UN solo buffer de texto: capítulos, párrafos y fragmentos se
+representan como pares (start, end) y el texto solo se copia al final, una
+vez por fragmento. Todo el recorrido es de una pasada (lineal en el tamaño
+del libro) y los fragmentos se dimensionan por tokens estimados de cada
+modelo destino en lugar de por caracteres.
+"""
+
+import regex as re
+from typing import Dict, Iterator, List, Tuple
+
+Span = Tuple[int, int]
+
+SPECIAL_KEYWORDS = r'(?:Prólogo|Prefacio|Introducción|Interludio|Epílogo|Nota para el editor)'
+CHAPTER_HEADER_PATTERN = re.compile(
+    f'(?mi)(?:^\\s*)(?:{SPECIAL_KEYWORDS}|(?:Capítulo|Acto|Parte)\\s+)[^\n]*'
+)
+# Párrafo = bloque separado por líneas en blanco. En PDF cada línea visual
+# termina en salto de línea, así que un salto simple no corta párrafos salvo
+# que el bloque entero no quepa en el presupuesto.
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+LINE_BREAK = re.compile(r'\n')
+
+
+class TokenBudget:
+    """
+    Presupuesto de tokens por fragmento para varios modelos a la vez.
+
+    budgets: {modelo: {"max_tokens": int, "chars_per_token": float}}
+    """
+
+    def __init__(self, budgets: Dict[str, Dict[str, float]]):
+        self.budgets = budgets
+        # Caracteres que caben en el presupuesto más estricto
+        self.max_chars = int(min(
+            cfg['max_tokens'] * cfg['chars_per_token'] for cfg in budgets.values()
+        ))
+
+    def estimate_tokens(self, n_chars: int) -> Dict[str, int]:
+        return {
+            model: int(round(n_chars / cfg['chars_per_token']))
+            for model, cfg in self.budgets.items()
+        }
+
+    def fits(self, n_chars: int) -> bool:
+        return n_chars <= self.max_chars
+
+
+def trim_span(text: str, start: int, end: int) -> Span:
+    """Recorta espacios en blanco de los extremos sin copiar el texto."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+class ChapterDetector:
+    """
+    Detección incremental de capítulos: recibe el texto por piezas (páginas,
+    párrafos) terminadas en salto de línea y registra los offsets de cada
+    encabezado conforme llegan. El buffer se une una sola vez en finish().
+    """
+
+    def __init__(self):
+        self.pieces = []
+        self.length = 0
+        self.boundaries = []
+
+    def feed(self, piece: str):
+        for match in CHAPTER_HEADER_PATTERN.finditer(piece):
+            self.boundaries.append(self.length + match.start())
+        self.pieces.append(piece)
+        self.length += len(piece)
+
+    def finish(self) -> Tuple[str, List[Dict]]:
+        text = ''.join(self.pieces)
+        self.pieces = []
+        return text, chapters_from_boundaries(text, self.boundaries)
+
+
+def chapters_from_boundaries(text: str, header_offsets: List[int]) -> List[Dict]:
+    """
+    Convierte los offsets de encabezado en capítulos.
+
+    Returns:
+        [{"title": str, "start": int, "end": int}] — start/end delimitan el
+        contenido (sin el título) dentro de text. El texto previo al primer
+        encabezado se trata como una sección más (su primera línea es el título).
+    """
+    boundaries = list(header_offsets)
+    if not boundaries or boundaries[0] > 0:
+        boundaries.insert(0, 0)
+    boundaries.append(len(text))
+
+    chapters = []
+    for section_start, section_end in zip(boundaries, boundaries[1:]):
+        start, end = trim_span(text, section_start, section_end)
+        if start >= end:
+            continue
+
+        title_end = text.find('\n', start, end)
+        if title_end == -1:
+            title_end = end
+
+        content_start, content_end = trim_span(text, title_end, end)
+        chapters.append({
+            'title': text[start:title_end].strip(),
+            'start': content_start,
+            'end': content_end
+        })
+    return chapters
+
+
+def detect_chapters(text: str) -> List[Dict]:
+    """Capítulos de un texto ya completo (ver chapters_from_boundaries)."""
+    return chapters_from_boundaries(
+        text, [m.start() for m in CHAPTER_HEADER_PATTERN.finditer(text)]
+    )
+
+
+def split_spans(text: str, start: int, end: int, separator) -> Iterator[Span]:
+    """Trozos no vacíos de text[start:end] entre coincidencias de separator, como offsets."""
+    position = start
+    for match in separator.finditer(text, start, end):
+        p_start, p_end = trim_span(text, position, match.start())
+        if p_start < p_end:
+            yield p_start, p_end
+        position = match.end()
+
+    p_start, p_end = trim_span(text, position, end)
+    if p_start < p_end:
+        yield p_start, p_end
+
+
+def paragraph_spans(text: str, start: int, end: int) -> Iterator[Span]:
+    """Párrafos (bloques separados por líneas en blanco) de text[start:end]."""
+    return split_spans(text, start, end, PARAGRAPH_BREAK)
+
+
+def line_spans(text: str, start: int, end: int) -> Iterator[Span]:
+    """Líneas no vacías de text[start:end]."""
+    return split_spans(text, start, end, LINE_BREAK)
+
+
+def split_long_span(text: str, start: int, end: int, max_chars: int) -> Iterator[Span]:
+    """Corta un párrafo que no cabe en el presupuesto por fin de oración."""
+    position = start
+    while end - position > max_chars:
+        cut = text.rfind('. ', position, position + max_chars)
+        cut = cut + 1 if cut > position else position + max_chars
+        yield position, cut
+        position, _ = trim_span(text, cut, end)
+    if position < end:
+        yield position, end
+
+
+def budget_units(text: str, start: int, end: int, budget: TokenBudget) -> Iterator[Span]:
+    """
+    Unidades que caben en el presupuesto: párrafos; si uno no cabe, sus
+    líneas; si una línea no cabe, sus oraciones (split_long_span).
+    """
+    for p_start, p_end in paragraph_spans(text, start, end):
+        if budget.fits(p_end - p_start):
+            yield p_start, p_end
+            continue
+        for l_start, l_end in line_spans(text, p_start, p_end):
+            if budget.fits(l_end - l_start):
+                yield l_start, l_end
+            else:
+                yield from split_long_span(text, l_start, l_end, budget.max_chars)
+
+
+def pack_fragments(text: str, start: int, end: int, budget: TokenBudget) -> List[Span]:
+    """
+    Agrupa los párrafos de un capítulo en fragmentos lo más grandes posible
+    dentro del presupuesto, sin partir párrafos salvo que uno solo lo exceda.
+    """
+    if budget.fits(end - start):
+        return [(start, end)]
+
+    fragments = []
+    frag_start = frag_end = None
+
+    for u_start, u_end in budget_units(text, start, end, budget):
+        if frag_start is not None and not budget.fits(u_end - frag_start):
+            fragments.append((frag_start, frag_end))
+            frag_start = None
+
+        if frag_start is None:
+            frag_start = u_start
+        frag_end = u_end
+
+    if frag_start is not None:
+        fragments.append((frag_start, frag_end))
+
+    return fragments
@@ -4,53 +4,47 @@
 # ACTUALIZACIÓN:
 # - Modelo actualizado a: models/gemini-2.5-flash
 # - Análisis semántico de Show vs Tell para evitar falsos positivos de regex.
+#
+# MODOS DE EJECUCIÓN:
+# - Online (input = lista de capítulos): cliente asíncrono de genai con
+#   concurrencia acotada (semáforo), token bucket y reintentos por llamada.
+# - Batch (input = {"chapters": [...], "result_manifest": {...}}): libros muy
+#   grandes; el orquestador envía analysis_type "sensory" a SubmitGeminiProBatch
+#   y esta activity solo agrega los resultados del manifest.
 # =============================================================================
 
 import logging
 import json
 import os
-import time
+import sys
+import asyncio
 from typing import List, Dict, Any
 import numpy as np
 from google import genai
 from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from payload_store import offload_payloads, iter_manifest
+    from config_models import get_sensory_detection_config
+    from execution_router import TokenBucket
+    from sensory_utils import (
+        SENSORY_MODEL_ID, build_sensory_prompt, parse_sensory_response,
+        short_chapter_analysis, failed_analysis
+    )
+except ImportError:
+    from API_DURABLE.payload_store import offload_payloads, iter_manifest
+    from API_DURABLE.config_models import get_sensory_detection_config
+    from API_DURABLE.execution_router import TokenBucket
+    from API_DURABLE.sensory_utils import (
+        SENSORY_MODEL_ID, build_sensory_prompt, parse_sensory_response,
+        short_chapter_analysis, failed_analysis
+    )
+
 logging.basicConfig(level=logging.INFO)
 
-# Configuración del modelo "Sensor"
-# Usamos Flash 2.5 para máxima velocidad y bajo costo en tareas de clasificación.
-SENSORY_MODEL_ID = "models/gemini-2.5-flash" 
-
-SENSORY_ANALYSIS_PROMPT = """
-Eres un ANALISTA SENSORIAL experto en escritura creativa.
-Tu tarea es analizar el siguiente texto (Capítulo de una novela) para diagnosticar el balance "Show vs Tell" (Mostrar vs Contar).
-
-ANALIZA EL TEXTO BUSCANDO:
-1. **Inmersión Sensorial (Show):** Descripciones que estimulan los 5 sentidos (vista, oído, tacto, olfato, gusto) y acciones físicas concretas.
-2. **Abstracción (Tell):** Explicaciones de emociones ("sintió miedo"), resúmenes de hechos, metáforas clichés o verbos de filtrado ("vio", "oyó", "supo").
-
-RESPONDE ÚNICAMENTE CON ESTE JSON:
-{{
-  "showing_ratio": 0.00, // (0.0 a 1.0) Porcentaje del texto que es inmersivo/sensorial
-  "avg_sensory_density": 0.00, // (0.0 a 1.0) Intensidad promedio de los detalles
-  "dominant_sense": "VISUAL|AUDITIVO|TACTIL|OLFATIVO|GUSTATIVO|KINESTESICO|NINGUNO",
-  
-  "problem_paragraphs": [
-    // Lista de hasta 5 párrafos más problemáticos (puro Telling aburrido)
-    {{
-      "text_preview": "Primeras 15 palabras...",
-      "issue": "Explicación abstracta de emociones / Falta de anclaje físico",
-      "suggestion": "Describir la reacción física en lugar de nombrar la emoción"
-    }}
-  ],
-  
-  "diagnosis_global": "Breve diagnóstico de 1 frase sobre la inmersión del capítulo."
-}}
-
---- TEXTO DEL CAPÍTULO ---
-{chapter_content}
-"""
 
 @retry(
     retry=retry_if_exception_type((Exception,)),
@@ -58,9 +52,10 @@ RESPONDE ÚNICAMENTE CON ESTE JSON:
     stop=stop_after_attempt(3),
     reraise=True
 )
-def call_gemini_flash(client, prompt):
-    """Llamada rápida a Gemini Flash 2.5."""
-    return client.models.generate_content(
+async def call_gemini_flash(client, prompt, bucket: TokenBucket):
+    """Llamada rápida a Gemini Flash 2.5 (cada reintento consume un token)."""
+    await bucket.acquire()
+    return await client.aio.models.generate_content(
         model=SENSORY_MODEL_ID,
         contents=prompt,
         config=types.GenerateContentConfig(
@@ -70,109 +65,102 @@ def call_gemini_flash(client, prompt):
         )
     )
 
-def analyze_chapter_with_ai(client, chapter_content: str, chapter_id: Any) -> Dict[str, Any]:
+
+async def analyze_chapter_with_ai(client, chapter_content: str, chapter_id: Any,
+                                  semaphore: asyncio.Semaphore, bucket: TokenBucket) -> Dict[str, Any]:
     """
     Envía el capítulo a Gemini Flash para análisis sensorial.
-    INCLUYE LIMPIEZA DE JSON "ANTI-CREATIVIDAD".
     """
-    if len(chapter_content) < 200:
-        return {
-            "chapter_id": chapter_id,
-            "showing_ratio": 0.5,
-            "avg_sensory_density": 0.5,
-            "dominant_sense": "NEUTRO",
-            "diagnosis": "Texto demasiado corto.",
-            "problem_paragraphs": []
-        }
+    prompt = build_sensory_prompt(chapter_content)
+    if not prompt:
+        return short_chapter_analysis(chapter_id)
 
-    prompt = SENSORY_ANALYSIS_PROMPT.format(chapter_content=chapter_content[:50000])
-    
+    raw_text = ""
     try:
-        response = call_gemini_flash(client, prompt)
-        
-        if not response.text:
-            raise ValueError(f"Respuesta vacía de {SENSORY_MODEL_ID}")
-            
-        raw_text = response.text.strip()
-        
-        # --- BLOQUE DE LIMPIEZA QUIRÚRGICA ---
-        # 1. Eliminar bloques de código markdown si existen
-        if "```" in raw_text:
-            # Eliminar ```json y ``` al final
-            raw_text = raw_text.replace("```json", "").replace("```", "").strip()
-        
-        # 2. Búsqueda de llaves (Safety Net)
-        # Si Gemini dice "Claro, aquí está: { ... }", esto extrae solo lo que está entre { }
-        first_brace = raw_text.find("{")
-        last_brace = raw_text.rfind("}")
-        
-        if first_brace != -1 and last_brace != -1:
-            json_str = raw_text[first_brace : last_brace + 1]
-        else:
-            # Si no encuentra llaves, probablemente falló la generación
-            logging.warning(f"⚠️ No se encontró JSON válido en respuesta de Cap {chapter_id}")
-            # Intentar parsear lo que haya por si acaso
-            json_str = raw_text
-            
-        # 3. Parseo
-        data = json.loads(json_str)
-        # -------------------------------------
-        
-        data['chapter_id'] = chapter_id
-        return data
+        async with semaphore:
+            response = await call_gemini_flash(client, prompt, bucket)
+        raw_text = response.text or ""
+        return parse_sensory_response(raw_text, chapter_id)
 
     except json.JSONDecodeError as e:
         logging.error(f"⚠️ Error decodificando JSON de Gemini en Cap {chapter_id}: {e}")
         logging.error(f"   Respuesta cruda problemática: {raw_text[:200]}...") # Loguear el inicio para debug
-        return {
-            "chapter_id": chapter_id,
-            "showing_ratio": 0.0,
-            "avg_sensory_density": 0.0,
-            "diagnosis": "Error de formato JSON en IA",
-            "problem_paragraphs": []
-        }
+        return failed_analysis(chapter_id, "Error de formato JSON en IA")
     except Exception as e:
         logging.error(f"⚠️ Error general analizando Cap {chapter_id}: {e}")
-        return {
-            "chapter_id": chapter_id,
-            "showing_ratio": 0.0,
-            "avg_sensory_density": 0.0,
-            "diagnosis": f"Error: {str(e)}",
-            "problem_paragraphs": []
-        }
+        return failed_analysis(chapter_id, f"Error: {str(e)}")
+
+
+async def analyze_chapters_online(client, chapters: List[Dict], config: dict) -> List[Dict[str, Any]]:
+    """Analiza todos los capítulos en paralelo, respetando concurrencia y ritmo."""
+    semaphore = asyncio.Semaphore(max(1, config['max_concurrency']))
+    bucket = TokenBucket(config['requests_per_minute'], config['max_concurrency'])
 
-def main(consolidated_chapters: List[Dict]) -> Dict:
+    return await asyncio.gather(*[
+        analyze_chapter_with_ai(
+            client, chapter.get('content', ''), chapter.get('chapter_id', '?'), semaphore, bucket
+        )
+        for chapter in chapters
+    ])
+
+
+def collect_batch_analyses(chapters: List[Dict], manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Ordena por capítulo los resultados del batch "sensory" (faltantes = fallidos)."""
+    by_chapter = {str(item.get('chapter_id')): item for item in iter_manifest(manifest)}
+
+    analyses = []
+    for chapter in chapters:
+        ch_id = chapter.get('chapter_id', '?')
+        if not build_sensory_prompt(chapter.get('content', '')):
+            analyses.append(short_chapter_analysis(ch_id))
+        elif str(ch_id) in by_chapter:
+            analysis = by_chapter[str(ch_id)]
+            analysis['chapter_id'] = ch_id
+            analyses.append(analysis)
+        else:
+            analyses.append(failed_analysis(ch_id, "Sin resultado en el batch"))
+    return analyses
+
+
+@offload_payloads(fields=('sensory_analyses',))
+def main(consolidated_chapters) -> Dict:
     """
     Función principal llamada por el Orquestador.
     """
     try:
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if not api_key:
-            return {"error": "GEMINI_API_KEY missing", "status": "error"}
-            
-        client = genai.Client(api_key=api_key)
-        
-        logging.info(f"🔬 Iniciando Análisis Sensorial AI ({SENSORY_MODEL_ID})...")
-        
-        chapter_analyses = []
+        config = get_sensory_detection_config()
+
+        if isinstance(consolidated_chapters, dict):
+            # Modo batch: los análisis ya están en el manifest
+            chapters = consolidated_chapters.get('chapters', [])
+            logging.info(f"🔬 Agregando Análisis Sensorial desde batch ({len(chapters)} capítulos)...")
+            chapter_analyses = collect_batch_analyses(chapters, consolidated_chapters.get('result_manifest', {}))
+        else:
+            api_key = os.environ.get('GEMINI_API_KEY')
+            if not api_key:
+                return {"error": "GEMINI_API_KEY missing", "status": "error"}
+
+            client = genai.Client(api_key=api_key)
+
+            logging.info(
+                f"🔬 Iniciando Análisis Sensorial AI ({SENSORY_MODEL_ID}) - "
+                f"{len(consolidated_chapters)} capítulos, concurrencia {config['max_concurrency']}, "
+                f"{config['requests_per_minute']} req/min..."
+            )
+            chapter_analyses = asyncio.run(analyze_chapters_online(client, consolidated_chapters, config))
+
         all_ratios = []
         all_densities = []
         critical_issues = []
 
-        # Procesar capítulos
-        for chapter in consolidated_chapters:
-            ch_id = chapter.get('chapter_id', '?')
-            content = chapter.get('content', '')
-            
-            # Llamada AI
-            analysis = analyze_chapter_with_ai(client, content, ch_id)
-            chapter_analyses.append(analysis)
-            
+        for analysis in chapter_analyses:
+            ch_id = analysis.get('chapter_id', '?')
+
             # Recolectar métricas
             ratio = analysis.get('showing_ratio', 0)
             all_ratios.append(ratio)
             all_densities.append(analysis.get('avg_sensory_density', 0))
-            
+
             # Detectar problemas graves para el reporte global
             if ratio < 0.25: # Umbral estricto
                 critical_issues.append({
@@ -185,7 +173,7 @@ def main(consolidated_chapters: List[Dict]) -> Dict:
         # Métricas Globales
         global_ratio = np.mean(all_ratios) if all_ratios else 0
         global_density = np.mean(all_densities) if all_densities else 0
-        
+
         logging.info(f"✅ Análisis Sensorial Completado. Ratio Global: {global_ratio:.2%}")
 
         return {
@@ -203,4 +191,4 @@ def main(consolidated_chapters: List[Dict]) -> Dict:
         logging.error(f"❌ Error crítico en SensoryDetection: {e}")
         import traceback
         logging.error(traceback.format_exc())
-        return {"error": str(e), "status": "error"}
\ No newline at end of file
+        return {"error": str(e), "status": "error"}
@@ -11,10 +11,22 @@ import logging
 import json
 import os
 import time
+import sys
 import tempfile
 from google import genai
 from google.genai import types
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from result_cache import build_cache_key, has_cached_result
+    from payload_store import offload_payloads
+    from execution_router import ONLINE_STATUS, choose_execution, run_gemini_online
+except ImportError:
+    from API_DURABLE.result_cache import build_cache_key, has_cached_result
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.execution_router import ONLINE_STATUS, choose_execution, run_gemini_online
+
 logging.basicConfig(level=logging.INFO)
 
 # =============================================================================
@@ -69,11 +81,42 @@ Genera un objeto JSON con esta estructura exacta:
 }}
 """
 
+# ID fijo con el que se renderiza el prompt para la clave del cache
+CACHE_REFERENCE_ID = "CACHE"
+
+
+def build_request(chapter_id: str, title: str, tipo_fragmento: str, content: str) -> dict:
+    """Request del batch (prompt renderizado + generationConfig)."""
+    prompt = ANALYSIS_TASK_TEMPLATE.format(
+        chapter_id=chapter_id,
+        title=title,
+        tipo_fragmento=tipo_fragmento,
+        content=content
+    )
+    # Nota: Batch API a veces prefiere system_instruction dentro del request
+    return {
+        "contents": [
+            {"role": "user", "parts": [{"text": SYSTEM_INSTRUCTION_TEXT + "\n\n" + prompt}]}
+        ],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "temperature": 0.1 # Determinista para datos factuales
+        }
+    }
+
+
+@offload_payloads(fields=('online_results',))
 def main(chapters: list) -> dict:
     """
     Envía fragmentos a Gemini Batch API (JSONL).
+    Acepta la lista de fragmentos o {"fragments": [...], "fragment_ids": [...]}
+    para enviar solo un grupo de capítulos (análisis por capítulos).
     """
     try:
+        if isinstance(chapters, dict):
+            wanted = {str(i) for i in chapters.get('fragment_ids') or []}
+            chapters = [f for f in chapters.get('fragments') or [] if str(f.get('id')) in wanted]
+        
         api_key = os.environ.get('GEMINI_API_KEY')
         if not api_key:
             return {"error": "GEMINI_API_KEY no configurada", "status": "config_error"}
@@ -89,6 +132,7 @@ def main(chapters: list) -> dict:
         
         jsonl_lines = []
         id_map = []
+        cached_map = []
         
         for chapter in valid_chapters:
             fragment_id = str(chapter.get('id', 'ID_NULO'))
@@ -101,26 +145,26 @@ def main(chapters: list) -> dict:
             # Key única para correlación posterior
             key = f"frag_{fragment_id}_parent_{parent_id}"
             
-            prompt = ANALYSIS_TASK_TEMPLATE.format(
-                chapter_id=fragment_id,
-                title=title,
-                tipo_fragmento=tipo_frag,
-                content=content
+            # Cache: sha256(modelo + request renderizado). El ID cambia si se
+            # insertan capítulos, así que la clave se calcula con un ID fijo;
+            # cualquier cambio de plantilla o configuración invalida la entrada.
+            cache_key = build_cache_key(
+                "layer1_factual",
+                json.dumps(build_request(CACHE_REFERENCE_ID, title, tipo_frag, content), ensure_ascii=False, sort_keys=True),
+                BATCH_MODEL_ID
             )
+            if has_cached_result(cache_key):
+                cached_map.append({
+                    'fragment_id': fragment_id,
+                    'parent_chapter_id': parent_id,
+                    'cache_key': cache_key
+                })
+                continue
             
             # Construcción del request para Batch
-            # Nota: Batch API a veces prefiere system_instruction dentro del request
             jsonl_entry = {
                 "key": key,
-                "request": {
-                    "contents": [
-                        {"role": "user", "parts": [{"text": SYSTEM_INSTRUCTION_TEXT + "\n\n" + prompt}]}
-                    ],
-                    "generationConfig": {
-                        "responseMimeType": "application/json",
-                        "temperature": 0.1 # Determinista para datos factuales
-                    }
-                }
+                "request": build_request(fragment_id, title, tipo_frag, content)
             }
             
             jsonl_lines.append(json.dumps(jsonl_entry, ensure_ascii=False))
@@ -128,15 +172,48 @@ def main(chapters: list) -> dict:
             id_map.append({
                 'key': key,
                 'fragment_id': fragment_id,
-                'parent_chapter_id': parent_id
+                'parent_chapter_id': parent_id,
+                'cache_key': cache_key
             })
         
+        if cached_map:
+            logging.info(f"♻️ Cache: {len(cached_map)} fragmentos sin cambios, {len(jsonl_lines)} a enviar")
+        
+        if not jsonl_lines:
+            # Todo el libro está en cache: no hace falta crear batch job
+            return {
+                "batch_job_name": None,
+                "chapters_count": len(valid_chapters),
+                "status": "cached",
+                "state": "CACHED",
+                "id_map": [],
+                "cached_map": cached_map,
+                "model_used": BATCH_MODEL_ID
+            }
+        
+        # Envíos pequeños: online, sin cola de batch (mismo formato de salida)
+        entries = [json.loads(line) for line in jsonl_lines]
+        execution = choose_execution('gemini_flash', entries, BATCH_MODEL_ID)
+        if execution['mode'] == 'online':
+            return {
+                "batch_job_name": None,
+                "chapters_count": len(valid_chapters),
+                "status": ONLINE_STATUS,
+                "state": "ONLINE",
+                "id_map": id_map,
+                "cached_map": cached_map,
+                "online_results": run_gemini_online('gemini_flash', BATCH_MODEL_ID, entries),
+                "execution": execution,
+                "model_used": BATCH_MODEL_ID
+            }
+        
         # Crear archivo temporal JSONL
         timestamp = int(time.time())
         temp_dir = tempfile.gettempdir()
-        temp_filename = os.path.join(temp_dir, f"lya_batch_{timestamp}.jsonl")
+        # mkstemp: varios grupos de capítulos pueden enviarse en el mismo segundo
+        temp_fd, temp_filename = tempfile.mkstemp(prefix=f"lya_batch_{timestamp}_", suffix=".jsonl", dir=temp_dir)
         
-        with open(temp_filename, 'w', encoding='utf-8') as f:
+        with os.fdopen(temp_fd, 'w', encoding='utf-8') as f:
             for line in jsonl_lines:
                 f.write(line + "\n")
         
@@ -171,6 +248,7 @@ def main(chapters: list) -> dict:
             "status": "submitted",
             "state": str(batch_job.state),
             "id_map": id_map,
+            "cached_map": cached_map,
             "model_used": BATCH_MODEL_ID
         }
     
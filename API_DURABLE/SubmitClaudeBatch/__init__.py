@@ -17,10 +17,16 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 try:
     from vertex_utils import submit_vertex_batch_job, upload_jsonl_to_gcs, format_claude_vertex_request
     from config_models import CLAUDE_SONNET_MODEL
+    from result_cache import build_cache_key, has_cached_result
+    from payload_store import offload_payloads
+    from execution_router import ONLINE_STATUS, choose_execution, run_claude_online
 except ImportError:
     # Fallback para desarrollo local si el path falla
     from API_DURABLE.vertex_utils import submit_vertex_batch_job, upload_jsonl_to_gcs, format_claude_vertex_request
     from API_DURABLE.config_models import CLAUDE_SONNET_MODEL
+    from API_DURABLE.result_cache import build_cache_key, has_cached_result
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.execution_router import ONLINE_STATUS, choose_execution, run_claude_online
 
 logging.basicConfig(level=logging.INFO)
 
@@ -231,6 +237,7 @@ def format_dynamic_lists(context: Dict) -> Dict:
         'advertencia_ritmo': adv_ritmo
     }
 
+@offload_payloads(fields=('fragment_metadata_map', 'online_results'))
 def main(edit_requests: Dict) -> Dict:
     """Envía capítulos a Vertex AI Batch (Claude)."""
     try:
@@ -238,8 +245,20 @@ def main(edit_requests: Dict) -> Dict:
         raw_requests = edit_requests.get('edit_requests', [])
         chapters = [r['chapter'] for r in raw_requests] if raw_requests and 'chapter' in raw_requests[0] else edit_requests.get('chapters', [])
         
+        # Selección desde el orquestador: fragmentos (BlobRef) + capítulos a editar
+        if not chapters and edit_requests.get('fragments'):
+            wanted = edit_requests.get('chapter_ids')
+            wanted = {str(c) for c in wanted} if wanted is not None else None
+            chapters = [
+                f for f in edit_requests['fragments']
+                if wanted is None or str(f.get('parent_chapter_id', f.get('id'))) in wanted
+            ]
+        
         bible = edit_requests.get('bible', {})
         margin_notes_map = edit_requests.get('margin_notes', {})
+        if isinstance(margin_notes_map, list):
+            # Varias fuentes de notas {chapter_id: [...]}: las posteriores pisan a las anteriores
+            margin_notes_map = {k: v for source in margin_notes_map for k, v in (source or {}).items()}
         book_metadata = edit_requests.get('book_metadata', {})
         
         logging.info(f"📦 Preparando Edición Batch (Vertex AI) para {len(chapters)} capítulos")
@@ -247,6 +266,7 @@ def main(edit_requests: Dict) -> Dict:
         batch_requests = []
         ordered_ids = []
         fragment_metadata = {}
+        cached_ids = []
         
         # 2. CONSTRUIR SYSTEM PROMPT
         book_ctx = extract_book_context(bible, book_metadata)
@@ -292,6 +312,13 @@ def main(edit_requests: Dict) -> Dict:
                 contenido=chapter.get('content', '')
             )
             
+            # Cache: system + user determinan completamente la respuesta
+            cache_key = build_cache_key("professional_editing", system_content + "\n" + user_content, CLAUDE_SONNET_MODEL)
+            fragment_metadata[ch_id]['cache_key'] = cache_key
+            if has_cached_result(cache_key):
+                cached_ids.append(ch_id)
+                continue
+            
             # Formato Vertex AI Claude
             request = format_claude_vertex_request(
                 messages=[{"role": "user", "content": user_content}],
@@ -300,7 +327,37 @@ def main(edit_requests: Dict) -> Dict:
                 temperature=0.3
             )
             batch_requests.append(request)
+        
+        if cached_ids:
+            logging.info(f"♻️ Cache: {len(cached_ids)} capítulos sin cambios, {len(batch_requests)} a enviar")
+        
+        if not batch_requests:
+            # Todas las ediciones en cache: no se crea batch job
+            return {
+                "batch_id": None,
+                "status": "cached",
+                "chapters_count": len(chapters),
+                "id_map": ordered_ids,
+                "fragment_metadata_map": fragment_metadata,
+                "cached_ids": cached_ids,
+                "provider": "cache"
+            }
             
+        # Envíos pequeños: online, sin cola de batch (mismo formato de salida)
+        execution = choose_execution('claude_vertex', batch_requests, CLAUDE_SONNET_MODEL)
+        if execution['mode'] == 'online':
+            return {
+                "batch_id": None,
+                "status": ONLINE_STATUS,
+                "chapters_count": len(chapters),
+                "id_map": ordered_ids,
+                "fragment_metadata_map": fragment_metadata,
+                "cached_ids": cached_ids,
+                "online_results": run_claude_online(CLAUDE_SONNET_MODEL, batch_requests),
+                "execution": execution,
+                "provider": "vertex_ai_online"
+            }
+        
         logging.info(f"📝 Subiendo {len(batch_requests)} requests a GCS")
         
         # Generar nombre único para el archivo batch
@@ -328,6 +385,7 @@ def main(edit_requests: Dict) -> Dict:
             "chapters_count": len(chapters),
             "id_map": ordered_ids,
             "fragment_metadata_map": fragment_metadata,
+            "cached_ids": cached_ids,
             "provider": "vertex_ai"
         }
 
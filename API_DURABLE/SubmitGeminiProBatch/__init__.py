@@ -1,18 +1,42 @@
 # =============================================================================
 # SubmitGeminiProBatch/__init__.py - BATCH GENÉRICO GEMINI PRO (v2 FIXED)
 # =============================================================================
-# Soporta: layer2_structural, layer3_qualitative, arc_maps
+# Soporta: layer2_structural, layer3_qualitative, arc_maps, sensory
 # FIX: Escribe archivo temporal antes de subir (requerido por API)
 # =============================================================================
 
 import logging
 import json
 import os
+import sys
 import tempfile
 from google import genai
 
+# Agregar directorio padre para importar módulos compartidos
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+try:
+    from result_cache import build_cache_key, has_cached_result
+    from payload_store import offload_payloads
+    from sensory_utils import SENSORY_MODEL_ID, SENSORY_ANALYSIS_PROMPT, build_sensory_prompt
+    from execution_router import ONLINE_STATUS, choose_execution, run_gemini_online
+except ImportError:
+    from API_DURABLE.result_cache import build_cache_key, has_cached_result
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.sensory_utils import SENSORY_MODEL_ID, SENSORY_ANALYSIS_PROMPT, build_sensory_prompt
+    from API_DURABLE.execution_router import ONLINE_STATUS, choose_execution, run_gemini_online
+
 logging.basicConfig(level=logging.INFO)
 
+BATCH_MODEL_ID = "models/gemini-3-pro-preview"
+
+# Tipos de análisis que usan otro modelo / otra configuración de generación
+BATCH_MODEL_OVERRIDES = {
+    "sensory": SENSORY_MODEL_ID
+}
+GENERATION_CONFIG_OVERRIDES = {
+    "sensory": {"temperature": 0.1, "maxOutputTokens": 1024}
+}
+
 # =============================================================================
 # PROMPTS POR TIPO DE ANÁLISIS
 # =============================================================================
@@ -133,7 +157,9 @@ Responde SOLO JSON:
   }},
   "es_punto_critico": false,
   "nivel_proteccion": "alto|medio|bajo"
-}}"""
+}}""",
+
+    "sensory": SENSORY_ANALYSIS_PROMPT
 }
 
 
@@ -172,6 +198,10 @@ def build_prompt(analysis_type: str, item: dict, bible: dict = None) -> str:
             metrics_summary=json.dumps(metrics, ensure_ascii=False)[:1000]
         )
     
+    elif analysis_type == "sensory":
+        # Mismo prompt que el modo online de SensoryDetectionAnalysis
+        return build_sensory_prompt(item.get('content', ''))
+    
     elif analysis_type == "arc_maps":
         structural = item.get('layer2_structural', {})
         qualitative = item.get('layer3_qualitative', {})
@@ -193,12 +223,13 @@ def build_prompt(analysis_type: str, item: dict, bible: dict = None) -> str:
     return ""
 
 
+@offload_payloads(fields=('online_results',))
 def main(batch_input: dict) -> dict:
     """
     Envía batch a Gemini Pro.
     
     Input:
-        analysis_type: "layer2_structural" | "layer3_qualitative" | "arc_maps"
+        analysis_type: "layer2_structural" | "layer3_qualitative" | "arc_maps" | "sensory"
         items: lista de capítulos/análisis
         bible: (opcional) para arc_maps
     """
@@ -221,10 +252,18 @@ def main(batch_input: dict) -> dict:
             return {'error': 'GEMINI_API_KEY no configurada', 'status': 'error'}
         
         client = genai.Client(api_key=api_key)
+        model_id = BATCH_MODEL_OVERRIDES.get(analysis_type, BATCH_MODEL_ID)
+        generation_config = {
+            "temperature": 0.3,
+            "maxOutputTokens": 8192,
+            "responseMimeType": "application/json",
+            **GENERATION_CONFIG_OVERRIDES.get(analysis_type, {})
+        }
         
         # Construir requests
         requests = []
         id_map = []
+        cached_map = []
         
         for item in items:
             chapter_id = item.get('chapter_id', 0)
@@ -234,30 +273,62 @@ def main(batch_input: dict) -> dict:
                 logging.warning(f"⚠️ Prompt vacío para capítulo {chapter_id}")
                 continue
             
+            # Cache: el prompt renderizado ya contiene todos los datos del capítulo
+            cache_key = build_cache_key(analysis_type, prompt, model_id)
+            if has_cached_result(cache_key):
+                cached_map.append({"chapter_id": chapter_id, "cache_key": cache_key})
+                continue
+            
             request_id = f"{analysis_type}-{chapter_id}"
             
             requests.append({
                 "key": request_id,
                 "request": {
-                    "model": "models/gemini-3-pro-preview",
+                    "model": model_id,
                     "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-                    "generationConfig": {
-                        "temperature": 0.3,
-                        "maxOutputTokens": 8192,
-                        "responseMimeType": "application/json"
-                    }
+                    "generationConfig": generation_config
                 }
             })
             
             id_map.append({
                 "key": request_id,
                 "chapter_id": chapter_id,
-                "analysis_type": analysis_type
+                "analysis_type": analysis_type,
+                "cache_key": cache_key
             })
         
+        if cached_map:
+            logging.info(f"♻️ Cache [{analysis_type}]: {len(cached_map)} capítulos sin cambios, {len(requests)} a enviar")
+        
+        if not requests and cached_map:
+            # Todos los capítulos en cache: no se crea batch job
+            return {
+                'status': 'cached',
+                'batch_job_name': None,
+                'analysis_type': analysis_type,
+                'total_requests': 0,
+                'id_map': [],
+                'cached_map': cached_map
+            }
+        
         if not requests:
             return {'error': 'No valid requests generated', 'status': 'error'}
         
+        # Envíos pequeños: online, sin cola de batch (mismo formato de salida)
+        kind = 'gemini_flash' if analysis_type in BATCH_MODEL_OVERRIDES else 'gemini_pro'
+        execution = choose_execution(kind, requests, model_id)
+        if execution['mode'] == 'online':
+            return {
+                'status': ONLINE_STATUS,
+                'batch_job_name': None,
+                'analysis_type': analysis_type,
+                'total_requests': len(requests),
+                'id_map': id_map,
+                'cached_map': cached_map,
+                'online_results': run_gemini_online(kind, model_id, requests),
+                'execution': execution
+            }
+        
         # =========================================================================
         # FIX: Escribir a archivo temporal ANTES de subir
         # La API de Gemini requiere una RUTA DE ARCHIVO, no contenido directo
@@ -292,7 +363,7 @@ def main(batch_input: dict) -> dict:
             
             # Crear batch job
             batch_job = client.batches.create(
-                model="models/gemini-3-pro-preview",
+                model=model_id,
                 src=uploaded_file.name,
                 config={
                     'display_name': f'lya_{analysis_type}'
@@ -308,7 +379,8 @@ def main(batch_input: dict) -> dict:
                 'batch_job_name': job_name,
                 'analysis_type': analysis_type,
                 'total_requests': len(requests),
-                'id_map': id_map
+                'id_map': id_map,
+                'cached_map': cached_map
             }
             
         finally:
@@ -17,9 +17,15 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 try:
     from vertex_utils import submit_vertex_batch_job, upload_jsonl_to_gcs, format_claude_vertex_request
     from config_models import CLAUDE_SONNET_MODEL
+    from result_cache import build_cache_key, has_cached_result
+    from payload_store import offload_payloads
+    from execution_router import ONLINE_STATUS, choose_execution, run_claude_online
 except ImportError:
     from API_DURABLE.vertex_utils import submit_vertex_batch_job, upload_jsonl_to_gcs, format_claude_vertex_request
     from API_DURABLE.config_models import CLAUDE_SONNET_MODEL
+    from API_DURABLE.result_cache import build_cache_key, has_cached_result
+    from API_DURABLE.payload_store import offload_payloads
+    from API_DURABLE.execution_router import ONLINE_STATUS, choose_execution, run_claude_online
 
 logging.basicConfig(level=logging.INFO)
 
@@ -92,12 +98,16 @@ TEXTO DEL CAPÍTULO:
 ═══════════════════════════════════════════════════════════════════════════════
 """
 
+@offload_payloads(fields=('chapter_metadata', 'online_results'))
 def main(input_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Envía capítulos a Vertex AI Batch.
     """
     try:
         chapters = input_data.get('chapters', [])
+        if input_data.get('chapter_ids') is not None:
+            wanted = {str(c) for c in input_data['chapter_ids']}
+            chapters = [c for c in chapters if str(c.get('parent_chapter_id', c.get('id', c.get('chapter_id')))) in wanted]
         carta = input_data.get('carta_editorial', {})
         bible = input_data.get('bible', {})
         book_metadata = input_data.get('book_metadata', {})
@@ -108,6 +118,7 @@ def main(input_data: Dict[str, Any]) -> Dict[str, Any]:
         
         batch_requests = []
         chapter_metadata = {}
+        cached_ids = []
         
         # 1. Preparar el contenido estático
         contexto_editorial_str = extraer_contexto_editorial(carta, bible)
@@ -146,6 +157,13 @@ def main(input_data: Dict[str, Any]) -> Dict[str, Any]:
                 contenido=chapter.get('content', '')
             )
             
+            # Cache: system + user determinan completamente la respuesta
+            cache_key = build_cache_key("margin_notes", system_content + "\n" + user_content, CLAUDE_SONNET_MODEL)
+            chapter_metadata[ch_id]['cache_key'] = cache_key
+            if has_cached_result(cache_key):
+                cached_ids.append(ch_id)
+                continue
+            
             request = format_claude_vertex_request(
                 messages=[{"role": "user", "content": user_content}],
                 system=system_content,
@@ -154,6 +172,34 @@ def main(input_data: Dict[str, Any]) -> Dict[str, Any]:
             )
             batch_requests.append(request)
         
+        if cached_ids:
+            logging.info(f"♻️ Cache: {len(cached_ids)} capítulos sin cambios, {len(batch_requests)} a enviar")
+        
+        if not batch_requests:
+            # Todas las notas en cache: no se crea batch job
+            return {
+                "batch_id": None,
+                "chapters_count": len(chapters),
+                "status": "cached",
+                "chapter_metadata": chapter_metadata,
+                "cached_ids": cached_ids,
+                "provider": "cache"
+            }
+        
+        # Envíos pequeños: online, sin cola de batch (mismo formato de salida)
+        execution = choose_execution('claude_vertex', batch_requests, CLAUDE_SONNET_MODEL)
+        if execution['mode'] == 'online':
+            return {
+                "batch_id": None,
+                "chapters_count": len(chapters),
+                "status": ONLINE_STATUS,
+                "chapter_metadata": chapter_metadata,
+                "cached_ids": cached_ids,
+                "online_results": run_claude_online(CLAUDE_SONNET_MODEL, batch_requests),
+                "execution": execution,
+                "provider": "vertex_ai_online"
+            }
+        
         logging.info(f"📦 Subiendo {len(batch_requests)} requests a GCS")
         
         batch_filename = f"claude_notes_batch_{uuid.uuid4()}.jsonl"
@@ -178,6 +224,7 @@ def main(input_data: Dict[str, Any]) -> Dict[str, Any]:
             "chapters_count": len(chapters),
             "status": "submitted",
             "chapter_metadata": chapter_metadata,
+            "cached_ids": cached_ids,
             "provider": "vertex_ai"
         }
         
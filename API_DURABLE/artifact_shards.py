@@ -0,0 +1,117 @@
+# =============================================================================
+# artifact_shards.py - Artefactos por Capítulo (LYA 6.0)
+# =============================================================================
+# SaveOutputs escribe, además de los archivos completos, un shard por
+# capítulo para que el editor descargue solo lo que tiene en pantalla:
+#
+#   {job_id}/chapters/index.json          -> resumen de cada capítulo (sin texto)
+#                                            + contadores de cambios por estado
+#   {job_id}/chapters/{chapter_id}.json   -> capítulo consolidado completo
+#   {job_id}/changes/{chapter_id}.json    -> cambios estructurados del capítulo
+#
+# Los endpoints HTTP usan los mismos helpers de rutas y paginación.
+# =============================================================================
+
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+# Campos de texto de un capítulo que no van al índice
+SUMMARY_MAX_STR_CHARS = 300
+
+CHANGE_STATUSES = ('pending', 'accepted', 'rejected')
+
+DEFAULT_CHANGES_PAGE_SIZE = 100
+MAX_CHANGES_PAGE_SIZE = 500
+
+
+def chapters_index_path(job_id: str) -> str:
+    return f"{job_id}/chapters/index.json"
+
+
+def chapter_shard_path(job_id: str, chapter_id: Any) -> str:
+    return f"{job_id}/chapters/{chapter_id}.json"
+
+
+def changes_shard_path(job_id: str, chapter_id: Any) -> str:
+    return f"{job_id}/changes/{chapter_id}.json"
+
+
+def count_by_status(changes: List[Dict]) -> Dict[str, int]:
+    counts = {status: 0 for status in CHANGE_STATUSES}
+    for change in changes:
+        status = change.get('status', 'pending')
+        counts[status] = counts.get(status, 0) + 1
+    counts['total'] = len(changes)
+    return counts
+
+
+def chapter_summary(chapter: Dict[str, Any], position: int, changes: List[Dict]) -> Dict[str, Any]:
+    """Campos escalares del capítulo (sin textos largos) + contadores de cambios."""
+    summary = {
+        key: value for key, value in chapter.items()
+        if isinstance(value, (int, float, bool)) or value is None
+        or (isinstance(value, str) and len(value) <= SUMMARY_MAX_STR_CHARS)
+    }
+    summary['position'] = position
+    summary['changes'] = count_by_status(changes)
+    return summary
+
+
+def group_changes_by_chapter(changes: List[Dict]) -> Dict[str, List[Dict]]:
+    grouped: Dict[str, List[Dict]] = {}
+    for change in changes:
+        grouped.setdefault(str(change.get('chapter_id')), []).append(change)
+    return grouped
+
+
+def build_chapter_shards(job_id: str, consolidated_chapters: List[Dict],
+                         structured_changes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Retorna {ruta_blob: contenido} con el índice y los shards de capítulos y
+    cambios, listos para subir.
+    """
+    by_chapter = group_changes_by_chapter(structured_changes.get('changes', []))
+
+    shards = {}
+    index = []
+    for position, chapter in enumerate(consolidated_chapters):
+        chapter_id = chapter.get('chapter_id', position + 1)
+        chapter_changes = by_chapter.get(str(chapter_id), [])
+
+        shards[chapter_shard_path(job_id, chapter_id)] = chapter
+        shards[changes_shard_path(job_id, chapter_id)] = {'chapter_id': chapter_id, 'changes': chapter_changes}
+        index.append(chapter_summary(chapter, position, chapter_changes))
+
+    shards[chapters_index_path(job_id)] = {
+        'total_chapters': len(index),
+        'changes': count_by_status(structured_changes.get('changes', [])),
+        'chapters': index
+    }
+    return shards
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    try:
+        return max(0, int(base64.urlsafe_b64decode(cursor.encode()).decode()))
+    except Exception:
+        return 0
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def page_changes(changes: List[Dict], status: Optional[str] = None, tipo: Optional[str] = None,
+                 cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Dict], int, Optional[str]]:
+    """Filtra por estado/tipo y pagina. Retorna (página, total filtrado, next_cursor)."""
+    if status:
+        wanted = {s.strip() for s in status.split(',') if s.strip()}
+        changes = [c for c in changes if c.get('status', 'pending') in wanted]
+    if tipo:
+        changes = [c for c in changes if c.get('tipo') == tipo]
+
+    limit = min(max(1, limit or DEFAULT_CHANGES_PAGE_SIZE), MAX_CHANGES_PAGE_SIZE)
+    offset = decode_cursor(cursor) if cursor else 0
+    page = changes[offset:offset + limit]
+    next_offset = offset + len(page)
+    return page, len(changes), (encode_cursor(next_offset) if next_offset < len(changes) else None)
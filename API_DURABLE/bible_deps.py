@@ -0,0 +1,201 @@
+# =============================================================================
+# bible_deps.py - Dependencias de la Biblia por Capítulo (LYA 6.0)
+# =============================================================================
+# Qué parte de la Biblia consume cada artefacto posterior a BibleApproved, con
+# las mismas reglas que las activities que arman los prompts:
+#
+#   notas de margen (SubmitMarginNotes)
+#     - voz_del_autor: NO_CORREGIR[:3], estilo_detectado      (todo el libro)
+#     - nombres del reparto del capítulo (máx. 6)             (por capítulo)
+#   edición (SubmitClaudeBatch)
+#     - identidad_obra: titulo, genero, tono, tema_central    (todo el libro)
+#     - voz_del_autor: estilo_detectado, NO_CORREGIR          (todo el libro)
+#     - punto clave del arco, ritmo, reparto (máx. 5) y
+#       problemas de causalidad del capítulo                  (por capítulo)
+#     - notas de margen del capítulo
+#   mapas de arco (SubmitGeminiProBatch arc_maps)
+#     - identidad_obra.genero, arco_narrativo.arcos_principales (todo el libro)
+#   carta editorial: la Biblia completa.
+#
+# Las notas de margen también leen la carta editorial (contexto editorial y
+# notas por capítulo): si la carta se regenera (letter_stale), las notas de
+# TODOS los capítulos y las ediciones que las usan se regeneran con ella.
+# margin_notes_chapters solo cubre lo que las notas leen de la Biblia.
+#
+# Un personaje sin capitulos_clave aplica a todos los capítulos. Si cambia
+# cómo una activity lee la Biblia, hay que cambiar aquí su vista.
+#
+# Al comparar la Biblia aplicada (biblia_aplicada.json, la que produjo los
+# artefactos actuales) con la editada, solo se recalculan los capítulos cuya
+# vista cambió; el resto de notas y ediciones se conservan. Cada Biblia
+# aprobada se guarda inmutable en bible_versions/{hash}.json.
+# =============================================================================
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+BIBLE_FILE = 'biblia_validada.json'
+APPLIED_BIBLE_FILE = 'biblia_aplicada.json'
+
+CAST_GROUPS = ('protagonistas', 'antagonistas', 'secundarios')
+MARGIN_NOTES_MAX_CHARACTERS = 6
+EDIT_MAX_CHARACTERS = 5
+
+
+def bible_version_path(job_id: str, version_hash: str) -> str:
+    return f"{job_id}/bible_versions/{version_hash}.json"
+
+
+def bible_hash(bible: Dict[str, Any]) -> str:
+    """Huella estable de la Biblia (independiente del orden de las llaves)."""
+    canonical = json.dumps(bible or {}, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def chapter_number(chapter_id: Any) -> int:
+    """Número de capítulo con el que la Biblia referencia a chapter_id (0 si no es numérico)."""
+    try:
+        return int(chapter_id)
+    except (TypeError, ValueError):
+        return 0
+
+
+def cast(bible: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Personajes del reparto en el orden en que los recorren las activities."""
+    reparto = bible.get('reparto_completo', {}) or {}
+    return [
+        {**character, '_tipo': group}
+        for group in CAST_GROUPS for character in (reparto.get(group) or [])
+        if isinstance(character, dict)
+    ]
+
+
+def chapter_cast(bible: Dict[str, Any], ch_num: int) -> List[Dict[str, Any]]:
+    return [c for c in cast(bible) if not c.get('capitulos_clave') or ch_num in c.get('capitulos_clave', [])]
+
+
+# -----------------------------------------------------------------------------
+# VISTAS POR ARTEFACTO
+# -----------------------------------------------------------------------------
+
+def margin_notes_view(bible: Dict[str, Any], ch_num: int) -> Dict[str, Any]:
+    voz = bible.get('voz_del_autor', {}) or {}
+    return {
+        'no_corregir': (voz.get('NO_CORREGIR') or [])[:3],
+        'estilo': voz.get('estilo_detectado'),
+        'personajes': [c.get('nombre') for c in chapter_cast(bible, ch_num)][:MARGIN_NOTES_MAX_CHARACTERS],
+    }
+
+
+def edit_view(bible: Dict[str, Any], ch_num: int) -> Dict[str, Any]:
+    identidad = bible.get('identidad_obra', {}) or {}
+    voz = bible.get('voz_del_autor', {}) or {}
+
+    posicion = next(
+        (punto for punto, data in (bible.get('arco_narrativo', {}) or {}).get('puntos_clave', {}).items()
+         if isinstance(data, dict) and data.get('capitulo') == ch_num),
+        None
+    )
+    ritmo = next(
+        (cap for cap in (bible.get('mapa_de_ritmo', {}) or {}).get('capitulos', []) if cap.get('numero') == ch_num),
+        None
+    )
+    causalidad = (bible.get('analisis_causalidad', {}) or {}).get('problemas_detectados', {}) or {}
+    problemas = [
+        p for tipo in ('eventos_huerfanos', 'contradicciones') for p in causalidad.get(tipo, [])
+        if str(p.get('capitulo')) == str(ch_num)
+    ]
+
+    return {
+        'obra': {key: identidad.get(key) for key in ('titulo', 'genero', 'tono_predominante', 'tema_central')},
+        'estilo': voz.get('estilo_detectado'),
+        'no_corregir': voz.get('NO_CORREGIR') or [],
+        'posicion': posicion,
+        'ritmo': ritmo,
+        'personajes': [
+            {'nombre': c.get('nombre'), 'rol': c.get('rol_arquetipo', c['_tipo']), 'voz': c.get('patron_dialogo')}
+            for c in chapter_cast(bible, ch_num)
+        ][:EDIT_MAX_CHARACTERS],
+        'problemas': problemas,
+    }
+
+
+def arc_maps_view(bible: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'genero': (bible.get('identidad_obra', {}) or {}).get('genero'),
+        'arcos_principales': (bible.get('arco_narrativo', {}) or {}).get('arcos_principales', []),
+    }
+
+
+# -----------------------------------------------------------------------------
+# DIFF
+# -----------------------------------------------------------------------------
+
+def _character_changes(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    before = {c.get('nombre'): c for c in cast(old)}
+    after = {c.get('nombre'): c for c in cast(new)}
+    return sorted(
+        str(name) for name in set(before) | set(after)
+        if bible_hash(before.get(name)) != bible_hash(after.get(name))
+    )
+
+
+def diff_bible(old: Dict[str, Any], new: Dict[str, Any], chapter_ids: Iterable[Any]) -> Dict[str, Any]:
+    """
+    Compara la Biblia aplicada con la editada. Retorna:
+
+        {
+          "old_hash", "new_hash", "changed": bool,
+          "sections": [secciones de primer nivel modificadas],
+          "characters": [personajes agregados / quitados / modificados],
+          "no_corregir": {"added": [...], "removed": [...]},
+          "margin_notes_chapters": [chapter_id...],   # notas a regenerar
+          "edit_chapters": [chapter_id...],           # capítulos a reeditar (incluye los anteriores)
+          "arc_maps_stale": bool,                     # mapas de arco (dependencia global)
+          "letter_stale": bool                        # la carta usa la Biblia completa
+        }
+    """
+    old, new = old or {}, new or {}
+    old_hash, new_hash = bible_hash(old), bible_hash(new)
+
+    old_rules = (old.get('voz_del_autor', {}) or {}).get('NO_CORREGIR') or []
+    new_rules = (new.get('voz_del_autor', {}) or {}).get('NO_CORREGIR') or []
+
+    margin_chapters, edit_chapters = [], []
+    if old_hash != new_hash:
+        for chapter_id in chapter_ids:
+            ch_num = chapter_number(chapter_id)
+            notes_changed = bible_hash(margin_notes_view(old, ch_num)) != bible_hash(margin_notes_view(new, ch_num))
+            if notes_changed:
+                margin_chapters.append(str(chapter_id))
+            # Notas nuevas -> edición nueva (las notas entran en el prompt de edición)
+            if notes_changed or bible_hash(edit_view(old, ch_num)) != bible_hash(edit_view(new, ch_num)):
+                edit_chapters.append(str(chapter_id))
+
+    return {
+        'old_hash': old_hash,
+        'new_hash': new_hash,
+        'changed': old_hash != new_hash,
+        'sections': sorted(
+            key for key in set(old) | set(new) if bible_hash(old.get(key)) != bible_hash(new.get(key))
+        ),
+        'characters': _character_changes(old, new),
+        'no_corregir': {
+            'added': [r for r in new_rules if r not in old_rules],
+            'removed': [r for r in old_rules if r not in new_rules],
+        },
+        'margin_notes_chapters': margin_chapters,
+        'edit_chapters': edit_chapters,
+        'arc_maps_stale': bible_hash(arc_maps_view(old)) != bible_hash(arc_maps_view(new)),
+        'letter_stale': old_hash != new_hash,
+    }
+
+
+def recompute_summary(diff: Optional[Dict[str, Any]]) -> str:
+    """Texto corto para logs y respuestas HTTP."""
+    if not diff or not diff.get('changed'):
+        return "Biblia sin cambios"
+    return (f"{len(diff['edit_chapters'])} capítulos a reeditar "
+            f"({len(diff['margin_notes_chapters'])} con notas nuevas); "
+            f"secciones: {', '.join(diff['sections']) or '-'}")
@@ -61,6 +61,9 @@ REFLECTION_CRITIC_MODEL = GEMINI_PRO_MODEL
 # Modelo para redacción en reflection loop
 REFLECTION_WRITER_MODEL = CLAUDE_SONNET_MODEL
 
+# Capítulos en reflection simultáneamente (sub-orquestaciones en paralelo)
+REFLECTION_MAX_CONCURRENCY = 8
+
 # =============================================================================
 # CONFIGURACIÓN DE ANÁLISIS EMOCIONAL (LYA 6.0)
 # =============================================================================
@@ -74,6 +77,16 @@ SENTIMENT_MODEL = "finiteautomata/beto-sentiment-analysis"
 # Tamaño de ventana para análisis deslizante (palabras)
 SENTIMENT_WINDOW_SIZE = 500
 
+# Ventanas por lote de inferencia y longitud máxima de cada ventana (tokens)
+SENTIMENT_BATCH_SIZE = 16
+SENTIMENT_MAX_TOKENS = 512
+
+# Backend de inferencia del modelo de sentiment:
+#   "torch"      - PyTorch fp32 (por defecto)
+#   "torch_int8" - PyTorch con cuantización dinámica int8 de las capas Linear
+#   "onnx"       - ONNX Runtime vía optimum (requiere optimum[onnxruntime])
+SENTIMENT_BACKEND = "torch"
+
 # =============================================================================
 # CONFIGURACIÓN DE DETECCIÓN SENSORIAL (LYA 6.0)
 # =============================================================================
@@ -85,6 +98,150 @@ ENABLE_SENSORY_DETECTION = True
 # Si < umbral en párrafo crítico, se marca como "telling"
 SENSORY_CONTENT_THRESHOLD = 0.3
 
+# Modo online: llamadas simultáneas y ritmo máximo (requests por minuto)
+SENSORY_MAX_CONCURRENCY = 8
+SENSORY_REQUESTS_PER_MINUTE = 120
+
+# A partir de este número de capítulos se usa la Batch API (SubmitGeminiProBatch)
+SENSORY_BATCH_MIN_CHAPTERS = 80
+
+# =============================================================================
+# CONFIGURACIÓN DE CACHE DE RESULTADOS (LYA 6.0)
+# =============================================================================
+
+# Reutilizar resultados de batch para fragmentos/capítulos sin cambios
+ENABLE_RESULT_CACHE = True
+
+# Container de Blob Storage donde viven los resultados cacheados
+RESULT_CACHE_CONTAINER = "lya-cache"
+
+# Versión de cada plantilla de prompt.
+# La clave del cache ya incluye el prompt renderizado; incrementar al cambiar
+# el parser o el post-proceso de los resultados para invalidar el cache.
+PROMPT_VERSIONS = {
+    "layer1_factual": "v1",
+    "layer2_structural": "v1",
+    "layer3_qualitative": "v1",
+    "arc_maps": "v1",
+    "margin_notes": "v1",
+    "professional_editing": "v1",
+    "sensory": "v1",
+}
+
+# =============================================================================
+# CONFIGURACIÓN DE PAYLOADS EN BLOB (LYA 6.0)
+# =============================================================================
+
+# Container donde se escriben resultados de batch y payloads grandes
+PAYLOAD_CONTAINER = "lya-payloads"
+
+# Resultados por chunk NDJSON al volcar la salida de un batch
+RESULT_CHUNK_SIZE = 50
+
+# Tamaño a partir del cual un input/output de activity se guarda en Blob
+# y viaja por el historial del orquestador como BlobRef (bytes JSON)
+PAYLOAD_OFFLOAD_MIN_BYTES = 16 * 1024
+
+# =============================================================================
+# CONFIGURACIÓN DE SEGMENTACIÓN (LYA 6.0)
+# =============================================================================
+
+# Presupuesto de tokens (estimados) por fragmento para cada modelo que lo
+# procesa. Un fragmento debe caber en el presupuesto de TODOS los modelos.
+SEGMENT_TOKEN_BUDGETS = {
+    GEMINI_FLASH_MODEL: 8000,    # Capa 1 (batch factual)
+    CLAUDE_SONNET_MODEL: 6000,   # Edición profesional
+}
+
+# Caracteres por token estimados para prosa en español, por modelo
+CHARS_PER_TOKEN = {
+    GEMINI_FLASH_MODEL: 4.0,
+    CLAUDE_SONNET_MODEL: 3.5,
+}
+
+# Extracción de PDF: procesos del pool y páginas por tarea
+# (PDFs con menos de PDF_PAGES_PER_TASK páginas se extraen en el mismo proceso)
+PDF_EXTRACTION_WORKERS = 4
+PDF_PAGES_PER_TASK = 25
+
+# =============================================================================
+# CONFIGURACIÓN DE SEGUIMIENTO DE BATCHES (LYA 6.0)
+# =============================================================================
+
+# Tiempo máximo de espera (reloj real) para un grupo de batches
+BATCH_DEADLINE_MINUTES = 120
+
+# Límites del intervalo entre polls de un mismo batch (segundos)
+BATCH_POLL_MIN_SECONDS = 10
+BATCH_POLL_MAX_SECONDS = 300
+
+# Polls con error consecutivos antes de dar un batch por fallido
+BATCH_MAX_POLL_ERRORS = 3
+
+# Historial de tiempos de finalización por proveedor (muestras guardadas
+# y mínimo necesario para usarlo en lugar de la secuencia fija)
+BATCH_LATENCY_HISTORY_SIZE = 50
+BATCH_LATENCY_MIN_SAMPLES = 3
+
+# =============================================================================
+# EJECUCIÓN HÍBRIDA ONLINE / BATCH (LYA 6.0)
+# =============================================================================
+
+# Cada Submit* decide con sus requests ya armados si los ejecuta online
+# (llamadas concurrentes acotadas) o crea un batch (ver execution_router.py).
+# Las claves son los tipos de proveedor de BatchLatencyHistory.
+ENABLE_HYBRID_EXECUTION = True
+
+# Tamaño máximo de un envío online (requests y tokens de entrada estimados)
+ONLINE_MAX_REQUESTS = {"gemini_flash": 60, "gemini_pro": 24, "claude_vertex": 16}
+ONLINE_MAX_INPUT_TOKENS = {"gemini_flash": 400_000, "gemini_pro": 200_000, "claude_vertex": 120_000}
+
+# Llamadas simultáneas y ritmo máximo (requests por minuto) en modo online
+ONLINE_MAX_CONCURRENCY = {"gemini_flash": 16, "gemini_pro": 8, "claude_vertex": 6}
+ONLINE_REQUESTS_PER_MINUTE = {"gemini_flash": 240, "gemini_pro": 60, "claude_vertex": 40}
+
+# Duración estimada de una llamada online (segundos)
+ONLINE_SECONDS_PER_REQUEST = {"gemini_flash": 15, "gemini_pro": 60, "claude_vertex": 90}
+
+# Tope del tiempo online estimado: la activity corre bajo functionTimeout (10 min)
+ONLINE_MAX_SECONDS = 300
+
+# Latencia de batch supuesta mientras no haya BATCH_LATENCY_MIN_SAMPLES muestras
+BATCH_DEFAULT_LATENCY_SECONDS = {"gemini_flash": 600, "gemini_pro": 900, "claude_vertex": 1200}
+
+# =============================================================================
+# ANÁLISIS POR CAPÍTULOS (LYA 6.0)
+# =============================================================================
+
+# Capa 1 -> consolidación -> Capa 2/3 avanzan por grupos de capítulos: cada
+# grupo es un micro-batch y sigue en cuanto terminan SUS fragmentos, de modo
+# que un fragmento rezagado solo retrasa su grupo. Con un solo grupo se usa
+# el flujo clásico (un batch por capa para todo el libro).
+ENABLE_ANALYSIS_STREAMING = True
+ANALYSIS_STREAM_CHAPTERS_PER_BATCH = 8
+
+# Fragmentos que se rescatan uno a uno (AnalyzeChapter) si faltan en Capa 1
+LAYER1_RESCUE_MAX_FRAGMENTS = 10
+
+# =============================================================================
+# EDICIÓN POR CAPÍTULOS (LYA 6.0)
+# =============================================================================
+
+# Notas de margen y edición single-pass avanzan por grupos de capítulos: el
+# batch de edición de un grupo se envía en cuanto están SUS notas, mientras
+# los demás grupos y los mapas de arco siguen en curso.
+ENABLE_EDITING_STREAMING = True
+EDITING_STREAM_CHAPTERS_PER_BATCH = 10
+
+# =============================================================================
+# EJECUCIÓN ESPECULATIVA DURANTE LA APROBACIÓN DE LA BIBLIA (LYA 6.0)
+# =============================================================================
+
+# Carta, notas de margen y arcos se lanzan con la Biblia sin aprobar mientras
+# se espera BibleApproved; al aprobar se reutilizan si la Biblia no cambió o
+# se recalcula solo lo que dependa de lo editado (ver bible_deps.py)
+ENABLE_SPECULATIVE_EDITORIAL = True
+
 # =============================================================================
 # MAPPING DE MODELOS POR FUNCIÓN (para retrocompatibilidad)
 # =============================================================================
@@ -146,6 +303,7 @@ def get_reflection_config() -> dict:
         "enabled": ENABLE_REFLECTION_LOOPS,
         "quality_threshold": REFLECTION_QUALITY_THRESHOLD,
         "max_iterations": REFLECTION_MAX_ITERATIONS,
+        "max_concurrency": REFLECTION_MAX_CONCURRENCY,
         "critic_model": REFLECTION_CRITIC_MODEL,
         "writer_model": REFLECTION_WRITER_MODEL
     }
@@ -158,7 +316,10 @@ def get_emotional_analysis_config() -> dict:
     return {
         "enabled": ENABLE_EMOTIONAL_ARC_ANALYSIS,
         "sentiment_model": SENTIMENT_MODEL,
-        "window_size": SENTIMENT_WINDOW_SIZE
+        "window_size": SENTIMENT_WINDOW_SIZE,
+        "batch_size": SENTIMENT_BATCH_SIZE,
+        "max_tokens": SENTIMENT_MAX_TOKENS,
+        "backend": SENTIMENT_BACKEND
     }
 
 
@@ -168,5 +329,44 @@ def get_sensory_detection_config() -> dict:
     """
     return {
         "enabled": ENABLE_SENSORY_DETECTION,
-        "threshold": SENSORY_CONTENT_THRESHOLD
+        "threshold": SENSORY_CONTENT_THRESHOLD,
+        "max_concurrency": SENSORY_MAX_CONCURRENCY,
+        "requests_per_minute": SENSORY_REQUESTS_PER_MINUTE,
+        "batch_min_chapters": SENSORY_BATCH_MIN_CHAPTERS
     }
+
+
+def get_online_execution_config(kind: str) -> dict:
+    """
+    Retorna los límites del modo online para un tipo de proveedor.
+    """
+    return {
+        "max_requests": ONLINE_MAX_REQUESTS.get(kind, 0),
+        "max_input_tokens": ONLINE_MAX_INPUT_TOKENS.get(kind, 0),
+        "max_concurrency": ONLINE_MAX_CONCURRENCY.get(kind, 4),
+        "requests_per_minute": ONLINE_REQUESTS_PER_MINUTE.get(kind, 30),
+        "seconds_per_request": ONLINE_SECONDS_PER_REQUEST.get(kind, 60),
+        "max_seconds": ONLINE_MAX_SECONDS,
+        "default_batch_seconds": BATCH_DEFAULT_LATENCY_SECONDS.get(kind, 900)
+    }
+
+
+def get_segment_token_budget() -> dict:
+    """
+    Retorna el presupuesto de tokens por fragmento de cada modelo destino
+    y su relación caracteres/token.
+    """
+    return {
+        model: {
+            "max_tokens": budget,
+            "chars_per_token": CHARS_PER_TOKEN.get(model, 4.0)
+        }
+        for model, budget in SEGMENT_TOKEN_BUDGETS.items()
+    }
+
+
+def get_prompt_version(prompt_name: str) -> str:
+    """
+    Obtiene la versión vigente de una plantilla de prompt (para el cache).
+    """
+    return PROMPT_VERSIONS.get(prompt_name, "v1")
@@ -0,0 +1,253 @@
+# =============================================================================
+# execution_router.py - Ejecución Híbrida Online / Batch (LYA 6.0)
+# =============================================================================
+# Las activities Submit* arman sus requests como siempre y preguntan a
+# choose_execution si conviene ejecutarlos en el acto (online) o crear el
+# batch del proveedor:
+#
+#   - online: pocos requests y pocos tokens, y un tiempo estimado (oleadas de
+#     ONLINE_MAX_CONCURRENCY llamadas, limitado por requests/minuto) menor que
+#     la latencia observada del batch (p50 de BatchLatencyHistory) y que el
+#     tope de la activity (ONLINE_MAX_SECONDS).
+#   - batch: todo lo demás. Los libros grandes siguen por batch (mitad de precio).
+#
+# Online, las respuestas se guardan con el MISMO formato de línea que la
+# salida del batch ({"key", "response"} en Gemini, {"instance", "prediction"}
+# en Vertex) y el Submit devuelve status "online": BatchTrackerOrchestrator
+# consulta en el acto (como con "cached") y el Poll* parsea esas líneas con
+# el mismo código que un batch terminado.
+# =============================================================================
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List
+
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+try:
+    from payload_store import hydrate
+    from BatchLatencyHistory import get_history_blob, load_history, summarize
+except ImportError:
+    from API_DURABLE.payload_store import hydrate
+    from API_DURABLE.BatchLatencyHistory import get_history_blob, load_history, summarize
+
+try:
+    from config_models import (
+        ENABLE_HYBRID_EXECUTION,
+        BATCH_LATENCY_MIN_SAMPLES,
+        CHARS_PER_TOKEN,
+        get_online_execution_config
+    )
+except ImportError:
+    ENABLE_HYBRID_EXECUTION = False
+    BATCH_LATENCY_MIN_SAMPLES = 3
+    CHARS_PER_TOKEN = {}
+    get_online_execution_config = None
+
+logging.basicConfig(level=logging.INFO)
+
+ONLINE_STATUS = "online"
+
+
+def is_online(batch_info: Dict[str, Any]) -> bool:
+    return isinstance(batch_info, dict) and batch_info.get('status') == ONLINE_STATUS
+
+
+# -----------------------------------------------------------------------------
+# DECISIÓN
+# -----------------------------------------------------------------------------
+
+def estimate_tokens(requests: List[Any], model: str = None) -> int:
+    """Tokens de entrada estimados a partir del tamaño de los requests serializados."""
+    chars = sum(len(json.dumps(r, ensure_ascii=False)) for r in requests)
+    return int(chars / CHARS_PER_TOKEN.get(model, 4.0))
+
+
+def observed_batch_latency(kind: str, default: float) -> Dict[str, Any]:
+    """p50 de finalización de batches del proveedor, o default sin historial suficiente."""
+    try:
+        blob_client = get_history_blob()
+        stats = summarize(load_history(blob_client), [kind]).get(kind) if blob_client else None
+    except Exception as e:
+        logging.warning(f"⚠️ Historial de latencia no disponible: {e}")
+        stats = None
+    if not stats or stats.get('samples', 0) < BATCH_LATENCY_MIN_SAMPLES:
+        return {'seconds': default, 'source': 'default'}
+    return {'seconds': stats['p50'], 'source': f"p50 de {stats['samples']} batches"}
+
+
+def choose_execution(kind: str, requests: List[Any], model: str = None) -> Dict[str, Any]:
+    """
+    Decide 'online' o 'batch' para un envío de requests del proveedor kind
+    (gemini_flash, gemini_pro, claude_vertex). Devuelve la decisión con sus
+    números, para logs y para el batch_info.
+    """
+    decision = {'mode': 'batch', 'kind': kind, 'requests': len(requests)}
+    if not ENABLE_HYBRID_EXECUTION or get_online_execution_config is None or not requests:
+        return {**decision, 'reason': 'ejecución híbrida desactivada' if requests else 'sin requests'}
+
+    config = get_online_execution_config(kind)
+    tokens = estimate_tokens(requests, model)
+    waves = math.ceil(len(requests) / max(1, config['max_concurrency']))
+    online_seconds = max(
+        waves * config['seconds_per_request'],
+        len(requests) * 60.0 / max(1, config['requests_per_minute'])
+    )
+    decision.update({'estimated_tokens': tokens, 'online_seconds': round(online_seconds, 1)})
+
+    if len(requests) > config['max_requests']:
+        reason = f"{len(requests)} requests > {config['max_requests']}"
+    elif tokens > config['max_input_tokens']:
+        reason = f"~{tokens:,} tokens > {config['max_input_tokens']:,}"
+    elif online_seconds > config['max_seconds']:
+        reason = f"~{online_seconds:.0f}s online > tope de {config['max_seconds']}s"
+    else:
+        latency = observed_batch_latency(kind, config['default_batch_seconds'])
+        decision['batch_seconds'] = latency['seconds']
+        if online_seconds < latency['seconds']:
+            decision['mode'] = 'online'
+            reason = f"~{online_seconds:.0f}s online < ~{latency['seconds']:.0f}s de cola batch ({latency['source']})"
+        else:
+            reason = f"~{online_seconds:.0f}s online >= ~{latency['seconds']:.0f}s de cola batch ({latency['source']})"
+
+    decision['reason'] = reason
+    logging.info(f"🔀 [{kind}] {len(requests)} requests -> {decision['mode'].upper()}: {reason}")
+    return decision
+
+
+# -----------------------------------------------------------------------------
+# EJECUCIÓN ONLINE (fan-out asíncrono acotado)
+# -----------------------------------------------------------------------------
+
+class TokenBucket:
+    """
+    Limitador de ritmo para las llamadas asíncronas: se reponen
+    requests_per_minute tokens por minuto, con una ráfaga máxima de capacity.
+    """
+
+    def __init__(self, requests_per_minute: int, capacity: int):
+        self.rate = max(requests_per_minute, 1) / 60.0
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@retry(
+    retry=retry_if_exception_type((Exception,)),
+    wait=wait_exponential(multiplier=1, min=2, max=30),
+    stop=stop_after_attempt(3),
+    reraise=True
+)
+async def _call_with_retry(call: Callable, item: Any, bucket: TokenBucket):
+    """Cada reintento consume un token del bucket."""
+    await bucket.acquire()
+    return await call(item)
+
+
+async def _run_bounded(kind: str, items: List[Any], call: Callable, on_error: Callable) -> List[Any]:
+    config = get_online_execution_config(kind)
+    semaphore = asyncio.Semaphore(max(1, config['max_concurrency']))
+    bucket = TokenBucket(config['requests_per_minute'], config['max_concurrency'])
+
+    async def run(item):
+        try:
+            async with semaphore:
+                return await _call_with_retry(call, item, bucket)
+        except Exception as e:
+            logging.error(f"⚠️ [{kind}] Llamada online fallida: {e}")
+            return on_error(item, e)
+
+    return await asyncio.gather(*[run(item) for item in items])
+
+
+def run_gemini_online(kind: str, model_id: str, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Ejecuta requests JSONL del batch de Gemini ({"key", "request"}) y devuelve
+    líneas con el formato de salida del batch ({"key", "response"}).
+    """
+    from google import genai  # solo los Submit que van online cargan el SDK
+
+    client = genai.Client(api_key=os.environ.get('GEMINI_API_KEY'))
+
+    async def call(entry):
+        request = entry['request']
+        response = await client.aio.models.generate_content(
+            model=request.get('model', model_id),
+            contents=request['contents'],
+            config=request.get('generationConfig')
+        )
+        return {
+            'key': entry['key'],
+            'response': {'candidates': [{'content': {'parts': [{'text': response.text or ''}]}}]}
+        }
+
+    started = time.monotonic()
+    lines = asyncio.run(_run_bounded(kind, requests, call, lambda entry, e: {'key': entry['key'], 'error': str(e)}))
+    logging.info(f"✅ [{kind}] {len(lines)} requests online en {time.monotonic() - started:.0f}s")
+    return lines
+
+
+def run_claude_online(model_name: str, instances: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Ejecuta instancias del batch de Claude en Vertex (format_claude_vertex_request)
+    y devuelve líneas con el formato de salida del batch ({"instance", "prediction"}).
+    """
+    from anthropic import AsyncAnthropicVertex
+    try:
+        from vertex_utils import PROJECT_ID, REGION, resolve_vertex_model_id
+    except ImportError:
+        from API_DURABLE.vertex_utils import PROJECT_ID, REGION, resolve_vertex_model_id
+
+    client = AsyncAnthropicVertex(region=REGION, project_id=PROJECT_ID)
+    model = resolve_vertex_model_id(model_name)
+
+    async def call(instance):
+        options = {key: instance[key] for key in ('system', 'temperature') if key in instance}
+        message = await client.messages.create(
+            model=model,
+            messages=instance['messages'],
+            max_tokens=instance.get('max_tokens', 4096),
+            **options
+        )
+        return {
+            'instance': instance,
+            'prediction': {
+                'content': [{'type': 'text', 'text': block.text} for block in message.content if hasattr(block, 'text')],
+                'usage': {'input_tokens': message.usage.input_tokens, 'output_tokens': message.usage.output_tokens}
+            }
+        }
+
+    started = time.monotonic()
+    lines = asyncio.run(_run_bounded('claude_vertex', instances, call, lambda instance, e: {'instance': instance, 'error': str(e)}))
+    logging.info(f"✅ [claude_vertex] {len(lines)} requests online en {time.monotonic() - started:.0f}s")
+    return lines
+
+
+# -----------------------------------------------------------------------------
+# LECTURA (Poll*)
+# -----------------------------------------------------------------------------
+
+def online_results(batch_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Líneas de salida de un envío online (pueden venir como BlobRef)."""
+    return hydrate(batch_info.get('online_results')) or []
+
+
+def online_results_jsonl(batch_info: Dict[str, Any]) -> bytes:
+    """Las mismas líneas como JSONL, para los parsers de la salida de Gemini Batch."""
+    return "\n".join(json.dumps(line, ensure_ascii=False) for line in online_results(batch_info)).encode('utf-8')
@@ -0,0 +1,224 @@
+# =============================================================================
+# manuscript_export.py - Manuscrito Final con Decisiones (LYA 6.0)
+# =============================================================================
+# Aplica los cambios ACEPTADOS de cambios_estructurados.json sobre el texto
+# original de cada capítulo y genera Markdown o DOCX, capítulo a capítulo.
+#
+# Cada capítulo se representa como una piece table: el texto original queda
+# intacto y el resultado es una secuencia de piezas (original | añadido) con
+# los offsets de structure_changes.find_change_position ('offset'/'length').
+# No se construyen copias intermedias del capítulo por cada cambio (el
+# str.split/join del cliente era O(cambios x texto)).
+#
+# Cambios sin offset (proyectos anteriores) o cuyo offset ya no coincide se
+# ubican buscando el texto original; los que no aparecen o se solapan con
+# otro aceptado se omiten y se cuentan en las estadísticas.
+# =============================================================================
+
+import io
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Pt
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+
+EXPORT_FORMATS = {
+    'md': 'text/markdown',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+
+class PieceTable:
+    """
+    Texto = buffer original inmutable + buffer de añadidos. Cada reemplazo es
+    (start, end) en coordenadas del original -> índice en added; pieces()
+    recorre los reemplazos ordenados intercalando tramos del original. Los
+    reemplazos no pueden solaparse (ver overlaps).
+    """
+
+    def __init__(self, original: str):
+        self.original = original
+        self.added: List[str] = []
+        self.edits: List[Tuple[int, int, int]] = []  # (start, end, índice en added)
+
+    def replace(self, start: int, end: int, text: str):
+        self.added.append(text)
+        self.edits.append((start, end, len(self.added) - 1))
+
+    def overlaps(self, start: int, end: int) -> bool:
+        return any(start < e_end and s_start < end for s_start, e_end, _ in self.edits)
+
+    def pieces(self) -> Iterator[str]:
+        cursor = 0
+        for start, end, added_index in sorted(self.edits):
+            if start > cursor:
+                yield self.original[cursor:start]
+            yield self.added[added_index]
+            cursor = end
+        if cursor < len(self.original):
+            yield self.original[cursor:]
+
+    def text(self) -> str:
+        return ''.join(self.pieces())
+
+
+def locate_change(text: str, change: Dict[str, Any], table: PieceTable) -> Optional[Tuple[int, int]]:
+    """Span del texto original del cambio: primero su offset, luego por búsqueda."""
+    original = change.get('original') or ''
+    if not original:
+        return None
+
+    offset = (change.get('position') or {}).get('offset')
+    if isinstance(offset, int) and text.startswith(original, offset):
+        span = (offset, offset + len(original))
+        if not table.overlaps(*span):
+            return span
+
+    # Sin offset válido: la siguiente aparición libre del texto
+    position = text.find(original)
+    while position != -1:
+        span = (position, position + len(original))
+        if not table.overlaps(*span):
+            return span
+        position = text.find(original, position + 1)
+    return None
+
+
+def build_chapter_table(chapter: Dict[str, Any], changes: List[Dict[str, Any]], stats: Dict[str, int]) -> PieceTable:
+    text = chapter.get('contenido_original') or chapter.get('contenido_editado') or ''
+    table = PieceTable(text)
+    for change in changes:
+        if change.get('status') != 'accepted' or change.get('editado') is None:
+            continue
+        span = locate_change(text, change, table)
+        if span is None:
+            stats['skipped'] += 1
+            continue
+        table.replace(span[0], span[1], change['editado'])
+        stats['applied'] += 1
+    return table
+
+
+def iter_final_chapters(chapters: List[Dict], changes: List[Dict], stats: Optional[Dict[str, int]] = None):
+    """Genera (capítulo, PieceTable) en orden, con solo los cambios aceptados aplicados."""
+    stats = stats if stats is not None else {}
+    stats.setdefault('applied', 0)
+    stats.setdefault('skipped', 0)
+
+    by_chapter: Dict[str, List[Dict]] = {}
+    for change in changes:
+        by_chapter.setdefault(str(change.get('chapter_id')), []).append(change)
+
+    for chapter in chapters:
+        table = build_chapter_table(chapter, by_chapter.get(str(chapter.get('chapter_id')), []), stats)
+        yield chapter, table
+
+
+def chapter_title(chapter: Dict[str, Any]) -> str:
+    return chapter.get('display_title') or chapter.get('titulo') or f"Capítulo {chapter.get('chapter_id', '')}".strip()
+
+
+# -----------------------------------------------------------------------------
+# MARKDOWN (STREAMING)
+# -----------------------------------------------------------------------------
+
+def iter_markdown(book_name: str, chapters: List[Dict], changes: List[Dict],
+                  stats: Optional[Dict[str, int]] = None) -> Iterator[bytes]:
+    """Markdown en bytes, una pieza a la vez (apto para upload_blob en streaming)."""
+    yield f"# {book_name}\n\n".encode('utf-8')
+    for chapter, table in iter_final_chapters(chapters, changes, stats):
+        yield f"\n## {chapter_title(chapter)}\n\n".encode('utf-8')
+        for piece in table.pieces():
+            yield piece.encode('utf-8')
+        yield b"\n"
+
+
+# -----------------------------------------------------------------------------
+# DOCX
+# -----------------------------------------------------------------------------
+
+def render_docx(book_name: str, chapters: List[Dict], changes: List[Dict],
+                stats: Optional[Dict[str, int]] = None) -> bytes:
+    """DOCX con el mismo formato que generaba el editor (título, H1 por capítulo)."""
+    if not DOCX_AVAILABLE:
+        raise ImportError("python-docx no instalado")
+
+    document = Document()
+    title = document.add_paragraph()
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    run = title.add_run(book_name)
+    run.bold, run.font.size, run.font.name = True, Pt(28), 'Georgia'
+
+    for chapter, table in iter_final_chapters(chapters, changes, stats):
+        heading = document.add_heading(level=1)
+        heading.paragraph_format.page_break_before = True
+        run = heading.add_run(chapter_title(chapter))
+        run.font.size, run.font.name = Pt(18), 'Georgia'
+
+        content = table.text()
+        paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
+        if not paragraphs:
+            document.add_paragraph().add_run("[Capítulo vacío o sin contenido procesado]").italic = True
+        for text in paragraphs:
+            paragraph = document.add_paragraph()
+            paragraph.paragraph_format.space_after = Pt(10)
+            paragraph.paragraph_format.line_spacing = 1.5
+            run = paragraph.add_run(text)
+            run.font.size, run.font.name = Pt(12), 'Times New Roman'
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    logging.info(f"📄 DOCX generado: {len(chapters)} capítulos, {buffer.tell():,} bytes")
+    return buffer.getvalue()
+
+
+# -----------------------------------------------------------------------------
+# RENDER A BLOB
+# -----------------------------------------------------------------------------
+
+def export_to_blob(service, container: str, job_id: str, fmt: str, blob_path: str) -> Dict[str, int]:
+    """
+    Renderiza el manuscrito final de job_id en blob_path (Markdown en
+    streaming por capítulo, DOCX completo) y borra los renders anteriores del
+    mismo formato. Retorna las estadísticas de cambios aplicados/omitidos.
+    """
+    from azure.storage.blob import ContentSettings
+
+    container_client = service.get_container_client(container)
+
+    def read(name, default):
+        try:
+            return json.loads(container_client.get_blob_client(f"{job_id}/{name}").download_blob().readall())
+        except Exception:
+            return default
+
+    chapters = read('capitulos_consolidados.json', [])
+    changes = read('cambios_estructurados.json', {}).get('changes', [])
+    metadata = read('metadata.json', {})
+    book_name = metadata.get('book_name') or metadata.get('project_name') or 'Manuscrito'
+
+    stats = {'applied': 0, 'skipped': 0}
+    if fmt == 'docx':
+        data = render_docx(book_name, chapters, changes, stats)
+    else:
+        data = iter_markdown(book_name, chapters, changes, stats)
+
+    container_client.get_blob_client(blob_path).upload_blob(
+        data, overwrite=True, content_settings=ContentSettings(content_type=EXPORT_FORMATS[fmt])
+    )
+    logging.info(f"📦 Export {fmt} de {job_id}: {stats['applied']} cambios aplicados, {stats['skipped']} omitidos")
+
+    prefix = blob_path.rsplit('/', 1)[0] + '/'
+    for old in container_client.list_blobs(name_starts_with=prefix):
+        if old.name != blob_path and old.name.endswith(f".{fmt}"):
+            try:
+                container_client.delete_blob(old.name)
+            except Exception:
+                pass
+    return stats
@@ -0,0 +1,292 @@
+# =============================================================================
+# payload_store.py - Payloads en Blob Storage (LYA 6.0)
+# =============================================================================
+# Mantiene pequeño el historial durable del orquestador:
+#   - Resultados de batch: la salida JSONL se parsea línea a línea y se vuelca
+#     en chunks NDJSON. Al orquestador solo le llega un MANIFEST.
+#   - BlobRef: los inputs/outputs grandes de las activities se guardan en Blob
+#     (direccionados por contenido) y viajan como {"__blobref__": {...}}.
+#     El decorador @offload_payloads hidrata/deshidrata de forma transparente.
+# =============================================================================
+
+import logging
+import json
+import os
+import io
+import uuid
+import hashlib
+import functools
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+
+try:
+    from config_models import PAYLOAD_CONTAINER, RESULT_CHUNK_SIZE, PAYLOAD_OFFLOAD_MIN_BYTES
+except ImportError:
+    PAYLOAD_CONTAINER = "lya-payloads"
+    RESULT_CHUNK_SIZE = 50
+    PAYLOAD_OFFLOAD_MIN_BYTES = 16 * 1024
+
+BLOBREF_KEY = "__blobref__"
+
+try:
+    from azure.storage.blob import BlobServiceClient, ContentSettings
+    BLOB_AVAILABLE = True
+except ImportError:
+    BLOB_AVAILABLE = False
+
+# Clientes compartidos por proceso (se reutilizan entre invocaciones de activities)
+_service = None
+_container_client = None
+
+
+def _get_service():
+    global _service
+
+    if _service is not None:
+        return _service
+
+    if not BLOB_AVAILABLE:
+        raise RuntimeError("azure-storage-blob no disponible")
+
+    connect_str = os.environ.get('AzureWebJobsStorage')
+    if not connect_str:
+        raise RuntimeError("AzureWebJobsStorage no configurado")
+
+    _service = BlobServiceClient.from_connection_string(connect_str)
+    return _service
+
+
+def _get_container():
+    """Devuelve el container de payloads, creándolo la primera vez."""
+    global _container_client
+
+    if _container_client is not None:
+        return _container_client
+
+    service = _get_service()
+    try:
+        service.create_container(PAYLOAD_CONTAINER)
+    except Exception:
+        pass
+
+    _container_client = service.get_container_client(PAYLOAD_CONTAINER)
+    return _container_client
+
+
+# =============================================================================
+# LECTURA INCREMENTAL DE JSONL
+# =============================================================================
+
+def iter_jsonl(data: bytes) -> Iterator[Tuple[int, Optional[dict]]]:
+    """
+    Recorre un JSONL línea a línea sin decodificar ni partir el archivo entero.
+
+    Yields:
+        (line_num, objeto) — objeto es None si la línea no es JSON válido
+    """
+    for line_num, raw_line in enumerate(io.BytesIO(data), 1):
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            yield line_num, None
+
+
+# =============================================================================
+# ESCRITURA DE RESULTADOS EN CHUNKS NDJSON
+# =============================================================================
+
+class ResultManifestWriter:
+    """
+    Acumula resultados y los sube en chunks NDJSON de RESULT_CHUNK_SIZE líneas.
+
+    Uso:
+        writer = ResultManifestWriter("layer1_factual")
+        writer.add(analysis, analysis['fragment_id'])
+        manifest = writer.close()
+    """
+
+    def __init__(self, label: str, chunk_size: int = RESULT_CHUNK_SIZE):
+        self.prefix = f"batch-results/{label}/{uuid.uuid4().hex}"
+        self.chunk_size = max(1, chunk_size)
+        self.chunks: List[str] = []
+        self.ids: List[str] = []
+        self._buffer: List[str] = []
+
+    def add(self, result: Any, result_id: Any) -> None:
+        self._buffer.append(json.dumps(result, ensure_ascii=False))
+        self.ids.append(str(result_id))
+        if len(self._buffer) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        blob_name = f"{self.prefix}/part-{len(self.chunks):05d}.ndjson"
+        _get_container().get_blob_client(blob_name).upload_blob(
+            "\n".join(self._buffer) + "\n",
+            overwrite=True,
+            content_settings=ContentSettings(content_type='application/x-ndjson')
+        )
+        self.chunks.append(blob_name)
+        self._buffer = []
+
+    def close(self) -> Dict[str, Any]:
+        """Sube el último chunk y devuelve el manifest."""
+        self._flush()
+        logging.info(f"💾 {len(self.ids)} resultados en {len(self.chunks)} chunks ({self.prefix})")
+        return {
+            "container": PAYLOAD_CONTAINER,
+            "prefix": self.prefix,
+            "chunks": self.chunks,
+            "ids": self.ids,
+            "count": len(self.ids)
+        }
+
+
+# =============================================================================
+# LECTURA DE MANIFESTS
+# =============================================================================
+
+def is_result_manifest(obj: Any) -> bool:
+    return isinstance(obj, dict) and 'chunks' in obj and 'ids' in obj
+
+
+def iter_manifest(manifest: Dict[str, Any]) -> Iterator[Any]:
+    """Recorre los resultados de un manifest chunk a chunk."""
+    if not is_result_manifest(manifest):
+        return
+    container = _get_container()
+    for blob_name in manifest.get('chunks', []):
+        data = container.get_blob_client(blob_name).download_blob().readall()
+        for _, item in iter_jsonl(data):
+            if item is not None:
+                yield item
+
+
+def load_manifest(manifest: Dict[str, Any]) -> List[Any]:
+    """Carga todos los resultados de un manifest en una lista."""
+    return list(iter_manifest(manifest))
+
+
+# =============================================================================
+# BLOBREF: DESHIDRATAR / HIDRATAR
+# =============================================================================
+
+def is_blobref(obj: Any) -> bool:
+    """True si obj es un sobre BlobRef. No hace I/O (seguro en el orquestador)."""
+    return isinstance(obj, dict) and len(obj) == 1 and BLOBREF_KEY in obj
+
+
+def dehydrate(obj: Any, min_bytes: int = PAYLOAD_OFFLOAD_MIN_BYTES) -> Any:
+    """
+    Guarda obj en Blob si su JSON supera min_bytes y devuelve su BlobRef.
+
+    El blob se nombra por el sha256 del contenido: subir dos veces el mismo
+    payload (reintentos, replays) reutiliza el blob existente.
+    """
+    if obj is None or is_blobref(obj):
+        return obj
+
+    data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    if len(data) < min_bytes:
+        return obj
+
+    digest = hashlib.sha256(data).hexdigest()
+    blob_name = f"refs/{digest[:2]}/{digest}.json"
+    blob_client = _get_container().get_blob_client(blob_name)
+    if not blob_client.exists():
+        blob_client.upload_blob(
+            data,
+            overwrite=True,
+            content_settings=ContentSettings(content_type='application/json')
+        )
+
+    return {BLOBREF_KEY: {"container": PAYLOAD_CONTAINER, "blob": blob_name, "bytes": len(data)}}
+
+
+def blobref(container: str, blob_name: str) -> Dict[str, Any]:
+    """
+    BlobRef a un JSON ya existente (p.ej. un artefacto de lya-outputs): el
+    orquestador lo pasa a una activity sin descargarlo. No hace I/O.
+    """
+    return {BLOBREF_KEY: {"container": container, "blob": blob_name}}
+
+
+def load_blobref(ref: Dict[str, Any]) -> Any:
+    """Descarga y decodifica el payload apuntado por un BlobRef."""
+    info = ref[BLOBREF_KEY]
+    container = info.get('container', PAYLOAD_CONTAINER)
+    if container == PAYLOAD_CONTAINER:
+        container_client = _get_container()
+    else:
+        container_client = _get_service().get_container_client(container)
+    data = container_client.get_blob_client(info['blob']).download_blob().readall()
+    return json.loads(data)
+
+
+def hydrate(obj: Any, _loaded: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Sustituye recursivamente los BlobRef de obj por su contenido.
+
+    Solo recorre la estructura que construyó el orquestador; el contenido
+    descargado no se vuelve a recorrer (las activities nunca guardan refs).
+    Un mismo blob referenciado varias veces se descarga una sola vez.
+    """
+    if _loaded is None:
+        _loaded = {}
+
+    if is_blobref(obj):
+        key = (obj[BLOBREF_KEY].get('container', PAYLOAD_CONTAINER), obj[BLOBREF_KEY]['blob'])
+        if key not in _loaded:
+            _loaded[key] = load_blobref(obj)
+        return _loaded[key]
+
+    if isinstance(obj, dict):
+        return {k: hydrate(v, _loaded) for k, v in obj.items()}
+
+    if isinstance(obj, list):
+        return [hydrate(v, _loaded) for v in obj]
+
+    return obj
+
+
+def offload_payloads(fields: Optional[Iterable[str]] = None):
+    """
+    Decorador para el main() de una activity.
+
+    - Hidrata cualquier BlobRef presente en el input.
+    - Deshidrata el output: completo si fields es None, o solo esas claves
+      de primer nivel (lo demás queda legible para el orquestador).
+
+    Uso:
+        @offload_payloads(fields=('fragments',))
+        def main(book_path) -> dict: ...
+    """
+    fields = tuple(fields) if fields is not None else None
+
+    def decorator(func):
+        # El worker de Functions invoca main() con el nombre del binding como
+        # keyword; wraps() conserva la firma original para que lo resuelva.
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            loaded = {}
+            args = tuple(hydrate(a, loaded) for a in args)
+            kwargs = {k: hydrate(v, loaded) for k, v in kwargs.items()}
+            result = func(*args, **kwargs)
+
+            if fields is None:
+                return dehydrate(result)
+
+            if isinstance(result, dict):
+                for field in fields:
+                    if field in result:
+                        result[field] = dehydrate(result[field])
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,105 @@
+# =============================================================================
+# progress_model.py - Progreso Estructurado (LYA 6.0)
+# =============================================================================
+# El orquestador publica su avance como custom_status con esta forma:
+#
+#   {
+#     "v": 1,
+#     "seq": 17,                     # crece con cada actualización
+#     "stage": "edicion",            # etapa del pipeline (PIPELINE_STAGES)
+#     "stage_index": 4, "total_stages": 7,
+#     "label": "Fase 10: Edición inteligente...",
+#     "completed": 12, "total": 40,  # ítems de la etapa (fases, capítulos...)
+#     "percent": 61.4,               # avance global aproximado
+#     "eta_seconds": 380,            # de la etapa, por ritmo observado (o None)
+#     "stage_started_at": iso, "updated_at": iso
+#   }
+#
+# Todo se calcula con context.current_utc_datetime, así que es determinista
+# en los replays. Los endpoints HTTP usan seq para el long-poll (solo
+# responden cuando el valor cambia) y label como texto compatible con el
+# custom_status de siempre.
+# =============================================================================
+
+from typing import Any, Dict, Optional
+
+PROGRESS_SCHEMA_VERSION = 1
+
+# (clave, peso relativo en el tiempo total típico)
+PIPELINE_STAGES = (
+    ('segmentacion', 2),
+    ('analisis', 35),
+    ('aprobacion_biblia', 0),
+    ('editorial', 20),
+    ('edicion', 35),
+    ('reconstruccion', 4),
+    ('guardado', 4),
+)
+_STAGE_KEYS = [key for key, _ in PIPELINE_STAGES]
+_STAGE_WEIGHT_TOTAL = sum(weight for _, weight in PIPELINE_STAGES)
+
+
+class ProgressReporter:
+    """Publica el progreso estructurado del orquestador como custom_status."""
+
+    def __init__(self, context):
+        self.context = context
+        self.seq = 0
+        self.stage = None
+        self.stage_started_at = None
+        self.last = None
+
+    def update(self, stage: str, label: str, completed: Optional[int] = None,
+               total: Optional[int] = None, **extra) -> Dict[str, Any]:
+        now = self.context.current_utc_datetime
+        if stage != self.stage:
+            self.stage, self.stage_started_at = stage, now
+
+        self.seq += 1
+        stage_index = _STAGE_KEYS.index(stage) if stage in _STAGE_KEYS else 0
+        fraction = (completed / total) if completed is not None and total else 0.0
+
+        eta_seconds = None
+        if completed and total and completed < total:
+            elapsed = (now - self.stage_started_at).total_seconds()
+            eta_seconds = int(elapsed / completed * (total - completed))
+
+        done_weight = sum(weight for _, weight in PIPELINE_STAGES[:stage_index])
+        current_weight = PIPELINE_STAGES[stage_index][1]
+        percent = round(100.0 * (done_weight + current_weight * fraction) / _STAGE_WEIGHT_TOTAL, 1)
+
+        self.last = {
+            'v': PROGRESS_SCHEMA_VERSION,
+            'seq': self.seq,
+            'stage': stage,
+            'stage_index': stage_index,
+            'total_stages': len(PIPELINE_STAGES),
+            'label': label,
+            'completed': completed,
+            'total': total,
+            'percent': percent,
+            'eta_seconds': eta_seconds,
+            'stage_started_at': self.stage_started_at.isoformat(),
+            'updated_at': now.isoformat(),
+            **extra
+        }
+        self.context.set_custom_status(self.last)
+        return self.last
+
+
+def is_structured(custom_status: Any) -> bool:
+    return isinstance(custom_status, dict) and 'seq' in custom_status and 'label' in custom_status
+
+
+def progress_label(custom_status: Any) -> str:
+    """Texto del estado, venga estructurado o como string (orquestaciones antiguas)."""
+    if is_structured(custom_status):
+        return custom_status.get('label') or ''
+    return str(custom_status) if custom_status else ''
+
+
+def progress_version(runtime_status: str, custom_status: Any) -> str:
+    """Identificador del estado visible: cambia cuando hay algo nuevo que mostrar."""
+    if is_structured(custom_status):
+        return f"{runtime_status}:{custom_status['seq']}"
+    return f"{runtime_status}:{progress_label(custom_status)}"
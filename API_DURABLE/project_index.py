@@ -0,0 +1,184 @@
+# =============================================================================
+# project_index.py - Índice de Proyectos (LYA 6.0)
+# =============================================================================
+# Un único blob (lya-outputs/_index/projects.json) con una entrada resumida por
+# proyecto. Lo mantienen las escrituras (upload, SaveOutputs, terminate,
+# aprobación de biblia, delete) para que listar el dashboard cueste UNA lectura
+# sin importar cuántos artefactos tenga el container.
+#
+# Concurrencia: read-modify-write con ETag (if_match) y reintentos; dos
+# escrituras simultáneas nunca se pisan. Si el índice no existe se reconstruye
+# una vez recorriendo los metadata.json existentes.
+# =============================================================================
+
+import logging
+import json
+import base64
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+
+try:
+    from azure.storage.blob import ContentSettings
+    from azure.core import MatchConditions
+    from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+    BLOB_AVAILABLE = True
+except ImportError:
+    BLOB_AVAILABLE = False
+
+INDEX_CONTAINER = "lya-outputs"
+INDEX_BLOB = "_index/projects.json"
+INDEX_MAX_RETRIES = 8
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SORT_FIELDS = ('createdAt', 'updatedAt', 'name', 'status')
+
+
+def entry_from_metadata(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Resumen de un metadata.json tal como lo ve el dashboard."""
+    return {
+        'id': meta.get('job_id'),
+        'name': meta.get('project_name') or meta.get('book_name'),
+        'status': meta.get('status'),
+        'createdAt': meta.get('created_at', ''),
+        'updatedAt': datetime.utcnow().isoformat() + 'Z'
+    }
+
+
+def _rebuild(service) -> Dict[str, Any]:
+    """Reconstruye el índice leyendo el metadata.json de cada proyecto."""
+    container = service.get_container_client(INDEX_CONTAINER)
+    projects = {}
+    for prefix in container.walk_blobs(delimiter='/'):
+        job_id = prefix.name.rstrip('/')
+        if not hasattr(prefix, 'prefix') or job_id.startswith('_'):
+            continue
+        try:
+            meta = json.loads(container.get_blob_client(f"{job_id}/metadata.json").download_blob().readall())
+            meta.setdefault('job_id', job_id)
+            projects[job_id] = entry_from_metadata(meta)
+        except ResourceNotFoundError:
+            continue
+        except Exception as e:
+            logging.warning(f"⚠️ Índice: metadata ilegible en {job_id}: {e}")
+    logging.info(f"🗂️ Índice de proyectos reconstruido: {len(projects)} proyectos")
+    return {'projects': projects}
+
+
+def _load(service):
+    """Retorna (index, etag); etag None si el índice todavía no existe."""
+    blob = service.get_blob_client(INDEX_CONTAINER, INDEX_BLOB)
+    try:
+        downloader = blob.download_blob()
+        return json.loads(downloader.readall()), downloader.properties.etag
+    except ResourceNotFoundError:
+        return _rebuild(service), None
+
+
+def _save(service, index: Dict[str, Any], etag: Optional[str]):
+    """Escribe el índice; falla si otro proceso lo modificó desde la lectura."""
+    blob = service.get_blob_client(INDEX_CONTAINER, INDEX_BLOB)
+    body = json.dumps(index, ensure_ascii=False)
+    settings = ContentSettings(content_type='application/json')
+    if etag:
+        blob.upload_blob(body, overwrite=True, etag=etag,
+                         match_condition=MatchConditions.IfNotModified, content_settings=settings)
+    else:
+        # Índice nuevo: falla si otro proceso lo creó primero
+        blob.upload_blob(body, overwrite=False, content_settings=settings)
+
+
+def update_index(service, mutate: Callable[[Dict[str, Dict]], None]) -> bool:
+    """
+    Aplica mutate(projects) al índice con concurrencia optimista.
+    Nunca lanza: un índice desactualizado se corrige en la próxima escritura.
+    """
+    if not BLOB_AVAILABLE:
+        return False
+
+    for attempt in range(INDEX_MAX_RETRIES):
+        try:
+            index, etag = _load(service)
+            mutate(index.setdefault('projects', {}))
+            _save(service, index, etag)
+            return True
+        except (ResourceModifiedError, ResourceExistsError):
+            continue
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo actualizar el índice de proyectos: {e}")
+            return False
+
+    logging.warning(f"⚠️ Índice de proyectos: {INDEX_MAX_RETRIES} conflictos seguidos, se omite la actualización")
+    return False
+
+
+def upsert_project(service, meta: Dict[str, Any]) -> bool:
+    """Inserta o actualiza la entrada de un proyecto desde su metadata."""
+    entry = entry_from_metadata(meta)
+    if not entry['id']:
+        return False
+
+    def mutate(projects):
+        previous = projects.get(entry['id'], {})
+        # Un metadata parcial no borra campos conocidos (p.ej. createdAt)
+        projects[entry['id']] = {**previous, **{k: v for k, v in entry.items() if v}}
+
+    return update_index(service, mutate)
+
+
+def remove_project(service, job_id: str) -> bool:
+    return update_index(service, lambda projects: projects.pop(job_id, None))
+
+
+def _decode_cursor(cursor: Optional[str]) -> int:
+    try:
+        return max(0, int(base64.urlsafe_b64decode(cursor.encode()).decode()))
+    except Exception:
+        return 0
+
+
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def query_projects(service, status: Optional[str] = None, search: Optional[str] = None,
+                   sort: str = 'createdAt', order: str = 'desc',
+                   cursor: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Página de proyectos filtrada y ordenada (una sola lectura del índice).
+
+    Returns:
+        {"projects": [...], "total": int, "next_cursor": str | None}
+    """
+    index, etag = _load(service)
+    if etag is None:
+        # Primer uso: persistir lo reconstruido para no volver a recorrer
+        try:
+            _save(service, index, None)
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo guardar el índice reconstruido: {e}")
+
+    projects: List[Dict] = list(index.get('projects', {}).values())
+
+    if status:
+        wanted = {s.strip() for s in status.split(',') if s.strip()}
+        projects = [p for p in projects if p.get('status') in wanted]
+    if search:
+        needle = search.lower()
+        projects = [p for p in projects if needle in (p.get('name') or '').lower() or needle in (p.get('id') or '').lower()]
+
+    sort = sort if sort in SORT_FIELDS else 'createdAt'
+    projects.sort(key=lambda p: (p.get(sort) or '').lower(), reverse=(order != 'asc'))
+
+    limit = min(max(1, limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    offset = _decode_cursor(cursor) if cursor else 0
+    page = projects[offset:offset + limit]
+    next_offset = offset + len(page)
+
+    return {
+        'projects': page,
+        'total': len(projects),
+        'next_cursor': _encode_cursor(next_offset) if next_offset < len(projects) else None
+    }
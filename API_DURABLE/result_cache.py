@@ -0,0 +1,129 @@
+# =============================================================================
+# result_cache.py - Cache de Resultados Direccionado por Contenido (LYA 6.0)
+# =============================================================================
+# Guarda en Blob Storage el resultado de cada request de batch, indexado por
+# hash(contenido del prompt) + versión de plantilla + modelo.
+# En re-subidas de un manuscrito (revisiones) solo los fragmentos/capítulos que
+# cambiaron generan requests nuevos; el resto se recupera del cache.
+# =============================================================================
+
+import logging
+import json
+import os
+import hashlib
+from typing import Optional, Any
+
+logging.basicConfig(level=logging.INFO)
+
+try:
+    from config_models import ENABLE_RESULT_CACHE, RESULT_CACHE_CONTAINER, get_prompt_version
+except ImportError:
+    ENABLE_RESULT_CACHE = True
+    RESULT_CACHE_CONTAINER = "lya-cache"
+
+    def get_prompt_version(prompt_name: str) -> str:
+        return "v1"
+
+try:
+    from azure.storage.blob import BlobServiceClient, ContentSettings
+    BLOB_AVAILABLE = True
+except ImportError:
+    BLOB_AVAILABLE = False
+
+# Cliente compartido por proceso (se reutiliza entre invocaciones de activities)
+_container_client = None
+
+
+def _get_container():
+    """Devuelve el container del cache, creándolo la primera vez."""
+    global _container_client
+
+    if _container_client is not None:
+        return _container_client
+
+    if not BLOB_AVAILABLE:
+        return None
+
+    connect_str = os.environ.get('AzureWebJobsStorage')
+    if not connect_str:
+        return None
+
+    service = BlobServiceClient.from_connection_string(connect_str)
+    try:
+        service.create_container(RESULT_CACHE_CONTAINER)
+    except Exception:
+        pass
+
+    _container_client = service.get_container_client(RESULT_CACHE_CONTAINER)
+    return _container_client
+
+
+def build_cache_key(prompt_name: str, content: str, model_id: str) -> str:
+    """
+    Construye la clave del cache.
+
+    Args:
+        prompt_name: Nombre lógico del prompt (clave en PROMPT_VERSIONS)
+        content: Texto completo enviado al modelo (prompt renderizado)
+        model_id: Modelo que procesa el request
+
+    Returns:
+        Ruta del blob: "{prompt_name}/{version}/{sha256}"
+    """
+    version = get_prompt_version(prompt_name)
+    digest = hashlib.sha256()
+    digest.update(model_id.encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(content.encode('utf-8'))
+    return f"{prompt_name}/{version}/{digest.hexdigest()}"
+
+
+def has_cached_result(cache_key: str) -> bool:
+    """Comprueba si existe un resultado (HEAD, sin descargar el contenido)."""
+    if not ENABLE_RESULT_CACHE or not cache_key:
+        return False
+
+    try:
+        container = _get_container()
+        if container is None:
+            return False
+        return container.get_blob_client(f"{cache_key}.json").exists()
+    except Exception:
+        return False
+
+
+def get_cached_result(cache_key: str) -> Optional[Any]:
+    """Lee un resultado del cache. Devuelve None si no existe o falla."""
+    if not ENABLE_RESULT_CACHE or not cache_key:
+        return None
+
+    try:
+        container = _get_container()
+        if container is None:
+            return None
+        data = container.get_blob_client(f"{cache_key}.json").download_blob().readall()
+        return json.loads(data)
+    except Exception:
+        # ResourceNotFound es el caso normal (miss)
+        return None
+
+
+def put_cached_result(cache_key: str, result: Any) -> bool:
+    """Guarda un resultado en el cache. Los fallos no son críticos."""
+    if not ENABLE_RESULT_CACHE or not cache_key or result is None:
+        return False
+
+    try:
+        container = _get_container()
+        if container is None:
+            return False
+        container.get_blob_client(f"{cache_key}.json").upload_blob(
+            json.dumps(result, ensure_ascii=False),
+            overwrite=True,
+            content_settings=ContentSettings(content_type='application/json')
+        )
+        return True
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudo escribir en cache ({cache_key}): {e}")
+        return False
+
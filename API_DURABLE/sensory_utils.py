@@ -0,0 +1,121 @@
+# =============================================================================
+# sensory_utils.py - Prompt y Parseo del Análisis Sensorial (LYA 6.0)
+# =============================================================================
+# Compartido por SensoryDetectionAnalysis (modo online asíncrono) y por
+# SubmitGeminiProBatch / PollGeminiProBatchResult (modo batch, analysis_type
+# "sensory") para que ambos modos produzcan exactamente el mismo análisis.
+# =============================================================================
+
+import json
+import logging
+from typing import Any, Dict
+
+# Configuración del modelo "Sensor"
+# Usamos Flash 2.5 para máxima velocidad y bajo costo en tareas de clasificación.
+SENSORY_MODEL_ID = "models/gemini-2.5-flash"
+
+# Caracteres del capítulo enviados al modelo
+SENSORY_MAX_CHARS = 50000
+
+# Por debajo de esto no se llama al modelo
+SENSORY_MIN_CHARS = 200
+
+SENSORY_ANALYSIS_PROMPT = """
+Eres un ANALISTA SENSORIAL experto en escritura creativa.
+Tu tarea es analizar el siguiente texto (Capítulo de una novela) para diagnosticar el balance "Show vs Tell" (Mostrar vs Contar).
+
+ANALIZA EL TEXTO BUSCANDO:
+1. **Inmersión Sensorial (Show):** Descripciones que estimulan los 5 sentidos (vista, oído, tacto, olfato, gusto) y acciones físicas concretas.
+2. **Abstracción (Tell):** Explicaciones de emociones ("sintió miedo"), resúmenes de hechos, metáforas clichés o verbos de filtrado ("vio", "oyó", "supo").
+
+RESPONDE ÚNICAMENTE CON ESTE JSON:
+{{
+  "showing_ratio": 0.00, // (0.0 a 1.0) Porcentaje del texto que es inmersivo/sensorial
+  "avg_sensory_density": 0.00, // (0.0 a 1.0) Intensidad promedio de los detalles
+  "dominant_sense": "VISUAL|AUDITIVO|TACTIL|OLFATIVO|GUSTATIVO|KINESTESICO|NINGUNO",
+
+  "problem_paragraphs": [
+    // Lista de hasta 5 párrafos más problemáticos (puro Telling aburrido)
+    {{
+      "text_preview": "Primeras 15 palabras...",
+      "issue": "Explicación abstracta de emociones / Falta de anclaje físico",
+      "suggestion": "Describir la reacción física en lugar de nombrar la emoción"
+    }}
+  ],
+
+  "diagnosis_global": "Breve diagnóstico de 1 frase sobre la inmersión del capítulo."
+}}
+
+--- TEXTO DEL CAPÍTULO ---
+{chapter_content}
+"""
+
+
+def build_sensory_prompt(chapter_content: str) -> str:
+    """Prompt del capítulo, o '' si es demasiado corto para analizarlo."""
+    if len(chapter_content or '') < SENSORY_MIN_CHARS:
+        return ""
+    return SENSORY_ANALYSIS_PROMPT.format(chapter_content=chapter_content[:SENSORY_MAX_CHARS])
+
+
+def short_chapter_analysis(chapter_id: Any) -> Dict[str, Any]:
+    """Resultado neutro para capítulos que no se envían al modelo."""
+    return {
+        "chapter_id": chapter_id,
+        "showing_ratio": 0.5,
+        "avg_sensory_density": 0.5,
+        "dominant_sense": "NEUTRO",
+        "diagnosis": "Texto demasiado corto.",
+        "problem_paragraphs": []
+    }
+
+
+def failed_analysis(chapter_id: Any, diagnosis: str) -> Dict[str, Any]:
+    """Resultado de un capítulo cuyo análisis falló (ratio 0)."""
+    return {
+        "chapter_id": chapter_id,
+        "showing_ratio": 0.0,
+        "avg_sensory_density": 0.0,
+        "diagnosis": diagnosis,
+        "problem_paragraphs": []
+    }
+
+
+def parse_sensory_response(raw_text: str, chapter_id: Any) -> Dict[str, Any]:
+    """
+    Parsea la respuesta del modelo.
+    INCLUYE LIMPIEZA DE JSON "ANTI-CREATIVIDAD".
+
+    Raises:
+        ValueError / json.JSONDecodeError si no hay JSON utilizable
+    """
+    if not raw_text:
+        raise ValueError(f"Respuesta vacía de {SENSORY_MODEL_ID}")
+
+    raw_text = raw_text.strip()
+
+    # --- BLOQUE DE LIMPIEZA QUIRÚRGICA ---
+    # 1. Eliminar bloques de código markdown si existen
+    if "```" in raw_text:
+        # Eliminar ```json y ``` al final
+        raw_text = raw_text.replace("```json", "").replace("```", "").strip()
+
+    # 2. Búsqueda de llaves (Safety Net)
+    # Si Gemini dice "Claro, aquí está: { ... }", esto extrae solo lo que está entre { }
+    first_brace = raw_text.find("{")
+    last_brace = raw_text.rfind("}")
+
+    if first_brace != -1 and last_brace != -1:
+        json_str = raw_text[first_brace : last_brace + 1]
+    else:
+        # Si no encuentra llaves, probablemente falló la generación
+        logging.warning(f"⚠️ No se encontró JSON válido en respuesta de Cap {chapter_id}")
+        # Intentar parsear lo que haya por si acaso
+        json_str = raw_text
+
+    # 3. Parseo
+    data = json.loads(json_str)
+    # -------------------------------------
+
+    data['chapter_id'] = chapter_id
+    return data
@@ -0,0 +1,58 @@
+# =============================================================================
+# tests/conftest.py - Fixtures compartidas
+# =============================================================================
+# Los módulos compartidos se importan como en las activities (directorio
+# API_DURABLE en sys.path). Blob Storage se sustituye por un container en
+# memoria para probar payload_store sin Azure.
+# =============================================================================
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Download:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def readall(self) -> bytes:
+        return self.data
+
+
+class _MemoryBlob:
+    def __init__(self, store: dict, name: str):
+        self.store = store
+        self.name = name
+
+    def exists(self) -> bool:
+        return self.name in self.store
+
+    def upload_blob(self, data, overwrite=False, content_settings=None):
+        self.store[self.name] = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+
+    def download_blob(self) -> _Download:
+        return _Download(self.store[self.name])
+
+
+class MemoryContainer:
+    """Lo justo de ContainerClient que usa payload_store."""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def get_blob_client(self, name: str) -> _MemoryBlob:
+        return _MemoryBlob(self.blobs, name)
+
+
+@pytest.fixture
+def memory_container(monkeypatch):
+    import payload_store
+
+    container = MemoryContainer()
+    monkeypatch.setattr(payload_store, '_get_container', lambda: container)
+    # Sin azure-storage-blob instalado ContentSettings no existe
+    monkeypatch.setattr(payload_store, 'ContentSettings', lambda **kwargs: None, raising=False)
+    return container
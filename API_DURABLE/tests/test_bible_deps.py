@@ -0,0 +1,85 @@
+import copy
+
+from bible_deps import bible_hash, chapter_number, diff_bible, recompute_summary
+
+BIBLE = {
+    'identidad_obra': {'titulo': 'Libro', 'genero': 'Thriller', 'tono_predominante': 'oscuro', 'tema_central': 'culpa'},
+    'voz_del_autor': {'estilo_detectado': 'seco', 'NO_CORREGIR': ['frases cortas', 'presente', 'jerga', 'cursivas']},
+    'reparto_completo': {
+        'protagonistas': [{'nombre': 'Ana', 'capitulos_clave': [1, 2]}],
+        'secundarios': [{'nombre': 'Luis', 'capitulos_clave': [3]}],
+    },
+    'arco_narrativo': {'arcos_principales': ['caída'], 'puntos_clave': {'climax': {'capitulo': 3}}},
+    'mapa_de_ritmo': {'capitulos': [{'numero': 2, 'ritmo': 'lento'}]},
+}
+CHAPTERS = ['1', '2', '3']
+
+
+def edited(change):
+    bible = copy.deepcopy(BIBLE)
+    change(bible)
+    return bible
+
+
+def test_bible_hash_ignores_key_order():
+    assert bible_hash({'a': 1, 'b': 2}) == bible_hash({'b': 2, 'a': 1})
+    assert bible_hash(None) == bible_hash({})
+
+
+def test_chapter_number_non_numeric_is_zero():
+    assert chapter_number('7') == 7
+    assert chapter_number('prologo') == 0
+    assert chapter_number(None) == 0
+
+
+def test_unchanged_bible_recomputes_nothing():
+    diff = diff_bible(BIBLE, copy.deepcopy(BIBLE), CHAPTERS)
+    assert not diff['changed']
+    assert diff['margin_notes_chapters'] == diff['edit_chapters'] == []
+    assert not diff['arc_maps_stale'] and not diff['letter_stale']
+    assert recompute_summary(diff) == "Biblia sin cambios"
+
+
+def test_character_edit_affects_only_its_chapters():
+    diff = diff_bible(BIBLE, edited(lambda b: b['reparto_completo']['secundarios'][0].update(nombre='Luisa')), CHAPTERS)
+    assert diff['characters'] == ['Luis', 'Luisa']
+    assert diff['margin_notes_chapters'] == ['3']
+    assert diff['edit_chapters'] == ['3']
+    assert diff['sections'] == ['reparto_completo']
+    assert diff['letter_stale'] and not diff['arc_maps_stale']
+
+
+def test_rhythm_edit_reedits_without_new_notes():
+    diff = diff_bible(BIBLE, edited(lambda b: b['mapa_de_ritmo']['capitulos'][0].update(ritmo='rápido')), CHAPTERS)
+    assert diff['margin_notes_chapters'] == []
+    assert diff['edit_chapters'] == ['2']
+
+
+def test_rule_beyond_margin_notes_window_only_reedits():
+    # Las notas de margen solo ven NO_CORREGIR[:3]; la edición ve todas
+    diff = diff_bible(BIBLE, edited(lambda b: b['voz_del_autor']['NO_CORREGIR'].append('diálogos sin rayas')), CHAPTERS)
+    assert diff['no_corregir'] == {'added': ['diálogos sin rayas'], 'removed': []}
+    assert diff['margin_notes_chapters'] == []
+    assert diff['edit_chapters'] == CHAPTERS
+
+
+def test_global_style_edit_affects_every_chapter():
+    diff = diff_bible(BIBLE, edited(lambda b: b['voz_del_autor'].update(estilo_detectado='lírico')), CHAPTERS)
+    assert diff['margin_notes_chapters'] == CHAPTERS
+    assert diff['edit_chapters'] == CHAPTERS
+
+
+def test_character_without_key_chapters_applies_everywhere():
+    diff = diff_bible(
+        BIBLE,
+        edited(lambda b: b['reparto_completo']['secundarios'].append({'nombre': 'Narrador'})),
+        CHAPTERS
+    )
+    assert diff['margin_notes_chapters'] == CHAPTERS
+
+
+def test_arc_edit_marks_arc_maps_stale():
+    diff = diff_bible(BIBLE, edited(lambda b: b['arco_narrativo']['arcos_principales'].append('redención')), CHAPTERS)
+    assert diff['arc_maps_stale']
+    assert diff['edit_chapters'] == []
+    assert '0 capítulos a reeditar' in recompute_summary(diff)
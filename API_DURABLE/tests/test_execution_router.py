@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+from tenacity import wait_none
+
+import execution_router
+from execution_router import TokenBucket, choose_execution, estimate_tokens, is_online, online_results_jsonl
+
+CONFIG = {
+    'max_requests': 20,
+    'max_input_tokens': 10_000,
+    'max_concurrency': 4,
+    'requests_per_minute': 120,
+    'seconds_per_request': 30,
+    'max_seconds': 300,
+    'default_batch_seconds': 600,
+}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(execution_router, 'ENABLE_HYBRID_EXECUTION', True)
+    monkeypatch.setattr(execution_router, 'get_online_execution_config', lambda kind: dict(CONFIG))
+    monkeypatch.setattr(execution_router, 'get_history_blob', lambda: None)
+    return execution_router
+
+
+def requests(n, chars=100):
+    return [{'key': f'k{i}', 'text': 'x' * chars} for i in range(n)]
+
+
+def with_history(monkeypatch, samples):
+    monkeypatch.setattr(execution_router, 'get_history_blob', lambda: object())
+    monkeypatch.setattr(execution_router, 'load_history', lambda blob: {'gemini_flash': samples})
+
+
+def test_estimate_tokens_uses_model_ratio(monkeypatch):
+    monkeypatch.setattr(execution_router, 'CHARS_PER_TOKEN', {'modelo': 2.0})
+    payload = [{'t': 'x' * 100}]
+    assert estimate_tokens(payload, 'modelo') == 2 * estimate_tokens(payload, 'otro')
+
+
+def test_small_submission_goes_online(router):
+    decision = choose_execution('gemini_flash', requests(8))
+    assert decision['mode'] == 'online'
+    # 8 requests / 4 concurrentes = 2 oleadas de 30s
+    assert decision['online_seconds'] == 60
+    assert decision['batch_seconds'] == 600
+
+
+def test_too_many_requests_go_batch(router):
+    decision = choose_execution('gemini_flash', requests(21))
+    assert decision['mode'] == 'batch'
+    assert '21 requests' in decision['reason']
+
+
+def test_too_many_tokens_go_batch(router):
+    assert choose_execution('gemini_flash', requests(2, chars=40_000))['mode'] == 'batch'
+
+
+def test_online_estimate_over_activity_cap_goes_batch(router, monkeypatch):
+    monkeypatch.setattr(router, 'get_online_execution_config', lambda kind: {**CONFIG, 'max_concurrency': 1})
+    decision = choose_execution('gemini_flash', requests(11))
+    assert decision['mode'] == 'batch'
+    assert 'tope' in decision['reason']
+
+
+def test_requests_per_minute_bounds_the_estimate(router, monkeypatch):
+    monkeypatch.setattr(router, 'get_online_execution_config', lambda kind: {**CONFIG, 'requests_per_minute': 6})
+    # 12 requests a 6/min = 120s aunque las oleadas sumen 90s
+    assert choose_execution('gemini_flash', requests(12))['online_seconds'] == 120
+
+
+def test_fast_observed_batches_keep_batch(router, monkeypatch):
+    with_history(monkeypatch, [20.0, 25.0, 30.0])
+    decision = choose_execution('gemini_flash', requests(8))
+    assert decision['mode'] == 'batch'
+    assert decision['batch_seconds'] == 25.0
+
+
+def test_few_samples_fall_back_to_default_latency(router, monkeypatch):
+    with_history(monkeypatch, [20.0])
+    assert choose_execution('gemini_flash', requests(8))['batch_seconds'] == 600
+
+
+def test_disabled_or_empty_always_batch(router, monkeypatch):
+    assert choose_execution('gemini_flash', [])['mode'] == 'batch'
+    monkeypatch.setattr(router, 'ENABLE_HYBRID_EXECUTION', False)
+    assert choose_execution('gemini_flash', requests(1))['mode'] == 'batch'
+
+
+def test_online_results_round_trip_as_jsonl():
+    batch_info = {'status': 'online', 'online_results': [{'key': 'a', 'response': {}}, {'key': 'b', 'error': 'x'}]}
+    assert is_online(batch_info) and not is_online({'status': 'cached'})
+    assert online_results_jsonl(batch_info).decode('utf-8').splitlines() == [
+        '{"key": "a", "response": {}}', '{"key": "b", "error": "x"}'
+    ]
+
+
+def test_token_bucket_allows_burst_then_throttles():
+    async def run():
+        bucket = TokenBucket(requests_per_minute=600, capacity=2)  # 10/s
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_run_bounded_limits_concurrency_and_reports_errors(router, monkeypatch):
+    monkeypatch.setattr(router, 'get_online_execution_config',
+                        lambda kind: {**CONFIG, 'max_concurrency': 2, 'requests_per_minute': 60_000})
+    monkeypatch.setattr(router, '_call_with_retry', router._call_with_retry.retry_with(wait=wait_none()))
+    active = {'now': 0, 'max': 0}
+
+    async def call(item):
+        active['now'] += 1
+        active['max'] = max(active['max'], active['now'])
+        await asyncio.sleep(0.01)
+        active['now'] -= 1
+        if item == 3:
+            raise RuntimeError('fallo')
+        return item * 10
+
+    results = asyncio.run(router._run_bounded('gemini_flash', [1, 2, 3, 4], call, lambda item, e: {'item': item, 'error': str(e)}))
+
+    assert results == [10, 20, {'item': 3, 'error': 'fallo'}, 40]
+    assert active['max'] <= 2
@@ -0,0 +1,100 @@
+import json
+
+import payload_store
+from payload_store import (
+    BLOBREF_KEY, ResultManifestWriter, dehydrate, hydrate, is_blobref,
+    iter_jsonl, load_manifest, offload_payloads
+)
+
+
+def big_payload(n=200):
+    return [{'chapter_id': i, 'content': 'palabra ' * 50} for i in range(n)]
+
+
+def test_dehydrate_keeps_small_payloads_inline(memory_container):
+    payload = {'chapter_id': 1}
+    assert dehydrate(payload) is payload
+    assert memory_container.blobs == {}
+
+
+def test_dehydrate_hydrate_round_trip(memory_container):
+    payload = big_payload()
+    ref = dehydrate(payload)
+    assert is_blobref(ref)
+    assert ref[BLOBREF_KEY]['bytes'] == len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    assert hydrate(ref) == payload
+
+
+def test_dehydrate_is_content_addressed(memory_container):
+    assert dehydrate(big_payload()) == dehydrate(big_payload())
+    assert len(memory_container.blobs) == 1
+
+
+def test_hydrate_resolves_nested_refs_once(memory_container, monkeypatch):
+    ref = dehydrate(big_payload())
+    loads = []
+    original = payload_store.load_blobref
+    monkeypatch.setattr(payload_store, 'load_blobref', lambda r: loads.append(r) or original(r))
+
+    hydrated = hydrate({'a': ref, 'b': [ref, {'c': 1}]})
+
+    assert hydrated['a'] == hydrated['b'][0] == big_payload()
+    assert hydrated['b'][1] == {'c': 1}
+    assert len(loads) == 1
+
+
+def test_offload_payloads_hydrates_input_and_dehydrates_fields(memory_container):
+    @offload_payloads(fields=('chapters',))
+    def activity(payload):
+        return {'chapters': payload['chapters'], 'count': len(payload['chapters'])}
+
+    result = activity({'chapters': dehydrate(big_payload())})
+
+    assert result['count'] == 200
+    assert is_blobref(result['chapters'])
+    assert hydrate(result['chapters']) == big_payload()
+
+
+def test_offload_payloads_keeps_keyword_binding(memory_container):
+    @offload_payloads()
+    def main(input_data):
+        return input_data
+
+    assert main(input_data=dehydrate(big_payload())) == dehydrate(big_payload())
+
+
+def test_offloaded_activity_output_reflects_in_place_changes(memory_container):
+    # Regresión: mutar la copia hidratada dentro de un helper decorado no
+    # llegaba al resultado de la activity.
+    from ConsolidateFragmentAnalyses import main as consolidate
+
+    fragments = [
+        {'id': 1, 'parent_chapter_id': 1, 'fragment_index': 1, 'content': 'segunda parte'},
+        {'id': 2, 'parent_chapter_id': 1, 'fragment_index': 0, 'content': 'primera parte'},
+    ]
+    analyses = [{'fragment_id': 1, 'parent_chapter_id': 1}, {'fragment_id': 2, 'parent_chapter_id': 1}]
+
+    consolidated = hydrate(consolidate({
+        'fragment_analyses': analyses,
+        'fragments': dehydrate(fragments, min_bytes=0),
+        'chapter_map': {}
+    }))
+
+    assert [c['content'] for c in consolidated] == ['primera parte\n\nsegunda parte']
+
+
+def test_iter_jsonl_reports_invalid_lines():
+    data = b'{"a": 1}\n\nno es json\n{"b": 2}\n'
+    assert list(iter_jsonl(data)) == [(1, {'a': 1}), (3, None), (4, {'b': 2})]
+
+
+def test_result_manifest_writer_chunks(memory_container):
+    writer = ResultManifestWriter('test', chunk_size=2)
+    for i in range(5):
+        writer.add({'chapter_id': i}, i)
+    manifest = writer.close()
+
+    assert manifest['count'] == 5
+    assert len(manifest['chunks']) == 3
+    assert manifest['ids'] == ['0', '1', '2', '3', '4']
+    assert load_manifest(manifest) == [{'chapter_id': i} for i in range(5)]
@@ -0,0 +1,112 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SegmentBook'))
+
+from segmenter import (  # noqa: E402
+    ChapterDetector, TokenBudget, detect_chapters, line_spans, pack_fragments,
+    paragraph_spans, split_long_span, trim_span
+)
+
+
+def budget(max_chars):
+    return TokenBudget({'modelo': {'max_tokens': max_chars, 'chars_per_token': 1.0}})
+
+
+def test_budget_uses_strictest_model():
+    b = TokenBudget({
+        'flash': {'max_tokens': 1000, 'chars_per_token': 4.0},
+        'claude': {'max_tokens': 500, 'chars_per_token': 3.5},
+    })
+    assert b.max_chars == 1750
+    assert b.fits(1750) and not b.fits(1751)
+    assert b.estimate_tokens(700) == {'flash': 175, 'claude': 200}
+
+
+def test_trim_span_skips_whitespace():
+    text = "  \n hola \n"
+    start, end = trim_span(text, 0, len(text))
+    assert text[start:end] == "hola"
+
+
+def test_detect_chapters_offsets_exclude_titles():
+    text = "Prólogo\nAntes.\n\nCapítulo 1\nUno.\n\nCapítulo 2: Final\nDos.\n"
+    chapters = detect_chapters(text)
+    assert [c['title'] for c in chapters] == ['Prólogo', 'Capítulo 1', 'Capítulo 2: Final']
+    assert [text[c['start']:c['end']] for c in chapters] == ['Antes.', 'Uno.', 'Dos.']
+
+
+def test_detect_chapters_keeps_text_before_first_header():
+    text = "Mi libro\nDedicatoria.\nCapítulo 1\nUno."
+    assert [c['title'] for c in detect_chapters(text)] == ['Mi libro', 'Capítulo 1']
+
+
+def test_incremental_detector_matches_full_text():
+    pieces = ["Capítulo 1\nUno.\n", "Más del uno.\n", "Capítulo 2\nDos.\n"]
+    detector = ChapterDetector()
+    for piece in pieces:
+        detector.feed(piece)
+    text, chapters = detector.finish()
+    assert text == ''.join(pieces)
+    assert chapters == detect_chapters(text)
+
+
+def test_paragraph_spans_skip_blank_lines():
+    text = "uno\n\n  dos  \n \n\ntres"
+    assert [text[s:e] for s, e in paragraph_spans(text, 0, len(text))] == ['uno', 'dos', 'tres']
+
+
+def test_paragraph_spans_keep_wrapped_lines_together():
+    text = "línea uno\nlínea dos\n\notro párrafo"
+    assert [text[s:e] for s, e in paragraph_spans(text, 0, len(text))] == ['línea uno\nlínea dos', 'otro párrafo']
+    assert [text[s:e] for s, e in line_spans(text, 0, len(text))] == ['línea uno', 'línea dos', 'otro párrafo']
+
+
+def test_split_long_span_cuts_at_sentence_end():
+    text = "Primera frase. Segunda frase. Tercera."
+    spans = list(split_long_span(text, 0, len(text), 20))
+    assert [text[s:e] for s, e in spans] == ['Primera frase.', 'Segunda frase.', 'Tercera.']
+    assert all(e - s <= 20 for s, e in spans)
+
+
+def test_split_long_span_hard_cut_without_sentence_end():
+    text = "a" * 25
+    assert list(split_long_span(text, 0, 25, 10)) == [(0, 10), (10, 20), (20, 25)]
+
+
+def test_pack_fragments_whole_chapter_when_it_fits():
+    text = "uno\ndos\ntres"
+    assert pack_fragments(text, 0, len(text), budget(100)) == [(0, len(text))]
+
+
+def test_pack_fragments_groups_paragraphs_within_budget():
+    paragraphs = ["a" * 8, "b" * 8, "c" * 8, "d" * 8]
+    text = "\n".join(paragraphs)
+    fragments = pack_fragments(text, 0, len(text), budget(20))
+    assert [text[s:e] for s, e in fragments] == ["a" * 8 + "\n" + "b" * 8, "c" * 8 + "\n" + "d" * 8]
+
+
+def test_pack_fragments_splits_only_oversized_paragraph():
+    text = "corto\n" + "Frase larga uno. Frase larga dos." + "\nfinal"
+    fragments = pack_fragments(text, 0, len(text), budget(20))
+    assert [text[s:e] for s, e in fragments] == ['corto', 'Frase larga uno.', 'Frase larga dos.', 'final']
+    assert all(e - s <= 20 for s, e in fragments)
+
+
+def test_pack_fragments_cuts_between_paragraphs_of_hard_wrapped_text():
+    # PDF: una línea por línea visual, párrafos separados por línea en blanco
+    first = "aaaa aaaa\naaaa aaaa"
+    second = "bbbb bbbb\nbbbb bbbb"
+    text = first + "\n\n" + second
+    fragments = pack_fragments(text, 0, len(text), budget(30))
+    assert [text[s:e] for s, e in fragments] == [first, second]
+
+
+def test_pack_fragments_falls_back_to_lines_for_oversized_paragraph():
+    paragraph = "\n".join(["cccc cccc"] * 4)
+    text = "corto\n\n" + paragraph
+    fragments = pack_fragments(text, 0, len(text), budget(20))
+    assert [text[s:e] for s, e in fragments] == [
+        'corto\n\ncccc cccc', 'cccc cccc\ncccc cccc', 'cccc cccc'
+    ]
+    assert all(e - s <= 20 for s, e in fragments)
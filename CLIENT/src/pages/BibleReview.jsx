@@ -62,7 +62,9 @@ export default function BibleReview() {
       // 1. Guardar últimos cambios
       await bibleAPI.save(projectId, bible);
       // 2. Aprobar y despertar orquestador
-      await bibleAPI.approve(projectId);
+      const result = await bibleAPI.approve(projectId);
+      // Proyecto ya terminado: el servidor indica qué capítulos se recalculan
+      if (result?.diff) alert(result.message);
       
       // 3. Redirigir al status
       navigate(`/proyecto/${projectId}/status`);
@@ -5,7 +5,6 @@
 import { useState, useEffect, useMemo } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import { manuscriptAPI, editorialAPI } from '../services/api';
-import { Document, Packer, Paragraph, TextRun, HeadingLevel, AlignmentType } from 'docx';
 import { saveAs } from 'file-saver';
 import { 
   FileText, Download, ArrowLeft, Loader2, 
@@ -18,7 +17,10 @@ export default function Editor() {
   
   // --- ESTADOS ---
   const [chapters, setChapters] = useState([]);
-  const [changes, setChanges] = useState([]);
+  const [changes, setChanges] = useState([]); // Solo los cambios de capítulos ya abiertos
+  const [loadedChapterIds, setLoadedChapterIds] = useState({}); // { chapter_id: true } ya descargados
+  const [indexTotals, setIndexTotals] = useState(null); // Contadores globales del índice
+  const [unsavedIds, setUnsavedIds] = useState({}); // { change_id: true } decisiones sin confirmar
   const [marginNotes, setMarginNotes] = useState({}); // Nuevo: Mapa de notas por capítulo
   const [summary, setSummary] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -37,29 +39,28 @@ export default function Editor() {
   async function loadData() {
     try {
       setLoading(true);
-      const [summaryData, changesData, chaptersData, notesData] = await Promise.all([
+      // Índice de capítulos (sin texto); los cambios se piden por capítulo al abrirlo
+      const [summaryData, indexData, notesData] = await Promise.all([
         manuscriptAPI.getSummary(projectId).catch(() => null),
-        manuscriptAPI.getChanges(projectId).catch(() => ({ changes: [] })),
-        manuscriptAPI.getChapters(projectId).catch(() => []),
+        manuscriptAPI.getChaptersIndex(projectId).catch(() => null),
         editorialAPI.getMarginNotes(projectId).catch(() => ({ results: [] })) // Nuevo endpoint
       ]);
 
       setSummary(summaryData);
-      setChanges(changesData.changes || []);
-
-      // Procesar capítulos
-      let loadedChapters = [];
-      if (Array.isArray(chaptersData)) {
-          loadedChapters = chaptersData;
-      } else if (chaptersData && chaptersData.chapters) {
-          loadedChapters = chaptersData.chapters;
-      }
+      setChanges([]);
+      setLoadedChapterIds({});
+      setIndexTotals(indexData?.changes || null);
+
+      const loadedChapters = indexData?.chapters || [];
 
       if (loadedChapters.length > 0) {
         setChapters(loadedChapters);
       } else {
-        // Fallback si no hay capítulos estructurados
+        // Fallback si no hay capítulos estructurados: todos los cambios de una vez
+        const changesData = await manuscriptAPI.getChanges(projectId).catch(() => ({ changes: [] }));
         const changesArray = changesData.changes || [];
+        setChanges(changesArray);
+        setLoadedChapterIds(Object.fromEntries(changesArray.map(c => [String(c.chapter_id), true])));
         const uniqueIds = [...new Set(changesArray.map(c => c.chapter_id))].sort((a, b) => a - b);
         setChapters(uniqueIds.map(id => ({
           chapter_id: id,
@@ -91,6 +92,35 @@ export default function Editor() {
   // --- DERIVADOS (MEMOS) ---
   const activeChapter = chapters[activeChapterIdx];
   const activeChapterIdStr = activeChapter ? String(activeChapter.chapter_id) : null;
+
+  // Cambios del capítulo activo bajo demanda
+  useEffect(() => {
+    if (!activeChapterIdStr || loadedChapterIds[activeChapterIdStr]) return;
+    setLoadedChapterIds(prev => ({ ...prev, [activeChapterIdStr]: true }));
+    manuscriptAPI.getChapterChanges(projectId, activeChapterIdStr)
+      .then(chapterChanges => setChanges(prev => [
+        ...prev.filter(c => String(c.chapter_id) !== activeChapterIdStr),
+        ...chapterChanges
+      ]))
+      .catch(() => setLoadedChapterIds(prev => ({ ...prev, [activeChapterIdStr]: false })));
+  }, [projectId, activeChapterIdStr, loadedChapterIds]);
+
+  // Contadores por capítulo: los del índice, salvo capítulos ya cargados (decisiones locales)
+  const chapterCounts = useMemo(() => {
+    const counts = {};
+    chapters.forEach(ch => {
+      const c = ch.changes || {};
+      counts[String(ch.chapter_id)] = { total: c.total || 0, pending: c.pending || 0 };
+    });
+    const loaded = {};
+    changes.forEach(c => {
+      const cid = String(c.chapter_id);
+      if (!loaded[cid]) loaded[cid] = { total: 0, pending: 0 };
+      loaded[cid].total += 1;
+      if (c.status === 'pending') loaded[cid].pending += 1;
+    });
+    return { ...counts, ...loaded };
+  }, [chapters, changes]);
   
   // Cambios de texto para este capítulo
   const currentChapterChanges = useMemo(() => {
@@ -110,34 +140,68 @@ export default function Editor() {
   }, [currentChapterChanges, filter]);
 
   const stats = useMemo(() => {
-    const total = changes.length;
-    const pending = changes.filter(c => c.status === 'pending').length;
+    const counts = Object.values(chapterCounts);
+    const total = counts.reduce((acc, c) => acc + c.total, 0);
+    const pending = counts.reduce((acc, c) => acc + c.pending, 0);
     return { total, pending, progress: total > 0 ? Math.round(((total - pending) / total) * 100) : 100 };
-  }, [changes]);
+  }, [chapterCounts]);
 
   // --- ACCIONES ---
+  // Cada decisión se envía al momento (un append en el servidor); las que fallan
+  // quedan en unsavedIds y se reintentan con el botón Guardar
+  function markUnsaved(ids, unsaved) {
+    setUnsavedIds(prev => {
+      const next = { ...prev };
+      ids.forEach(id => { if (unsaved) next[id] = true; else delete next[id]; });
+      return next;
+    });
+  }
+
+  async function persistDecisions(decisions) {
+    const ids = decisions.map(d => d.change_id);
+    markUnsaved(ids, true);
+    try {
+      if (decisions.length === 1) await manuscriptAPI.saveChangeDecision(projectId, decisions[0].change_id, decisions[0].status);
+      else await manuscriptAPI.saveAllDecisions(projectId, decisions);
+      markUnsaved(ids, false);
+    } catch (err) {
+      console.error('Decisión no guardada, queda pendiente de reintento:', err);
+    }
+  }
+
   function updateChangeStatus(changeId, newStatus) {
     setChanges(prev => prev.map(c => 
       c.change_id === changeId 
         ? { ...c, status: newStatus, user_decision: { action: newStatus, timestamp: new Date().toISOString() } }
         : c
     ));
+    persistDecisions([{ change_id: changeId, status: newStatus }]);
   }
 
   function bulkUpdateChapter(status) {
     if (!activeChapter) return;
+    const decisions = currentChapterChanges
+      .filter(c => c.status === 'pending')
+      .map(c => ({ change_id: c.change_id, status }));
     setChanges(prev => prev.map(c => 
       String(c.chapter_id) === activeChapterIdStr && c.status === 'pending'
         ? { ...c, status, user_decision: { action: status, timestamp: new Date().toISOString() } }
         : c
     ));
+    if (decisions.length > 0) persistDecisions(decisions);
   }
 
   async function saveDecisions() {
     try {
       setIsSaving(true);
-      const decisions = changes.map(c => ({ change_id: c.change_id, status: c.status }));
-      await manuscriptAPI.saveAllDecisions(projectId, decisions);
+      // Solo viajan las decisiones que no se pudieron guardar al hacer click
+      const decisions = changes
+        .filter(c => unsavedIds[c.change_id])
+        .map(c => ({ change_id: c.change_id, status: c.status }));
+      if (decisions.length > 0) {
+        await manuscriptAPI.saveAllDecisions(projectId, decisions);
+        markUnsaved(decisions.map(d => d.change_id), false);
+      }
       alert('✓ Decisiones guardadas en la nube');
     } catch (err) {
       alert('Error al guardar: ' + err.message);
@@ -147,72 +211,16 @@ export default function Editor() {
   }
 
   // --- EXPORTACIÓN DOCX ---
+  // El servidor aplica los cambios aceptados y cachea el render por versión de decisiones
   async function exportToDocx() {
     try {
       setIsExporting(true);
-      const changesByChapter = {};
-      changes.forEach(c => {
-        const cid = String(c.chapter_id);
-        if (!changesByChapter[cid]) changesByChapter[cid] = [];
-        changesByChapter[cid].push(c);
-      });
-
-      const children = [];
-
-      // Título Principal
-      children.push(
-        new Paragraph({
-          children: [new TextRun({ text: summary?.book_name || 'Manuscrito', bold: true, size: 56, font: 'Georgia' })],
-          alignment: AlignmentType.CENTER,
-          spacing: { after: 600 }
-        })
-      );
-
-      for (const chapter of chapters) {
-        const cid = String(chapter.chapter_id);
-        const chChanges = changesByChapter[cid] || [];
-        
-        // Título de Capítulo
-        children.push(
-          new Paragraph({
-            children: [new TextRun({ text: chapter.display_title || `Capítulo`, bold: true, size: 36, font: 'Georgia' })],
-            heading: HeadingLevel.HEADING_1,
-            spacing: { before: 600, after: 400 },
-            pageBreakBefore: true
-          })
-        );
-
-        // Contenido base
-        let content = chapter.contenido_original || '';
-        if (!content) content = chapter.contenido_editado || ''; 
-
-        // Aplicar cambios aceptados
-        for (const change of chChanges) {
-          if (change.status === 'accepted' && change.original && change.editado) {
-             content = content.split(change.original).join(change.editado);
-          }
-        }
-
-        // Renderizar párrafos
-        if (content) {
-          const paragraphs = content.split(/\n\n+/);
-          for (const para of paragraphs) {
-            if (para.trim()) {
-              children.push(
-                new Paragraph({
-                  children: [new TextRun({ text: para.trim(), size: 24, font: 'Times New Roman' })],
-                  spacing: { after: 200, line: 360 }
-                })
-              );
-            }
-          }
-        } else {
-           children.push(new Paragraph({ text: "[Capítulo vacío o sin contenido procesado]", italics: true }));
-        }
+      const unsaved = changes.filter(c => unsavedIds[c.change_id]).map(c => ({ change_id: c.change_id, status: c.status }));
+      if (unsaved.length > 0) {
+        await manuscriptAPI.saveAllDecisions(projectId, unsaved);
+        markUnsaved(unsaved.map(d => d.change_id), false);
       }
-
-      const doc = new Document({ sections: [{ children }] });
-      const blob = await Packer.toBlob(doc);
+      const blob = await manuscriptAPI.downloadExport(projectId, 'docx');
       saveAs(blob, `${(summary?.book_name || 'Libro').replace(/\s+/g, '_')}_Editado.docx`);
 
     } catch (err) {
@@ -254,8 +262,7 @@ export default function Editor() {
         <div className="flex-1 overflow-y-auto p-3 space-y-1 custom-scrollbar">
           {chapters.map((chap, idx) => {
              const cid = String(chap.chapter_id);
-             const chChanges = changes.filter(c => String(c.chapter_id) === cid);
-             const pending = chChanges.filter(c => c.status === 'pending').length;
+             const pending = chapterCounts[cid]?.pending || 0;
              const notesCount = marginNotes[cid]?.length || 0;
              
              return (
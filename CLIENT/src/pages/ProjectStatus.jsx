@@ -97,7 +97,7 @@ export default function ProjectStatus() {
   const [elapsedTime, setElapsedTime] = useState('00:00');
   
   // Refs
-  const pollIntervalRef = useRef(null);
+  const pollActiveRef = useRef(false); // El bucle de long-poll sigue mientras sea true
   const timerIntervalRef = useRef(null);
   // Refs para notificaciones
   const titleIntervalRef = useRef(null);
@@ -172,11 +172,26 @@ export default function ProjectStatus() {
     }
   }, [projectId]);
 
-  // 2. POLLING
+  // 2. LONG-POLL: el servidor responde solo cuando el progreso cambia (o a los ~25 s)
   useEffect(() => {
-    checkStatus();
-    pollIntervalRef.current = setInterval(checkStatus, 4000);
-    return () => clearInterval(pollIntervalRef.current);
+    pollActiveRef.current = true;
+    (async () => {
+      let version = null;
+      while (pollActiveRef.current) {
+        try {
+          const data = await projectsAPI.waitProgress(projectId, version);
+          if (!pollActiveRef.current) break;
+          version = data.version;
+          await checkStatus(data);
+          // Terminado/cancelado: el servidor ya no tiene cambios que empujar
+          if (data.runtime_status && !['Running', 'Pending'].includes(data.runtime_status)) pollActiveRef.current = false;
+        } catch (err) {
+          console.warn("Polling error:", err);
+          await new Promise(resolve => setTimeout(resolve, 4000));
+        }
+      }
+    })();
+    return () => { pollActiveRef.current = false; };
   }, [projectId]);
 
   // 3. TIMER
@@ -203,10 +218,8 @@ export default function ProjectStatus() {
     return () => clearInterval(timerIntervalRef.current);
   }, [projectCreatedAt, status, terminated]);
 
-  async function checkStatus() {
-    if (terminated) return;
+  async function checkStatus(data) {
     try {
-      const data = await projectsAPI.getStatus(projectId);
       setStatus(data);
 
       if (!projectCreatedAt && (data.created_at || data.createdAt || data.startTime)) {
@@ -219,7 +232,7 @@ export default function ProjectStatus() {
       
       // --- FINALIZACION ---
       if (data.is_completed) {
-        clearInterval(pollIntervalRef.current);
+        pollActiveRef.current = false;
         
         // 2. FORZAR ACTUALIZACION DEL CONTEXTO (Solución al F5)
         await refreshProject(); 
@@ -229,7 +242,7 @@ export default function ProjectStatus() {
       }
       
       if (data.is_failed) {
-        clearInterval(pollIntervalRef.current);
+        pollActiveRef.current = false;
         setError('El orquestador reportó un fallo crítico.');
       }
     } catch (err) { 
@@ -242,6 +255,7 @@ export default function ProjectStatus() {
     setIsTerminating(true);
     try {
       await projectsAPI.terminate(projectId);
+      pollActiveRef.current = false;
       setTerminated(true);
       setStatus(prev => ({ ...prev, custom_status: 'Detenido por usuario' }));
     } catch (err) {
@@ -274,6 +288,12 @@ export default function ProjectStatus() {
               <h1 className="text-4xl md:text-5xl font-editorial font-bold text-gray-900 leading-tight">
                 {terminated ? 'Proceso Detenido' : status?.is_completed ? 'Análisis Completado' : status?.friendly_message || 'Iniciando LYA...'}
               </h1>
+              {!terminated && !status?.is_completed && status?.progress?.total > 0 && (
+                <p className="text-sm text-gray-500 font-mono">
+                  {status.progress.completed}/{status.progress.total} · {Math.round(status.progress.percent)}% del total
+                  {status.progress.eta_seconds != null && ` · ~${Math.max(1, Math.round(status.progress.eta_seconds / 60))} min restantes`}
+                </p>
+              )}
            </div>
 
            {/* Timer y Acciones */}
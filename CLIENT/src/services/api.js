@@ -58,8 +58,21 @@ export const authAPI = {
 
 export const projectsAPI = {
   async getAll() { const data = await apiFetch('projects'); return data.projects || []; },
+  // Página filtrada/ordenada: { projects, total, next_cursor }
+  async list({ status, q, sort, order, limit, cursor } = {}) {
+    const params = new URLSearchParams();
+    Object.entries({ status, q, sort, order, limit, cursor }).forEach(([k, v]) => { if (v !== undefined && v !== null && v !== '') params.set(k, v); });
+    const query = params.toString();
+    return await apiFetch(`projects${query ? `?${query}` : ''}`);
+  },
   async getById(id) { return await apiFetch(`project/${id}`); },
   async getStatus(id) { return await apiFetch(`project/${id}/status`); },
+  // Long-poll: responde cuando la versión del progreso difiere de `since` (o a los `wait` segundos)
+  async waitProgress(id, since, wait = 25) {
+    const params = new URLSearchParams({ wait });
+    if (since) params.set('since', since);
+    return await apiFetch(`project/${id}/progress?${params.toString()}`);
+  },
   async terminate(id, reason = 'User cancelled') { return await apiFetch(`project/${id}/terminate`, { method: 'POST', body: JSON.stringify({ reason }) }); },
   async delete(id) { return await apiFetch(`project/${id}`, { method: 'DELETE' }); },
 };
@@ -67,12 +80,17 @@ export const projectsAPI = {
 export const bibleAPI = {
   async get(id) { return await apiFetch(`project/${id}/bible`); },
   async save(id, data) { return await apiFetch(`project/${id}/bible`, { method: 'POST', body: JSON.stringify(data) }); },
+  // En un proyecto terminado responde { job_id, diff, message }: recalculo solo de los capítulos afectados
   async approve(id) { return await apiFetch(`project/${id}/bible/approve`, { method: 'POST' }); },
+  async getRecomputeStatus(id, jobId) { return await apiFetch(`project/${id}/bible/recompute${jobId ? `/${jobId}` : ''}`); },
 };
 
 export const editorialAPI = {
   async getLetter(projectId) { return await apiFetch(`project/${projectId}/editorial-letter`); },
-  async getMarginNotes(projectId) { return await apiFetch(`project/${projectId}/margin-notes`); }
+  async getMarginNotes(projectId) { return await apiFetch(`project/${projectId}/margin-notes`); },
+  // Regeneración en segundo plano: responde { job_id, status_url } y se consulta el progreso
+  async regenerateLetter(projectId) { return await apiFetch(`project/${projectId}/editorial-letter/regenerate`, { method: 'POST' }); },
+  async getRegenerateStatus(projectId, jobId) { return await apiFetch(`project/${projectId}/editorial-letter/regenerate${jobId ? `/${jobId}` : ''}`); }
 };
 
 export const manuscriptAPI = {
@@ -82,15 +100,82 @@ export const manuscriptAPI = {
   async getSummary(id) { return await apiFetch(`project/${id}`); },
   async getChanges(id) { return await apiFetch(`project/${id}/changes`); },
   async getChapters(id) { return await apiFetch(`project/${id}/chapters`); },
+  // Por capítulo: índice sin texto + contadores, un capítulo, y cambios paginados
+  async getChaptersIndex(id) { return await apiFetch(`project/${id}/chapters/index`); },
+  async getChapter(id, chapterId) { return await apiFetch(`project/${id}/chapters/${chapterId}`); },
+  async getChangesPage(id, { chapter, status, tipo, cursor, limit } = {}) {
+    const params = new URLSearchParams();
+    Object.entries({ chapter, status, tipo, cursor, limit }).forEach(([k, v]) => { if (v !== undefined && v !== null && v !== '') params.set(k, v); });
+    return await apiFetch(`project/${id}/changes?${params.toString()}`);
+  },
+  async getChapterChanges(id, chapter) {
+    const changes = [];
+    let cursor = null;
+    do {
+      const page = await apiFetch(`project/${id}/changes?${new URLSearchParams({ chapter, limit: 500, ...(cursor ? { cursor } : {}) })}`);
+      changes.push(...(page.changes || []));
+      cursor = page.next_cursor;
+    } while (cursor);
+    return changes;
+  },
+  // action: accepted | rejected | pending (también accept/reject/revert)
   async saveChangeDecision(pid, cid, action) { return await apiFetch(`project/${pid}/changes/${cid}/decision`, { method: 'POST', body: JSON.stringify({ action }) }); },
   async saveAllDecisions(pid, decisions) { return await apiFetch(`project/${pid}/changes/decisions`, { method: 'POST', body: JSON.stringify({ decisions }) }); },
-  async export(id, accepted) { return await apiFetch(`project/${id}/export`, { method: 'POST', body: JSON.stringify({ accepted_changes: accepted }) }); },
+  // Manuscrito final con los cambios aceptados aplicados (format: 'md' | 'docx') como Blob
+  async downloadExport(id, format = 'docx') {
+    const response = await fetch(`${API_BASE}/project/${id}/export?format=${format}`, { headers: getAuthHeaders() });
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.error || `Error: ${response.status}`);
+    }
+    return await response.blob();
+  },
 };
 
+// Upload por bloques: debe coincidir con UPLOAD_BLOCK_SIZE del backend
+const UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024;
+const UPLOAD_CONCURRENCY = 3;
+
 export const uploadAPI = {
-  async uploadManuscript(file, projectName) {
-    const base64 = await fileToBase64(file);
-    return await apiFetch('project/upload', { method: 'POST', body: JSON.stringify({ filename: file.name, projectName, content: base64 }) });
+  // init -> bloques en paralelo (reanudable) -> commit
+  async uploadManuscript(file, projectName, onProgress = () => {}) {
+    const fingerprint = await fileFingerprint(file);
+    const resumeKey = `lya_upload_${fingerprint}`;
+
+    let session = null;
+    const pendingId = localStorage.getItem(resumeKey);
+    if (pendingId) {
+      session = await apiFetch(`project/upload/${pendingId}`).catch(() => null);
+    }
+    if (!session) {
+      session = await apiFetch('project/upload/init', { method: 'POST', body: JSON.stringify({ filename: file.name, projectName, size: file.size, fingerprint }) });
+      if (session.status === 'uploaded') return session; // Duplicado: el manuscrito ya estaba en el servidor
+      localStorage.setItem(resumeKey, session.job_id);
+    }
+
+    const received = new Set(session.received_blocks || []);
+    const pending = [];
+    for (let i = 0; i < session.total_blocks; i++) if (!received.has(i)) pending.push(i);
+
+    let done = received.size;
+    onProgress(done / session.total_blocks);
+    const worker = async () => {
+      while (pending.length) {
+        const index = pending.shift();
+        const block = file.slice(index * session.block_size, (index + 1) * session.block_size);
+        await apiFetch(`project/upload/${session.job_id}/block/${index}`, {
+          method: 'PUT',
+          headers: { 'Content-Type': 'application/octet-stream' },
+          body: await block.arrayBuffer(),
+        });
+        onProgress(++done / session.total_blocks);
+      }
+    };
+    await Promise.all(Array.from({ length: UPLOAD_CONCURRENCY }, worker));
+
+    const result = await apiFetch(`project/upload/${session.job_id}/commit`, { method: 'POST' });
+    localStorage.removeItem(resumeKey);
+    return result;
   },
   
   // CORRECCIÓN APLICADA: Se agregó el parámetro bookName y se envía en el body como book_name
@@ -118,6 +203,19 @@ export const uploadAPI = {
   },
 };
 
+// Huella = SHA-256 de los SHA-256 de cada bloque (misma definición que el backend)
+async function fileFingerprint(file) {
+  const digests = [];
+  for (let offset = 0; offset < Math.max(file.size, 1); offset += UPLOAD_BLOCK_SIZE) {
+    const block = await file.slice(offset, offset + UPLOAD_BLOCK_SIZE).arrayBuffer();
+    digests.push(new Uint8Array(await crypto.subtle.digest('SHA-256', block)));
+  }
+  const joined = new Uint8Array(digests.length * 32);
+  digests.forEach((d, i) => joined.set(d, i * 32));
+  const fingerprint = new Uint8Array(await crypto.subtle.digest('SHA-256', joined));
+  return Array.from(fingerprint, (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
 function fileToBase64(file) {
   return new Promise((resolve, reject) => {
     const reader = new FileReader();